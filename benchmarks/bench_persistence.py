@@ -0,0 +1,102 @@
+"""
+Benchmark Persistence - So sánh json indent=2 (cũ) với utils.persistence (compact/atomic/streaming)
+
+Chạy từ thư mục gốc của tool:
+    python benchmarks/bench_persistence.py
+    python benchmarks/bench_persistence.py --posts 10000 --repeat 5
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import persistence  # noqa: E402
+
+
+def make_posts(count):
+    """Tạo list dict giống ScheduledPost.to_dict()"""
+    posts = []
+    for i in range(count):
+        posts.append({
+            "id": f"post_{i:06d}",
+            "video_path": f"C:/tool_ld/temp/scheduled/video_{i:06d}.mp4",
+            "video_name": f"video_{i:06d}.mp4",
+            "scheduled_time_vn": f"{(i % 28) + 1:02d}/10/2025 {(i % 24):02d}:{(i % 60):02d}",
+            "vm_name": f"SD-Farm-{i % 20}",
+            "account_display": f"SD-Farm-{i % 20} - tài_khoản_{i % 20}",
+            "title": f"Video số {i} #reels #viral #xuhuong",
+            "status": "draft" if i % 3 else "posted",
+            "is_paused": bool(i % 2),
+            "post_now": False,
+        })
+    return posts
+
+
+def bench(label, func, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return label, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ghi scheduled_posts.json")
+    parser.add_argument("--posts", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    posts = make_posts(args.posts)
+    data = {"posts": posts}
+
+    tmp_dir = tempfile.mkdtemp(prefix="bench_persist_")
+    old_path = os.path.join(tmp_dir, "old.json")
+    new_path = os.path.join(tmp_dir, "new.json")
+    stream_path = os.path.join(tmp_dir, "stream.json")
+
+    def write_old():
+        with open(old_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+
+    def write_new():
+        persistence.atomic_write_json(new_path, data)
+
+    def write_stream():
+        persistence.atomic_write_json_stream(stream_path, iter(posts), wrap_key="posts")
+
+    results = [
+        bench("json indent=2 (cũ)", write_old, args.repeat),
+        bench("atomic_write_json", write_new, args.repeat),
+        bench("atomic_write_json_stream", write_stream, args.repeat),
+    ]
+
+    # Kiểm tra dữ liệu giống nhau
+    assert persistence.load_json(new_path) == data
+    assert persistence.load_json(stream_path) == data
+
+    backend = "orjson" if persistence.orjson is not None else "json (stdlib)"
+    print(f"📊 {args.posts} posts | backend: {backend} | best of {args.repeat}")
+    sizes = {
+        "json indent=2 (cũ)": os.path.getsize(old_path),
+        "atomic_write_json": os.path.getsize(new_path),
+        "atomic_write_json_stream": os.path.getsize(stream_path),
+    }
+    for label, elapsed in results:
+        print(f"   {label:<26} {elapsed * 1000:8.1f} ms   {sizes[label] / 1024:9.1f} KB")
+
+    for path in (old_path, new_path, stream_path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    os.rmdir(tmp_dir)
+
+
+if __name__ == "__main__":
+    main()
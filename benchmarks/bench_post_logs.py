@@ -0,0 +1,154 @@
+"""
+Benchmark Post Logs - RAM cho log của nhiều post: list chuỗi (cũ) vs ring buffer của utils.trace_log
+
+Cũ: mỗi post giữ list chuỗi "[dd/mm/YYYY HH:MM:SS] msg", cắt self.logs[-1000:] (copy list)
+mỗi lần append khi quá 1000 dòng.
+Mới: trace_log giữ TRACE_MEMORY_EVENTS event gần nhất / post (tuple), phần cũ hơn spill xuống đĩa.
+
+Mặc định 10k post x 1200 dòng (> 1000 → mô hình cũ chạm slice self.logs[-1000:] ở mỗi lần log).
+10k post đủ log giữ vài GB RAM ở mô hình cũ → RAM đo bằng tracemalloc trên --mem-posts post
+rồi nhân theo tỉ lệ (mỗi post giữ log riêng, RAM tăng tuyến tính theo số post); thời gian đo
+trên --time-posts post.
+
+Chạy từ thư mục gốc của tool:
+    python benchmarks/bench_post_logs.py
+    python benchmarks/bench_post_logs.py --posts 10000 --lines 1200 --mem-posts 10000   # đo đủ - vài GB RAM, rất lâu
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import trace_log as trace_module  # noqa: E402
+from constants import TRACE_MEMORY_EVENTS  # noqa: E402
+
+VN_TZ = timezone(timedelta(hours=7))
+
+STAGES = ("acquire", "boot", "adb_ready", "push", "verify", "post", "teardown")
+
+
+def make_message(post_index, line):
+    return f"📤 Bước {line}: gửi file video_{post_index:06d}.mp4 vào máy ảo SD-Farm-{post_index % 50}..."
+
+
+class OldPost:
+    """Bản sao ScheduledPost.log trước đây"""
+
+    def __init__(self, post_id):
+        self.id = post_id
+        self.logs = []
+
+    def log(self, message):
+        timestamp = datetime.now(VN_TZ).strftime("%d/%m/%Y %H:%M:%S")
+        self.logs.append(f"[{timestamp}] {message}")
+        if len(self.logs) > 1000:
+            self.logs = self.logs[-1000:]
+
+
+def run_old(posts, lines):
+    store = [OldPost(f"post_{i:06d}") for i in range(posts)]
+    for line in range(lines):
+        for i, post in enumerate(store):
+            post.log(make_message(i, line))
+    return store
+
+
+def run_new(posts, lines, flush_times):
+    log = trace_module.trace_log
+    ids = [f"post_{i:06d}" for i in range(posts)]
+    for line in range(lines):
+        stage = STAGES[line % len(STAGES)]
+        for i, post_id in enumerate(ids):
+            log.event(post_id, make_message(i, line), post=post_id, stage=stage, vm=f"SD-Farm-{i % 50}")
+        if line % 5 == 0:
+            # Trong app việc này do thread writer chạy nền - ở đây gọi tay và đo riêng
+            start = time.perf_counter()
+            log.flush()
+            flush_times.append(time.perf_counter() - start)
+    start = time.perf_counter()
+    log.flush()
+    flush_times.append(time.perf_counter() - start)
+    return log
+
+
+def measure_memory(label, func, *args):
+    tracemalloc.start()
+    keep = func(*args)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del keep
+    return label, current, peak
+
+
+def measure_time(func, *args):
+    """Đo riêng, không bật tracemalloc (tracemalloc làm chậm ~3 lần)"""
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark RAM log của post")
+    parser.add_argument("--posts", type=int, default=10000)
+    parser.add_argument("--lines", type=int, default=1200, help="Số dòng log mỗi post (> 1000 để chạm slice cũ)")
+    parser.add_argument("--mem-posts", type=int, default=200, help="Số post đo RAM bằng tracemalloc")
+    parser.add_argument("--time-posts", type=int, default=500, help="Số post đo thời gian gọi log")
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp(prefix="bench_logs_")
+    trace_module.TRACE_DIR = tmp_dir
+    trace_module.SPILL_DIR = os.path.join(tmp_dir, "spill")
+    # Bật spill nhưng không start thread writer (flush gọi tay trong run_new)
+    trace_module.trace_log._write_enabled = True
+
+    mem_posts = min(args.posts, args.mem_posts)
+    time_posts = min(args.posts, args.time_posts)
+    scale = args.posts / mem_posts
+    print(f"{args.posts} post x {args.lines} dòng log (ring RAM = {TRACE_MEMORY_EVENTS} event/post)")
+    if args.lines <= 1000:
+        print("⚠️ --lines <= 1000: mô hình cũ không chạm slice self.logs[-1000:]")
+
+    # Thời gian thread gọi log, phần writer nền đo riêng
+    flush_times = []
+    old_time = measure_time(run_old, time_posts, args.lines)
+    new_time = measure_time(run_new, time_posts, args.lines, flush_times) - sum(flush_times)
+    writer_time = sum(flush_times)
+    trace_module.trace_log._recent.clear()
+    shutil.rmtree(trace_module.SPILL_DIR, ignore_errors=True)
+
+    flush_times = []
+    results = [
+        measure_memory("list chuỗi + slice (cũ)", run_old, mem_posts, args.lines) + (old_time,),
+        measure_memory("trace_log ring + spill", run_new, mem_posts, args.lines, flush_times) + (new_time,),
+    ]
+
+    # Kiểm tra đọc lại đủ log của 1 post (RAM + các trang từ spill file)
+    events, cursor = trace_module.trace_log.snapshot("post_000000")
+    total = len(events)
+    while cursor:
+        page, cursor = trace_module.trace_log.page("post_000000", before=cursor)
+        total += len(page)
+
+    spill_bytes = sum(
+        os.path.getsize(os.path.join(trace_module.SPILL_DIR, name))
+        for name in os.listdir(trace_module.SPILL_DIR)
+    ) if os.path.isdir(trace_module.SPILL_DIR) else 0
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    if scale > 1:
+        print(f"RAM đo trên {mem_posts} post, nhân x{scale:g} cho {args.posts} post")
+    print(f"{'Cách lưu':<28}{'RAM giữ (MB)':>15}{'RAM đỉnh (MB)':>15}{'Thời gian* (s)':>16}")
+    for label, current, peak, elapsed in results:
+        print(f"{label:<28}{current * scale / 1e6:>15.1f}{peak * scale / 1e6:>15.1f}{elapsed:>16.2f}")
+    print(f"* thread gọi log, {time_posts} post x {args.lines} dòng, không tracemalloc - "
+          f"writer nền (JSONL + spill) thêm {writer_time:.2f}s ở thread riêng")
+    print(f"Spill trên đĩa: {spill_bytes * scale / 1e6:.1f} MB - đọc lại post_000000: {total}/{args.lines} dòng")
+
+if __name__ == "__main__":
+    main()
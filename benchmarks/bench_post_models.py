@@ -0,0 +1,152 @@
+"""
+Benchmark Post Models - Load scheduled_posts.json: ScheduledPost cũ (__dict__ + strptime) vs __slots__ + from_dicts
+
+Chạy từ thư mục gốc của tool:
+    python benchmarks/bench_post_models.py
+    python benchmarks/bench_post_models.py --posts 100000 --repeat 3
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import tracemalloc
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import persistence  # noqa: E402
+from core import scheduler  # noqa: E402
+
+VN_TZ = scheduler.VN_TZ
+
+
+class OldScheduledPost:
+    """Bản sao ScheduledPost trước đây (__dict__, strptime mỗi post)"""
+
+    def __init__(self, post_id, video_path, scheduled_time_vn=None, vm_name=None,
+                 account_display=None, title="", status="draft", is_paused=True, post_now=False, log_callback=None):
+        self.id = post_id
+        self.video_path = video_path
+        self.video_name = os.path.basename(video_path)
+        self.scheduled_time_vn = scheduled_time_vn
+        self.vm_name = vm_name
+        self.account_display = account_display or "Chưa chọn"
+        self.title = title or self.video_name
+        self.status = status
+        self.is_paused = is_paused
+        self.post_now = post_now
+        self.stop_requested = False
+        self.logs = []
+        self.log_callback = log_callback
+
+    @staticmethod
+    def from_dict(data):
+        scheduled_time = None
+        if data.get("scheduled_time_vn"):
+            scheduled_time = datetime.strptime(data["scheduled_time_vn"], "%d/%m/%Y %H:%M")
+            scheduled_time = scheduled_time.replace(tzinfo=VN_TZ)
+        return OldScheduledPost(
+            post_id=data["id"],
+            video_path=data["video_path"],
+            scheduled_time_vn=scheduled_time,
+            vm_name=data.get("vm_name"),
+            account_display=data.get("account_display"),
+            title=data.get("title", ""),
+            status=data.get("status", "draft"),
+            is_paused=data.get("is_paused", True),
+            post_now=data.get("post_now", False)
+        )
+
+
+def make_posts(count):
+    """Tạo list dict giống ScheduledPost.to_dict() - 1/3 post có title riêng, 1/4 post tự chia VM"""
+    posts = []
+    for i in range(count):
+        video_name = f"video_{i:06d}.mp4"
+        post = {
+            "id": f"post_{i:06d}",
+            "video_path": f"C:/tool_ld/temp/scheduled/{video_name}",
+            "video_name": video_name,
+            "scheduled_time_vn": f"{(i % 28) + 1:02d}/10/2025 {(i // 60) % 24:02d}:{i % 60:02d}",
+            "vm_name": f"SD-Farm-{i % 50}",
+            "account_display": f"SD-Farm-{i % 50} - tài_khoản_{i % 50}",
+            "title": f"Video số {i} #reels #viral" if i % 3 == 0 else video_name,
+            "status": "draft" if i % 3 else "posted",
+            "is_paused": bool(i % 2),
+            "post_now": False,
+        }
+        if i % 4 == 0:
+            post["auto_vm"] = True
+        posts.append(post)
+    return posts
+
+
+def load_old(path):
+    data = persistence.load_json(path, default={})
+    return [OldScheduledPost.from_dict(p) for p in data.get("posts", [])]
+
+
+def load_new(path):
+    return scheduler.load_scheduled_posts()
+
+
+def best_time(func, path, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(path)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def retained_memory(func, path):
+    tracemalloc.start()
+    posts = func(path)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del posts
+    return current
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark load scheduled_posts.json")
+    parser.add_argument("--posts", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp(prefix="bench_models_")
+    path = os.path.join(tmp_dir, "scheduled_posts.json")
+    persistence.atomic_write_json_stream(path, iter(make_posts(args.posts)), wrap_key="posts")
+    scheduler.SCHEDULED_POSTS_FILE = path
+
+    # Dữ liệu load ra phải giống nhau
+    old_posts, new_posts = load_old(path), load_new(path)
+    for old, new in zip(old_posts, new_posts):
+        assert (old.id, old.video_name, old.title, old.scheduled_time_vn, old.vm_name, old.status) == \
+               (new.id, new.video_name, new.title, new.scheduled_time_vn, new.vm_name, new.status)
+    assert [p.to_dict() for p in new_posts] == make_posts(args.posts)
+    del old_posts, new_posts
+
+    # JSON decode chung cho cả 2 cách - tách riêng để thấy phần dựng model
+    decode = best_time(lambda p: persistence.load_json(p, default={}), path, args.repeat)
+    results = []
+    for label, func in (("__dict__ + strptime (cũ)", load_old), ("__slots__ + from_dicts", load_new)):
+        elapsed = best_time(func, path, args.repeat)
+        results.append((label, elapsed, elapsed - decode, retained_memory(func, path)))
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    print(f"{args.posts} post - JSON decode: {decode:.3f}s (orjson: {'có' if persistence.orjson else 'không'})")
+    print(f"{'Model':<28}{'Load (s)':>12}{'Dựng model (s)':>16}{'RAM (MB)':>12}")
+    for label, elapsed, build, memory in results:
+        print(f"{label:<28}{elapsed:>12.3f}{build:>16.3f}{memory / 1e6:>12.1f}")
+    print(f"Tăng tốc load: x{results[0][1] / results[1][1]:.1f} - dựng model: x{results[0][2] / max(results[1][2], 1e-9):.1f}")
+    # Phần còn lại của load mới là JSON decode (chung cho cả 2 cách) → trần tăng tốc khi chỉ đổi model
+    print(f"JSON decode = {decode / results[1][1]:.0%} load mới - trần tăng tốc load khi giữ định dạng file: "
+          f"x{results[0][1] / decode:.1f}")
+
+
+if __name__ == "__main__":
+    main()
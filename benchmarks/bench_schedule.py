@@ -0,0 +1,98 @@
+"""
+Benchmark Lên lịch hàng loạt - xếp khung giờ xoay vòng (cách cũ) vs schedule optimizer
+
+Tạo workload giả: N video chia cho V máy ảo (số video mỗi VM lệch nhau, video cùng VM nằm liền
+nhau như khi import theo kênh), thời gian đăng / boot ngẫu nhiên theo từng VM, khung giờ cách
+đều trong ngày. Dự đoán bằng cùng mô hình (VM chạy tuần tự + boot admission) rồi so sánh số
+video lỡ hẹn (bắt đầu trễ > POST_MAX_LATE_SECONDS), độ trễ, ngày xong và thời gian chạy optimizer.
+
+Chạy từ thư mục gốc của tool:
+    python benchmarks/bench_schedule.py
+    python benchmarks/bench_schedule.py --posts 5000 --vms 80 --slot-minutes 10 --warm
+"""
+import os
+import sys
+import time
+import random
+import argparse
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from constants import POST_MAX_LATE_SECONDS
+from utils.schedule_optimizer import (
+    VMProfile, iter_slots, optimize_schedule, round_robin_schedule, predict_schedule, plan_stats
+)
+
+VN_TZ = timezone(timedelta(hours=7))
+
+
+def make_workload(args):
+    rng = random.Random(args.seed)
+    vms = [f"VM{i + 1}" for i in range(args.vms)]
+    profiles = {vm: VMProfile(post_seconds=rng.uniform(args.post_min, args.post_max),
+                              boot_seconds=rng.uniform(args.boot_min, args.boot_max), measured=True)
+                for vm in vms}
+    # Số video mỗi VM lệch nhau (kênh lớn / nhỏ)
+    weights = [rng.paretovariate(1.5) for _ in vms]
+    assigned = rng.choices(vms, weights=weights, k=args.posts)
+    if args.order == "blocks":
+        assigned.sort(key=vms.index)
+    posts = [(i, vm) for i, vm in enumerate(assigned)]
+
+    slots = []
+    minute = args.day_start * 60
+    while minute < args.day_end * 60:
+        slots.append((minute // 60, minute % 60))
+        minute += args.slot_minutes
+    start_date = datetime(2025, 1, 1, tzinfo=VN_TZ)
+    return posts, profiles, slots, start_date
+
+
+def report(name, plan, elapsed, start_date):
+    stats = plan_stats(plan)
+    days = (stats["last_finish"] - start_date).total_seconds() / 86400 if stats["last_finish"] else 0
+    print(f"{name:<12} {stats['late']:>6} {100 * stats['late'] / max(stats['posts'], 1):>6.1f}% "
+          f"{stats['mean_lateness'] / 60:>9.1f}m {stats['max_lateness'] / 3600:>8.1f}h "
+          f"{days:>8.1f}d {elapsed * 1000:>9.1f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--posts", type=int, default=5000)
+    parser.add_argument("--vms", type=int, default=50)
+    parser.add_argument("--slot-minutes", type=int, default=5, help="Khoảng cách giữa 2 khung giờ")
+    parser.add_argument("--day-start", type=int, default=6, help="Giờ bắt đầu khung giờ trong ngày")
+    parser.add_argument("--day-end", type=int, default=24, help="Giờ kết thúc khung giờ trong ngày")
+    parser.add_argument("--post-min", type=float, default=150, help="Giây đăng 1 video (VM nhanh nhất)")
+    parser.add_argument("--post-max", type=float, default=480, help="Giây đăng 1 video (VM chậm nhất)")
+    parser.add_argument("--boot-min", type=float, default=40)
+    parser.add_argument("--boot-max", type=float, default=120)
+    parser.add_argument("--order", choices=("blocks", "random"), default="blocks",
+                        help="Thứ tự video trên bảng: liền theo VM hoặc xáo trộn")
+    parser.add_argument("--per-slot", type=int, default=1, help="Số video tối đa / VM / khung giờ (optimizer)")
+    parser.add_argument("--warm", action="store_true", help="Giả lập warm VM mode")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    posts, profiles, slots, start_date = make_workload(args)
+    print(f"{args.posts} video, {args.vms} VM, {len(slots)} khung giờ/ngày (mỗi {args.slot_minutes} phút), "
+          f"đăng {args.post_min:g}-{args.post_max:g}s, boot {args.boot_min:g}-{args.boot_max:g}s, "
+          f"thứ tự {args.order}{', warm' if args.warm else ''}\n")
+    print(f"{'cách xếp':<12} {'lỡ hẹn':>6} {'%':>7} {'trễ TB':>10} {'trễ max':>9} {'xong sau':>9} {'thời gian':>11}")
+
+    start = time.perf_counter()
+    legacy = predict_schedule(round_robin_schedule(posts, iter_slots(start_date, slots)), profiles, warm=args.warm)
+    report("xoay vòng", legacy, time.perf_counter() - start, start_date)
+
+    start = time.perf_counter()
+    plan = optimize_schedule(posts, iter_slots(start_date, slots), profiles, per_slot=args.per_slot, warm=args.warm)
+    report("optimizer", plan, time.perf_counter() - start, start_date)
+
+    late = plan_stats(plan, POST_MAX_LATE_SECONDS)["late"]
+    print("\n✅ Không video nào lỡ hẹn" if late == 0 else f"\n⚠️ Optimizer còn {late} video lỡ hẹn")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,150 @@
+"""
+Benchmark Selectors - thời gian match từng XPath của constants.py trên các dump hierarchy đã ghi
+
+So sánh cho từng selector (trung bình trên mọi màn hình trong bản ghi):
+- xpath   : XPath tổng quát ElementTree trên cả cây (như ReplayDevice mặc định)
+- lxml    : lxml .xpath() - engine u2 dùng cho d.xpath() (bỏ qua nếu chưa cài lxml)
+- quét    : selector đã compile (utils/ui_selector.py), lần hỏi đầu trên 1 dump - quét 1 lượt
+- dict    : selector đã compile, attribute đã index - tra dict
+Kết quả của xpath và selector đã compile được so khớp trên từng dump.
+
+Chạy từ thư mục gốc của tool:
+    python benchmarks/bench_selectors.py
+    python benchmarks/bench_selectors.py logs/ui_recordings --repeat 200
+    python benchmarks/bench_selectors.py --nodes 2000
+"""
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import constants  # noqa: E402
+from utils.ui_selector import HierarchyIndex, compile_selector  # noqa: E402
+from utils.ui_replay import find_recordings, load_recording, synthetic_recording  # noqa: E402
+
+try:
+    from lxml import etree as lxml_etree
+except ImportError:
+    lxml_etree = None
+
+
+def collect(recordings):
+    """(danh sách XML màn hình, selector: constants.py + selector đã hỏi trong bản ghi)"""
+    dumps = [screen["xml"] for recording in recordings for screen in recording["screens"]]
+    selectors = {value for name, value in vars(constants).items()
+                 if name.isupper() and isinstance(value, str) and value.startswith("//")}
+    for recording in recordings:
+        selectors.update(query["sel"] for query in recording.get("queries", [])
+                         if isinstance(query["sel"], str))
+    return dumps, sorted(selectors)
+
+
+def timed(func, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - started) / repeat
+
+
+def signature(nodes):
+    return [tuple(sorted(node.attrib.items())) for node in nodes]
+
+
+def bench_selector(selector, indexes, lxml_roots, repeat):
+    compiled = compile_selector(selector)
+    row = {"selector": selector, "compiled": compiled is not None, "xpath": 0.0, "lxml": None,
+           "scan": None, "dict": None, "mismatch": 0, "found": 0}
+    for index in indexes:
+        try:
+            expected = index.find_xpath(selector)
+        except ValueError:
+            row["xpath"] = None
+            break
+        row["found"] += bool(expected)
+        row["xpath"] += timed(lambda: index.find_xpath(selector), repeat)
+        if compiled is None:
+            continue
+
+        def first_lookup():
+            index._used.clear()  # giả lập dump mới: attribute chưa được hỏi lần nào
+            index._by_attr.clear()
+            return index.find_compiled(compiled)
+
+        if signature(first_lookup()) != signature(expected):
+            row["mismatch"] += 1
+        row["scan"] = (row["scan"] or 0.0) + timed(first_lookup, repeat)
+        index.find_compiled(compiled)  # lần 2 → dựng index
+        row["dict"] = (row["dict"] or 0.0) + timed(lambda: index.find_compiled(compiled), repeat)
+    if lxml_roots and row["xpath"] is not None:
+        row["lxml"] = sum(timed(lambda: root.xpath(selector), repeat) for root in lxml_roots)
+    count = len(indexes)
+    for key in ("xpath", "lxml", "scan", "dict"):
+        if row[key] is not None:
+            row[key] /= count
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="*", help="File / thư mục bản ghi UI (mặc định logs/ui_recordings)")
+    parser.add_argument("--nodes", type=int, default=400, help="Số node mỗi màn hình giả lập (khi không có bản ghi)")
+    parser.add_argument("--repeat", type=int, default=100, help="Số lần match mỗi selector trên mỗi dump")
+    args = parser.parse_args()
+
+    paths = find_recordings(args.paths or None)
+    if paths:
+        recordings = [load_recording(path) for path in paths]
+    else:
+        print("Không tìm thấy bản ghi UI - dùng kịch bản giả lập")
+        recordings = [synthetic_recording(flow, nodes=args.nodes) for flow in ("post", "login")]
+    dumps, selectors = collect(recordings)
+
+    started = time.perf_counter()
+    indexes = [HierarchyIndex(xml) for xml in dumps]
+    parse_ms = (time.perf_counter() - started) / len(dumps) * 1000
+    nodes = sum(len(index.nodes) for index in indexes) / len(indexes)
+    lxml_roots = None
+    if lxml_etree is not None:
+        lxml_roots = []
+        for xml in dumps:
+            root = lxml_etree.fromstring(xml.encode("utf-8"))
+            for node in root.iter("node"):
+                node.tag = node.get("class") or "node"
+            lxml_roots.append(root)
+
+    print(f"{len(dumps)} dump từ {len(recordings)} bản ghi, TB {nodes:.0f} node/dump, parse {parse_ms:.2f} ms/dump")
+    print(f"{len(selectors)} selector, compile được {sum(compile_selector(s) is not None for s in selectors)}"
+          + ("" if lxml_etree is not None else " | lxml chưa cài - bỏ cột lxml"))
+
+    compile_selector.cache_clear()
+    cold = timed(lambda: [compile_selector.__wrapped__(s) for s in selectors], 50) / len(selectors)
+    print(f"compile: {cold * 1e6:.1f} µs/selector lần đầu, sau đó lấy từ cache (lru_cache)\n")
+
+    rows = [bench_selector(selector, indexes, lxml_roots, args.repeat) for selector in selectors]
+    rows.sort(key=lambda row: row["xpath"] or 0, reverse=True)
+
+    def us(value):
+        return f"{value * 1e6:8.1f}" if value is not None else "       -"
+
+    print(f"{'xpath':>8} {'lxml':>8} {'quét':>8} {'dict':>8} {'x nhanh':>8}  thấy  selector (µs / lần match / dump)")
+    totals = {"xpath": 0.0, "dict": 0.0, "scan": 0.0}
+    for row in rows:
+        speedup = f"{row['xpath'] / row['dict']:7.0f}x" if row["dict"] and row["xpath"] else "       -"
+        flag = " ⚠️ lệch" if row["mismatch"] else ""
+        short = row["selector"].replace("com.instagram.android:id/", "…/")
+        print(f"{us(row['xpath'])} {us(row['lxml'])} {us(row['scan'])} {us(row['dict'])} {speedup}  "
+              f"{row['found']:4d}  {short}{flag}")
+        if row["dict"] is not None and row["xpath"] is not None:
+            totals["xpath"] += row["xpath"]
+            totals["scan"] += row["scan"]
+            totals["dict"] += row["dict"]
+
+    mismatched = sum(row["mismatch"] for row in rows)
+    print(f"\nTổng selector đã compile: xpath {totals['xpath'] * 1e6:.0f} µs | quét {totals['scan'] * 1e6:.0f} µs "
+          f"| dict {totals['dict'] * 1e6:.0f} µs | lệch kết quả: {mismatched}")
+
+
+if __name__ == "__main__":
+    main()
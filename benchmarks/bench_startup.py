@@ -0,0 +1,102 @@
+"""
+Benchmark Startup - Thời gian từ lúc chạy tool tới first paint (mục tiêu < STARTUP_TARGET_SECONDS)
+
+Mỗi phép đo chạy trong 1 process Python mới (import cache sạch):
+- eager (cũ): import cả 3 tab (tab_users + tab_post + tab_follow) như core/app.py trước đây
+- lazy (mới): import core.app - tab_post/tab_follow, yt_dlp, uiautomator2 chỉ nạp khi cần
+- first paint: dựng App() + update() tới khi cửa sổ vẽ xong (cần màn hình / $DISPLAY)
+
+Chạy từ thư mục gốc của tool:
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --repeat 5
+"""
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from constants import STARTUP_TARGET_SECONDS  # noqa: E402
+
+HEAVY_MODULES = ("yt_dlp", "uiautomator2", "tabs.tab_post", "tabs.tab_follow", "utils.api_manager_multi")
+
+PROBE = r"""
+import sys, time, json
+start = time.perf_counter()
+{imports}
+imported = time.perf_counter() - start
+paint = None
+if {paint}:
+    from core.app import App
+    app = App()
+    app.update_idletasks()
+    app.update()
+    paint = time.perf_counter() - start
+    app.tab_builders.clear()  # không dựng thêm tab nào nữa
+    app.destroy()
+print(json.dumps({{"import": imported, "paint": paint,
+                  "heavy": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+EAGER_IMPORTS = "import core.app, tabs.tab_users, tabs.tab_post, tabs.tab_follow"
+LAZY_IMPORTS = "import core.app"
+
+
+def probe(imports, paint=False):
+    """Chạy PROBE trong process mới, trả về dict kết quả (None nếu lỗi)"""
+    code = PROBE.format(imports=imports, paint=paint, heavy=HEAVY_MODULES)
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True)
+    if result.returncode != 0:
+        print(f"⚠️ Lỗi khi đo ({imports}, paint={paint}):\n{result.stderr.strip().splitlines()[-1:]}")
+        return None
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def best_of(imports, repeat, paint=False):
+    runs = [r for r in (probe(imports, paint) for _ in range(repeat)) if r]
+    if not runs:
+        return None
+    key = "paint" if paint else "import"
+    return min(runs, key=lambda r: r[key])
+
+
+def has_display():
+    if sys.platform == "win32":
+        return True
+    return bool(os.environ.get("DISPLAY") or os.environ.get("WAYLAND_DISPLAY"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark thời gian khởi động tới first paint")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    eager = best_of(EAGER_IMPORTS, args.repeat)
+    lazy = best_of(LAZY_IMPORTS, args.repeat)
+    if not eager or not lazy:
+        sys.exit(1)
+
+    print(f"{'Cách khởi động':<30}{'Import (s)':>12}  Module nặng đã nạp")
+    for label, run in (("eager - import cả 3 tab (cũ)", eager), ("lazy - chỉ core.app (mới)", lazy)):
+        print(f"{label:<30}{run['import']:>12.3f}  {', '.join(run['heavy']) or '-'}")
+    print(f"Import nhanh hơn: x{eager['import'] / max(lazy['import'], 1e-9):.1f}")
+
+    if not has_display():
+        print("ℹ️ Không có màn hình ($DISPLAY) - bỏ qua đo first paint")
+        return
+
+    painted = best_of(LAZY_IMPORTS, args.repeat, paint=True)
+    if not painted:
+        sys.exit(1)
+    ok = painted["paint"] < STARTUP_TARGET_SECONDS
+    print(f"First paint (import + App() + update): {painted['paint']:.3f}s "
+          f"- mục tiêu < {STARTUP_TARGET_SECONDS:.1f}s: {'✅ ĐẠT' if ok else '❌ CHƯA ĐẠT'}")
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Benchmark UI flow offline - phát lại bản ghi UI (utils/ui_replay.py) của auto_post / auto_login
+
+Không cần LDPlayer: ReplayDevice thay u2.Device, màn hình chuyển theo thao tác / thời gian đã ghi,
+mọi sleep chạy trên đồng hồ giả lập. Mỗi bản ghi in ra:
+- thời gian match selector (CPU thật) + parse hierarchy
+- số lần dump hierarchy (u2: mỗi lần hỏi xpath = 1 dump; IndexedDevice dùng chung trong TTL)
+- tổng thời gian flow giả lập (sleep + chờ element + dump_latency x số dump)
+- thao tác lệch bản ghi (flow đã đổi so với lúc ghi) và độ khớp match offline vs u2 lúc ghi
+
+Thu bản ghi thật: bật UI_RECORD_ENABLED trong constants.py rồi chạy đăng bài / đăng nhập như
+bình thường → logs/ui_recordings/<flow>/*.json.gz. Chưa có bản ghi → dùng kịch bản giả lập.
+
+Chạy từ thư mục gốc của tool:
+    python benchmarks/bench_ui_replay.py
+    python benchmarks/bench_ui_replay.py logs/ui_recordings/post --repeat 5
+    python benchmarks/bench_ui_replay.py --synthetic --nodes 1500 --dump-latency 0.4
+    python benchmarks/bench_ui_replay.py --no-index      # so với match XPath đầy đủ mỗi truy vấn
+"""
+import os
+import sys
+import logging
+import argparse
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Flag chỉ có trên Windows - flow có import subprocess.CREATE_NO_WINDOW
+if not hasattr(subprocess, "CREATE_NO_WINDOW"):
+    subprocess.CREATE_NO_WINDOW = 0
+
+from utils.ui_replay import (  # noqa: E402
+    find_recordings, load_recording, synthetic_recording, replay_flow, verify_recording
+)
+
+
+def run_one(recording, repeat, dump_latency, use_token, index_selectors):
+    best = None
+    for _ in range(repeat):
+        report = replay_flow(recording, dump_latency=dump_latency, use_cancel_token=use_token,
+                             index_selectors=index_selectors)
+        if best is None or report["wall_seconds"] < best["wall_seconds"]:
+            best = report
+    return best
+
+
+def match_seconds(report):
+    return report["match_seconds"] + (report["indexed"] or {}).get("match_seconds", 0.0)
+
+
+def print_report(report, check):
+    name = os.path.basename(report["path"] or "?")
+    recorded = report["recorded_seconds"]
+    print(f"\n[{report['flow']}] {name}")
+    print(f"  kết quả: {report['result']} (lúc ghi: {report['recorded_result']}), "
+          f"màn hình {report['final_screen'] + 1}/{report['screens']}")
+    print(f"  thời gian giả lập: {report['sim_seconds']:.1f}s (sleep {report['sleep_seconds']:.1f}s, "
+          f"dump {report['dump_wait_seconds']:.1f}s)"
+          + (f" | lúc ghi {recorded:.1f}s" if recorded else ""))
+    indexed = report["indexed"] or {}
+    queries = report["queries"] + indexed.get("lookups", 0)
+    match = match_seconds(report)
+    per_query = match / queries * 1e6 if queries else 0
+    print(f"  truy vấn: {queries} | dump hierarchy: {report['dumps']} | thao tác: {report['actions']}")
+    print(f"  match selector: {match * 1000:.2f} ms ({per_query:.1f} µs/truy vấn) | "
+          f"parse: {(report['parse_seconds'] + indexed.get('index_seconds', 0)) * 1000:.2f} ms | "
+          f"chạy thật: {report['wall_seconds'] * 1000:.1f} ms")
+    if indexed:
+        print(f"  index: {indexed['lookups']} tra dict, {indexed['reused']} dùng lại dump, "
+              f"{indexed['fallbacks']} XPath đầy đủ")
+    if report["unmatched"]:
+        print(f"  ⚠️ {len(report['unmatched'])} thao tác không có trong bản ghi, vd: {report['unmatched'][0]}")
+    if report["unsupported"]:
+        print(f"  ⚠️ selector không match được offline: {report['unsupported']}")
+    if check and check["checked"]:
+        print(f"  khớp u2 lúc ghi: {check['checked'] - len(check['mismatches'])}/{check['checked']} truy vấn")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="*", help="File / thư mục bản ghi (mặc định logs/ui_recordings)")
+    parser.add_argument("--synthetic", action="store_true", help="Dùng kịch bản giả lập (post + login)")
+    parser.add_argument("--nodes", type=int, default=400, help="Số node mỗi màn hình giả lập")
+    parser.add_argument("--repeat", type=int, default=3, help="Lấy lần chạy nhanh nhất")
+    parser.add_argument("--dump-latency", type=float, default=None,
+                        help="Giây / lần dump hierarchy (mặc định: trung bình lúc ghi)")
+    parser.add_argument("--no-token", action="store_true",
+                        help="Chạy nhánh không cancel_token (d.xpath().wait thay vì poll .exists)")
+    parser.add_argument("--no-index", action="store_true",
+                        help="Tắt IndexedDevice (utils/ui_selector.py) - so với u2 match XPath mỗi truy vấn")
+    parser.add_argument("--top", type=int, default=8, help="Số selector tốn thời gian match nhất")
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)  # log WARNING của flow (element optional không thấy...)
+
+    paths = [] if args.synthetic else find_recordings(args.paths or None)
+    if paths:
+        recordings = [load_recording(path) for path in paths]
+    else:
+        if not args.synthetic:
+            print("Không tìm thấy bản ghi UI - dùng kịch bản giả lập")
+        recordings = [synthetic_recording(flow, nodes=args.nodes) for flow in ("post", "login")]
+
+    totals = {}
+    selectors = {}
+    for recording in recordings:
+        check = verify_recording(recording) if recording.get("queries") else None
+        report = run_one(recording, args.repeat, args.dump_latency, not args.no_token,
+                         False if args.no_index else None)
+        print_report(report, check)
+
+        flow = totals.setdefault(report["flow"], {"runs": 0, "ok": 0, "sim": 0.0, "dumps": 0, "match": 0.0})
+        flow["runs"] += 1
+        flow["ok"] += bool(report["result"])
+        flow["sim"] += report["sim_seconds"]
+        flow["dumps"] += report["dumps"]
+        flow["match"] += match_seconds(report)
+        for key, (calls, seconds) in report["per_selector"].items():
+            entry = selectors.setdefault(key, [0, 0.0])
+            entry[0] += calls
+            entry[1] += seconds
+
+    print("\n=== Tổng theo flow ===")
+    for name, flow in totals.items():
+        runs = flow["runs"]
+        print(f"  {name}: {runs} bản ghi, thành công {flow['ok']}/{runs} | "
+              f"giả lập TB {flow['sim'] / runs:.1f}s | dump TB {flow['dumps'] / runs:.0f} | "
+              f"match TB {flow['match'] / runs * 1000:.2f} ms")
+
+    print(f"\n=== Top {args.top} selector theo thời gian match ===")
+    ranked = sorted(selectors.items(), key=lambda item: item[1][1], reverse=True)[:args.top]
+    for key, (calls, seconds) in ranked:
+        print(f"  {seconds * 1000:8.2f} ms  {calls:5d} lần  {seconds / calls * 1e6:7.1f} µs/lần  {key}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""
+Giả lập farm nhiều máy - 1 coordinator + nhiều host agent trên cùng 1 máy (Linux/Windows)
+
+Mỗi agent chạy `daemon.py --role agent --simulate N` trong process riêng, LDPLAYER_PATH trỏ
+tới thư mục tạm chứa ldconsole.exe / adb.exe giả (script Python):
+- ldconsole list2 / launch / quit đọc-ghi trạng thái VM trong thư mục vms/ của agent
+- adb devices luôn báo emulator-5554 device
+VM trùng giữa các agent (A: VM1,VM2 / B: VM2,VM3 / C: VM3,VM1) → kiểm tra chia việc theo VM +
+chỗ trống. Giữa chừng kill 1 agent → lease hết hạn, post được giao lại cho agent còn sống.
+
+Chạy từ thư mục gốc của tool:
+    python benchmarks/sim_farm.py
+    python benchmarks/sim_farm.py --posts 30 --job-seconds 2 --no-kill
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# ldconsole/adb giả là script Python - flag chỉ có trên Windows
+if not hasattr(subprocess, "CREATE_NO_WINDOW"):
+    subprocess.CREATE_NO_WINDOW = 0
+
+FAKE_LDCONSOLE = r'''#!{python}
+import os, sys
+VMS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "vms")
+args = sys.argv[1:]
+name = args[args.index("--name") + 1] if "--name" in args else None
+if args and args[0] == "list2":
+    for i, vm in enumerate(sorted(os.listdir(VMS))):
+        status = open(os.path.join(VMS, vm)).read().strip()
+        print(f"{{i}},{{vm}},{{vm}},0,{{status}},{{1000 + i if status == '1' else -1}}")
+elif args and args[0] in ("launch", "quit") and name:
+    with open(os.path.join(VMS, name), "w") as f:
+        f.write("1" if args[0] == "launch" else "0")
+'''
+
+FAKE_ADB = r'''#!{python}
+import sys
+if sys.argv[1:2] == ["devices"]:
+    print("List of devices attached")
+    print("emulator-5554\tdevice")
+'''
+
+AGENT_VMS = {"A": ["VM1", "VM2"], "B": ["VM2", "VM3"], "C": ["VM3", "VM1"]}
+
+
+def make_ldplayer_dir(base: str, vms: list) -> str:
+    path = os.path.join(base, "ldplayer")
+    os.makedirs(os.path.join(path, "vms"), exist_ok=True)
+    for vm in vms:
+        with open(os.path.join(path, "vms", vm), "w") as f:
+            f.write("0")
+    for exe, source in (("ldconsole.exe", FAKE_LDCONSOLE), ("adb.exe", FAKE_ADB)):
+        exe_path = os.path.join(path, exe)
+        with open(exe_path, "w") as f:
+            f.write(source.format(python=sys.executable))
+        os.chmod(exe_path, 0o755)
+    return path
+
+
+def spawn_agent(host_id: str, ldplayer: str, port: int, capacity: int, job_seconds: float) -> subprocess.Popen:
+    env = dict(os.environ, LDPLAYER_PATH=ldplayer)
+    return subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, "daemon.py"), "--role", "agent",
+         "--coordinator", f"http://127.0.0.1:{port}", "--host-id", host_id,
+         "--capacity", str(capacity), "--simulate", str(job_seconds)],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--posts", type=int, default=12)
+    parser.add_argument("--job-seconds", type=float, default=3.0)
+    parser.add_argument("--capacity", type=int, default=2)
+    parser.add_argument("--port", type=int, default=18799)
+    parser.add_argument("--lease-ttl", type=float, default=6.0, help="COORD_LEASE_TTL khi giả lập")
+    parser.add_argument("--no-kill", action="store_true", help="Không kill agent giữa chừng")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="sim_farm_")
+    try:
+        import core.coordinator as coordinator_module
+        import constants
+        from core import scheduler
+        from utils.daemon_client import DaemonClient
+        from utils.trace_log import trace_log
+
+        # Coordinator chạy trong process này, file post + chu kỳ rút ngắn cho giả lập
+        scheduler.SCHEDULED_POSTS_FILE = os.path.join(tmp, "scheduled_posts.json")
+        constants.AGENT_HEARTBEAT_INTERVAL = coordinator_module.AGENT_HEARTBEAT_INTERVAL = 1
+        coordinator_module.COORD_LEASE_TTL = args.lease_ttl
+        coordinator_module.COORD_HOST_TIMEOUT = args.lease_ttl
+
+        coordinator = coordinator_module.Coordinator()
+        if not coordinator.start("127.0.0.1", args.port):
+            print(f"❌ Port {args.port} đang bị chiếm")
+            return 1
+        threading.Thread(target=coordinator.serve_forever, daemon=True).start()
+        client = DaemonClient(port=args.port)
+
+        agents = {host_id: spawn_agent(host_id, make_ldplayer_dir(os.path.join(tmp, host_id), vms),
+                                       args.port, args.capacity, args.job_seconds)
+                  for host_id, vms in AGENT_VMS.items()}
+
+        # Chờ đủ agent để coordinator biết VM nào nằm ở đâu
+        deadline = time.monotonic() + 30
+        while len(client.call("list_agents")) < len(agents) and time.monotonic() < deadline:
+            time.sleep(0.2)
+
+        video = os.path.join(tmp, "video.mp4")
+        open(video, "wb").close()
+        vms = sorted({vm for vm_list in AGENT_VMS.values() for vm in vm_list})
+        for i in range(args.posts):
+            client.call("add_post", video_path=video, vm_name=vms[i % len(vms)],
+                        title=f"sim {i}", post_now=True, start=True)
+
+        start = time.perf_counter()
+        killed = None
+        while time.perf_counter() - start < args.timeout:
+            time.sleep(0.5)
+            status = client.call("status")["posts"]
+            if not args.no_kill and killed is None:
+                busy = {a["host_id"] for a in client.call("list_agents") if a["leases"]}
+                if busy:
+                    killed = sorted(busy)[0]
+                    agents[killed].kill()
+                    print(f"💀 Kill agent {killed} (đang chạy job)")
+            if status.get("pending", 0) + status.get("processing", 0) == 0:
+                break
+        elapsed = time.perf_counter() - start
+
+        print()
+        print(f"{'agent':<8} {'alive':<6} {'vms':<12} {'posted':>7} {'failed':>7}")
+        for a in sorted(client.call("list_agents"), key=lambda a: a["host_id"]):
+            print(f"{a['host_id']:<8} {str(a['alive']):<6} {','.join(a['vms']):<12} {a['posted']:>7} {a['failed']:>7}")
+        reassigned = sum(1 for p in coordinator.posts
+                         if any("Thu hồi lease" in (e.get("msg") or "") for e in trace_log.recent(p.id)))
+        status = client.call("status")["posts"]
+        print(f"\nPosts: {status}  |  giao lại: {reassigned}  |  {elapsed:.1f}s "
+              f"(tuần tự 1 máy ≈ {args.posts * args.job_seconds:.0f}s)")
+        ok = status.get("posted", 0) == args.posts
+        print("✅ Tất cả post đã đăng" if ok else "❌ Còn post chưa đăng")
+
+        for proc in agents.values():
+            if proc.poll() is None:
+                proc.terminate()
+        for proc in agents.values():
+            try:
+                proc.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        coordinator.shutdown()
+        return 0 if ok else 1
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,137 @@
+"""
+Giả lập tranh chấp VM - so sánh cách chọn job chờ khi VM được nhả (thời gian giả, không chạy VM)
+
+Mỗi VM có vài luồng theo dõi xả backlog liên tục (xong video này lại xếp hàng video tiếp)
+và post hẹn giờ tới ngẫu nhiên. Post hẹn giờ bị tính là trễ nếu bắt đầu sau giờ hẹn quá
+POST_MAX_LATE_SECONDS (PostScheduler sẽ bỏ qua → failed).
+
+Chính sách:
+- legacy   : job nào poll trúng lúc VM trống thì được (≈ ngẫu nhiên - cách cũ)
+- fifo     : vào hàng trước được trước
+- priority : pick_waiter của utils.vm_lock (priority + aging, deadline sớm nhất)
+
+Chạy từ thư mục gốc của tool:
+    python benchmarks/sim_vm_arbitration.py
+    python benchmarks/sim_vm_arbitration.py --vms 8 --streams-per-vm 4 --posts-per-hour 10 --hours 24
+"""
+import os
+import sys
+import heapq
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from constants import POST_MAX_LATE_SECONDS, VM_PRIORITY_SCHEDULED, VM_PRIORITY_STREAM, VM_PRIORITY_AGING_PER_MIN
+from utils.vm_lock import VMWaiter, pick_waiter
+
+POLICIES = ("legacy", "fifo", "priority")
+
+
+def choose(policy, queue, now, rng, aging):
+    if policy == "legacy":
+        return rng.choice(queue)
+    if policy == "fifo":
+        return min(queue, key=lambda w: w.seq)
+    return pick_waiter(queue, now, aging)
+
+
+def simulate(policy, args, aging=VM_PRIORITY_AGING_PER_MIN):
+    """Returns: (số post hẹn giờ, số trễ, độ trễ lớn nhất, thời gian chờ TB / lớn nhất của luồng)"""
+    rng = random.Random(args.seed)
+    horizon = args.hours * 3600
+    events = []  # (time, order, kind, vm, waiter)
+    order = 0
+
+    def push(t, kind, vm, waiter=None):
+        nonlocal order
+        order += 1
+        heapq.heappush(events, (t, order, kind, vm, waiter))
+
+    seq = 0
+
+    def new_waiter(vm, caller, priority, deadline, now):
+        nonlocal seq
+        seq += 1
+        return VMWaiter(vm, caller, priority, deadline, now, seq)
+
+    # Cùng seed → cùng lịch post hẹn giờ cho mọi chính sách
+    schedule_rng = random.Random(args.seed + 1)
+    for vm in range(args.vms):
+        t = 0.0
+        while True:
+            t += schedule_rng.expovariate(args.posts_per_hour / 3600)
+            if t >= horizon:
+                break
+            push(t, "arrive", vm)
+        for s in range(args.streams_per_vm):
+            push(schedule_rng.uniform(0, 5), "stream", vm, f"stream{s}")
+
+    queues = {vm: [] for vm in range(args.vms)}
+    busy = {vm: False for vm in range(args.vms)}
+    late = []
+    posts = 0
+    stream_waits = []
+
+    def dispatch(vm, now):
+        if busy[vm] or not queues[vm]:
+            return
+        waiter = choose(policy, queues[vm], now, rng, aging)
+        queues[vm].remove(waiter)
+        busy[vm] = True
+        if waiter.priority == VM_PRIORITY_SCHEDULED:
+            lateness = now - (waiter.deadline - POST_MAX_LATE_SECONDS)
+            late.append(lateness)
+        else:
+            stream_waits.append(now - waiter.enqueued_at)
+        push(now + rng.uniform(args.job_min, args.job_max), "done", vm, waiter)
+
+    while events:
+        now, _, kind, vm, payload = heapq.heappop(events)
+        if now >= horizon and kind != "done":
+            continue
+        if kind == "arrive":
+            posts += 1
+            queues[vm].append(new_waiter(vm, "post", VM_PRIORITY_SCHEDULED, now + POST_MAX_LATE_SECONDS, now))
+        elif kind == "stream":
+            queues[vm].append(new_waiter(vm, payload, VM_PRIORITY_STREAM, None, now))
+        elif kind == "done":
+            busy[vm] = False
+            if payload.priority == VM_PRIORITY_STREAM and now < horizon:
+                # Luồng còn backlog → xếp hàng video tiếp ngay
+                push(now, "stream", vm, payload.caller)
+        dispatch(vm, now)
+
+    # Post hẹn giờ còn trong hàng lúc hết giờ cũng tính là trễ nếu đã quá hạn
+    for queue in queues.values():
+        for waiter in queue:
+            if waiter.priority == VM_PRIORITY_SCHEDULED:
+                late.append(horizon - (waiter.deadline - POST_MAX_LATE_SECONDS))
+    misses = sum(1 for lateness in late if lateness > POST_MAX_LATE_SECONDS)
+    return (posts, misses, max(late, default=0.0),
+            sum(stream_waits) / len(stream_waits) if stream_waits else 0.0, max(stream_waits, default=0.0))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vms", type=int, default=4)
+    parser.add_argument("--streams-per-vm", type=int, default=3)
+    parser.add_argument("--posts-per-hour", type=float, default=6, help="Post hẹn giờ mỗi VM mỗi giờ")
+    parser.add_argument("--hours", type=float, default=8)
+    parser.add_argument("--job-min", type=float, default=90, help="Giây / job (min)")
+    parser.add_argument("--job-max", type=float, default=240, help="Giây / job (max)")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    print(f"{args.vms} VM × {args.streams_per_vm} luồng, {args.posts_per_hour:g} post hẹn giờ/VM/giờ, "
+          f"{args.hours:g}h, job {args.job_min:g}-{args.job_max:g}s, trễ tối đa {POST_MAX_LATE_SECONDS}s\n")
+    print(f"{'policy':<10} {'posts':>6} {'trễ':>6} {'%':>7} {'trễ max':>9} {'luồng chờ TB':>13} {'luồng chờ max':>14}")
+    for policy in POLICIES:
+        posts, misses, max_late, stream_avg, stream_max = simulate(policy, args)
+        print(f"{policy:<10} {posts:>6} {misses:>6} {100 * misses / max(posts, 1):>6.1f}% "
+              f"{max_late:>8.0f}s {stream_avg:>12.0f}s {stream_max:>13.0f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -119,6 +119,7 @@ class SimplePackageBuilder:
         # Copy source code files
         files_to_copy = [
             "main.py",
+            "daemon.py",
             "config.py",
             "constants.py",
             "requirements.txt",
@@ -241,6 +242,7 @@ InstagramTool_Portable/
 ├── run_tool.bat          <- Run main tool
 ├── updater.exe           <- Update tool
 ├── main.py               <- Main application script
+├── daemon.py             <- Headless mode (no GUI) - python daemon.py
 ├── config.py             <- Configuration
 ├── constants.py          <- Constants
 ├── requirements.txt      <- Python dependencies
@@ -121,6 +121,13 @@ OUTPUT_DIR = os.path.join(DATA_DIR, "output")
 # Streams metadata file
 STREAMS_META = os.path.join(OUTPUT_DIR, "streams.json")
 
+# VM lock leases (utils/vm_lock.py) - dùng chung giữa các instance trên cùng máy
+VM_LOCK_DIR = os.path.join(DATA_DIR, "locks")
+VM_LOCK_DB = os.path.join(VM_LOCK_DIR, "vm_locks.db")
+
+# Manifest file media tool đã đưa vào DCIM của từng device (utils/remote_media.py)
+MEDIA_MANIFEST_DIR = os.path.join(DATA_DIR, "media")
+
 # Temporary files directory
 TEMP_DIR = os.path.join(APP_DIR, "temp")
 
@@ -132,11 +139,19 @@ LOG_DIR = os.path.join(APP_DIR, "logs")
 LOG_FILE = os.path.join(LOG_DIR, "app.log")
 LOG_FORMAT = '%(asctime)s | %(name)s | %(levelname)s | %(message)s'
 LOG_LEVEL = "INFO"  # Can be: DEBUG, INFO, WARNING, ERROR, CRITICAL
+LOG_MAX_BYTES = 10 * 1024 * 1024  # app.log xoay vòng khi đạt 10MB
+LOG_BACKUP_COUNT = 5              # app.log.1 ... app.log.5
+LOG_VM_DIR = os.path.join(LOG_DIR, "vm")  # Log riêng từng máy ảo: logs/vm/<vm>.log
+LOG_VM_MAX_BYTES = 2 * 1024 * 1024
+LOG_VM_BACKUP_COUNT = 2
 
 # ==================== HELPER FUNCTIONS ====================
 def get_vm_id_from_name(vm_name):
     """
-    Tìm VM ID từ tên máy ảo bằng cách scan thư mục VM_DATA_DIR.
+    Tìm VM ID từ tên máy ảo.
+
+    ✅ Tra trong VM registry (cache RAM, tự reload khi file trong VM_DATA_DIR thay đổi)
+    thay vì mở và parse từng file JSON mỗi lần gọi.
 
     Args:
         vm_name: Tên máy ảo (VD: "test1", "SD-Farm-2")
@@ -148,32 +163,13 @@ def get_vm_id_from_name(vm_name):
         >>> get_vm_id_from_name("SD-Farm-2")
         "2"  # Trả về VM ID
     """
-    import json
-
-    if not os.path.exists(VM_DATA_DIR):
-        return None
+    # Import tại chỗ để tránh vòng import (vm_registry import config)
+    from utils.vm_registry import vm_registry
 
     try:
-        for filename in os.listdir(VM_DATA_DIR):
-            if not filename.endswith(".json"):
-                continue
-
-            filepath = os.path.join(VM_DATA_DIR, filename)
-            try:
-                with open(filepath, "r", encoding="utf-8") as f:
-                    data = json.load(f)
-
-                # Check if vm_name matches
-                if data.get("vm_name") == vm_name:
-                    # Return vm_id (filename without .json)
-                    return filename.replace(".json", "")
-            except Exception:
-                # Skip invalid JSON files
-                continue
+        return vm_registry.get_vm_id(vm_name)
     except Exception:
-        pass
-
-    return None
+        return None
 
 # ==================== ENSURE DIRECTORIES EXIST ====================
 def ensure_app_directories():
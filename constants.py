@@ -26,6 +26,138 @@ MAX_RETRY_POST_NOTIFICATION = 2700
 MAX_RETRY_VM_STATUS = 30
 MAX_RETRY_FIND_TAB = 10
 
+# Warm VM mode (giữ máy ảo chạy giữa các post liên tiếp)
+WARM_VM_MODE = False          # Mặc định tắt - bật trong tab Đặt lịch
+WARM_VM_IDLE_TTL = 300        # seconds - tắt máy ảo warm nếu rảnh quá lâu
+WARM_VM_BOOT_ESTIMATE = 60    # seconds - ước lượng cold boot khi chưa đo được
+WARM_VM_SHUTDOWN_ESTIMATE = 20  # seconds - ước lượng quit + chờ tắt khi chưa đo được
+
+# Boot admission (giới hạn số máy ảo khởi động cùng lúc)
+BOOT_MAX_CONCURRENCY = 8      # Trần tuyệt đối số VM boot đồng thời
+BOOT_STAGGER_SECONDS = 5      # Khoảng cách tối thiểu giữa 2 lần bắt đầu boot
+BOOT_TARGET_SECONDS = 60      # Thời gian boot mục tiêu - chậm hơn thì giảm concurrency
+BOOT_RAM_PER_VM_GB = 2.5      # RAM ước lượng cho 1 VM đang boot (DEFAULT_VM_MEMORY + overhead)
+BOOT_RAM_RESERVE_GB = 2       # RAM chừa lại cho hệ thống
+
+# Async post pipeline (utils/post_pipeline.py)
+PIPELINE_MAX_WORKERS = 16     # Thread cho các lệnh blocking (adb, uiautomator2, download)
+PIPELINE_STOP_POLL = 0.25     # seconds - chu kỳ kiểm tra yêu cầu dừng
+PIPELINE_LOCK_POLL = 0.5      # seconds - chu kỳ thử khóa VM / lấy lượt boot
+PIPELINE_STAGE_TIMEOUTS = {   # seconds - None = không giới hạn
+    "acquire": 5400,          # Chờ khóa máy ảo (1.5 giờ như trước)
+    "boot": 180,              # reboot/launch → VM status = 1 (không tính thời gian chờ lượt boot)
+    "adb_ready": 90,
+    "prefetch": 900,          # Tải video (chạy song song với boot)
+    "push": 300,
+    "verify": 120,
+    # auto_post tự giới hạn: bước UI trước Share + chờ upload (MAX_RETRY_POST_NOTIFICATION x WAIT_SHORT)
+    "post": 900 + MAX_RETRY_POST_NOTIFICATION * WAIT_SHORT,
+    "teardown": 180,
+}
+
+# Cancel token (utils/cancel_token.py)
+CANCEL_POLL_INTERVAL = 0.25   # seconds - mọi thao tác chờ trả về trong khoảng này khi bị dừng
+
+# MediaStore (utils/media_store.py) - xác nhận file đã được index thay vì sleep cố định
+MEDIA_INDEX_TIMEOUT = 15      # seconds - chờ tối đa MediaStore index file sau khi push
+MEDIA_INDEX_POLL = 0.5        # seconds - chu kỳ query content://media
+MEDIA_RESCAN_AFTER = 5        # seconds - file vẫn chưa được index → broadcast lại từng file (1 lần)
+ADB_PUSH_MAX_CMDLINE = 30000  # ký tự - chia batch push để không vượt giới hạn command line Windows
+
+# Verify sau khi push (utils/file_checker.verify_pushed_file) - size + mode + md5 trong 1 lệnh adb shell
+PUSH_VERIFY_RETRIES = 3       # lần thử nếu file chưa có / sai size (không retry khi sai hash)
+PUSH_VERIFY_RETRY_WAIT = 0.5  # seconds - chờ giữa 2 lần thử
+LOCAL_HASH_CACHE_SIZE = 256   # số file local giữ md5 trong cache (key: path + size + mtime)
+
+# Screenshot (utils/screenshot.py) - logs/screenshots/
+SCREENSHOT_FORMAT = "png"     # png / jpeg / webp (jpeg/webp cần Pillow - cài sẵn theo uiautomator2)
+SCREENSHOT_MAX_WIDTH = None   # px - thu nhỏ ảnh khi lưu (None = giữ nguyên độ phân giải)
+SCREENSHOT_QUALITY = 80       # jpeg/webp
+SCREENSHOT_KEEP_FILES = 500   # giữ tối đa số ảnh - cũ hơn thì xóa
+SCREENSHOT_KEEP_MB = 300      # giữ tối đa dung lượng thư mục ảnh
+SCREENSHOT_MIN_INTERVAL = 1.0  # seconds - chế độ chụp liên tục không chụp nhanh hơn mức này
+
+# Failure forensics (utils/forensics.py) - logs/forensics/
+FORENSICS_ENABLED = True
+FORENSICS_LOGCAT_LINES = 500  # dòng logcat gần nhất đưa vào bundle
+FORENSICS_STEPS = 200         # bước log gần nhất của InstagramPost đưa vào bundle
+FORENSICS_QUEUE_MAX = 4       # bundle chờ nén/ghi nền - đầy thì bỏ bundle mới (không chặn luồng đăng)
+FORENSICS_KEEP_BUNDLES = 300  # giữ tối đa số bundle - cũ hơn thì xóa
+
+# UI recorder (utils/ui_replay.py) - logs/ui_recordings/, phát lại offline: benchmarks/bench_ui_replay.py
+UI_RECORD_ENABLED = False     # bật khi cần thu bản ghi - mỗi lần dump hierarchy tốn thêm ~0.2-0.5s trên VM
+UI_RECORD_MIN_INTERVAL = 1.0  # seconds - màn hình chưa đổi do thao tác thì dump tối đa 1 lần / khoảng này
+UI_RECORD_KEEP = 50           # giữ tối đa số bản ghi mỗi flow - cũ hơn thì xóa
+
+# Selector (utils/ui_selector.py) - XPath đơn giản //*[@attr="..."] tra dict trên hierarchy đã index
+SELECTOR_INDEX_ENABLED = True
+SELECTOR_SNAPSHOT_TTL = 0.2   # seconds - truy vấn liền nhau dùng chung 1 lần dump (< CANCEL_POLL_INTERVAL)
+SELECTOR_CACHE_SIZE = 512     # số XPath đã compile giữ trong cache
+
+# Metrics (utils/metrics.py)
+METRICS_HTTP_ENABLED = True   # GET http://127.0.0.1:9464/metrics (Prometheus) và /summary (JSON)
+METRICS_HTTP_HOST = "127.0.0.1"
+METRICS_HTTP_PORT = 9464
+METRICS_CSV_ENABLED = True    # logs/metrics/metrics_YYYY-MM-DD.csv - 1 dòng mỗi lần đo
+METRICS_CSV_FLUSH_INTERVAL = 10  # seconds
+METRICS_CSV_KEEP_DAYS = 7
+
+# Trace log (utils/trace_log.py) - event JSONL theo từng post
+TRACE_LOG_ENABLED = True      # logs/trace/trace_YYYY-MM-DD.jsonl
+TRACE_FLUSH_INTERVAL = 1      # seconds - ghi theo lô
+TRACE_BATCH_SIZE = 500        # ghi ngay khi đủ số event này
+TRACE_KEEP_DAYS = 7
+TRACE_MEMORY_EVENTS = 100     # ring buffer RAM / post - cũ hơn thì spill xuống logs/trace/spill/
+TRACE_PAGE_SIZE = 200         # số event mỗi lần bấm "Tải log cũ hơn" trong cửa sổ log
+TRACE_SPILL_MAX_BYTES = 1024 * 1024  # spill file / post - quá thì giữ nửa mới nhất
+
+# Async logging (utils/async_logging.py)
+LOG_QUEUE_SIZE = 10000        # record chờ ghi tối đa - đầy thì bỏ DEBUG/INFO mới
+
+# Startup (core/app.py)
+LAZY_TAB_WARMUP_MS = 1500     # dựng PostTab (có scheduler) sau first paint dù chưa được chọn
+STARTUP_TARGET_SECONDS = 1.0  # mục tiêu import + first paint (benchmarks/bench_startup.py)
+
+# Headless daemon (daemon.py) - API JSON-RPC local: POST /rpc, GET /status, GET /events (SSE)
+DAEMON_HOST = "127.0.0.1"
+DAEMON_PORT = 8765
+DAEMON_ATTACH_GUI = True      # GUI thấy daemon đang chạy → chỉ làm thin client (không chạy scheduler riêng)
+DAEMON_CLIENT_TIMEOUT = 3     # seconds - timeout mỗi request của DaemonClient
+DAEMON_PING_TIMEOUT = 0.3     # seconds - GUI kiểm tra daemon lúc khởi động (không làm chậm first paint)
+DAEMON_POLL_INTERVAL_MS = 2000  # thin client làm mới bảng post/luồng
+DAEMON_SSE_KEEPALIVE = 15     # seconds - gửi comment giữ kết nối /events khi không có event
+POST_MAX_LATE_SECONDS = 600   # post trễ hơn giờ hẹn quá mức này thì bỏ qua (failed) thay vì đăng
+
+# Nhiều máy (daemon.py --role coordinator / agent) - coordinator giữ hàng đợi post, agent chạy VM local
+AGENT_HEARTBEAT_INTERVAL = 5  # seconds - agent gửi heartbeat (VM, chỗ trống, job đang chạy, kết quả, log)
+AGENT_MAX_JOBS = 4            # job chạy đồng thời tối đa / agent (mặc định của --capacity)
+AGENT_LOG_BATCH_MAX = 2000    # dòng log chờ gửi lên coordinator tối đa (đầy thì bỏ dòng cũ nhất)
+COORD_HOST_TIMEOUT = 20       # seconds - không nhận heartbeat quá lâu → host coi như chết, không giao thêm
+COORD_LEASE_TTL = 60          # seconds - lease của post, gia hạn mỗi heartbeat; hết hạn → thu hồi, giao lại
+COORD_MAX_REASSIGN = 3        # số lần thu hồi lease tối đa / post trước khi đánh dấu failed
+
+# Khóa máy ảo (utils/vm_lock.py) - lease có hạn + fencing token thay cho threading.Lock trong RAM
+VM_LOCK_BACKEND = "file"      # "memory" (1 process) / "file" (data/locks/*.json) / "sqlite" (data/locks/vm_locks.db)
+VM_LOCK_TTL = 90              # seconds - lease hết hạn nếu không được gia hạn (process chết / treo)
+VM_LOCK_RENEW_INTERVAL = 20   # seconds - chu kỳ gia hạn lease đang giữ (phải nhỏ hơn nhiều so với VM_LOCK_TTL)
+VM_LOCK_FILE_TIMEOUT = 30     # seconds - chờ OS file lock (<vm>.lock) tối đa trước khi báo lỗi
+# Hàng chờ VM: nhiều job chờ 1 VM → ưu tiên cao hơn được trước, chờ lâu được cộng điểm (aging)
+VM_PRIORITY_SCHEDULED = 100   # post hẹn giờ (PostTab / coordinator) - đúng giờ quan trọng hơn
+VM_PRIORITY_STREAM = 50       # luồng theo dõi xả backlog video
+VM_PRIORITY_AGING_PER_MIN = 5  # điểm cộng mỗi phút chờ → luồng chờ 10 phút ngang post hẹn giờ vừa tới
+VM_WAITER_STALE_SECONDS = 30  # job không poll quá lâu (chết / bị hủy) bị bỏ khỏi hàng chờ
+
+# Lên lịch hàng loạt (utils/schedule_optimizer.py) - xếp khung giờ theo thời gian đo được của từng VM
+SCHEDULE_DEFAULT_POST_SECONDS = 240  # ước lượng 1 post (adb_ready → teardown) khi VM chưa đo được
+SCHEDULE_SAFETY_SECONDS = 180  # optimizer chỉ xếp video bắt đầu kịp trước POST_MAX_LATE_SECONDS - khoảng này
+SCHEDULE_MAX_DAYS = 365       # số ngày khung giờ tối đa optimizer xét
+
+# Tự cân bằng máy ảo (utils/vm_balancer.py) - "Đặt máy ảo hàng loạt" chia video theo tải + độ ổn định của VM
+ACCOUNT_MAX_POSTS_PER_DAY = 10  # post tối đa / tài khoản (VM) / ngày khi tự chia - 0 = không giới hạn
+VM_HEALTH_WINDOW = 10         # số kết quả đăng gần nhất của VM dùng tính tỉ lệ thành công
+VM_FAILOVER_AFTER = 3         # thất bại liên tiếp → VM coi là lỗi: không chia thêm, post tự chia được chuyển đi
+VM_MIN_SUCCESS_RATE = 0.5     # tỉ lệ thành công (đủ VM_HEALTH_WINDOW / 2 mẫu) dưới mức này cũng coi là lỗi
+
 # Intervals
 VM_STATUS_CHECK_INTERVAL = 2  # seconds between VM status checks
 DOWNLOAD_CHECK_INTERVAL = 2   # seconds between download progress checks
@@ -113,6 +245,7 @@ TWOFA_API_URL = "https://2fa.live/tok/{key}"
 VIDEO_TEMP_DIR = "temp"
 VIDEO_DOWNLOAD_DIR = "downloads"
 DCIM_PATH = "/sdcard/DCIM"  # Android DCIM path
+PICTURES_PATH = "/sdcard/Pictures"  # Instagram lưu ảnh/video đã xử lý ở đây
 
 # ==================== CHROME/BROWSER ====================
 CHROME_PACKAGE = "com.android.chrome"
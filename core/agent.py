@@ -0,0 +1,203 @@
+"""
+Host Agent - Chạy post do coordinator giao trên VM của máy này.
+
+Agent không giữ hàng đợi: mỗi AGENT_HEARTBEAT_INTERVAL gọi coordinator.heartbeat với
+VM local (`ldconsole list2`), capacity, job đang chạy (kèm lease), kết quả + log mới,
+nhận lại post cần chạy và job cần dừng. Job chạy qua post_pipeline như daemon/GUI thường
+(VMManager khóa VM, boot admission, warm VM... giữ nguyên trên từng máy).
+
+Mất kết nối coordinator: job đang chạy vẫn chạy tiếp, kết quả/log được giữ lại và gửi ở
+heartbeat thành công kế tiếp (lease có thể đã bị thu hồi → coordinator bỏ qua).
+
+simulate=<giây>: không đăng thật - launch VM, đợi ldconsole báo chạy, kiểm tra adb, chờ,
+quit VM (chạy thử nhiều agent trên 1 máy với ldconsole/adb giả, xem benchmarks/sim_farm.py).
+"""
+import time
+import socket
+import logging
+import threading
+import subprocess
+from collections import deque
+
+from config import LDCONSOLE_EXE, ADB_EXE
+from constants import AGENT_HEARTBEAT_INTERVAL, AGENT_MAX_JOBS, AGENT_LOG_BATCH_MAX, CANCEL_POLL_INTERVAL, VM_PRIORITY_SCHEDULED
+from utils.daemon_client import DaemonClient, DaemonError
+from utils.post_pipeline import post_pipeline, PostJob, OUTCOME_POSTED, OUTCOME_FAILED, OUTCOME_STOPPED
+from utils.trace_log import trace_log
+from utils.vm_lock import vm_locks
+from utils.vm_manager import VMManager
+
+# Đọc lại danh sách VM local (ldconsole list2) sau mỗi khoảng này
+VM_REFRESH_INTERVAL = 60
+
+
+class HostAgent:
+    """1 máy trong farm nhiều máy"""
+
+    def __init__(self, coordinator: DaemonClient, host_id: str = None, capacity: int = AGENT_MAX_JOBS,
+                 simulate: float = None):
+        self.coordinator = coordinator
+        self.host_id = host_id or socket.gethostname()
+        self.capacity = capacity
+        self.simulate = simulate
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._jobs = {}  # {post_id: {"lease", "stop": Event}}
+        self._results = deque()
+        self._logs = deque(maxlen=AGENT_LOG_BATCH_MAX)
+        self._vms = []
+        self._vms_at = 0.0
+        self._stop_event = threading.Event()
+        self._connected = None  # None = chưa heartbeat lần nào
+
+    # ==================== VM LOCAL ====================
+    def discover_vms(self) -> list:
+        """Tên VM trên máy này (cache VM_REFRESH_INTERVAL giây)"""
+        if self._vms and time.monotonic() - self._vms_at < VM_REFRESH_INTERVAL:
+            return self._vms
+        try:
+            result = subprocess.run(
+                [LDCONSOLE_EXE, "list2"],
+                capture_output=True,
+                text=True,
+                creationflags=subprocess.CREATE_NO_WINDOW,
+                timeout=10
+            )
+            # Format: index,name,title,top_window,running,pid
+            self._vms = [parts[1].strip() for parts in (line.split(",") for line in result.stdout.splitlines())
+                         if len(parts) >= 5 and parts[1].strip()]
+            self._vms_at = time.monotonic()
+        except Exception as e:
+            self.logger.warning(f"⚠️ Không đọc được danh sách VM (ldconsole list2): {e}")
+        return self._vms
+
+    # ==================== LOOP ====================
+    def run(self):
+        """Block tới khi stop() - heartbeat liên tục"""
+        self.logger.info(f"🖥️ Agent {self.host_id} → {self.coordinator.base_url} "
+                         f"(capacity={self.capacity}{', giả lập' if self.simulate else ''})")
+        interval = AGENT_HEARTBEAT_INTERVAL
+        while not self._stop_event.is_set():
+            interval = self.heartbeat() or interval
+            self._stop_event.wait(interval)
+
+    def stop(self):
+        self._stop_event.set()
+
+    def heartbeat(self):
+        """1 lần gửi trạng thái + nhận việc. Returns: interval coordinator yêu cầu (None nếu lỗi)"""
+        with self._lock:
+            running = [{"post_id": post_id, "lease": entry["lease"]} for post_id, entry in self._jobs.items()]
+            results = list(self._results)
+            logs = list(self._logs)
+            self._results.clear()
+            self._logs.clear()
+        try:
+            response = self.coordinator.call(
+                "heartbeat", host_id=self.host_id, vms=self.discover_vms(), capacity=self.capacity,
+                running=running, results=results, logs=logs
+            )
+        except DaemonError as e:
+            # Giữ lại để gửi lần sau (log cũ nhất bị bỏ nếu quá AGENT_LOG_BATCH_MAX)
+            with self._lock:
+                self._results.extendleft(reversed(results))
+                self._logs.extendleft(reversed(logs))
+            if self._connected is not False:
+                self.logger.warning(f"⚠️ Mất kết nối coordinator: {e}")
+            self._connected = False
+            return None
+
+        if self._connected is False:
+            self.logger.info("✅ Đã kết nối lại coordinator")
+        self._connected = True
+        for post_id in response.get("cancel", []):
+            self.cancel_job(post_id)
+        for assignment in response.get("assign", []):
+            self.start_job(assignment)
+        return response.get("interval")
+
+    # ==================== JOB ====================
+    def start_job(self, assignment: dict):
+        post_id = assignment["post_id"]
+        lease = assignment["lease"]
+        with self._lock:
+            if post_id in self._jobs:
+                return
+            entry = self._jobs[post_id] = {"lease": lease, "stop": threading.Event()}
+
+        def log(msg, level="INFO", kind="log", **fields):
+            trace_log.event(post_id, msg, level=level, kind=kind, **fields)
+            if kind == "log" and msg is not None:
+                self._logs.append([post_id, lease, level, msg, fields.get("stage")])
+
+        job = PostJob(
+            job_id=post_id,
+            vm_name=assignment["vm_name"],
+            source=assignment["source"],
+            title=assignment["title"],
+            log=log,
+            stop_check=entry["stop"].is_set,
+            caller=f"Agent:{self.host_id}",
+            priority=VM_PRIORITY_SCHEDULED,
+            deadline=assignment.get("deadline"),
+        )
+        log(f"🖥️ Máy {self.host_id} nhận post (lease {lease})")
+        if self.simulate:
+            threading.Thread(target=self._simulate, args=(job, entry), daemon=True,
+                             name=f"Simulate:{post_id}").start()
+        else:
+            post_pipeline.submit(job, on_done=lambda done: self._on_done(post_id, entry, done))
+
+    def cancel_job(self, post_id):
+        with self._lock:
+            entry = self._jobs.get(post_id)
+        if entry is not None:
+            entry["stop"].set()
+            if not self.simulate:
+                post_pipeline.cancel(post_id)
+
+    def _on_done(self, post_id, entry, job: PostJob):
+        with self._lock:
+            if self._jobs.get(post_id) is entry:
+                del self._jobs[post_id]
+            self._results.append({
+                "post_id": post_id, "lease": entry["lease"],
+                "outcome": job.outcome, "failed_stage": job.failed_stage,
+            })
+
+    def _simulate(self, job: PostJob, entry: dict):
+        """Job giả: launch → chờ VM chạy → adb devices → chờ self.simulate giây → quit"""
+        try:
+            subprocess.run([LDCONSOLE_EXE, "launch", "--name", job.vm_name],
+                           creationflags=subprocess.CREATE_NO_WINDOW, timeout=10)
+            status = VMManager.query_vm_status(job.vm_name, LDCONSOLE_EXE)
+            VMManager.query_adb_state("emulator-5554", ADB_EXE)
+            job.log(f"🧪 Giả lập đăng trên {job.vm_name} (status={status})")
+            deadline = time.monotonic() + self.simulate
+            while time.monotonic() < deadline:
+                if entry["stop"].wait(CANCEL_POLL_INTERVAL):
+                    job.outcome = OUTCOME_STOPPED
+                    break
+            else:
+                job.outcome = OUTCOME_POSTED if status == "1" else OUTCOME_FAILED
+                job.failed_stage = None if status == "1" else "boot"
+            subprocess.run([LDCONSOLE_EXE, "quit", "--name", job.vm_name],
+                           creationflags=subprocess.CREATE_NO_WINDOW, timeout=10)
+        except Exception as e:
+            job.outcome = OUTCOME_FAILED
+            job.failed_stage = "boot"
+            job.log(f"❌ Lỗi giả lập: {e}", level="ERROR")
+        self._on_done(job.job_id, entry, job)
+
+    def shutdown(self):
+        """Dừng heartbeat, dừng job đang chạy, báo kết quả lần cuối"""
+        self.stop()
+        with self._lock:
+            entries = list(self._jobs.values())
+        for entry in entries:
+            entry["stop"].set()
+        if not self.simulate:
+            post_pipeline.shutdown(timeout=10)
+            vm_locks.shutdown()
+        self.heartbeat()
+        self.logger.info(f"✅ Agent {self.host_id} đã dừng")
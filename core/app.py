@@ -2,9 +2,12 @@ import customtkinter as ctk
 from tkinter import ttk  # For Treeview styling
 from ui_theme import *
 
-from tabs.tab_users import UsersTab
-from tabs.tab_post import PostTab
-from tabs.tab_follow import FollowTab
+from constants import LAZY_TAB_WARMUP_MS, DAEMON_ATTACH_GUI
+
+TAB_USERS = "👤 Quản lý VM & Tài khoản"
+TAB_POST = "📅 Đặt lịch đăng bài"
+TAB_FOLLOW = "▶️ Theo dõi & Tự động"
+TAB_DAEMON = "🛰️ Daemon"
 
 
 class App(ctk.CTk):
@@ -69,30 +72,79 @@ class App(ctk.CTk):
             segmented_button_unselected_color=COLORS["surface_2"],
             segmented_button_unselected_hover_color=COLORS["surface_3"],
             text_color=COLORS["text_primary"],
-            text_color_disabled=COLORS["disabled"]
+            text_color_disabled=COLORS["disabled"],
+            command=self.on_tab_changed
         )
         self.tabview.pack(fill="both", expand=True, padx=DIMENSIONS["spacing_lg"], pady=DIMENSIONS["spacing_lg"])
 
-        # Add 3 tabs with icons
-        tab1 = self.tabview.add("👤 Quản lý VM & Tài khoản")
-        tab2 = self.tabview.add("📅 Đặt lịch đăng bài")
-        tab3 = self.tabview.add("▶️ Theo dõi & Tự động")
+        # 🛰️ Daemon (daemon.py) đang chạy → GUI chỉ làm thin client, không chạy scheduler/luồng riêng
+        self.daemon_client = None
+        if DAEMON_ATTACH_GUI:
+            from utils.daemon_client import DaemonClient
+            client = DaemonClient()
+            if client.is_alive():
+                self.daemon_client = client
+                self.title("Instagram Automation Tool (daemon)")
+
+        # Add tabs with icons
+        # ⚡ Nội dung tab dựng lười: chỉ tab mặc định dựng ngay, tab khác dựng khi được chọn lần đầu
+        # (import tab_post/tab_follow kéo theo API manager, TikTok/YouTube modules...)
+        self.tab_frames = {TAB_USERS: self.tabview.add(TAB_USERS)}
+        self.tab_builders = {TAB_USERS: self._build_users_tab}
+        if self.daemon_client:
+            self.tab_frames[TAB_DAEMON] = self.tabview.add(TAB_DAEMON)
+            self.tab_builders[TAB_DAEMON] = self._build_daemon_tab
+        else:
+            self.tab_frames[TAB_POST] = self.tabview.add(TAB_POST)
+            self.tab_frames[TAB_FOLLOW] = self.tabview.add(TAB_FOLLOW)
+            self.tab_builders[TAB_POST] = self._build_post_tab
+            self.tab_builders[TAB_FOLLOW] = self._build_follow_tab
+
+        # Set default tab
+        self.tabview.set(TAB_USERS)
+        self.ensure_tab(TAB_USERS)
+
+        # PostTab chạy scheduler → dựng sau first paint dù user chưa mở tab
+        if not self.daemon_client:
+            self.after(LAZY_TAB_WARMUP_MS, lambda: self.ensure_tab(TAB_POST))
+
+        # ✅ Register cleanup handler khi đóng window
+        self.protocol("WM_DELETE_WINDOW", self.on_closing)
+
+    def on_tab_changed(self):
+        """Dựng nội dung tab ở lần đầu được chọn"""
+        self.ensure_tab(self.tabview.get())
 
-        # Create tab contents and store references for cleanup
-        self.users_tab = UsersTab(tab1)
+    def ensure_tab(self, name):
+        """Dựng tab `name` nếu chưa dựng (gọi nhiều lần không sao)"""
+        builder = self.tab_builders.pop(name, None)
+        if builder is None:
+            return
+        import logging
+        import time
+        start = time.perf_counter()
+        builder(self.tab_frames[name])
+        logging.getLogger(__name__).info(f"🧩 Dựng tab {name}: {time.perf_counter() - start:.2f}s")
+
+    def _build_users_tab(self, parent):
+        from tabs.tab_users import UsersTab
+        self.users_tab = UsersTab(parent)
         self.users_tab.pack(fill="both", expand=True)
 
-        self.post_tab = PostTab(tab2)
+    def _build_post_tab(self, parent):
+        from tabs.tab_post import PostTab
+        self.post_tab = PostTab(parent)
         self.post_tab.pack(fill="both", expand=True)
 
-        self.follow_tab = FollowTab(tab3)
+    def _build_follow_tab(self, parent):
+        from tabs.tab_follow import FollowTab
+        self.follow_tab = FollowTab(parent)
         self.follow_tab.pack(fill="both", expand=True)
 
-        # Set default tab
-        self.tabview.set("👤 Quản lý VM & Tài khoản")
-
-        # ✅ Register cleanup handler khi đóng window
-        self.protocol("WM_DELETE_WINDOW", self.on_closing)
+    def _build_daemon_tab(self, parent):
+        from tabs.tab_daemon import DaemonTab
+        self.daemon_tab = DaemonTab(parent, client=self.daemon_client)
+        self.daemon_tab.pack(fill="both", expand=True)
 
     def on_closing(self):
         """
@@ -116,15 +168,44 @@ class App(ctk.CTk):
                 logger.info("🔧 Cleanup FollowTab...")
                 self.follow_tab.cleanup()
 
+            # Thin client: chỉ ngừng poll (daemon vẫn chạy)
+            if hasattr(self, 'daemon_tab'):
+                self.daemon_tab.cleanup()
+
             # Cleanup UsersTab (nếu cần)
             if hasattr(self, 'users_tab') and hasattr(self.users_tab, 'cleanup'):
                 logger.info("🔧 Cleanup UsersTab...")
                 self.users_tab.cleanup()
 
+            # Dừng post pipeline (dùng chung cho PostTab + FollowTab)
+            from utils.post_pipeline import post_pipeline
+            logger.info("🔧 Dừng post pipeline...")
+            post_pipeline.shutdown(timeout=10)
+
+            # Nhả lease VM còn giữ (instance khác không phải chờ hết VM_LOCK_TTL)
+            from utils.vm_lock import vm_locks
+            vm_locks.shutdown()
+
+            # Ghi nốt metrics CSV + log bảng stage chậm nhất
+            from utils.metrics import metrics
+            metrics.shutdown()
+
+            # Ghi nốt trace log JSONL
+            from utils.trace_log import trace_log
+            trace_log.shutdown()
+
+            # Ghi nốt forensics bundle đang chờ
+            from utils.forensics import forensics
+            forensics.shutdown()
+
             logger.info("=" * 60)
             logger.info("✅ CLEANUP HOÀN TẤT - ĐÓNG APP")
             logger.info("=" * 60)
 
+            # Ghi nốt log còn trong queue (listener thread)
+            from utils.async_logging import stop_async_logging
+            stop_async_logging()
+
         except Exception as e:
             logger.exception(f"❌ Lỗi trong on_closing: {e}")
         finally:
@@ -0,0 +1,321 @@
+"""
+Coordinator - Hàng đợi post trung tâm, chia việc cho nhiều máy (host agent) theo VM.
+
+Trước đây 1 process trên 1 máy Windows chạy mọi VM trong `ldconsole list2` → số VM bị giới
+hạn bởi 1 máy. Coordinator giữ scheduled_posts.json + API của FarmDaemon (GUI thin client,
+add_post, list_posts, get_logs... dùng y như daemon thường), nhưng không tự đăng: mỗi agent
+(core/agent.py) chạy trên 1 máy, bọc VMManager + post pipeline cho VM của máy đó.
+
+Giao việc theo mô hình pull (agent gọi coordinator, coordinator không cần kết nối ngược):
+- Agent gửi heartbeat mỗi AGENT_HEARTBEAT_INTERVAL: VM của máy, capacity, job đang chạy
+  (kèm lease), kết quả job xong, log mới
+- Coordinator trả về: post đến giờ giao cho agent + danh sách job phải dừng
+- Post chỉ giao cho agent có VM đó; nhiều agent cùng có VM → agent còn nhiều chỗ trống nhất.
+  Mỗi vm_name chỉ có 1 lease tại 1 thời điểm (không chạy song song 1 tài khoản trên 2 máy)
+- Lease: hết hạn sau COORD_LEASE_TTL nếu không được gia hạn (host chết / mất mạng) →
+  thu hồi, post về "pending" để giao lại (tối đa COORD_MAX_REASSIGN lần)
+- Kết quả / log gửi kèm lease cũ (đã bị thu hồi) bị bỏ qua, agent được yêu cầu dừng job đó
+
+⚠️ Lease hết hạn do mất mạng (host vẫn sống) thì host cũ có thể vẫn đang đăng dở - đặt
+COORD_LEASE_TTL lớn hơn nhiều so với chu kỳ heartbeat.
+⚠️ video_path của post phải đọc được từ máy agent (ổ mạng dùng chung) hoặc là URL.
+Coordinator không chạy luồng theo dõi (Stream) - luồng vẫn chạy bằng daemon/GUI thường.
+
+Sử dụng:
+    python daemon.py --role coordinator --host 0.0.0.0
+    python daemon.py --role agent --coordinator http://10.0.0.5:8765 --host-id PC-01
+"""
+import time
+import itertools
+from datetime import datetime
+
+from constants import (
+    AGENT_HEARTBEAT_INTERVAL, COORD_HOST_TIMEOUT, COORD_LEASE_TTL, COORD_MAX_REASSIGN,
+    POST_MAX_LATE_SECONDS
+)
+from core.daemon import FarmDaemon, RPCError
+from core.scheduler import VN_TZ, save_scheduled_posts
+from utils.metrics import metrics
+from utils.post_pipeline import OUTCOME_POSTED, OUTCOME_STOPPED
+
+
+class AgentInfo:
+    """Trạng thái 1 host agent theo heartbeat gần nhất"""
+
+    __slots__ = ("host_id", "vms", "capacity", "free", "last_seen", "alive", "posted", "failed")
+
+    def __init__(self, host_id):
+        self.host_id = host_id
+        self.vms = frozenset()
+        self.capacity = 0
+        self.free = 0  # capacity - job đang chạy - job vừa giao
+        self.last_seen = 0.0
+        self.alive = False
+        self.posted = 0
+        self.failed = 0
+
+
+class Lease:
+    """Post đang giao cho 1 agent - lease_id tăng dần, kết quả mang lease cũ bị bỏ qua"""
+
+    __slots__ = ("lease_id", "post_id", "host_id", "vm_name", "expires", "confirmed")
+
+    def __init__(self, lease_id, post_id, host_id, vm_name, expires):
+        self.lease_id = lease_id
+        self.post_id = post_id
+        self.host_id = host_id
+        self.vm_name = vm_name
+        self.expires = expires
+        self.confirmed = False  # agent đã báo đang chạy ít nhất 1 lần
+
+
+class Coordinator(FarmDaemon):
+    """FarmDaemon giao post cho agent thay vì tự đăng"""
+
+    def __init__(self):
+        super().__init__()
+        self.agents = {}  # {host_id: AgentInfo}
+        self.leases = {}  # {post_id: Lease}
+        self._reassigns = {}  # {post_id: số lần bị thu hồi lease}
+        self._cancels = {}  # {host_id: [post_id]} - gửi kèm heartbeat kế tiếp
+        self._dirty = False  # có thay đổi post chưa lưu
+        # ms lúc khởi động → lease của lần chạy trước không trùng lease mới
+        self._lease_ids = itertools.count(int(time.time() * 1000))
+        self._methods["heartbeat"] = self.rpc_heartbeat
+        self._methods["list_agents"] = self.rpc_list_agents
+
+    def start_scheduler(self):
+        self.logger.info(f"🛰️ Coordinator: {len(self.posts)} post, chờ agent kết nối")
+
+    def load_streams(self, start_streams: bool):
+        if start_streams:
+            self.logger.warning("⚠️ Coordinator không chạy luồng theo dõi - bỏ qua --start-streams")
+
+    def _running_ids(self) -> set:
+        return set(self.leases)
+
+    def _resolve_vm(self, vm_name: str) -> str:
+        """VM có thể chỉ nằm trên máy agent (không có trong data/vm của coordinator)"""
+        try:
+            return super()._resolve_vm(vm_name)
+        except RPCError:
+            with self.posts_lock:
+                if any(vm_name in a.vms for a in self.agents.values()):
+                    return vm_name
+            raise
+
+    # ==================== HEARTBEAT ====================
+    def rpc_heartbeat(self, host_id, vms, capacity, running=(), results=(), logs=()):
+        """
+        Agent báo trạng thái, nhận việc mới.
+
+        Args:
+            host_id: Tên agent (duy nhất)
+            vms: Tên các VM của máy agent (ldconsole list2)
+            capacity: Số job chạy đồng thời tối đa
+            running: [{"post_id", "lease"}] job đang chạy
+            results: [{"post_id", "lease", "outcome", "failed_stage"}] job đã xong
+            logs: [[post_id, lease, level, msg, stage]] log mới của các job
+
+        Returns:
+            {"assign": [...], "cancel": [post_id], "interval": giây tới heartbeat sau}
+        """
+        now = time.time()
+        with self.posts_lock:
+            agent = self.agents.get(host_id)
+            if agent is None:
+                agent = self.agents[host_id] = AgentInfo(host_id)
+                self.logger.info(f"🖥️ Agent mới: {host_id} ({len(vms)} VM, capacity={capacity})")
+            elif not agent.alive:
+                self.logger.info(f"🖥️ Agent {host_id} kết nối lại")
+            agent.vms = frozenset(vms)
+            agent.capacity = int(capacity)
+            agent.last_seen = now
+            agent.alive = True
+
+            posts = {p.id: p for p in self.posts}
+            changed = False
+            cancel = self._cancels.pop(host_id, [])
+
+            for post_id, lease_id, level, msg, stage in logs:
+                lease = self.leases.get(post_id)
+                post = posts.get(post_id)
+                if post is not None and lease is not None and lease.lease_id == lease_id:
+                    post.log(msg, level=level, stage=stage, host=host_id)
+
+            for result in results:
+                lease = self._own_lease(host_id, result)
+                if lease is None:
+                    continue  # Lease đã bị thu hồi / giao cho agent khác
+                self._finish(lease, posts.get(lease.post_id), result, agent)
+                changed = True
+
+            reported = set()
+            for item in running:
+                lease = self._own_lease(host_id, item)
+                if lease is None:
+                    cancel.append(item["post_id"])
+                    continue
+                lease.expires = now + COORD_LEASE_TTL
+                lease.confirmed = True
+                reported.add(lease.post_id)
+
+            # Lease đã xác nhận mà agent không còn báo (agent restart, mất job) → giao lại ngay
+            for lease in [l for l in self.leases.values() if l.host_id == host_id]:
+                if lease.confirmed and lease.post_id not in reported:
+                    self._requeue(lease, posts.get(lease.post_id), f"agent {host_id} không còn chạy job")
+                    changed = True
+
+            agent.free = agent.capacity - len(reported) - sum(
+                1 for l in self.leases.values() if l.host_id == host_id and not l.confirmed)
+            assign = self._assign(agent, now)
+            if changed or assign or self._dirty:
+                self._dirty = False
+                save_scheduled_posts(self.posts)
+
+        return {"assign": assign, "cancel": cancel, "interval": AGENT_HEARTBEAT_INTERVAL}
+
+    def _own_lease(self, host_id, item):
+        """Lease hiện tại của post nếu đúng agent + đúng lease_id, ngược lại None"""
+        lease = self.leases.get(item.get("post_id"))
+        if lease is None or lease.host_id != host_id or lease.lease_id != item.get("lease"):
+            return None
+        return lease
+
+    def _assign(self, agent: AgentInfo, now: float) -> list:
+        """Chọn post đến giờ cho agent (gọi khi đang giữ posts_lock) - post quá trễ bị đánh dấu failed"""
+        if agent.free <= 0:
+            return []
+        now_vn = datetime.now(VN_TZ)
+        busy_vms = {lease.vm_name for lease in self.leases.values()}
+        live = [a for a in self.agents.values() if a.alive]
+        assign = []
+
+        due = [p for p in self.posts
+               if p.status == "pending" and not p.is_paused and p.id not in self.leases
+               and p.vm_name in agent.vms and p.vm_name not in busy_vms
+               and p.scheduled_time_vn and p.scheduled_time_vn <= now_vn]
+        due.sort(key=lambda p: p.scheduled_time_vn)
+
+        for post in due:
+            if agent.free <= 0:
+                break
+            if post.vm_name in busy_vms:
+                continue
+            late = (now_vn - post.scheduled_time_vn).total_seconds()
+            if late > POST_MAX_LATE_SECONDS:
+                self.logger.warning(f"Post {post.id} quá cũ ({late/60:.1f} phút), bỏ qua")
+                post.log(f"⏰ Post quá cũ (trễ {late/60:.1f} phút), tự động bỏ qua")
+                post.status = "failed"
+                post.is_paused = True
+                self._dirty = True
+                continue
+
+            # VM có trên nhiều máy → nhường agent còn nhiều chỗ trống hơn
+            best = max((a for a in live if post.vm_name in a.vms and a.free > 0),
+                       key=lambda a: (a.free, a is agent), default=agent)
+            if best is not agent:
+                continue
+
+            lease = Lease(next(self._lease_ids), post.id, agent.host_id, post.vm_name, now + COORD_LEASE_TTL)
+            self.leases[post.id] = lease
+            busy_vms.add(post.vm_name)
+            agent.free -= 1
+            post.status = "processing"
+            post.stop_requested = False
+            post.log(f"🛰️ Giao cho máy {agent.host_id} (lease {lease.lease_id})", host=agent.host_id)
+            metrics.observe("post_start_delay_seconds", max(0.0, late), vm=post.vm_name)
+            assign.append({
+                "post_id": post.id, "lease": lease.lease_id, "vm_name": post.vm_name,
+                "source": post.video_path, "title": post.title,
+                "deadline": post.scheduled_time_vn.timestamp() + POST_MAX_LATE_SECONDS,
+            })
+        return assign
+
+    def _finish(self, lease: Lease, post, result: dict, agent: AgentInfo):
+        del self.leases[lease.post_id]
+        self._reassigns.pop(lease.post_id, None)
+        if post is None:
+            return  # Post đã bị xóa trong lúc chạy
+        outcome = result.get("outcome")
+        if outcome == OUTCOME_POSTED:
+            post.status = "posted"
+            post.log(f"✅ Hoàn tất! (máy {agent.host_id})", host=agent.host_id)
+            agent.posted += 1
+        else:
+            post.status = "failed"
+            if outcome == OUTCOME_STOPPED:
+                post.is_paused = True
+            post.log(f"❌ Thất bại trên máy {agent.host_id} (bước {result.get('failed_stage')})",
+                     level="ERROR", host=agent.host_id)
+            agent.failed += 1
+
+    def _requeue(self, lease: Lease, post, reason: str):
+        """Thu hồi lease, post về pending để giao lại (gọi khi đang giữ posts_lock)"""
+        self.leases.pop(lease.post_id, None)
+        if post is None:
+            return
+        count = self._reassigns[post.id] = self._reassigns.get(post.id, 0) + 1
+        if post.stop_requested or count > COORD_MAX_REASSIGN:
+            post.status = "failed"
+            post.is_paused = True
+            self._reassigns.pop(post.id, None)
+            post.log(f"❌ Thu hồi lease ({reason}) - không giao lại", level="ERROR")
+        else:
+            post.status = "pending"
+            post.log(f"⚠️ Thu hồi lease {lease.lease_id} ({reason}) - giao lại lần {count}", level="WARNING")
+        self.logger.warning(f"⚠️ Thu hồi lease post {post.id} trên {lease.host_id}: {reason}")
+
+    def tick(self):
+        """Đánh dấu agent chết + thu hồi lease hết hạn (mỗi giây)"""
+        super().tick()
+        now = time.time()
+        with self.posts_lock:
+            for agent in self.agents.values():
+                if agent.alive and now - agent.last_seen > COORD_HOST_TIMEOUT:
+                    agent.alive = False
+                    self.logger.warning(f"💀 Agent {agent.host_id} mất heartbeat "
+                                        f"{now - agent.last_seen:.0f}s - ngừng giao việc")
+            expired = [lease for lease in self.leases.values() if lease.expires < now]
+            if not expired:
+                return
+            posts = {p.id: p for p in self.posts}
+            for lease in expired:
+                self._requeue(lease, posts.get(lease.post_id), f"lease hết hạn trên {lease.host_id}")
+            save_scheduled_posts(self.posts)
+
+    # ==================== RPC ====================
+    def rpc_stop_post(self, post_id):
+        info = super().rpc_stop_post(post_id)
+        with self.posts_lock:
+            lease = self.leases.get(post_id)
+            if lease is not None:
+                self._cancels.setdefault(lease.host_id, []).append(post_id)
+        return info
+
+    def rpc_delete_post(self, post_id):
+        if post_id in self.leases:
+            raise RPCError("Không thể xóa post đang chạy trên agent")
+        return super().rpc_delete_post(post_id)
+
+    def rpc_list_agents(self):
+        now = time.time()
+        with self.posts_lock:
+            return [{
+                "host_id": a.host_id,
+                "alive": a.alive,
+                "last_seen": round(now - a.last_seen, 1),
+                "vms": sorted(a.vms),
+                "capacity": a.capacity,
+                "free": a.free,
+                "leases": [l.post_id for l in self.leases.values() if l.host_id == a.host_id],
+                "posted": a.posted,
+                "failed": a.failed,
+            } for a in self.agents.values()]
+
+    def rpc_status(self):
+        status = super().rpc_status()
+        with self.posts_lock:
+            status["agents"] = len(self.agents)
+            status["alive_agents"] = sum(1 for a in self.agents.values() if a.alive)
+        return status
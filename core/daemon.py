@@ -0,0 +1,510 @@
+"""
+Farm Daemon - Chạy scheduler đăng bài + luồng theo dõi không cần GUI.
+
+Trước đây toàn bộ lịch đăng nằm trong widget PostTab / FollowTab: đóng GUI là farm dừng,
+và mainloop Tk tranh GIL với các worker. Daemon dùng lại đúng PostScheduler, ScheduledPost
+(core/scheduler.py) và Stream (core/streams.py) như 2 tab nhưng không import tkinter.
+
+API local (chỉ bind 127.0.0.1):
+- POST /rpc      JSON-RPC 2.0: {"jsonrpc": "2.0", "id": 1, "method": "list_posts", "params": {...}}
+- GET  /status   JSON tóm tắt (số post theo trạng thái, luồng đang chạy)
+- GET  /events   Server-Sent Events: mọi trace event mới (?trace=<post id | stream:<id>> để lọc)
+
+Method RPC: ping, status, list_posts, add_post, update_post, set_paused, stop_post,
+delete_post, list_vms, vm_waiters, list_streams, start_stream, stop_stream, get_logs
+
+Sử dụng:
+    python daemon.py                          # xem daemon.py
+    curl -s localhost:8765/rpc -d '{"jsonrpc":"2.0","id":1,"method":"list_posts"}'
+    curl -N localhost:8765/events?trace=post_1700000000000_0
+
+⚠️ Không chạy daemon cùng lúc với GUI ở chế độ thường (2 scheduler cùng đọc/ghi
+scheduled_posts.json). GUI tự chuyển sang thin client khi thấy daemon đang chạy.
+"""
+import os
+import json
+import time
+import queue
+import logging
+import threading
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from constants import DAEMON_HOST, DAEMON_PORT, DAEMON_SSE_KEEPALIVE, TRACE_PAGE_SIZE
+from utils.trace_log import trace_log
+from core.scheduler import (
+    VN_TZ, ScheduledPost, PostScheduler, parse_vn_time, load_scheduled_posts,
+    save_scheduled_posts, reset_posts_after_restart, get_vm_list_with_insta
+)
+from core.streams import Stream, load_streams_meta
+
+# Mã lỗi JSON-RPC 2.0
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+INTERNAL_ERROR = -32603
+
+# Số event chờ gửi tối đa / kết nối /events (client đọc chậm thì bỏ event cũ nhất)
+SSE_QUEUE_MAX = 1000
+
+
+class RPCError(Exception):
+    """Lỗi trả về cho client trong trường "error" của JSON-RPC"""
+
+    def __init__(self, message: str, code: int = INVALID_PARAMS):
+        super().__init__(message)
+        self.code = code
+
+
+def post_info(post: ScheduledPost, running: bool = False) -> dict:
+    """ScheduledPost → dict trả về qua API (to_dict + trạng thái runtime)"""
+    info = post.to_dict()
+    info["running"] = running
+    info["stop_requested"] = post.stop_requested
+    return info
+
+
+class FarmDaemon:
+    """Chủ sở hữu posts + PostScheduler + Stream khi chạy headless"""
+
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+        self.ui_queue = queue.Queue()  # PostScheduler / Stream đẩy cập nhật trạng thái vào đây
+        self.posts = []
+        self.posts_lock = threading.RLock()  # thread HTTP thêm/xóa post trong lúc scheduler đọc
+        self.scheduler = None
+        self.streams = {}  # {stream id: Stream}
+        self.started_at = None
+        self._server = None
+        self._stop_event = threading.Event()
+        self._methods = {
+            "ping": self.rpc_ping,
+            "status": self.rpc_status,
+            "list_posts": self.rpc_list_posts,
+            "add_post": self.rpc_add_post,
+            "update_post": self.rpc_update_post,
+            "set_paused": self.rpc_set_paused,
+            "stop_post": self.rpc_stop_post,
+            "delete_post": self.rpc_delete_post,
+            "list_vms": self.rpc_list_vms,
+            "vm_waiters": self.rpc_vm_waiters,
+            "list_streams": self.rpc_list_streams,
+            "start_stream": self.rpc_start_stream,
+            "stop_stream": self.rpc_stop_stream,
+            "get_logs": self.rpc_get_logs,
+        }
+
+    # ==================== LIFECYCLE ====================
+    def start(self, host: str = DAEMON_HOST, port: int = DAEMON_PORT, start_streams: bool = False) -> bool:
+        """
+        Load posts/luồng, start scheduler và HTTP API.
+
+        Returns:
+            bool: False nếu không mở được port (vd: đã có daemon khác chạy)
+        """
+        if not self.start_http_server(host, port):
+            return False
+        self.started_at = time.time()
+
+        self.posts = load_scheduled_posts()
+        reset_posts_after_restart(self.posts)
+        if self.posts:
+            save_scheduled_posts(self.posts)
+        self.start_scheduler()
+        self.load_streams(start_streams)
+        return True
+
+    def start_scheduler(self):
+        """Đăng post đến giờ trên VM của máy này (Coordinator thay bằng giao cho agent)"""
+        self.scheduler = PostScheduler(self.posts, self.ui_queue)
+        self.scheduler.start()
+        self.logger.info(f"📅 Daemon: {len(self.posts)} post, scheduler đã chạy")
+
+    def load_streams(self, start_streams: bool):
+        for cfg in load_streams_meta().get("streams", []):
+            stream = Stream(cfg, cfg["id"])
+            self.streams[cfg["id"]] = stream
+            if start_streams:
+                stream.start(self.ui_queue)
+        self.logger.info(f"▶️ Daemon: {len(self.streams)} luồng theo dõi"
+                         f"{' (đã start tất cả)' if start_streams else ''}")
+
+    def serve_forever(self):
+        """Block tới khi stop() (Ctrl+C / SIGTERM / shutdown)"""
+        while not self._stop_event.is_set():
+            self.tick()
+            self._stop_event.wait(1)
+
+    def tick(self):
+        """Gọi mỗi giây trong serve_forever"""
+        # Không có bảng Tk để cập nhật: trạng thái đã nằm trong post.status / stream.status
+        try:
+            while True:
+                self.ui_queue.get_nowait()
+        except queue.Empty:
+            pass
+
+    def stop(self):
+        self._stop_event.set()
+
+    def shutdown(self):
+        """Dừng scheduler, luồng, pipeline và lưu state (giống cleanup của PostTab/FollowTab)"""
+        self.stop()
+        self.logger.info("🛑 Daemon: đang dừng...")
+        if self._server is not None:
+            try:
+                self._server.shutdown()
+                self._server.server_close()
+            except Exception:
+                pass
+            self._server = None
+
+        if self.scheduler and self.scheduler.is_alive():
+            self.scheduler.stop()
+            self.scheduler.join(timeout=5)
+        with self.posts_lock:
+            for post in self.posts:
+                if post.status == "processing":
+                    post.stop_requested = True
+                    post.is_paused = True
+                    post.status = "pending"
+
+        for stream in self.streams.values():
+            if stream.is_running():
+                try:
+                    stream.stop()
+                except Exception as e:
+                    self.logger.error(f"❌ Lỗi stop luồng {stream.cfg.get('name')}: {e}")
+
+        from utils.post_pipeline import post_pipeline
+        from utils.warm_vm import warm_vm_pool
+        post_pipeline.shutdown(timeout=10)
+        try:
+            warm_vm_pool.shutdown(quit_vms=True)
+        except Exception as e:
+            self.logger.error(f"❌ Lỗi khi tắt VM warm: {e}")
+        from utils.vm_lock import vm_locks
+        vm_locks.shutdown()
+
+        if self.started_at is not None:
+            with self.posts_lock:
+                save_scheduled_posts(self.posts)
+        self.logger.info("✅ Daemon đã dừng")
+
+    # ==================== HTTP ====================
+    def start_http_server(self, host: str, port: int) -> bool:
+        daemon = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                if urlparse(self.path).path != "/rpc":
+                    self.send_error(404)
+                    return
+                length = int(self.headers.get("Content-Length") or 0)
+                body = daemon.handle_rpc(self.rfile.read(length))
+                self._send_json(body)
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                if url.path == "/status":
+                    self._send_json({"result": daemon.rpc_status()})
+                elif url.path == "/events":
+                    trace = parse_qs(url.query).get("trace", [None])[0]
+                    daemon.stream_events(self, trace)
+                else:
+                    self.send_error(404)
+
+            def _send_json(self, payload):
+                data = json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass  # Thin client poll liên tục - không spam log
+
+        try:
+            server = ThreadingHTTPServer((host, port), Handler)
+        except OSError as e:
+            self.logger.error(f"❌ Không mở được daemon API {host}:{port}: {e}")
+            return False
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True, name="DaemonHTTP").start()
+        self._server = server
+        self.logger.info(f"🛰️ Daemon API: http://{host}:{server.server_address[1]}/rpc")
+        return True
+
+    def handle_rpc(self, raw: bytes) -> dict:
+        """1 request JSON-RPC 2.0 → response dict"""
+        try:
+            request = json.loads(raw or b"{}")
+        except ValueError:
+            return {"jsonrpc": "2.0", "id": None, "error": {"code": PARSE_ERROR, "message": "Parse error"}}
+        request_id = request.get("id") if isinstance(request, dict) else None
+        if not isinstance(request, dict) or not isinstance(request.get("method"), str):
+            return {"jsonrpc": "2.0", "id": request_id,
+                    "error": {"code": INVALID_REQUEST, "message": "Invalid request"}}
+
+        method = self._methods.get(request["method"])
+        params = request.get("params") or {}
+        try:
+            if method is None:
+                raise RPCError(f"Không có method: {request['method']}", METHOD_NOT_FOUND)
+            if not isinstance(params, dict):
+                raise RPCError("params phải là object (tham số theo tên)")
+            try:
+                result = method(**params)
+            except TypeError as e:
+                raise RPCError(f"Sai tham số: {e}")
+        except RPCError as e:
+            return {"jsonrpc": "2.0", "id": request_id, "error": {"code": e.code, "message": str(e)}}
+        except Exception as e:
+            self.logger.exception(f"❌ Lỗi RPC {request['method']}")
+            return {"jsonrpc": "2.0", "id": request_id, "error": {"code": INTERNAL_ERROR, "message": str(e)}}
+        return {"jsonrpc": "2.0", "id": request_id, "result": result}
+
+    def stream_events(self, handler: BaseHTTPRequestHandler, trace=None):
+        """GET /events: đẩy trace event mới dạng Server-Sent Events tới khi client ngắt"""
+        events = queue.Queue(maxsize=SSE_QUEUE_MAX)
+
+        def on_event(event):
+            if trace is not None and event.get("trace") != trace:
+                return
+            try:
+                events.put_nowait(event)
+            except queue.Full:
+                try:
+                    events.get_nowait()  # Bỏ event cũ nhất, giữ event mới
+                    events.put_nowait(event)
+                except (queue.Empty, queue.Full):
+                    pass
+
+        handler.send_response(200)
+        handler.send_header("Content-Type", "text/event-stream; charset=utf-8")
+        handler.send_header("Cache-Control", "no-cache")
+        handler.send_header("Connection", "close")
+        handler.end_headers()
+        handler.close_connection = True
+
+        trace_log.subscribe(on_event)
+        try:
+            while not self._stop_event.is_set():
+                try:
+                    event = events.get(timeout=DAEMON_SSE_KEEPALIVE)
+                    data = "data: " + json.dumps(event, ensure_ascii=False, default=str) + "\n\n"
+                except queue.Empty:
+                    data = ": keepalive\n\n"
+                handler.wfile.write(data.encode("utf-8"))
+                handler.wfile.flush()
+        except (BrokenPipeError, ConnectionError, OSError):
+            pass  # Client đã ngắt
+        finally:
+            trace_log.unsubscribe(on_event)
+
+    # ==================== RPC: POSTS ====================
+    def _find_post(self, post_id) -> ScheduledPost:
+        for post in self.posts:
+            if post.id == post_id:
+                return post
+        raise RPCError(f"Không tìm thấy post: {post_id}")
+
+    def _running_ids(self) -> set:
+        scheduler = self.scheduler
+        return set(scheduler.running_posts) if scheduler else set()
+
+    def _resolve_vm(self, vm_name: str) -> str:
+        """vm_name → account_display (VM phải có trong data/vm và có port)"""
+        for vm in get_vm_list_with_insta():
+            if vm["vm_name"] == vm_name:
+                return vm["display"]
+        raise RPCError(f"Không tìm thấy máy ảo (hoặc chưa có port): {vm_name}")
+
+    def rpc_ping(self):
+        return {"pid": os.getpid(), "uptime": round(time.time() - (self.started_at or time.time()), 1)}
+
+    def rpc_status(self):
+        counts = {}
+        with self.posts_lock:
+            for post in self.posts:
+                counts[post.status] = counts.get(post.status, 0) + 1
+            running_posts = len(self._running_ids())
+        return {
+            "pid": os.getpid(),
+            "started_at": self.started_at,
+            "posts": counts,
+            "running_posts": running_posts,
+            "streams": len(self.streams),
+            "running_streams": sum(1 for s in self.streams.values() if s.is_running()),
+        }
+
+    def rpc_list_posts(self, status=None):
+        running = self._running_ids()
+        with self.posts_lock:
+            return [post_info(p, p.id in running) for p in self.posts if status is None or p.status == status]
+
+    def rpc_add_post(self, video_path, vm_name=None, scheduled_time=None, title="", post_now=False, start=False):
+        """
+        Thêm 1 video. Không có vm_name → "draft" (giống Nhập File trên GUI), có vm_name + giờ hẹn
+        (dd/mm/YYYY HH:MM giờ VN) hoặc post_now → "pending", start=True thì chạy luôn.
+        """
+        if not os.path.isfile(video_path):
+            raise RPCError(f"Không tìm thấy file video: {video_path}")
+        with self.posts_lock:
+            post = ScheduledPost(
+                post_id=f"post_{int(time.time() * 1000)}_{len(self.posts)}",
+                video_path=video_path,
+                title=title or os.path.splitext(os.path.basename(video_path))[0],
+                status="draft",
+            )
+            if vm_name:
+                self._schedule(post, vm_name, scheduled_time, post_now, start)
+            self.posts.append(post)
+            save_scheduled_posts(self.posts)
+        post.log(f"🛰️ Thêm qua daemon API ({post.status})")
+        return post_info(post)
+
+    def rpc_update_post(self, post_id, vm_name=None, scheduled_time=None, title=None, post_now=False, start=False):
+        """Đặt lịch / sửa post (giống nút ⚙️ trên GUI) - post đang processing thì không sửa được"""
+        with self.posts_lock:
+            post = self._find_post(post_id)
+            if post.status == "processing":
+                raise RPCError("Post đang xử lý, không sửa được")
+            if title is not None:
+                post.title = title
+            self._schedule(post, vm_name or post.vm_name, scheduled_time, post_now, start)
+            save_scheduled_posts(self.posts)
+        return post_info(post)
+
+    def _schedule(self, post: ScheduledPost, vm_name, scheduled_time, post_now, start):
+        if not vm_name:
+            raise RPCError("Thiếu vm_name")
+        account_display = self._resolve_vm(vm_name)
+        if scheduled_time:
+            try:
+                when = parse_vn_time(scheduled_time)
+            except ValueError:
+                raise RPCError(f"Giờ hẹn không hợp lệ (dd/mm/YYYY HH:MM): {scheduled_time}")
+        elif post_now:
+            when = datetime.now(VN_TZ)
+        elif post.scheduled_time_vn:
+            when = post.scheduled_time_vn
+        else:
+            raise RPCError("Thiếu scheduled_time (hoặc post_now=true)")
+        if not post_now and when <= datetime.now(VN_TZ):
+            raise RPCError("Giờ hẹn đã qua - chọn giờ khác hoặc post_now=true")
+
+        if post.vm_name != vm_name:
+            post.auto_vm = False
+        post.vm_name = vm_name
+        post.account_display = account_display
+        post.scheduled_time_vn = when
+        post.post_now = bool(post_now)
+        post.status = "pending"
+        post.is_paused = True
+        if start:
+            self._activate(post)
+
+    def _activate(self, post: ScheduledPost):
+        if post.post_now:
+            post.scheduled_time_vn = datetime.now(VN_TZ)
+            post.post_now = False
+            post.log("⚡ Đăng ngay - Đã set thời gian = hiện tại")
+        post.is_paused = False
+        post.log("▶ Đã được kích hoạt qua daemon API")
+
+    def rpc_set_paused(self, post_id, paused=True):
+        with self.posts_lock:
+            post = self._find_post(post_id)
+            if post.status not in ("pending", "failed"):
+                raise RPCError(f"Không đổi được trạng thái chạy của post {post.status}")
+            if paused:
+                post.is_paused = True
+                post.log("⏸ Đã dừng qua daemon API")
+            else:
+                if post.status == "failed":
+                    post.status = "pending"
+                self._activate(post)
+            save_scheduled_posts(self.posts)
+        return post_info(post, post.id in self._running_ids())
+
+    def rpc_stop_post(self, post_id):
+        """Dừng ngay post đang chạy (pipeline kiểm tra stop_requested giữa các bước)"""
+        with self.posts_lock:
+            post = self._find_post(post_id)
+            post.stop_requested = True
+            post.is_paused = True
+            post.log("🛑 Yêu cầu dừng qua daemon API")
+            save_scheduled_posts(self.posts)
+        return post_info(post, post.id in self._running_ids())
+
+    def rpc_delete_post(self, post_id):
+        with self.posts_lock:
+            post = self._find_post(post_id)
+            if post.status == "processing":
+                raise RPCError("Không thể xóa post đang xử lý")
+            self.posts.remove(post)
+            trace_log.clear(post.id)
+            save_scheduled_posts(self.posts)
+        return True
+
+    def rpc_list_vms(self):
+        return get_vm_list_with_insta()
+
+    def rpc_vm_waiters(self, vm_name=None):
+        """Job đang xếp hàng chờ VM (theo thứ tự sẽ được lượt)"""
+        from utils.vm_manager import vm_manager
+        return vm_manager.get_waiters(vm_name)
+
+    # ==================== RPC: STREAMS ====================
+    def _find_stream(self, stream_id) -> Stream:
+        stream = self.streams.get(stream_id)
+        if stream is None:
+            raise RPCError(f"Không tìm thấy luồng: {stream_id}")
+        return stream
+
+    def rpc_list_streams(self):
+        return [{
+            "id": stream_id,
+            "name": s.cfg.get("name"),
+            "platform": s.cfg.get("platform", "youtube"),
+            "vm_name": s.cfg.get("vm_name"),
+            "channels": len(s.cfg.get("channels", [])),
+            "interval_min": s.cfg.get("interval_min"),
+            "status": s.status,
+            "running": s.is_running(),
+            "trace": s.trace_id,
+        } for stream_id, s in self.streams.items()]
+
+    def rpc_start_stream(self, stream_id):
+        stream = self._find_stream(stream_id)
+        stream.start(self.ui_queue)
+        return True
+
+    def rpc_stop_stream(self, stream_id):
+        stream = self._find_stream(stream_id)
+        # Stream.stop() join tối đa 5s - chạy nền để không giữ request HTTP
+        threading.Thread(target=stream.stop, daemon=True, name=f"StopStream:{stream_id}").start()
+        return True
+
+    # ==================== RPC: LOGS ====================
+    def rpc_get_logs(self, trace, before=None, since=None, limit=TRACE_PAGE_SIZE):
+        """
+        Log của 1 trace (post id hoặc "stream:<id>").
+
+        - since=<ts>: chỉ event trong RAM mới hơn ts (thin client poll)
+        - before=<cursor>: trang cũ hơn từ spill file (như nút "Tải log cũ hơn")
+        - không có cả 2: snapshot (RAM + cursor)
+        """
+        if since is not None:
+            return {"events": [e for e in trace_log.recent(trace) if e["ts"] > since], "cursor": None}
+        if before is not None:
+            events, cursor = trace_log.page(trace, before=before, limit=limit)
+        else:
+            events, cursor = trace_log.snapshot(trace)
+        return {"events": events, "cursor": cursor}
@@ -0,0 +1,397 @@
+"""
+Scheduler - Model + lịch đăng bài hẹn giờ, không phụ thuộc GUI.
+
+ScheduledPost, đọc/ghi scheduled_posts.json và PostScheduler (thread kiểm tra post đến giờ →
+post_pipeline). Dùng chung cho PostTab (tabs/tab_post.py), daemon headless (core/daemon.py)
+và coordinator - import module này không kéo theo tkinter / customtkinter.
+"""
+import os
+import gc
+import logging
+import threading
+from datetime import datetime, timezone, timedelta
+
+from config import SCHEDULED_POSTS_FILE
+from constants import POST_MAX_LATE_SECONDS, VM_PRIORITY_SCHEDULED
+from utils.vm_registry import vm_registry
+from utils.warm_vm import warm_vm_pool
+from utils.post_pipeline import post_pipeline, PostJob, OUTCOME_POSTED, OUTCOME_FAILED, OUTCOME_STOPPED
+from utils.metrics import metrics
+from utils.vm_balancer import failover, is_failing
+from utils.trace_log import trace_log
+from utils.persistence import load_json, atomic_write_json_stream
+
+VN_TZ = timezone(timedelta(hours=7))
+
+
+# ==================== DATA MODELS ====================
+def parse_vn_time(text):
+    """
+    "dd/mm/YYYY HH:MM" → datetime (VN_TZ).
+
+    Cắt chuỗi thay cho strptime (chậm ~10 lần) - định dạng khác thì mới dùng strptime.
+    """
+    if len(text) == 16 and text[2] == "/" and text[5] == "/" and text[10] == " " and text[13] == ":":
+        try:
+            return datetime(int(text[6:10]), int(text[3:5]), int(text[0:2]),
+                            int(text[11:13]), int(text[14:16]), tzinfo=VN_TZ)
+        except ValueError:
+            pass
+    return datetime.strptime(text, "%d/%m/%Y %H:%M").replace(tzinfo=VN_TZ)
+
+
+class ScheduledPost:
+    """
+    Một post được đặt lịch.
+
+    __slots__ → không có __dict__ riêng mỗi post. video_name tính lười từ video_path,
+    title chỉ lưu khi khác video_name (mặc định title = video_name).
+    """
+
+    __slots__ = (
+        "id", "video_path", "_video_name", "_title", "scheduled_time_vn", "vm_name",
+        "account_display", "status", "is_paused", "post_now", "stop_requested", "log_callback", "auto_vm",
+    )
+
+    def __init__(self, post_id, video_path, scheduled_time_vn=None, vm_name=None,
+                 account_display=None, title="", status="draft", is_paused=True, post_now=False, log_callback=None,
+                 auto_vm=False):
+        self.id = post_id
+        self.video_path = video_path
+        self._video_name = None
+        self.scheduled_time_vn = scheduled_time_vn  # datetime object or None
+        self.vm_name = vm_name
+        self.account_display = account_display or "Chưa chọn"
+        self._title = title or None
+        self.status = status  # draft, pending, processing, posted, failed
+        self.is_paused = is_paused  # True = dừng, False = chạy
+        self.post_now = post_now  # True = đăng ngay khi Start
+        self.stop_requested = False  # Flag để yêu cầu dừng ngay lập tức
+        self.log_callback = log_callback
+        self.auto_vm = auto_vm  # True = máy ảo do bộ cân tải chọn → được chuyển sang VM khác khi VM lỗi liên tục
+
+    @property
+    def video_name(self):
+        if self._video_name is None:
+            self._video_name = os.path.basename(self.video_path)
+        return self._video_name
+
+    @property
+    def title(self):
+        return self._title or self.video_name
+
+    @title.setter
+    def title(self, value):
+        self._title = value or None
+
+    def to_dict(self):
+        data = {
+            "id": self.id,
+            "video_path": self.video_path,
+            "video_name": self.video_name,
+            "scheduled_time_vn": self.scheduled_time_vn.strftime("%d/%m/%Y %H:%M") if self.scheduled_time_vn else None,
+            "vm_name": self.vm_name,
+            "account_display": self.account_display,
+            "title": self.title,
+            "status": self.status,
+            "is_paused": self.is_paused,
+            "post_now": self.post_now
+        }
+        if self.auto_vm:
+            data["auto_vm"] = True  # Chỉ ghi khi bật → file cũ load/save không đổi
+        return data
+
+    @staticmethod
+    def from_dict(data):
+        return ScheduledPost.from_dicts([data])[0]
+
+    @staticmethod
+    def from_dicts(items):
+        """
+        Tạo list post từ list dict (load scheduled_posts.json) - nhanh hơn from_dict từng cái:
+        - Không qua __init__ (gán slot trực tiếp)
+        - Parse mỗi chuỗi giờ hẹn 1 lần (nhiều post trùng giờ)
+        - vm_name / account_display / status trùng nhau dùng chung 1 object str
+        """
+        times = {}
+        shared = {}
+        new_post = ScheduledPost.__new__
+        posts = []
+        for data in items:
+            post = new_post(ScheduledPost)
+            post.id = data["id"]
+            post.video_path = data["video_path"]
+            video_name = data.get("video_name")
+            post._video_name = video_name
+            title = data.get("title")
+            post._title = title if title and title != video_name else None
+
+            raw_time = data.get("scheduled_time_vn")
+            if raw_time:
+                scheduled_time = times.get(raw_time)
+                if scheduled_time is None:
+                    scheduled_time = times[raw_time] = parse_vn_time(raw_time)
+                post.scheduled_time_vn = scheduled_time
+            else:
+                post.scheduled_time_vn = None
+
+            vm_name = data.get("vm_name")
+            post.vm_name = shared.setdefault(vm_name, vm_name)
+            account = data.get("account_display") or "Chưa chọn"
+            post.account_display = shared.setdefault(account, account)
+            status = data.get("status", "draft")
+            post.status = shared.setdefault(status, status)
+            post.is_paused = data.get("is_paused", True)
+            post.post_now = data.get("post_now", False)
+            post.auto_vm = data.get("auto_vm", False)
+            post.stop_requested = False
+            post.log_callback = None
+            posts.append(post)
+        return posts
+
+    def log(self, message, level="INFO", kind="log", **fields):
+        """Ghi event vào trace log của post (chỉ format khi cửa sổ log đang mở)"""
+        fields.setdefault("vm", self.vm_name)
+        event = trace_log.event(self.id, message, level=level, kind=kind, **fields)
+        # Gọi callback realtime
+        if self.log_callback:
+            self.log_callback(self.id, event)
+
+
+# ==================== DATA PERSISTENCE ====================
+def load_scheduled_posts():
+    """Load scheduled posts from JSON - Safe version with backup on error"""
+    if not os.path.exists(SCHEDULED_POSTS_FILE):
+        logging.info("No scheduled_posts.json found, starting with empty list")
+        return []
+
+    # Tắt GC khi dựng hàng chục nghìn object: GC chạy lặp lại trên toàn bộ dict vừa decode
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        data = load_json(SCHEDULED_POSTS_FILE, default={})
+        posts = ScheduledPost.from_dicts(data.get("posts", []))
+        logging.info(f"✅ Loaded {len(posts)} scheduled posts from JSON")
+        return posts
+    except Exception as e:
+        logging.error(f"❌ CRITICAL: Error loading scheduled posts: {e}")
+        logging.error(f"   File: {SCHEDULED_POSTS_FILE}")
+        logging.error(f"   Exception type: {type(e).__name__}")
+        import traceback
+        logging.error(f"   Traceback:\n{traceback.format_exc()}")
+
+        # ⚠️ Backup file cũ để tránh mất data
+        backup_file = SCHEDULED_POSTS_FILE + ".backup_error"
+        try:
+            import shutil
+            shutil.copy2(SCHEDULED_POSTS_FILE, backup_file)
+            logging.error(f"   📁 File đã được backup tại: {backup_file}")
+            logging.error("   ⚠️ KHÔNG TẢI ĐƯỢC DATA! Vui lòng kiểm tra file backup!")
+        except:
+            pass
+
+        # Return empty list NHƯNG không cho phép save (sẽ check trong __init__)
+        # Raise exception để user biết có vấn đề
+        raise RuntimeError(
+            f"❌ Cannot load scheduled_posts.json!\n"
+            f"📁 Backup saved at: {backup_file}\n"
+            f"Error: {e}\n"
+            f"⚠️ App cannot start to prevent data loss!"
+        )
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+
+def reset_posts_after_restart(posts):
+    """Khi app/daemon restart, force pause tất cả posts pending/processing để tránh tự động chạy"""
+    for post in posts:
+        if post.status in ["pending", "processing"]:
+            post.is_paused = True  # Force pause
+            post.status = "pending"  # Reset về pending
+            logging.info(f"Reset post {post.id} to paused state after app restart")
+
+
+def save_scheduled_posts(posts):
+    """Save scheduled posts to JSON - Safe version with backup"""
+    # ✅ v1.5.37: Removed overly-strict safety check
+    # Backup mechanism (below) is sufficient to prevent accidental data loss
+    # User should be able to delete all posts if they want to
+
+    try:
+        # Backup file cũ trước khi save
+        if os.path.exists(SCHEDULED_POSTS_FILE):
+            backup_file = SCHEDULED_POSTS_FILE + ".backup"
+            import shutil
+            shutil.copy2(SCHEDULED_POSTS_FILE, backup_file)
+
+        # Save new data
+        # ✅ Ghi compact + streaming + atomic (tmp → os.replace), không dựng cả list dict trong RAM
+        atomic_write_json_stream(SCHEDULED_POSTS_FILE, (p.to_dict() for p in posts), wrap_key="posts")
+        logging.info(f"💾 Saved {len(posts)} posts to JSON")
+    except Exception as e:
+        logging.error(f"❌ Error saving scheduled posts: {e}")
+        import traceback
+        logging.error(traceback.format_exc())
+
+
+def get_vm_list_with_insta():
+    """Lấy danh sách máy ảo kèm tên Instagram từ data/vm/ (qua VM registry)"""
+    vm_list = []
+    try:
+        for data in vm_registry.list_vms():
+            vm_name = data.get("vm_name", "")
+            insta_name = data.get("insta_name", "")
+            port = data.get("port", "")
+            if vm_name and port:  # Only include VMs with valid port
+                display = f"{vm_name} - {insta_name}" if insta_name else vm_name
+                vm_list.append({
+                    "vm_name": vm_name,
+                    "display": display,
+                    "port": port
+                })
+    except Exception as e:
+        logging.error(f"Error reading VM list: {e}")
+
+    return vm_list
+
+
+# ==================== SCHEDULER ====================
+class PostScheduler(threading.Thread):
+    """Background scheduler để check và post video đúng giờ"""
+
+    def __init__(self, posts, ui_queue):
+        super().__init__(daemon=True)
+        self.posts = posts  # List of ScheduledPost
+        self.ui_queue = ui_queue
+        self.stop_event = threading.Event()
+        self.logger = logging.getLogger(__name__)
+        # ✅ FIX BUG #5: Không dùng shared auto_poster nữa
+        # Mỗi post (PostJob trong post_pipeline) tạo InstagramPost riêng với callback của post
+        self.running_posts = set()  # Track posts being processed
+
+    def stop(self):
+        self.stop_event.set()
+
+    def run(self):
+        """Main scheduler loop"""
+        self.logger.info("Post scheduler started")
+
+        while not self.stop_event.is_set():
+            try:
+                now = datetime.now(VN_TZ)
+
+                # Check each pending post
+                for post in self.posts[:]:  # Copy list to avoid modification issues
+                    if post.status != "pending":
+                        continue
+
+                    if post.id in self.running_posts:
+                        continue
+
+                    # Chỉ chạy nếu post đang ở trạng thái running (is_paused=False)
+                    if post.is_paused:
+                        continue
+
+                    # Check if it's time to post
+                    if now >= post.scheduled_time_vn:
+                        # ✅ FIX BUG #2: Skip posts quá cũ (quá 10 phút)
+                        time_diff = (now - post.scheduled_time_vn).total_seconds()
+
+                        if time_diff > POST_MAX_LATE_SECONDS:
+                            # Quá cũ, skip và đánh dấu failed
+                            self.logger.warning(f"Post {post.id} quá cũ ({time_diff/60:.1f} phút), bỏ qua")
+                            post.log(f"⏰ Post quá cũ (trễ {time_diff/60:.1f} phút), tự động bỏ qua")
+                            post.status = "failed"
+                            post.is_paused = True
+                            self.ui_queue.put(("status_update", post.id, "failed"))
+                            save_scheduled_posts(self.posts)
+                            continue
+
+                        # Đưa vào pipeline asyncio (không tạo thread riêng cho mỗi post)
+                        self.running_posts.add(post.id)
+                        self.process_post(post)
+
+                # Sleep for 30 seconds before next check (Event.wait → thoát ngay khi stop)
+                self.stop_event.wait(30)
+
+            except Exception:
+                self.logger.exception("Error in scheduler loop")
+                self.stop_event.wait(5)
+
+        self.logger.info("Post scheduler stopped")
+
+    def _has_upcoming_post(self, post: ScheduledPost) -> bool:
+        """Còn post khác trên cùng VM sắp chạy (trong idle TTL của warm mode) không"""
+        horizon = datetime.now(VN_TZ) + timedelta(seconds=warm_vm_pool.idle_ttl)
+        for other in self.posts[:]:
+            if other.id == post.id or other.vm_name != post.vm_name:
+                continue
+            if other.id in self.running_posts:
+                return True  # Đang chờ lock VM
+            if (other.status == "pending" and not other.is_paused
+                    and other.scheduled_time_vn and other.scheduled_time_vn <= horizon):
+                return True
+        return False
+
+    def process_post(self, post: ScheduledPost):
+        """Đưa post vào pipeline asyncio (không còn 1 thread blocking cho mỗi post)"""
+        post.status = "processing"
+        post.stop_requested = False  # Reset flag
+        post.log(f"🚀 Bắt đầu xử lý post: {post.title}")
+        self.ui_queue.put(("status_update", post.id, "processing"))
+        try:
+            delay = (datetime.now(VN_TZ) - post.scheduled_time_vn).total_seconds()
+            metrics.observe("post_start_delay_seconds", max(0.0, delay), vm=post.vm_name)
+        except Exception:
+            pass
+
+        job = PostJob(
+            job_id=post.id,
+            vm_name=post.vm_name,
+            source=post.video_path,
+            title=post.title,
+            log=post.log,
+            stop_check=lambda: post.stop_requested or self.stop_event.is_set(),
+            has_more_work=lambda: self._has_upcoming_post(post),
+            caller=f"Post:{post.title[:20]}",
+            # Đúng giờ hẹn → được VM trước luồng theo dõi đang xả backlog
+            priority=VM_PRIORITY_SCHEDULED,
+            deadline=post.scheduled_time_vn.timestamp() + POST_MAX_LATE_SECONDS,
+        )
+        post_pipeline.submit(job, on_done=lambda job: self._on_post_done(post, job))
+
+    def _on_post_done(self, post: ScheduledPost, job: PostJob):
+        """Cập nhật trạng thái post khi pipeline kết thúc (chạy trong executor của pipeline)"""
+        try:
+            if job.outcome == OUTCOME_POSTED:
+                post.status = "posted"
+                post.log("✅ Hoàn tất!")
+                self.ui_queue.put(("status_update", post.id, "posted"))
+            else:
+                post.status = "failed"
+                if job.outcome == OUTCOME_STOPPED:
+                    post.is_paused = True
+                self.ui_queue.put(("status_update", post.id, "failed"))
+                if job.outcome == OUTCOME_FAILED:
+                    self._failover(post.vm_name)
+        finally:
+            self.running_posts.discard(post.id)
+            save_scheduled_posts(self.posts)
+
+    def _failover(self, vm_name: str):
+        """VM lỗi liên tục → chuyển post tự chia (auto_vm) còn chờ trên VM đó sang VM khác trong nhóm"""
+        try:
+            if not vm_name or not is_failing(vm_name):
+                return
+            displays = {vm_info["vm_name"]: vm_info["display"] for vm_info in get_vm_list_with_insta()}
+            moved = failover(self.posts, vm_name, displays)
+            for moved_post in moved:
+                moved_post.log(f"🔀 Máy ảo '{vm_name}' lỗi liên tục → chuyển sang '{moved_post.vm_name}'",
+                               level="WARNING")
+                self.ui_queue.put(("account_update", moved_post.id, moved_post.account_display))
+            if moved:
+                self.logger.warning(f"🔀 VM {vm_name} lỗi liên tục - đã chuyển {len(moved)} post sang VM khác",
+                                    extra={"vm": vm_name})
+        except Exception:
+            self.logger.exception(f"Error in failover of VM {vm_name}")
@@ -0,0 +1,514 @@
+"""
+Streams - Luồng theo dõi kênh YouTube / TikTok và đăng video mới, không phụ thuộc GUI.
+
+Stream (thread quét kênh → ghi file kết quả → đăng video "unpost" qua post_pipeline) cùng các
+tiện ích file streams.json / file kết quả. Dùng chung cho FollowTab (tabs/tab_follow.py) và
+daemon headless (core/daemon.py) - import module này không kéo theo tkinter / customtkinter.
+"""
+import os
+import re
+import json
+import time
+import queue
+import logging
+import threading
+import subprocess
+from datetime import datetime, timezone, timedelta
+from concurrent.futures import ThreadPoolExecutor, wait as futures_wait
+
+from constants import WAIT_LONG, CANCEL_POLL_INTERVAL, VM_PRIORITY_STREAM
+from utils.persistence import atomic_write_json
+from utils.warm_vm import warm_vm_pool
+from utils.post_pipeline import post_pipeline, PostJob, OUTCOME_POSTED, OUTCOME_STOPPED
+from utils.cancel_token import CancelToken, OperationCancelled
+from utils.metrics import metrics
+from utils.trace_log import trace_log
+from utils.text_utils import remove_keywords_from_text, remove_all_hashtags
+from utils.api_manager_multi import multi_api_manager
+from utils.tiktok_api_rapidapi import (
+    extract_tiktok_username,
+    get_tiktok_secuid,
+    fetch_tiktok_videos_latest,
+    filter_videos_newer_than,
+    convert_to_output_format
+)
+from utils.yt_api import (
+    extract_channel_id,
+    get_uploads_playlist_id,
+    iter_playlist_videos_newer_than,
+    fetch_video_details,
+    filter_videos_by_mode,
+    parse_vn_datetime,
+    iso_to_datetime,
+    datetime_to_iso
+)
+
+
+class StoppableWorker:
+    """Helper class để chạy tác vụ có thể dừng (dùng CancelToken chung với stop_event)"""
+    
+    def __init__(self, stop_event):
+        self.stop_event = stop_event
+        self.cancel_token = CancelToken(stop_event)
+        self.executor = ThreadPoolExecutor(max_workers=1)
+    
+    def run_blocking_func(self, func, *args, timeout=300, check_interval=1, **kwargs):
+        """
+        Chạy hàm blocking với khả năng dừng
+        
+        Args:
+            func: Hàm cần chạy
+            timeout: Thời gian tối đa (giây)
+            check_interval: Kiểm tra stop_event mỗi X giây (tối đa CANCEL_POLL_INTERVAL)
+        
+        Returns:
+            (success, result, reason)
+        """
+        future = self.executor.submit(func, *args, **kwargs)
+        poll = min(check_interval, CANCEL_POLL_INTERVAL)
+        
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.cancel_token.is_cancelled():
+                future.cancel()
+                return (False, None, "stopped")
+            
+            # Trả về ngay khi func xong, không chờ hết chu kỳ check
+            done, _ = futures_wait([future], timeout=poll)
+            if done:
+                try:
+                    result = future.result(timeout=0.1)
+                    return (True, result, "completed")
+                except Exception as e:
+                    return (False, None, f"error: {e}")
+        
+        future.cancel()
+        return (False, None, "timeout")
+    
+    def run_subprocess(self, cmd_list, timeout=300, check_interval=0.5):
+        """
+        Chạy subprocess với khả năng dừng (kill trong CANCEL_POLL_INTERVAL khi stop)
+        
+        Returns:
+            (success, returncode, reason)
+        """
+        try:
+            result = self.cancel_token.run(
+                cmd_list,
+                timeout=timeout,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                creationflags=subprocess.CREATE_NO_WINDOW
+            )
+            return (True, result.returncode, "completed")
+        except OperationCancelled:
+            return (False, None, "stopped")
+        except subprocess.TimeoutExpired:
+            return (False, None, "timeout")
+        except Exception as e:
+            return (False, None, f"error: {e}")
+    
+    def cleanup(self):
+        """Cleanup resources (process đang chạy bị kill bởi cancel_token khi stop_event set)"""
+        self.executor.shutdown(wait=False)
+
+
+# ========================= CẤU HÌNH ĐƯỜNG DẪN =========================
+OUTPUT_DIR = "data/output"
+STREAMS_META = os.path.join(OUTPUT_DIR, "streams.json")
+
+# ========================= HẰNG SỐ / TIỆN ÍCH =========================
+VN_TZ = timezone(timedelta(hours=7))  # Asia/Ho_Chi_Minh (UTC+7)
+LOCK = threading.Lock()  # khóa chung cho trạng thái chia sẻ
+
+def ensure_dirs():
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    if not os.path.exists(STREAMS_META):
+        atomic_write_json(STREAMS_META, {"streams": []})
+
+def slugify(name: str) -> str:
+    s = re.sub(r"[^a-zA-Z0-9\-_\s]+", "", name)
+    s = re.sub(r"\s+", "_", s).strip("_")
+    return s or "stream"
+
+def load_streams_meta():
+    ensure_dirs()
+    with open(STREAMS_META, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def save_streams_meta(meta):
+    ensure_dirs()
+    atomic_write_json(STREAMS_META, meta)
+
+def load_existing_urls(path: str) -> set:
+    if not os.path.exists(path):
+        return set()
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+            return {d.get("url") for d in data if isinstance(d, dict)}
+    except Exception:
+        return set()
+
+def newest_published_at(path: str, default_iso: str) -> datetime:
+    """Đọc file kết quả để xác định mốc mới nhất; nếu không có thì dùng default_iso."""
+    newest = iso_to_datetime(default_iso)
+    if os.path.exists(path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            for d in data:
+                pub = d.get("publishedAt")
+                if pub:
+                    dtp = iso_to_datetime(pub)
+                    if dtp > newest:
+                        newest = dtp
+        except Exception:
+            pass
+    return newest
+
+def _atomic_write_json(path, data):
+    atomic_write_json(path, data)  # compact + atomic trên Windows/Unix
+    
+def append_records(path: str, new_rows: list):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    data = []
+    if os.path.exists(path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception:
+            data = []
+    known = {d["url"] for d in data if isinstance(d, dict) and "url" in d}
+    for r in sorted(new_rows, key=lambda x: x["publishedAt"]):
+        if r["url"] not in known:
+            data.append(r); known.add(r["url"])
+    _atomic_write_json(path, data)
+    return len(new_rows)
+
+def reset_output_file(path: str):
+    """Xoá nội dung file kết quả của luồng và tạo file rỗng."""
+    try:
+        if os.path.exists(path):
+            os.remove(path)  # xoá file cũ
+        # tạo file rỗng (có thể bỏ nếu muốn để tool tự tạo lúc ghi lần đầu)
+        atomic_write_json(path, [])
+    except Exception:
+        pass
+
+# ========================= QUẢN LÝ LUỒNG =========================
+class Stream:
+    __slots__ = ("cfg", "row_id", "thread", "stop_event", "next_deadline", "status",
+                 "trace_id", "log_callback", "worker_helper")
+
+    def __init__(self, cfg: dict, row_id: str, log_callback=None):
+        self.cfg = cfg  # dict: id, name, start_vn, channels, mode, interval_min, out_path
+        self.row_id = row_id
+        self.thread = None
+        self.stop_event = threading.Event()
+        self.next_deadline = None  # datetime (UTC) cho lần chạy tiếp theo
+        self.status = "Chưa chạy"
+        self.trace_id = f"stream:{row_id}"  # Trace log của luồng (mỗi video trong luồng có field post riêng)
+        self.log_callback = log_callback
+        self.worker_helper = None
+
+    def log(self, msg: str, level: str = "INFO", kind: str = "log", **fields):
+        event = trace_log.event(self.trace_id, msg, level=level, kind=kind, **fields)
+        # 🟢 gọi callback realtime (chỉ format khi cửa sổ log đang mở)
+        if self.log_callback:
+            self.log_callback(self.row_id, event)
+
+    def is_running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self, ui_queue):
+        if self.is_running():
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.worker, args=(ui_queue,), daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.worker_helper:
+            self.worker_helper.cleanup()
+        if self.thread and self.thread.is_alive():
+            self.thread.join(timeout=5)
+
+    def worker(self, ui_queue: queue.Queue):
+        self.worker_helper = StoppableWorker(self.stop_event)
+        logger = logging.getLogger(f"{__name__}.Stream.{self.cfg['name']}")
+        try:
+            self.status = "Đang chạy (khởi tạo)"
+            ui_queue.put(("status", self.row_id, self.status))
+            
+            default_cutoff_utc = parse_vn_datetime(self.cfg["start_vn"], VN_TZ).astimezone(timezone.utc)
+            default_cutoff_iso = datetime_to_iso(default_cutoff_utc)
+            cutoff_dt = newest_published_at(self.cfg["out_path"], default_cutoff_iso)
+
+            # ✅ FIX: Không tạo shared auto_poster ở đây
+            # Mỗi video sẽ tạo InstagramPost riêng để tránh log nhầm
+
+            # ========== VÒNG LẶP CHÍNH ==========
+            while not self.stop_event.is_set():
+                self.log("Bắt đầu quét...")
+                scan_start = time.monotonic()
+
+                platform = self.cfg.get("platform", "youtube")
+
+                # CHỈ KHAI BÁO all_new_ids KHI LÀ YOUTUBE
+                all_new_ids = []
+
+                if platform == "youtube":
+                    # ========== QUÉT KÊNH YOUTUBE ==========
+                    for ch_url in self.cfg["channels"]:
+                        if self.stop_event.is_set():
+                            self.log("🛑 Dừng quét kênh")
+                            break
+
+                        try:
+                            cid = extract_channel_id(ch_url, multi_api_manager)
+                            pid = get_uploads_playlist_id(cid, multi_api_manager)
+
+                            ids = []
+                            for vid, pub in iter_playlist_videos_newer_than(pid, cutoff_dt, multi_api_manager):
+                                if self.stop_event.is_set():
+                                    break
+                                ids.append(vid)
+                            
+                            if ids:
+                                all_new_ids.extend(ids)
+                                self.log(f"[YouTube] {ch_url}: tìm thấy {len(ids)} video mới.")
+                            else:
+                                self.log(f"[YouTube] {ch_url}: không có video mới.")
+                        except Exception as e:
+                            self.log(f"[YouTube] Lỗi kênh {ch_url}: {e}")
+
+                elif platform != "tiktok":
+                    # TikTok logic đã được xử lý ở phần "XỬ LÝ VIDEO" bên dưới
+                    self.log(f"Nền tảng chưa hỗ trợ: {platform}")
+
+                
+                # Check trước khi xử lý video
+                if self.stop_event.is_set():
+                    break
+                
+                # ========== XỬ LÝ VIDEO ==========
+                # === Xử lý lấy video mới (YouTube hoặc TikTok) ===
+                # ========== XỬ LÝ VIDEO ==========
+                new_rows = []
+
+                if self.cfg.get("platform", "youtube") == "youtube":
+                    if all_new_ids:
+                        details = fetch_video_details(all_new_ids, multi_api_manager)
+                        for r in details:
+                            if iso_to_datetime(r["publishedAt"]) <= cutoff_dt:
+                                continue
+                            new_rows.append(r)
+
+                        self.log(f"Trước khi lọc mode: {len(new_rows)} video (mode={self.cfg['mode']})")
+
+                        # Log chi tiết từng video trước khi lọc
+                        from utils.yt_api import parse_iso8601_duration
+                        for idx, v in enumerate(new_rows, 1):
+                            duration_sec = parse_iso8601_duration(v.get("duration", "PT0S"))
+                            self.log(f"  Video {idx}: {v.get('title', 'No title')[:50]}... - Duration: {duration_sec}s")
+
+                        new_rows = filter_videos_by_mode(new_rows, self.cfg["mode"])
+
+                        self.log(f"Sau khi lọc mode: {len(new_rows)} video")
+
+                        if new_rows:
+                            added = append_records(self.cfg["out_path"], new_rows)
+                            self.log(f"Đã thêm {added}/{len(new_rows)} video mới vào file.")
+                        else:
+                            self.log("Không có video phù hợp sau khi lọc.")
+                    else:
+                        self.log("Không có video mới.")
+
+                elif self.cfg.get("platform") == "tiktok":
+                    # ========== XỬ LÝ TIKTOK ==========
+                    tiktok_key = multi_api_manager.get_next_tiktok_key()
+                    if not tiktok_key:
+                        self.log("❌ Không có TikTok API key. Vui lòng thêm key trong tab Đăng bài → 🔑 Quản lý API")
+                    else:
+                        new_rows = []
+                        for ch_url in self.cfg.get("channels", []):
+                            if self.stop_event.is_set():
+                                break
+                            try:
+                                # Extract username from URL
+                                username = extract_tiktok_username(ch_url)
+                                self.log(f"[TikTok] Đang quét @{username}...")
+
+                                # Step 1: Get secUid
+                                secuid = get_tiktok_secuid(username, tiktok_key, log_callback=self.log)
+                                if not secuid:
+                                    self.log(f"[TikTok] Không tìm thấy kênh @{username}")
+                                    continue
+
+                                # Step 2: Fetch latest 35 videos from TikTok
+                                all_videos = fetch_tiktok_videos_latest(secuid, username, tiktok_key, log_callback=self.log)
+
+                                # Step 3: Filter videos newer than cutoff_dt
+                                filtered = filter_videos_newer_than(all_videos, cutoff_dt, self.log)
+
+                                if filtered:
+                                    # Convert to output format
+                                    converted = convert_to_output_format(filtered)
+                                    new_rows.extend(converted)
+                                    self.log(f"[TikTok] {ch_url}: +{len(converted)} video mới.")
+                                else:
+                                    self.log(f"[TikTok] {ch_url}: không có video mới.")
+                            except Exception as e:
+                                self.log(f"[TikTok] Lỗi lấy video từ {ch_url}: {e}")
+
+                        if new_rows:
+                            added = append_records(self.cfg["out_path"], new_rows)
+                            self.log(f"🎵 Đã thêm {added}/{len(new_rows)} video TikTok mới vào file.")
+                        else:
+                            self.log("Không có video TikTok mới.")
+
+                else:
+                    self.log(f"Nền tảng chưa hỗ trợ: {self.cfg.get('platform')}")
+
+                metrics.observe("stream_scan_seconds", time.monotonic() - scan_start,
+                                platform=platform, stream=self.cfg["name"])
+
+                self.log("Kiểm tra nếu có video cũ chưa đăng thì sẽ đăng")
+   
+                # ========== ĐĂNG VIDEO ==========
+                try:
+                    with open(self.cfg["out_path"], "r", encoding="utf-8") as f:
+                        all_videos = json.load(f)
+
+                    vm_name = self.cfg.get("vm_name")
+
+                    for vid_index, vid in enumerate(all_videos):
+                        # Check trước mỗi video
+                        if self.stop_event.is_set():
+                            self.log("🛑 Dừng xử lý video")
+                            break
+
+                        if vid.get("status") != "unpost":
+                            continue
+
+                        url = vid.get("url", "")
+                        title = vid.get("title", "<3")
+
+                        # Apply auto remove hashtags if configured
+                        auto_remove_hashtags = self.cfg.get("auto_remove_hashtags", False)
+                        if auto_remove_hashtags:
+                            original_title = title
+                            title = remove_all_hashtags(title)
+                            if title != original_title:
+                                self.log(f"🗑️ Đã xóa tất cả hashtag khỏi title: {original_title} → {title}")
+
+                        # Apply remove keywords if configured
+                        remove_keywords = self.cfg.get("remove_keywords", "")
+                        if remove_keywords:
+                            original_title = title
+                            title = remove_keywords_from_text(title, remove_keywords)
+                            if title != original_title:
+                                self.log(f"✏️ Đã loại bỏ từ khóa khỏi title: {original_title} → {title}")
+
+                        self.log(f"🎬 [Bắt đầu] Xử lý video: {title}")
+
+                        # ========== ĐĂNG VIDEO QUA PIPELINE ==========
+                        # acquire → boot → adb_ready → prefetch → push → verify → post → teardown
+                        job = PostJob(
+                            job_id=f"{self.row_id}:{vid.get('id') or url}",
+                            vm_name=vm_name,
+                            source=url,
+                            title=title,
+                            log=self.log,
+                            stop_check=self.stop_event.is_set,
+                            has_more_work=lambda: any(v.get("status") == "unpost"
+                                                      for v in all_videos[vid_index + 1:]),
+                            caller=f"Follow:{self.cfg['name']}",
+                            platform=self.cfg.get("platform", "youtube"),
+                            max_attempts=1,  # Video lỗi giữ "unpost" → thử lại ở lần quét sau
+                            priority=VM_PRIORITY_STREAM,  # Nhường VM cho post hẹn giờ (có aging)
+                        )
+                        job = post_pipeline.run(job)
+
+                        if job.outcome == OUTCOME_STOPPED:
+                            self.log("🛑 Dừng xử lý video")
+                            break
+                        if job.outcome != OUTCOME_POSTED:
+                            self.log(f"❌ Bỏ qua video (lỗi ở bước {job.failed_stage}): {title}")
+                            continue
+
+                        # ========== CẬP NHẬT TRẠNG THÁI ==========
+                        vid["status"] = "post"
+
+                        # ========== UPDATE CUTOFF_DT ==========
+                        try:
+                            published_iso = vid.get("publishedAt")
+                            if published_iso:
+                                video_time = iso_to_datetime(published_iso)
+                                if video_time > cutoff_dt:
+                                    cutoff_dt = video_time
+                                    self.log(f"📅 Cập nhật cutoff → {cutoff_dt.strftime('%d/%m/%Y %H:%M')}")
+                        except Exception as e:
+                            self.log(f"⚠️ Không thể cập nhật cutoff_dt: {e}")
+
+                        self.log(f"✅ Hoàn tất {title}")
+
+                    # Lưu progress
+                    _atomic_write_json(self.cfg["out_path"], all_videos)
+
+
+                except Exception as e:
+                    self.log(f"⚠️ Lỗi xử lý video: {e}")
+                    logger.exception("Error processing video")
+
+                # NOTE: cutoff_dt đã được update ở line 707-713 SAU KHI đăng video thành công
+                # KHÔNG update từ new_rows vì video có thể chưa đăng (do lỗi)
+
+                # ========== ĐẾM NGƯỢC (Option 1: Check manual) ==========
+                if self.stop_event.is_set():
+                    break
+                
+                interval = int(self.cfg["interval_min"])
+                self.next_deadline = datetime.now(timezone.utc) + timedelta(minutes=interval)
+                
+                while not self.stop_event.is_set():
+                    now = datetime.now(timezone.utc)
+                    left = int((self.next_deadline - now).total_seconds())
+                    if left <= 0:
+                        break
+                    
+                    hh = left // 3600
+                    mm = (left % 3600) // 60
+                    ss = left % 60
+                    self.status = f"Đang chờ: {hh:02d}:{mm:02d}:{ss:02d}"
+                    ui_queue.put(("status", self.row_id, self.status))
+                    if self.worker_helper.cancel_token.wait(1):
+                        break
+            
+            self.status = "Đã dừng"
+            self.log("Luồng đã dừng.")
+
+
+        except Exception as e:
+            self.status = f"Lỗi: {e}"
+            self.log(f"Lỗi không mong muốn: {e}")
+            logger.exception("Unexpected error in stream worker")
+            import traceback
+            self.log(traceback.format_exc())
+        
+        finally:
+            # ========== CLEANUP ==========
+            if self.worker_helper:
+                self.worker_helper.cleanup()
+            
+            # Tắt máy ảo nếu còn đang bật (không giữ warm nữa) - trừ khi post khác đang giữ VM
+            try:
+                vm_name = self.cfg.get("vm_name")
+                if vm_name and warm_vm_pool.quit_if_free(vm_name, caller=f"Follow:{self.cfg['name']}"):
+                    time.sleep(WAIT_LONG)
+            except:
+                pass
+            
+            ui_queue.put(("status", self.row_id, self.status))
@@ -0,0 +1,120 @@
+"""
+Headless daemon - chạy lịch đăng bài + luồng theo dõi không cần mở GUI.
+
+Chạy từ thư mục gốc của tool:
+    python daemon.py
+    python daemon.py --port 8765 --start-streams
+    python daemon.py --role coordinator --host 0.0.0.0          (nhiều máy: core/coordinator.py)
+    python daemon.py --role agent --coordinator http://10.0.0.5:8765 --host-id PC-01
+
+Mở GUI (python main.py) khi daemon đang chạy → GUI chỉ làm thin client qua API (core/daemon.py).
+"""
+import os
+import signal
+import logging
+import argparse
+import subprocess
+
+from config import LOG_DIR, LOG_FILE, LOG_FORMAT, LOG_LEVEL
+from constants import DAEMON_HOST, DAEMON_PORT, AGENT_MAX_JOBS
+from utils.async_logging import setup_async_logging, stop_async_logging
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Instagram Automation Tool - headless daemon")
+    parser.add_argument("--host", default=DAEMON_HOST)
+    parser.add_argument("--port", type=int, default=DAEMON_PORT)
+    parser.add_argument("--start-streams", action="store_true",
+                        help="Start tất cả luồng theo dõi khi khởi động (mặc định: chờ start qua API)")
+    parser.add_argument("--role", choices=("daemon", "coordinator", "agent"), default="daemon",
+                        help="daemon: 1 máy (mặc định) / coordinator: chia post cho agent / agent: chạy VM máy này")
+    parser.add_argument("--coordinator", default=f"http://{DAEMON_HOST}:{DAEMON_PORT}",
+                        help="URL coordinator (--role agent)")
+    parser.add_argument("--host-id", default=None, help="Tên agent (mặc định: tên máy)")
+    parser.add_argument("--capacity", type=int, default=AGENT_MAX_JOBS,
+                        help="Số post chạy đồng thời tối đa (--role agent)")
+    parser.add_argument("--simulate", type=float, default=None, metavar="SECONDS",
+                        help="Agent không đăng thật, chỉ launch/quit VM (chạy thử với ldconsole/adb giả)")
+    args = parser.parse_args()
+
+    # Chạy thử trên Linux (ldconsole/adb giả) - flag chỉ có trên Windows
+    if not hasattr(subprocess, "CREATE_NO_WINDOW"):
+        subprocess.CREATE_NO_WINDOW = 0
+
+    os.makedirs(LOG_DIR, exist_ok=True)
+    setup_async_logging(getattr(logging, LOG_LEVEL), LOG_FORMAT, LOG_FILE)
+    logger = logging.getLogger(__name__)
+    logger.info("=" * 60)
+    logger.info(f"Daemon started ({args.role})")
+    logger.info("=" * 60)
+
+    # 📊 Metrics + 🧾 Trace log giống main.py
+    from utils.metrics import metrics
+    from utils.trace_log import trace_log
+    from utils.forensics import forensics
+    metrics.start_exporters()
+    trace_log.start()
+
+    if args.role == "agent":
+        run_agent(args, logger)
+        return
+
+    if args.role == "coordinator":
+        from core.coordinator import Coordinator
+        daemon = Coordinator()
+    else:
+        from core.daemon import FarmDaemon
+        daemon = FarmDaemon()
+    if not daemon.start(args.host, args.port, start_streams=args.start_streams):
+        logger.error("❌ Daemon không khởi động được (port đang bị chiếm?)")
+        stop_async_logging()
+        raise SystemExit(1)
+
+    def on_signal(signum, frame):
+        logger.info(f"🛑 Nhận tín hiệu {signum} - dừng daemon")
+        daemon.stop()
+
+    signal.signal(signal.SIGINT, on_signal)
+    if hasattr(signal, "SIGTERM"):
+        signal.signal(signal.SIGTERM, on_signal)
+
+    try:
+        daemon.serve_forever()
+    finally:
+        daemon.shutdown()
+        metrics.shutdown()
+        trace_log.shutdown()
+        forensics.shutdown()
+        stop_async_logging()
+
+
+def run_agent(args, logger):
+    from core.agent import HostAgent
+    from utils.daemon_client import DaemonClient
+    from utils.metrics import metrics
+    from utils.trace_log import trace_log
+    from utils.forensics import forensics
+
+    agent = HostAgent(DaemonClient.from_url(args.coordinator), host_id=args.host_id,
+                      capacity=args.capacity, simulate=args.simulate)
+
+    def on_signal(signum, frame):
+        logger.info(f"🛑 Nhận tín hiệu {signum} - dừng agent")
+        agent.stop()
+
+    signal.signal(signal.SIGINT, on_signal)
+    if hasattr(signal, "SIGTERM"):
+        signal.signal(signal.SIGTERM, on_signal)
+
+    try:
+        agent.run()
+    finally:
+        agent.shutdown()
+        metrics.shutdown()
+        trace_log.shutdown()
+        forensics.shutdown()
+        stop_async_logging()
+
+
+if __name__ == "__main__":
+    main()
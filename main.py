@@ -2,26 +2,21 @@ import os
 import logging
 from core.app import App
 from config import LOG_DIR, LOG_FILE, LOG_FORMAT, LOG_LEVEL
+from utils.async_logging import setup_async_logging
 
 
 def setup_logging():
     """
     Setup logging configuration for the application.
 
-    Logs to both file and console with proper formatting.
+    Logs to file (rotating), console and per-VM files with proper formatting.
+    Thread gọi log chỉ đẩy record vào queue - ghi file/console ở thread listener.
     """
     # Create logs directory if it doesn't exist
     os.makedirs(LOG_DIR, exist_ok=True)
 
     # Configure root logger
-    logging.basicConfig(
-        level=getattr(logging, LOG_LEVEL),
-        format=LOG_FORMAT,
-        handlers=[
-            logging.FileHandler(LOG_FILE, encoding='utf-8'),
-            logging.StreamHandler()
-        ]
-    )
+    setup_async_logging(getattr(logging, LOG_LEVEL), LOG_FORMAT, LOG_FILE)
 
     # Log startup
     logger = logging.getLogger(__name__)
@@ -32,5 +27,11 @@ def setup_logging():
 
 if __name__ == "__main__":
     setup_logging()
+    # 📊 Metrics: http://127.0.0.1:9464/metrics + logs/metrics/*.csv
+    from utils.metrics import metrics
+    metrics.start_exporters()
+    # 🧾 Trace log JSONL theo từng post: logs/trace/*.jsonl
+    from utils.trace_log import trace_log
+    trace_log.start()
     app = App()
     app.mainloop()
@@ -0,0 +1,303 @@
+"""
+Daemon Tab - GUI làm thin client khi headless daemon (daemon.py) đang chạy.
+
+Không giữ posts / scheduler / luồng trong GUI: mọi thao tác gọi API JSON-RPC của daemon
+(utils.daemon_client), bảng làm mới mỗi DAEMON_POLL_INTERVAL_MS. Đóng GUI không dừng farm.
+"""
+import os
+import logging
+import tkinter as tk
+from datetime import datetime, timedelta
+from tkinter import messagebox, filedialog
+from tkinter import ttk  # For Treeview only
+import customtkinter as ctk
+from ui_theme import *
+
+from constants import DAEMON_POLL_INTERVAL_MS
+from utils.daemon_client import DaemonClient, DaemonError
+from utils.trace_log import format_event, VN_TZ
+
+STATUS_ICONS = {
+    "draft": "📝 Nháp",
+    "pending": "⏳ Chờ",
+    "processing": "🔄 Đang đăng",
+    "posted": "✅ Đã đăng",
+    "failed": "❌ Thất bại",
+}
+
+
+class DaemonTab(ctk.CTkFrame):
+    """Thin client: bảng post + luồng của daemon"""
+
+    def __init__(self, parent, client: DaemonClient = None):
+        super().__init__(parent, fg_color=COLORS["bg_primary"], corner_radius=0)
+        self.logger = logging.getLogger(__name__)
+        self.client = client or DaemonClient()
+        self.log_windows = {}
+        self.streams = {}  # {trace: info luồng} - lần refresh gần nhất
+        self.is_shutting_down = False
+
+        self.build_topbar()
+        self.post_tree = self.build_table(
+            "📅 Bài đăng trên daemon",
+            (("title", "Tiêu đề", 320), ("account", "Tài khoản", 220), ("time", "Giờ hẹn", 150),
+             ("status", "Trạng thái", 140), ("run", "Chạy", 80)),
+            height=12
+        )
+        self.stream_tree = self.build_table(
+            "▶️ Luồng theo dõi trên daemon",
+            (("name", "Tên luồng", 260), ("platform", "Nền tảng", 100), ("account", "Máy ảo", 180),
+             ("status", "Trạng thái", 300), ("run", "Chạy", 80)),
+            height=5
+        )
+        self.refresh()
+
+    # ==================== UI ====================
+    def build_topbar(self):
+        top = ctk.CTkFrame(self, fg_color=COLORS["bg_secondary"], corner_radius=DIMENSIONS["corner_radius_medium"])
+        top.pack(fill=tk.X, padx=DIMENSIONS["spacing_lg"], pady=(DIMENSIONS["spacing_lg"], DIMENSIONS["spacing_sm"]))
+
+        self.status_label = ctk.CTkLabel(
+            top,
+            text=f"🛰️ Đang điều khiển daemon {self.client.base_url}",
+            font=(FONTS["family"], FONTS["size_medium"], FONTS["weight_semibold"]),
+            text_color=COLORS["accent"]
+        )
+        self.status_label.pack(side=tk.LEFT, padx=DIMENSIONS["spacing_md"])
+
+        actions = (
+            ("➕ Thêm video", self.add_videos, "success"),
+            ("⚙️ Đặt lịch", self.schedule_selected, "secondary"),
+            ("▶ Chạy", lambda: self.set_paused_selected(False), "primary"),
+            ("⏸ Dừng", lambda: self.set_paused_selected(True), "secondary"),
+            ("🛑 Dừng ngay", self.stop_selected, "danger"),
+            ("✖ Xóa", self.delete_selected, "danger"),
+            ("📝 Log", self.open_selected_log, "secondary"),
+        )
+        for text, command, style_name in reversed(actions):
+            ctk.CTkButton(top, text=text, command=command, **get_button_style(style_name), width=110).pack(
+                side=tk.RIGHT, padx=DIMENSIONS["spacing_xs"], pady=DIMENSIONS["spacing_sm"]
+            )
+
+    def build_table(self, title, columns, height):
+        outer = ctk.CTkFrame(self, fg_color=COLORS["bg_secondary"], corner_radius=DIMENSIONS["corner_radius_medium"])
+        outer.pack(fill=tk.BOTH, expand=True, padx=DIMENSIONS["spacing_lg"], pady=DIMENSIONS["spacing_sm"])
+        ctk.CTkLabel(
+            outer,
+            text=title,
+            font=(FONTS["family"], FONTS["size_medium"], FONTS["weight_semibold"]),
+            text_color=COLORS["text_primary"]
+        ).pack(padx=DIMENSIONS["spacing_md"], pady=(DIMENSIONS["spacing_md"], DIMENSIONS["spacing_sm"]), anchor="w")
+
+        frame = tk.Frame(outer, bg=COLORS["bg_tertiary"])
+        frame.pack(fill=tk.BOTH, expand=True, padx=DIMENSIONS["spacing_md"], pady=(0, DIMENSIONS["spacing_md"]))
+        tree = ttk.Treeview(frame, columns=[c[0] for c in columns], show="headings", height=height)
+        tree.tag_configure("oddrow", background=COLORS["bg_tertiary"])
+        tree.tag_configure("evenrow", background=COLORS["bg_secondary"])
+        for name, heading, width in columns:
+            tree.heading(name, text=heading)
+            tree.column(name, width=width, anchor=tk.W if name in ("title", "name", "status") else tk.CENTER)
+        vsb = ttk.Scrollbar(frame, orient="vertical", command=tree.yview)
+        tree.configure(yscroll=vsb.set)
+        tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        vsb.pack(side=tk.RIGHT, fill=tk.Y)
+        tree.bind("<Double-1>", lambda e: self.open_selected_log())
+        return tree
+
+    @staticmethod
+    def _fill(tree, rows):
+        """Cập nhật bảng theo id (giữ selection + vị trí cuộn, không xóa/dựng lại cả bảng)"""
+        seen = set()
+        for idx, (iid, values) in enumerate(rows):
+            seen.add(iid)
+            tag = ("evenrow" if idx % 2 == 0 else "oddrow",)
+            if tree.exists(iid):
+                tree.item(iid, values=values, tags=tag)
+                tree.move(iid, "", idx)
+            else:
+                tree.insert("", idx, iid=iid, values=values, tags=tag)
+        for iid in tree.get_children():
+            if iid not in seen:
+                tree.delete(iid)
+
+    def refresh(self):
+        """Làm mới 2 bảng từ daemon (tự gọi lại mỗi DAEMON_POLL_INTERVAL_MS)"""
+        if self.is_shutting_down:
+            return
+        self._update_tables()
+        self.after(DAEMON_POLL_INTERVAL_MS, self.refresh)
+
+    def _update_tables(self):
+        try:
+            posts = self.client.call("list_posts")
+            streams = self.client.call("list_streams")
+        except DaemonError as e:
+            self.status_label.configure(text=f"⚠️ Mất kết nối daemon: {e}", text_color=COLORS["danger"])
+            return
+        self._fill(self.post_tree, [(p["id"], (
+            p["title"], p["account_display"], p["scheduled_time_vn"] or "-",
+            STATUS_ICONS.get(p["status"], p["status"]),
+            "🔄" if p["running"] else ("⏸" if p["is_paused"] else "▶"),
+        )) for p in posts])
+        self._fill(self.stream_tree, [(s["trace"], (
+            s["name"], s["platform"], s["vm_name"] or "-", s["status"], "▶" if s["running"] else "■",
+        )) for s in streams])
+        self.streams = {s["trace"]: s for s in streams}
+        self.status_label.configure(text=f"🛰️ Đang điều khiển daemon {self.client.base_url}",
+                                    text_color=COLORS["accent"])
+
+    # ==================== ACTIONS ====================
+    def _call(self, method, **params):
+        try:
+            return self.client.call(method, **params)
+        except DaemonError as e:
+            messagebox.showerror("Daemon", f"❌ {method}: {e}")
+            return None
+
+    def _selected_posts(self):
+        return list(self.post_tree.selection())
+
+    def _selected_stream(self):
+        selection = self.stream_tree.selection()
+        return selection[0] if selection else None
+
+    def add_videos(self):
+        files = filedialog.askopenfilenames(
+            title="Chọn video để đăng",
+            filetypes=[("Video files", "*.mp4 *.avi *.mov *.mkv"), ("All files", "*.*")]
+        )
+        # Đường dẫn file phải đọc được từ máy chạy daemon (cùng máy → dùng nguyên đường dẫn)
+        for path in files:
+            if self._call("add_post", video_path=os.path.abspath(path)) is None:
+                break
+        self.refresh_now()
+
+    def schedule_selected(self):
+        post_ids = self._selected_posts()
+        if not post_ids:
+            messagebox.showinfo("Thông báo", "Chọn ít nhất 1 video trong bảng")
+            return
+        vms = self._call("list_vms")
+        if not vms:
+            return
+
+        dialog = tk.Toplevel(self)
+        dialog.title(f"Đặt lịch {len(post_ids)} video")
+        dialog.geometry("420x260")
+        dialog.grab_set()
+
+        ttk.Label(dialog, text="Máy ảo:").pack(anchor="w", padx=16, pady=(16, 2))
+        vm_var = tk.StringVar(value=vms[0]["display"])
+        ttk.Combobox(dialog, textvariable=vm_var, values=[v["display"] for v in vms], state="readonly").pack(
+            fill=tk.X, padx=16)
+        ttk.Label(dialog, text="Giờ hẹn (dd/mm/YYYY HH:MM, giờ VN):").pack(anchor="w", padx=16, pady=(10, 2))
+        time_var = tk.StringVar(value=(datetime.now(VN_TZ) + timedelta(minutes=10)).strftime("%d/%m/%Y %H:%M"))
+        ttk.Entry(dialog, textvariable=time_var).pack(fill=tk.X, padx=16)
+        post_now_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(dialog, text="⚡ Đăng ngay khi chạy", variable=post_now_var).pack(anchor="w", padx=16, pady=8)
+
+        def on_save():
+            vm_name = next(v["vm_name"] for v in vms if v["display"] == vm_var.get())
+            for post_id in post_ids:
+                result = self._call("update_post", post_id=post_id, vm_name=vm_name,
+                                    scheduled_time=None if post_now_var.get() else time_var.get().strip(),
+                                    post_now=post_now_var.get())
+                if result is None:
+                    return
+            dialog.destroy()
+            self.refresh_now()
+
+        ttk.Button(dialog, text="💾 Lưu", command=on_save, width=15).pack(pady=12)
+
+    def set_paused_selected(self, paused):
+        for post_id in self._selected_posts():
+            self._call("set_paused", post_id=post_id, paused=paused)
+        stream_id = self._selected_stream()
+        if stream_id:
+            self._call("stop_stream" if paused else "start_stream", stream_id=self.streams[stream_id]["id"])
+        self.refresh_now()
+
+    def stop_selected(self):
+        for post_id in self._selected_posts():
+            self._call("stop_post", post_id=post_id)
+        self.refresh_now()
+
+    def delete_selected(self):
+        post_ids = self._selected_posts()
+        if post_ids and messagebox.askyesno("Xóa", f"Xóa {len(post_ids)} video khỏi daemon?"):
+            for post_id in post_ids:
+                self._call("delete_post", post_id=post_id)
+            self.refresh_now()
+
+    def refresh_now(self):
+        """Cập nhật bảng ngay sau thao tác (không đợi lần poll kế tiếp)"""
+        self._update_tables()
+
+    # ==================== LOG ====================
+    def open_selected_log(self):
+        selection = self._selected_posts()
+        if selection:
+            self.open_log_window(selection[0], self.post_tree.set(selection[0], "title"))
+            return
+        stream_id = self._selected_stream()
+        if stream_id:
+            self.open_log_window(stream_id, self.streams[stream_id]["name"])
+
+    def open_log_window(self, trace, title):
+        """Cửa sổ log: snapshot từ daemon, sau đó poll event mới (since=ts) mỗi giây"""
+        if trace in self.log_windows and self.log_windows[trace].winfo_exists():
+            self.log_windows[trace].focus()
+            return
+        logs = self._call("get_logs", trace=trace)
+        if logs is None:
+            return
+
+        win = tk.Toplevel(self)
+        win.title(f"Log – {title}")
+        win.geometry("800x480")
+        txt = tk.Text(win, wrap="word", state="disabled")
+        txt.pack(fill=tk.BOTH, expand=True)
+        self.log_windows[trace] = win
+        state = {"since": 0, "cursor": logs["cursor"]}
+
+        def append(events, at_top=False):
+            if not events:
+                return
+            txt.config(state="normal")
+            text = "\n".join(format_event(e) for e in events) + "\n"
+            txt.insert("1.0" if at_top else "end", text)
+            txt.see("1.0" if at_top else "end")
+            txt.config(state="disabled")
+            if not at_top:
+                state["since"] = events[-1]["ts"]
+
+        def poll():
+            if not win.winfo_exists():
+                return
+            try:
+                append(self.client.call("get_logs", trace=trace, since=state["since"])["events"])
+            except DaemonError:
+                pass
+            win.after(1000, poll)
+
+        def load_older():
+            older = self._call("get_logs", trace=trace, before=state["cursor"])
+            if older:
+                state["cursor"] = older["cursor"]
+                append(older["events"], at_top=True)
+            if not state["cursor"]:
+                btn_older.state(["disabled"])
+
+        append(logs["events"])
+        btns = tk.Frame(win)
+        btns.pack(fill=tk.X, pady=5)
+        btn_older = ttk.Button(btns, text="⬆ Tải log cũ hơn", command=load_older)
+        btn_older.pack(side=tk.LEFT, padx=4)
+        if not state["cursor"]:
+            btn_older.state(["disabled"])
+        ttk.Button(btns, text="Đóng", command=win.destroy).pack(side=tk.RIGHT, padx=4)
+        win.after(1000, poll)
+
+    def cleanup(self):
+        """Đóng GUI không dừng daemon - chỉ ngừng poll"""
+        self.is_shutting_down = True
@@ -10,15 +10,12 @@ YouTube Multi-Stream Watcher GUI
 - Lọc: Shorts (<60s), Long (>=60s), hoặc Cả 2
 - Lưu kết quả mỗi luồng: E:\tool_ld\data\output\<slug_ten_luong>.json  (chỉ 4 trường: title, publishedAt, duration, url)
 """
-import subprocess
 import os
-import re
-import json
 import time
 import queue
 import threading
 import logging
-from datetime import datetime, timezone, timedelta
+from datetime import datetime
 import tkinter as tk
 from tkinter import messagebox, simpledialog
 from tkinter import ttk  # For Treeview only
@@ -26,153 +23,29 @@ import customtkinter as ctk
 from ui_theme import *
 import traceback
 import sys
-from utils.download_dlp import download_video_api
-from utils.send_file import send_file_api
-from utils.post import InstagramPost
-from utils.delete_file import clear_dcim, clear_pictures
-from utils.file_checker import verify_file_after_push
-from utils.vm_manager import vm_manager
-from utils.text_utils import remove_keywords_from_text, remove_all_hashtags
-from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
-from config import LDCONSOLE_EXE, ADB_EXE, VM_DATA_DIR, get_vm_id_from_name
-from constants import WAIT_SHORT, WAIT_MEDIUM, WAIT_LONG, WAIT_EXTRA_LONG, TIMEOUT_DEFAULT, TIMEOUT_MINUTE
+from utils.persistence import atomic_write_json
+from utils.vm_registry import vm_registry
+from utils.trace_log import trace_log, format_event
+from config import LDCONSOLE_EXE
 from utils.api_manager_multi import multi_api_manager
-from utils.tiktok_api_rapidapi import (
-    extract_tiktok_username,
-    get_tiktok_secuid,
-    fetch_tiktok_videos_latest,
-    filter_videos_newer_than,
-    convert_to_output_format,
-    download_tiktok_video,
-    check_tiktok_api_key_valid
+from utils.tiktok_api_rapidapi import check_tiktok_api_key_valid
+from utils.yt_api import check_api_key_valid, parse_vn_datetime
+from core.streams import (
+    OUTPUT_DIR, VN_TZ, Stream, slugify, load_streams_meta, save_streams_meta, reset_output_file
 )
-from utils.yt_api import check_api_key_valid
-
-class StoppableWorker:
-    """Helper class để chạy tác vụ có thể dừng"""
-    
-    def __init__(self, stop_event):
-        self.stop_event = stop_event
-        self.current_process = None
-        self.executor = ThreadPoolExecutor(max_workers=1)
-    
-    def run_blocking_func(self, func, *args, timeout=300, check_interval=1, **kwargs):
-        """
-        Chạy hàm blocking với khả năng dừng
-        
-        Args:
-            func: Hàm cần chạy
-            timeout: Thời gian tối đa (giây)
-            check_interval: Kiểm tra stop_event mỗi X giây
-        
-        Returns:
-            (success, result, reason)
-        """
-        future = self.executor.submit(func, *args, **kwargs)
-        
-        elapsed = 0
-        while elapsed < timeout:
-            if self.stop_event.is_set():
-                future.cancel()
-                return (False, None, "stopped")
-            
-            if future.done():
-                try:
-                    result = future.result(timeout=0.1)
-                    return (True, result, "completed")
-                except Exception as e:
-                    return (False, None, f"error: {e}")
-            
-            time.sleep(check_interval)
-            elapsed += check_interval
-        
-        future.cancel()
-        return (False, None, "timeout")
-    
-    def run_subprocess(self, cmd_list, timeout=300, check_interval=0.5):
-        """
-        Chạy subprocess với khả năng dừng
-        
-        Returns:
-            (success, returncode, reason)
-        """
-        try:
-            self.current_process = subprocess.Popen(
-                cmd_list,
-                stdout=subprocess.DEVNULL,
-                stderr=subprocess.DEVNULL,
-                creationflags=subprocess.CREATE_NO_WINDOW
-            )
-            
-            elapsed = 0
-            while elapsed < timeout:
-                if self.stop_event.is_set():
-                    self._kill_process()
-                    return (False, None, "stopped")
-                
-                retcode = self.current_process.poll()
-                if retcode is not None:
-                    return (True, retcode, "completed")
-                
-                time.sleep(check_interval)
-                elapsed += check_interval
-            
-            self._kill_process()
-            return (False, None, "timeout")
-            
-        except Exception as e:
-            return (False, None, f"error: {e}")
-        finally:
-            self.current_process = None
-    
-    def _kill_process(self):
-        """Kill process an toàn"""
-        if self.current_process:
-            try:
-                self.current_process.terminate()
-                self.current_process.wait(timeout=5)
-            except:
-                try:
-                    self.current_process.kill()
-                except:
-                    pass
-    
-    def cleanup(self):
-        """Cleanup resources"""
-        self._kill_process()
-        self.executor.shutdown(wait=False)
 
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
 
-from utils.yt_api import (
-    extract_channel_id,
-    get_uploads_playlist_id,
-    iter_playlist_videos_newer_than,
-    fetch_video_details,
-    filter_videos_by_mode,
-    parse_vn_datetime,
-    iso_to_datetime,
-    datetime_to_iso,
-    check_api_key_valid
-)
-
 
 def get_vm_list_with_insta():
-    """Lấy danh sách máy ảo kèm tên Instagram từ data/vm/"""
+    """Lấy danh sách máy ảo kèm tên Instagram từ data/vm/ (qua VM registry)"""
     vm_list = []
     try:
-        if not os.path.exists(VM_DATA_DIR):
-            return vm_list
-
-        files = [f for f in os.listdir(VM_DATA_DIR) if f.endswith(".json")]
-        for f in files:
-            path = os.path.join(VM_DATA_DIR, f)
-            with open(path, "r", encoding="utf-8") as fp:
-                data = json.load(fp)
-                vm_name = data.get("vm_name", "")
-                insta_name = data.get("insta_name", "")
-                display = f"{vm_name} - {insta_name}" if insta_name else vm_name
-                vm_list.append({"vm_name": vm_name, "display": display})
+        for data in vm_registry.list_vms():
+            vm_name = data.get("vm_name", "")
+            insta_name = data.get("insta_name", "")
+            display = f"{vm_name} - {insta_name}" if insta_name else vm_name
+            vm_list.append({"vm_name": vm_name, "display": display})
     except Exception as e:
         print(f"Lỗi khi đọc danh sách máy ảo: {e}")
     
@@ -181,818 +54,6 @@ def show_exception_dialog(title: str, err: Exception):
     tb = traceback.format_exc(limit=3)
     messagebox.showerror(title, f"{err}\n\n{tb}")
 
-# ========================= CẤU HÌNH ĐƯỜNG DẪN =========================
-OUTPUT_DIR = "data/output"
-STREAMS_META = os.path.join(OUTPUT_DIR, "streams.json")
-
-# ========================= HẰNG SỐ / TIỆN ÍCH =========================
-VN_TZ = timezone(timedelta(hours=7))  # Asia/Ho_Chi_Minh (UTC+7)
-LOCK = threading.Lock()  # khóa chung cho trạng thái chia sẻ
-
-def ensure_dirs():
-    os.makedirs(OUTPUT_DIR, exist_ok=True)
-    if not os.path.exists(STREAMS_META):
-        with open(STREAMS_META, "w", encoding="utf-8") as f:
-            json.dump({"streams": []}, f, ensure_ascii=False, indent=2)
-
-def slugify(name: str) -> str:
-    s = re.sub(r"[^a-zA-Z0-9\-_\s]+", "", name)
-    s = re.sub(r"\s+", "_", s).strip("_")
-    return s or "stream"
-
-def load_streams_meta():
-    ensure_dirs()
-    with open(STREAMS_META, "r", encoding="utf-8") as f:
-        return json.load(f)
-
-def save_streams_meta(meta):
-    ensure_dirs()
-    with open(STREAMS_META, "w", encoding="utf-8") as f:
-        json.dump(meta, f, ensure_ascii=False, indent=2)
-
-def load_existing_urls(path: str) -> set:
-    if not os.path.exists(path):
-        return set()
-    try:
-        with open(path, "r", encoding="utf-8") as f:
-            data = json.load(f)
-            return {d.get("url") for d in data if isinstance(d, dict)}
-    except Exception:
-        return set()
-
-def newest_published_at(path: str, default_iso: str) -> datetime:
-    """Đọc file kết quả để xác định mốc mới nhất; nếu không có thì dùng default_iso."""
-    newest = iso_to_datetime(default_iso)
-    if os.path.exists(path):
-        try:
-            with open(path, "r", encoding="utf-8") as f:
-                data = json.load(f)
-            for d in data:
-                pub = d.get("publishedAt")
-                if pub:
-                    dtp = iso_to_datetime(pub)
-                    if dtp > newest:
-                        newest = dtp
-        except Exception:
-            pass
-    return newest
-
-def _atomic_write_json(path, data):
-    tmp = f"{path}.tmp"
-    with open(tmp, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
-    os.replace(tmp, path)  # atomic trên Windows/Unix
-    
-def append_records(path: str, new_rows: list):
-    os.makedirs(os.path.dirname(path), exist_ok=True)
-    data = []
-    if os.path.exists(path):
-        try:
-            with open(path, "r", encoding="utf-8") as f:
-                data = json.load(f)
-        except Exception:
-            data = []
-    known = {d["url"] for d in data if isinstance(d, dict) and "url" in d}
-    for r in sorted(new_rows, key=lambda x: x["publishedAt"]):
-        if r["url"] not in known:
-            data.append(r); known.add(r["url"])
-    _atomic_write_json(path, data)
-    return len(new_rows)
-
-def reset_output_file(path: str):
-    """Xoá nội dung file kết quả của luồng và tạo file rỗng."""
-    try:
-        if os.path.exists(path):
-            os.remove(path)  # xoá file cũ
-        # tạo file rỗng (có thể bỏ nếu muốn để tool tự tạo lúc ghi lần đầu)
-        with open(path, "w", encoding="utf-8") as f:
-            json.dump([], f, ensure_ascii=False, indent=2)
-    except Exception:
-        pass
-
-# ========================= QUẢN LÝ LUỒNG =========================
-class Stream:
-    def __init__(self, cfg: dict, row_id: str, log_callback=None):
-        self.cfg = cfg  # dict: id, name, start_vn, channels, mode, interval_min, out_path
-        self.row_id = row_id
-        self.thread = None
-        self.stop_event = threading.Event()
-        self.next_deadline = None  # datetime (UTC) cho lần chạy tiếp theo
-        self.status = "Chưa chạy"
-        self.logs = []
-        self.log_callback = log_callback
-        self.worker_helper = None
-
-    def log(self, msg: str):
-        stamp = datetime.now(VN_TZ).strftime("%d/%m/%Y %H:%M:%S")
-        line = f"[{stamp}] {msg}"
-        self.logs.append(line)
-        if len(self.logs) > 1000:
-            self.logs = self.logs[-1000:]
-        # 🟢 gọi callback realtime
-        if self.log_callback:
-            self.log_callback(self.row_id, line)
-
-    def is_running(self):
-        return self.thread is not None and self.thread.is_alive()
-
-    def start(self, ui_queue):
-        if self.is_running():
-            return
-        self.stop_event.clear()
-        self.thread = threading.Thread(target=self.worker, args=(ui_queue,), daemon=True)
-        self.thread.start()
-
-    def stop(self):
-        self.stop_event.set()
-        if self.worker_helper:
-            self.worker_helper.cleanup()
-        if self.thread and self.thread.is_alive():
-            self.thread.join(timeout=5)
-
-    def worker(self, ui_queue: queue.Queue):
-        self.worker_helper = StoppableWorker(self.stop_event)
-        logger = logging.getLogger(f"{__name__}.Stream.{self.cfg['name']}")
-        try:
-            self.status = "Đang chạy (khởi tạo)"
-            ui_queue.put(("status", self.row_id, self.status))
-            
-            default_cutoff_utc = parse_vn_datetime(self.cfg["start_vn"], VN_TZ).astimezone(timezone.utc)
-            default_cutoff_iso = datetime_to_iso(default_cutoff_utc)
-            cutoff_dt = newest_published_at(self.cfg["out_path"], default_cutoff_iso)
-
-            # ✅ FIX: Không tạo shared auto_poster ở đây
-            # Mỗi video sẽ tạo InstagramPost riêng để tránh log nhầm
-
-            # ========== VÒNG LẶP CHÍNH ==========
-            while not self.stop_event.is_set():
-                self.log("Bắt đầu quét...")
-
-                platform = self.cfg.get("platform", "youtube")
-
-                # CHỈ KHAI BÁO all_new_ids KHI LÀ YOUTUBE
-                all_new_ids = []
-
-                if platform == "youtube":
-                    # ========== QUÉT KÊNH YOUTUBE ==========
-                    for ch_url in self.cfg["channels"]:
-                        if self.stop_event.is_set():
-                            self.log("🛑 Dừng quét kênh")
-                            break
-
-                        try:
-                            cid = extract_channel_id(ch_url, multi_api_manager)
-                            pid = get_uploads_playlist_id(cid, multi_api_manager)
-
-                            ids = []
-                            for vid, pub in iter_playlist_videos_newer_than(pid, cutoff_dt, multi_api_manager):
-                                if self.stop_event.is_set():
-                                    break
-                                ids.append(vid)
-                            
-                            if ids:
-                                all_new_ids.extend(ids)
-                                self.log(f"[YouTube] {ch_url}: tìm thấy {len(ids)} video mới.")
-                            else:
-                                self.log(f"[YouTube] {ch_url}: không có video mới.")
-                        except Exception as e:
-                            self.log(f"[YouTube] Lỗi kênh {ch_url}: {e}")
-
-                elif platform != "tiktok":
-                    # TikTok logic đã được xử lý ở phần "XỬ LÝ VIDEO" bên dưới
-                    self.log(f"Nền tảng chưa hỗ trợ: {platform}")
-
-                
-                # Check trước khi xử lý video
-                if self.stop_event.is_set():
-                    break
-                
-                # ========== XỬ LÝ VIDEO ==========
-                # === Xử lý lấy video mới (YouTube hoặc TikTok) ===
-                # ========== XỬ LÝ VIDEO ==========
-                new_rows = []
-
-                if self.cfg.get("platform", "youtube") == "youtube":
-                    if all_new_ids:
-                        details = fetch_video_details(all_new_ids, multi_api_manager)
-                        for r in details:
-                            if iso_to_datetime(r["publishedAt"]) <= cutoff_dt:
-                                continue
-                            new_rows.append(r)
-
-                        self.log(f"Trước khi lọc mode: {len(new_rows)} video (mode={self.cfg['mode']})")
-
-                        # Log chi tiết từng video trước khi lọc
-                        from utils.yt_api import parse_iso8601_duration
-                        for idx, v in enumerate(new_rows, 1):
-                            duration_sec = parse_iso8601_duration(v.get("duration", "PT0S"))
-                            self.log(f"  Video {idx}: {v.get('title', 'No title')[:50]}... - Duration: {duration_sec}s")
-
-                        new_rows = filter_videos_by_mode(new_rows, self.cfg["mode"])
-
-                        self.log(f"Sau khi lọc mode: {len(new_rows)} video")
-
-                        if new_rows:
-                            added = append_records(self.cfg["out_path"], new_rows)
-                            self.log(f"Đã thêm {added}/{len(new_rows)} video mới vào file.")
-                        else:
-                            self.log("Không có video phù hợp sau khi lọc.")
-                    else:
-                        self.log("Không có video mới.")
-
-                elif self.cfg.get("platform") == "tiktok":
-                    # ========== XỬ LÝ TIKTOK ==========
-                    tiktok_key = multi_api_manager.get_next_tiktok_key()
-                    if not tiktok_key:
-                        self.log("❌ Không có TikTok API key. Vui lòng thêm key trong tab Đăng bài → 🔑 Quản lý API")
-                    else:
-                        new_rows = []
-                        for ch_url in self.cfg.get("channels", []):
-                            if self.stop_event.is_set():
-                                break
-                            try:
-                                # Extract username from URL
-                                username = extract_tiktok_username(ch_url)
-                                self.log(f"[TikTok] Đang quét @{username}...")
-
-                                # Step 1: Get secUid
-                                secuid = get_tiktok_secuid(username, tiktok_key, log_callback=self.log)
-                                if not secuid:
-                                    self.log(f"[TikTok] Không tìm thấy kênh @{username}")
-                                    continue
-
-                                # Step 2: Fetch latest 35 videos from TikTok
-                                all_videos = fetch_tiktok_videos_latest(secuid, username, tiktok_key, log_callback=self.log)
-
-                                # Step 3: Filter videos newer than cutoff_dt
-                                filtered = filter_videos_newer_than(all_videos, cutoff_dt, self.log)
-
-                                if filtered:
-                                    # Convert to output format
-                                    converted = convert_to_output_format(filtered)
-                                    new_rows.extend(converted)
-                                    self.log(f"[TikTok] {ch_url}: +{len(converted)} video mới.")
-                                else:
-                                    self.log(f"[TikTok] {ch_url}: không có video mới.")
-                            except Exception as e:
-                                self.log(f"[TikTok] Lỗi lấy video từ {ch_url}: {e}")
-
-                        if new_rows:
-                            added = append_records(self.cfg["out_path"], new_rows)
-                            self.log(f"🎵 Đã thêm {added}/{len(new_rows)} video TikTok mới vào file.")
-                        else:
-                            self.log("Không có video TikTok mới.")
-
-                else:
-                    self.log(f"Nền tảng chưa hỗ trợ: {self.cfg.get('platform')}")
-
-
-                self.log("Kiểm tra nếu có video cũ chưa đăng thì sẽ đăng")
-   
-                # ========== ĐĂNG VIDEO ==========
-                try:
-                    with open(self.cfg["out_path"], "r", encoding="utf-8") as f:
-                        all_videos = json.load(f)
-
-                    vm_name = self.cfg.get("vm_name")
-
-                    for vid in all_videos:
-                        vm_acquired = False  # Reset flag cho mỗi video
-
-                        # Check trước mỗi video
-                        if self.stop_event.is_set():
-                            self.log("🛑 Dừng xử lý video")
-                            break
-
-                        if vid.get("status") != "unpost":
-                            continue
-
-                        url = vid.get("url", "")
-                        title = vid.get("title", "<3")
-
-                        # Apply auto remove hashtags if configured
-                        auto_remove_hashtags = self.cfg.get("auto_remove_hashtags", False)
-                        if auto_remove_hashtags:
-                            original_title = title
-                            title = remove_all_hashtags(title)
-                            if title != original_title:
-                                self.log(f"🗑️ Đã xóa tất cả hashtag khỏi title: {original_title} → {title}")
-
-                        # Apply remove keywords if configured
-                        remove_keywords = self.cfg.get("remove_keywords", "")
-                        if remove_keywords:
-                            original_title = title
-                            title = remove_keywords_from_text(title, remove_keywords)
-                            if title != original_title:
-                                self.log(f"✏️ Đã loại bỏ từ khóa khỏi title: {original_title} → {title}")
-
-                        self.log(f"🎬 [Bắt đầu] Xử lý video: {title}")
-
-                        # ========== ACQUIRE VM LOCK ==========
-                        self.log(f"🔒 Chờ máy ảo '{vm_name}' sẵn sàng...")
-                        if not vm_manager.acquire_vm(vm_name, timeout=5400, caller=f"Follow:{self.cfg['name']}"):
-                            self.log(f"⏱️ Timeout chờ máy ảo '{vm_name}' sau 1.5 giờ - Bỏ qua video")
-                            continue
-
-                        vm_acquired = True
-                        self.log(f"✅ Đã khóa máy ảo '{vm_name}'")
-
-                        # Wrap toàn bộ logic xử lý video trong try/finally để đảm bảo release
-                        try:
-                            # ========== KIỂM TRA MÁY ẢO (Option 3: subprocess) ==========
-                            try:
-                                result = subprocess.run(
-                                    [LDCONSOLE_EXE, "list2"],
-                                    capture_output=True, text=True, creationflags=subprocess.CREATE_NO_WINDOW
-                                )
-                                is_running = False
-                                for line in result.stdout.splitlines():
-                                    parts = line.split(",")
-                                    if len(parts) >= 5 and parts[1].strip() == vm_name:
-                                        is_running = (parts[4].strip() == "1")
-                                        break
-                            except Exception as e:
-                                self.log(f"⚠️ Không thể kiểm tra trạng thái máy ảo: {e}")
-                                logger.exception("Error checking VM status")
-                                is_running = True  # Assume running để skip video
-
-                            # 🧩 2️⃣ Xử lý trạng thái máy ảo (QUEUE-BASED: Đảm bảo VM ở trạng thái sạch)
-                            if is_running:
-                                # VM đang chạy → Reboot để đảm bảo trạng thái sạch
-                                self.log(f"⚠️ Máy ảo '{vm_name}' đang chạy — Reboot để đảm bảo trạng thái sạch")
-
-                                # ✅ KHÔNG reset ADB server toàn cục (ảnh hưởng tất cả VMs khác!)
-                                # LDPlayer sẽ tự động setup lại ADB connection khi reboot
-
-                                subprocess.run([LDCONSOLE_EXE, "reboot", "--name", vm_name],
-                                            creationflags=subprocess.CREATE_NO_WINDOW)
-                            else:
-                                # VM chưa chạy → Bật mới
-                                if self.stop_event.is_set():
-                                    break
-
-                                self.log(f"🚀 Bật máy ảo '{vm_name}' để đăng video: {title}")
-
-                                # ✅ KHÔNG reset ADB server toàn cục (ảnh hưởng tất cả VMs khác!)
-                                # LDPlayer sẽ tự động setup lại ADB connection khi launch
-
-                                subprocess.run([LDCONSOLE_EXE, "launch", "--name", vm_name],
-                                            creationflags=subprocess.CREATE_NO_WINDOW)
-
-                            # ========== CHỜ MÁY ẢO SẴN SÀNG (Tăng timeout lên 120s) ==========
-                            self.log(f"⏳ Chờ máy ảo '{vm_name}' khởi động hoàn toàn...")
-                            if not vm_manager.wait_vm_ready(vm_name, LDCONSOLE_EXE, timeout=120, log_callback=self.log):
-                                self.log(f"⏱️ Timeout 120s - Máy ảo '{vm_name}' không khởi động được")
-                                self.log(f"🛑 Tắt máy ảo '{vm_name}'...")
-                                self.worker_helper.run_subprocess(
-                                    [LDCONSOLE_EXE, "quit", "--name", vm_name],
-                                    timeout=30
-                                )
-                                # QUAN TRỌNG: Đợi VM tắt HOÀN TOÀN trước khi release lock
-                                vm_manager.wait_vm_stopped(vm_name, LDCONSOLE_EXE, timeout=60)
-                                time.sleep(WAIT_EXTRA_LONG)
-                                self.log(f"✅ Đã tắt máy ảo hoàn toàn")
-                                continue
-
-                            # ========== CHỜ ADB KẾT NỐI ==========
-                            # ✅ v1.5.36: Tìm VM ID từ tên máy ảo
-                            vm_id = get_vm_id_from_name(vm_name)
-                            if not vm_id:
-                                self.log(f"❌ Không tìm thấy file cấu hình cho VM: {vm_name}")
-                                continue
-
-                            vm_file = os.path.join(VM_DATA_DIR, f"{vm_id}.json")
-                            with open(vm_file, "r", encoding="utf-8") as f:
-                                vm_info = json.load(f)
-                            port = vm_info.get("port")
-                            adb_device = f"emulator-{port}"
-
-                            # Ensure ADB connection (force connect nếu cần)
-                            self.log(f"🔌 Đang kết nối ADB...")
-                            if not vm_manager.ensure_adb_connected(adb_device, ADB_EXE, max_retries=3, log_callback=self.log):
-                                self.log(f"❌ Không thể kết nối ADB đến '{adb_device}'")
-                                self.log(f"🛑 Tắt máy ảo '{vm_name}'...")
-                                self.worker_helper.run_subprocess(
-                                    [LDCONSOLE_EXE, "quit", "--name", vm_name],
-                                    timeout=30
-                                )
-                                vm_manager.wait_vm_stopped(vm_name, LDCONSOLE_EXE, timeout=60)
-                                time.sleep(WAIT_EXTRA_LONG)
-                                self.log(f"❌ Lỗi kết nối ADB - Đã tắt máy ảo")
-                                continue  # Skip video này
-
-                            self.log(f"⏳ Chờ ADB sẵn sàng...")
-                            if not vm_manager.wait_adb_ready(adb_device, ADB_EXE, timeout=30, log_callback=self.log):
-                                self.log(f"⏱️ Timeout - ADB không kết nối được đến '{adb_device}'")
-                                self.log(f"🛑 Tắt máy ảo '{vm_name}'...")
-                                self.worker_helper.run_subprocess(
-                                    [LDCONSOLE_EXE, "quit", "--name", vm_name],
-                                    timeout=30
-                                )
-                                # QUAN TRỌNG: Đợi VM tắt HOÀN TOÀN trước khi release lock
-                                vm_manager.wait_vm_stopped(vm_name, LDCONSOLE_EXE, timeout=60)
-                                time.sleep(WAIT_EXTRA_LONG)
-                                self.log(f"✅ Đã tắt máy ảo hoàn toàn")
-                                continue
-
-                            # ========== TẢI VIDEO (Option 2: Thread + timeout) ==========
-                            if self.stop_event.is_set():
-                                break
-
-                            self.log(f"📥 Đang tải video: {title}")
-
-                            # Chọn download function dựa vào platform
-                            platform = self.cfg.get("platform", "youtube")
-
-                            if platform == "tiktok":
-                                # Get TikTok API key for download
-                                tiktok_key = multi_api_manager.get_next_tiktok_key()
-                                if not tiktok_key:
-                                    self.log(f"❌ Không có TikTok API key để tải video")
-                                    self.log(f"🛑 Tắt máy ảo '{vm_name}'...")
-                                    self.worker_helper.run_subprocess(
-                                        [LDCONSOLE_EXE, "quit", "--name", vm_name],
-                                        timeout=30
-                                    )
-                                    vm_manager.wait_vm_stopped(vm_name, LDCONSOLE_EXE, timeout=60)
-                                    time.sleep(WAIT_EXTRA_LONG)
-                                    continue
-
-                                # Download TikTok video using RapidAPI
-                                success, video_path, reason = self.worker_helper.run_blocking_func(
-                                    download_tiktok_video,
-                                    url,
-                                    tiktok_key,
-                                    log_callback=lambda msg: self.log(msg),
-                                    timeout=600,  # 10 phút
-                                    check_interval=2
-                                )
-                            else:
-                                # Download YouTube video
-                                success, video_path, reason = self.worker_helper.run_blocking_func(
-                                    download_video_api,
-                                    url,
-                                    log_callback=lambda msg: self.log(msg),
-                                    timeout=600,  # 10 phút
-                                    check_interval=2
-                                )
-
-                            if not success:
-                                if reason == "stopped":
-                                    self.log("🛑 Dừng tải video")
-                                    # Tắt máy ảo trước khi break
-                                    self.log(f"🛑 Tắt máy ảo '{vm_name}'...")
-                                    self.worker_helper.run_subprocess(
-                                        [LDCONSOLE_EXE, "quit", "--name", vm_name],
-                                        timeout=30
-                                    )
-                                    vm_manager.wait_vm_stopped(vm_name, LDCONSOLE_EXE, timeout=60)
-                                    time.sleep(WAIT_EXTRA_LONG)
-                                    break
-                                else:
-                                    self.log(f"❌ Không thể tải video: {reason}")
-                                    self.log(f"🛑 Tắt máy ảo '{vm_name}'...")
-                                    self.worker_helper.run_subprocess(
-                                        [LDCONSOLE_EXE, "quit", "--name", vm_name],
-                                        timeout=30
-                                    )
-                                    vm_manager.wait_vm_stopped(vm_name, LDCONSOLE_EXE, timeout=60)
-                                    time.sleep(WAIT_EXTRA_LONG)
-                                    self.log(f"✅ Đã tắt máy ảo hoàn toàn")
-                                    continue
-
-                            if not video_path or not os.path.exists(video_path):
-                                self.log(f"❌ File video không tồn tại")
-                                self.log(f"🛑 Tắt máy ảo '{vm_name}'...")
-                                self.worker_helper.run_subprocess(
-                                    [LDCONSOLE_EXE, "quit", "--name", vm_name],
-                                    timeout=30
-                                )
-                                # QUAN TRỌNG: Chờ máy ảo tắt hoàn toàn để tránh race condition
-                                vm_manager.wait_vm_stopped(vm_name, LDCONSOLE_EXE, timeout=60)
-                                time.sleep(WAIT_EXTRA_LONG)
-                                self.log(f"✅ Đã tắt máy ảo hoàn toàn")
-                                continue
-
-                            self.log(f"✅ Đã tải xong: {video_path}")
-                            time.sleep(15)
-
-                            # ========== GỬI FILE (Option 2) ==========
-                            if self.stop_event.is_set():
-                                if os.path.exists(video_path):
-                                    os.remove(video_path)
-                                self.log(f"🛑 Tắt máy ảo '{vm_name}'...")
-                                self.worker_helper.run_subprocess(
-                                    [LDCONSOLE_EXE, "quit", "--name", vm_name],
-                                    timeout=30
-                                )
-                                vm_manager.wait_vm_stopped(vm_name, LDCONSOLE_EXE, timeout=60)
-                                time.sleep(WAIT_EXTRA_LONG)
-                                break
-
-                            # Clear DCIM and Pictures folders before sending file
-                            try:
-                                # ✅ v1.5.36: Tìm VM ID từ tên máy ảo
-                                vm_id = get_vm_id_from_name(vm_name)
-                                if not vm_id:
-                                    self.log(f"❌ Không tìm thấy file cấu hình cho VM: {vm_name}")
-                                    raise Exception(f"VM config not found: {vm_name}")
-
-                                # Read port from JSON to create adb_address
-                                json_path = os.path.join(VM_DATA_DIR, f"{vm_id}.json")
-                                with open(json_path, "r", encoding="utf-8") as f:
-                                    vm_info = json.load(f)
-                                port = vm_info.get("port")
-                                adb_address = f"emulator-{port}"
-
-                                self.log(f"🗑️ Xóa DCIM và Pictures...")
-                                clear_dcim(adb_address, log_callback=lambda msg: self.log(msg))
-                                clear_pictures(adb_address, log_callback=lambda msg: self.log(msg))
-                                self.log(f"✅ Đã xóa DCIM và Pictures")
-                            except Exception as e:
-                                self.log(f"⚠️ Lỗi khi xóa DCIM/Pictures: {e}")
-
-                            self.log(f"📤 Gửi file sang máy ảo")
-                            success, success_push, reason = self.worker_helper.run_blocking_func(
-                                send_file_api,
-                                video_path,
-                                vm_name,
-                                log_callback=lambda msg: self.log(msg),
-                                timeout=300,
-                                check_interval=2
-                            )
-
-                            if not success or not success_push:
-                                if reason == "stopped":
-                                    self.log("🛑 Dừng gửi file")
-                                else:
-                                    self.log(f"⚠️ Gửi file thất bại: {reason}")
-
-                                if os.path.exists(video_path):
-                                    os.remove(video_path)
-
-                                self.log(f"🛑 Tắt máy ảo '{vm_name}'...")
-                                self.worker_helper.run_subprocess(
-                                    [LDCONSOLE_EXE, "quit", "--name", vm_name],
-                                    timeout=30
-                                )
-                                vm_manager.wait_vm_stopped(vm_name, LDCONSOLE_EXE, timeout=60)
-                                time.sleep(WAIT_EXTRA_LONG)
-                                self.log(f"✅ Đã tắt máy ảo")
-
-                                if reason == "stopped":
-                                    break
-                                else:
-                                    continue
-
-                            self.log(f"✅ Đã gửi video sang máy ảo")
-
-                            # ✅ v1.5.30: Verify file đã có trong VM sau khi push
-                            filename = os.path.basename(video_path)
-                            remote_path = f"/sdcard/DCIM/{filename}"
-
-                            # Get expected file size
-                            try:
-                                local_size_mb = os.path.getsize(video_path) / (1024 * 1024)
-                            except:
-                                local_size_mb = None  # Nếu không lấy được size, chỉ check tồn tại
-
-                            # Verify với retry mechanism (wait 5s, retry 3 lần nếu chưa có)
-                            self.log(f"🔍 Đang verify file trong VM...")
-                            verified = verify_file_after_push(
-                                vm_name,
-                                remote_path,
-                                expected_size_mb=local_size_mb,
-                                wait_seconds=5,
-                                max_retries=3,
-                                log_callback=lambda msg: self.log(msg)
-                            )
-
-                            if not verified:
-                                self.log(f"❌ File verification FAILED - File không có trong VM sau khi push!")
-
-                                if os.path.exists(video_path):
-                                    os.remove(video_path)
-
-                                self.log(f"🛑 Tắt máy ảo '{vm_name}'...")
-                                self.worker_helper.run_subprocess(
-                                    [LDCONSOLE_EXE, "quit", "--name", vm_name],
-                                    timeout=30
-                                )
-                                vm_manager.wait_vm_stopped(vm_name, LDCONSOLE_EXE, timeout=60)
-                                time.sleep(WAIT_EXTRA_LONG)
-                                self.log(f"✅ Đã tắt máy ảo")
-                                continue  # Skip to next video
-
-                            time.sleep(WAIT_MEDIUM)
-
-                            # ========== ĐĂNG BÀI ==========
-                            if self.stop_event.is_set():
-                                self.log(f"🛑 Tắt máy ảo '{vm_name}'...")
-                                self.worker_helper.run_subprocess(
-                                    [LDCONSOLE_EXE, "quit", "--name", vm_name],
-                                    timeout=30
-                                )
-                                vm_manager.wait_vm_stopped(vm_name, LDCONSOLE_EXE, timeout=60)
-                                time.sleep(WAIT_EXTRA_LONG)
-                                break
-
-                            self.log(f"📲 Đang đăng video: {title}")
-
-                            # ✅ v1.5.36: Tìm VM ID từ tên máy ảo
-                            vm_id = get_vm_id_from_name(vm_name)
-                            if not vm_id:
-                                self.log(f"❌ Không tìm thấy file cấu hình cho VM: {vm_name}")
-                                self.log(f"🛑 Tắt máy ảo '{vm_name}'...")
-                                self.worker_helper.run_subprocess(
-                                    [LDCONSOLE_EXE, "quit", "--name", vm_name],
-                                    timeout=30
-                                )
-                                vm_manager.wait_vm_stopped(vm_name, LDCONSOLE_EXE, timeout=60)
-                                time.sleep(WAIT_EXTRA_LONG)
-                                break
-
-                            vm_file = os.path.join(VM_DATA_DIR, f"{vm_id}.json")
-                            with open(vm_file, "r", encoding="utf-8") as f:
-                                vm_info = json.load(f)
-                            port = vm_info.get("port")
-                            adb_address = f"emulator-{port}"
-
-                            # ✅ FIX: Tạo InstagramPost riêng cho video này với callback dùng title
-                            def video_log_callback(vm, message):
-                                """Log callback specific cho video này"""
-                                self.log(f"[{title[:30]}...] {message}")
-
-                            auto_poster = InstagramPost(log_callback=video_log_callback)
-
-                            # Extract video filename for MediaStore broadcast retry
-                            video_filename = os.path.basename(video_path) if video_path else None
-
-                            # Call auto_post with use_launchex=True
-                            def post_with_launchex():
-                                return auto_poster.auto_post(
-                                    vm_name, adb_address, title,
-                                    use_launchex=True, ldconsole_exe=LDCONSOLE_EXE,
-                                    video_filename=video_filename
-                                )
-
-                            success, success_post, reason = self.worker_helper.run_blocking_func(
-                                post_with_launchex,
-                                timeout=600,
-                                check_interval=2
-                            )
-
-                            if not success or not success_post:
-                                if reason == "stopped":
-                                    self.log("🛑 Dừng đăng bài")
-                                else:
-                                    self.log(f"❌ Lỗi đăng bài: {reason}")
-
-                                self.log(f"🛑 Tắt máy ảo '{vm_name}'...")
-                                self.worker_helper.run_subprocess(
-                                    [LDCONSOLE_EXE, "quit", "--name", vm_name],
-                                    timeout=30
-                                )
-                                vm_manager.wait_vm_stopped(vm_name, LDCONSOLE_EXE, timeout=60)
-                                time.sleep(WAIT_EXTRA_LONG)
-                                self.log(f"✅ Đã tắt máy ảo")
-
-                                if reason == "stopped":
-                                    break
-                                else:
-                                    continue
-
-                            self.log(f"✅ Đã đăng thành công: {title}")
-
-                            # ========== XÓA FILE ==========
-                            if self.stop_event.is_set():
-                                self.log(f"🛑 Tắt máy ảo '{vm_name}'...")
-                                self.worker_helper.run_subprocess(
-                                    [LDCONSOLE_EXE, "quit", "--name", vm_name],
-                                    timeout=30
-                                )
-                                vm_manager.wait_vm_stopped(vm_name, LDCONSOLE_EXE, timeout=60)
-                                time.sleep(WAIT_EXTRA_LONG)
-                                self.log(f"✅ Đã tắt máy ảo")
-                                break
-
-                            success, success_delete, reason = self.worker_helper.run_blocking_func(
-                                clear_dcim,
-                                adb_address,
-                                log_callback=lambda msg: self.log(msg),
-                                timeout=60,
-                                check_interval=1
-                            )
-
-                            if success and success_delete:
-                                self.log(f"✅ Xóa thành công")
-                            else:
-                                self.log(f"⚠️ Xóa file thất bại: {reason}")
-
-                            time.sleep(WAIT_MEDIUM)
-
-                            # ========== TẮT MÁY ẢO ==========
-                            self.log(f"🛑 Tắt máy ảo '{vm_name}'")
-                            self.worker_helper.run_subprocess(
-                                [LDCONSOLE_EXE, "quit", "--name", vm_name],
-                                timeout=30
-                            )
-                            vm_manager.wait_vm_stopped(vm_name, LDCONSOLE_EXE, timeout=60)
-                            time.sleep(WAIT_EXTRA_LONG)
-                            self.log(f"✅ Đã tắt máy ảo hoàn toàn")
-
-                            # ========== CẬP NHẬT TRẠNG THÁI ==========
-                            vid["status"] = "post"
-
-                            # ========== UPDATE CUTOFF_DT ==========
-                            try:
-                                published_iso = vid.get("publishedAt")
-                                if published_iso:
-                                    video_time = iso_to_datetime(published_iso)
-                                    if video_time > cutoff_dt:
-                                        cutoff_dt = video_time
-                                        self.log(f"📅 Cập nhật cutoff → {cutoff_dt.strftime('%d/%m/%Y %H:%M')}")
-                            except Exception as e:
-                                self.log(f"⚠️ Không thể cập nhật cutoff_dt: {e}")
-
-                            try:
-                                if os.path.exists(video_path):
-                                    os.remove(video_path)
-                            except Exception as e:
-                                self.log(f"⚠️ Không thể xóa {video_path}: {e}")
-
-                            self.log(f"✅ Hoàn tất {title}")
-
-                        finally:
-                            # ========== RELEASE VM LOCK ==========
-                            if vm_acquired:
-                                vm_manager.release_vm(vm_name, caller=f"Follow:{self.cfg['name']}")
-                                self.log(f"🔓 Đã giải phóng máy ảo '{vm_name}'")
-                                vm_acquired = False
-
-                    # Lưu progress
-                    with open(self.cfg["out_path"], "w", encoding="utf-8") as f:
-                        json.dump(all_videos, f, ensure_ascii=False, indent=2)
-
-
-                except Exception as e:
-                    self.log(f"⚠️ Lỗi xử lý video: {e}")
-                    logger.exception("Error processing video")
-
-                # NOTE: cutoff_dt đã được update ở line 707-713 SAU KHI đăng video thành công
-                # KHÔNG update từ new_rows vì video có thể chưa đăng (do lỗi)
-
-                # ========== ĐẾM NGƯỢC (Option 1: Check manual) ==========
-                if self.stop_event.is_set():
-                    break
-                
-                interval = int(self.cfg["interval_min"])
-                self.next_deadline = datetime.now(timezone.utc) + timedelta(minutes=interval)
-                
-                while not self.stop_event.is_set():
-                    now = datetime.now(timezone.utc)
-                    left = int((self.next_deadline - now).total_seconds())
-                    if left <= 0:
-                        break
-                    
-                    hh = left // 3600
-                    mm = (left % 3600) // 60
-                    ss = left % 60
-                    self.status = f"Đang chờ: {hh:02d}:{mm:02d}:{ss:02d}"
-                    ui_queue.put(("status", self.row_id, self.status))
-                    time.sleep(1)
-            
-            self.status = "Đã dừng"
-            self.log("Luồng đã dừng.")
-
-
-        except Exception as e:
-            self.status = f"Lỗi: {e}"
-            self.log(f"Lỗi không mong muốn: {e}")
-            logger.exception("Unexpected error in stream worker")
-            import traceback
-            self.log(traceback.format_exc())
-        
-        finally:
-            # ========== CLEANUP ==========
-            if self.worker_helper:
-                self.worker_helper.cleanup()
-            
-            # Tắt máy ảo nếu còn đang bật
-            try:
-                vm_name = self.cfg.get("vm_name")
-                if vm_name:
-                    subprocess.run(
-                        [LDCONSOLE_EXE, "quit", "--name", vm_name],
-                        creationflags=subprocess.CREATE_NO_WINDOW,
-                        timeout=10
-                    )
-                    time.sleep(WAIT_LONG)
-            except:
-                pass
-            
-            ui_queue.put(("status", self.row_id, self.status))
-
 # ========================= GIAO DIỆN =========================
 class FollowTab(ctk.CTkFrame):
     """Follow Tab - Modern Windows 11 Style"""
@@ -1011,12 +72,13 @@ class FollowTab(ctk.CTkFrame):
         self.load_existing_streams()
         self.after(200, self.process_ui_queue)
 
-    def append_log_line(self, row_id, line):
+    def append_log_line(self, row_id, event):
         # chỉ update nếu cửa sổ log đang mở
         if hasattr(self, "log_windows") and row_id in self.log_windows:
             win = self.log_windows[row_id]
             if win.winfo_exists():
                 txt = win.text_log
+                line = format_event(event)
 
                 def safe_append():
                     # kiểm tra widget còn tồn tại
@@ -1636,8 +698,7 @@ class FollowTab(ctk.CTkFrame):
                 # --- THÊM LUỒNG MỚI ---
                 # tạo file rỗng ngay để thấy kết quả
                 os.makedirs(os.path.dirname(out_path), exist_ok=True)
-                with open(out_path, "w", encoding="utf-8") as f:
-                    json.dump([], f, ensure_ascii=False, indent=2)
+                atomic_write_json(out_path, [])
 
                 # ghi meta (ghi đè theo id nếu trùng)
                 found = False
@@ -1718,9 +779,11 @@ class FollowTab(ctk.CTkFrame):
         txt.pack(fill=tk.BOTH, expand=True)
 
         # 🟢 hiển thị sẵn log cũ (nếu có)
-        if stream.logs:
+        # Ring buffer trong RAM; log cũ hơn (đã spill xuống đĩa) tải theo trang khi bấm nút
+        events, older_cursor = trace_log.snapshot(stream.trace_id)
+        if events:
             txt.config(state="normal")
-            txt.insert("1.0", "\n".join(stream.logs))
+            txt.insert("1.0", "\n".join(format_event(e) for e in events))
             txt.see("end")
             txt.config(state="disabled")
 
@@ -1732,12 +795,30 @@ class FollowTab(ctk.CTkFrame):
         btns = tk.Frame(win)
         btns.pack(fill=tk.X, pady=5)
 
+        paging = {"cursor": older_cursor}
+
+        def load_older():
+            older, paging["cursor"] = trace_log.page(stream.trace_id, before=paging["cursor"])
+            if older:
+                txt.config(state="normal")
+                txt.insert("1.0", "\n".join(format_event(e) for e in older) + "\n")
+                txt.see("1.0")
+                txt.config(state="disabled")
+            if not paging["cursor"]:
+                btn_older.state(["disabled"])
+
         def clear_logs():
-            stream.logs.clear()
+            trace_log.clear(stream.trace_id)
+            paging["cursor"] = 0
+            btn_older.state(["disabled"])
             txt.config(state="normal")
             txt.delete("1.0", tk.END)
             txt.config(state="disabled")
 
+        btn_older = ttk.Button(btns, text="⬆ Tải log cũ hơn", command=load_older)
+        btn_older.pack(side=tk.LEFT, padx=4)
+        if not older_cursor:
+            btn_older.state(["disabled"])
         ttk.Button(btns, text="Xóa lịch sử", command=clear_logs).pack(side=tk.LEFT, padx=4)
         ttk.Button(btns, text="Đóng", command=win.destroy).pack(side=tk.RIGHT, padx=4)
 
@@ -1756,6 +837,7 @@ class FollowTab(ctk.CTkFrame):
         # xóa khỏi UI
         self.tree.delete(row_id)
         del self.streams[row_id]
+        trace_log.clear(s.trace_id)
         self.refresh_stt()
         # hỏi xóa file kết quả
         if os.path.exists(s.cfg["out_path"]):
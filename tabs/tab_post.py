@@ -8,28 +8,26 @@ Features:
 - Log realtime cho mỗi post
 """
 import os
-import json
 import csv
 import time
 import queue
 import threading
 import logging
 import subprocess
-from datetime import datetime, timezone, timedelta
+from datetime import datetime, timedelta
 from tkinter import messagebox, filedialog
 import tkinter as tk
 from tkinter import ttk  # For Treeview only
 import customtkinter as ctk
 from ui_theme import *
 
-from config import LDCONSOLE_EXE, VM_DATA_DIR, ADB_EXE, SCHEDULED_POSTS_FILE, get_vm_id_from_name
-from constants import WAIT_MEDIUM, WAIT_LONG, WAIT_SHORT, WAIT_EXTRA_LONG, TIMEOUT_MINUTE
-from utils.send_file import send_file_api
-from utils.post import InstagramPost
-from utils.delete_file import clear_dcim, clear_pictures
-from utils.file_checker import verify_file_after_push
-from utils.vm_manager import vm_manager
-from utils.download_dlp import download_video_api
+from constants import POST_MAX_LATE_SECONDS, ACCOUNT_MAX_POSTS_PER_DAY
+from utils.warm_vm import warm_vm_pool
+from utils.vm_balancer import vm_health, queue_depths, assign_balanced
+from utils.schedule_optimizer import (
+    measure_vm_profiles, iter_slots, busy_intervals, optimize_schedule, plan_stats
+)
+from utils.trace_log import trace_log, format_event
 from utils.api_manager_multi import multi_api_manager
 from utils.yt_api import (
     check_api_key_valid,
@@ -46,14 +44,16 @@ from utils.tiktok_api_rapidapi import (
     get_tiktok_secuid,
     fetch_tiktok_videos_with_count,
     get_video_download_link,
-    download_tiktok_video,
     convert_to_output_format
 )
 from utils.text_utils import remove_keywords_from_text, parse_keywords_input, remove_all_hashtags
+from core.scheduler import (
+    VN_TZ, ScheduledPost, PostScheduler, load_scheduled_posts,
+    reset_posts_after_restart, save_scheduled_posts, get_vm_list_with_insta
+)
 
 
 # ==================== CONSTANTS ====================
-VN_TZ = timezone(timedelta(hours=7))
 SCHEDULED_VIDEOS_DIR = os.path.join("temp", "scheduled")
 os.makedirs(SCHEDULED_VIDEOS_DIR, exist_ok=True)
 
@@ -168,899 +168,6 @@ class WheelPicker(tk.Frame):
         return self.values[self.current_index]
 
 
-# ==================== DATA MODELS ====================
-class ScheduledPost:
-    """Một post được đặt lịch"""
-
-    def __init__(self, post_id, video_path, scheduled_time_vn=None, vm_name=None,
-                 account_display=None, title="", status="draft", is_paused=True, post_now=False, log_callback=None):
-        self.id = post_id
-        self.video_path = video_path
-        self.video_name = os.path.basename(video_path)
-        self.scheduled_time_vn = scheduled_time_vn  # datetime object or None
-        self.vm_name = vm_name
-        self.account_display = account_display or "Chưa chọn"
-        self.title = title or self.video_name
-        self.status = status  # draft, pending, processing, posted, failed
-        self.is_paused = is_paused  # True = dừng, False = chạy
-        self.post_now = post_now  # True = đăng ngay khi Start
-        self.stop_requested = False  # Flag để yêu cầu dừng ngay lập tức
-        self.logs = []
-        self.log_callback = log_callback
-
-    def to_dict(self):
-        return {
-            "id": self.id,
-            "video_path": self.video_path,
-            "video_name": self.video_name,
-            "scheduled_time_vn": self.scheduled_time_vn.strftime("%d/%m/%Y %H:%M") if self.scheduled_time_vn else None,
-            "vm_name": self.vm_name,
-            "account_display": self.account_display,
-            "title": self.title,
-            "status": self.status,
-            "is_paused": self.is_paused,
-            "post_now": self.post_now
-        }
-
-    @staticmethod
-    def from_dict(data):
-        scheduled_time = None
-        if data.get("scheduled_time_vn"):
-            scheduled_time = datetime.strptime(data["scheduled_time_vn"], "%d/%m/%Y %H:%M")
-            scheduled_time = scheduled_time.replace(tzinfo=VN_TZ)
-
-        return ScheduledPost(
-            post_id=data["id"],
-            video_path=data["video_path"],
-            scheduled_time_vn=scheduled_time,
-            vm_name=data.get("vm_name"),
-            account_display=data.get("account_display"),
-            title=data.get("title", ""),
-            status=data.get("status", "draft"),
-            is_paused=data.get("is_paused", True),
-            post_now=data.get("post_now", False)
-        )
-
-    def log(self, message):
-        """Add log message"""
-        timestamp = datetime.now(VN_TZ).strftime("%d/%m/%Y %H:%M:%S")
-        log_entry = f"[{timestamp}] {message}"
-        self.logs.append(log_entry)
-        if len(self.logs) > 1000:
-            self.logs = self.logs[-1000:]
-        # Gọi callback realtime
-        if self.log_callback:
-            self.log_callback(self.id, log_entry)
-
-
-# ==================== DATA PERSISTENCE ====================
-def load_scheduled_posts():
-    """Load scheduled posts from JSON - Safe version with backup on error"""
-    if not os.path.exists(SCHEDULED_POSTS_FILE):
-        logging.info("No scheduled_posts.json found, starting with empty list")
-        return []
-
-    try:
-        with open(SCHEDULED_POSTS_FILE, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        posts = [ScheduledPost.from_dict(p) for p in data.get("posts", [])]
-        logging.info(f"✅ Loaded {len(posts)} scheduled posts from JSON")
-        return posts
-    except Exception as e:
-        logging.error(f"❌ CRITICAL: Error loading scheduled posts: {e}")
-        logging.error(f"   File: {SCHEDULED_POSTS_FILE}")
-        logging.error(f"   Exception type: {type(e).__name__}")
-        import traceback
-        logging.error(f"   Traceback:\n{traceback.format_exc()}")
-
-        # ⚠️ Backup file cũ để tránh mất data
-        backup_file = SCHEDULED_POSTS_FILE + ".backup_error"
-        try:
-            import shutil
-            shutil.copy2(SCHEDULED_POSTS_FILE, backup_file)
-            logging.error(f"   📁 File đã được backup tại: {backup_file}")
-            logging.error(f"   ⚠️ KHÔNG TẢI ĐƯỢC DATA! Vui lòng kiểm tra file backup!")
-        except:
-            pass
-
-        # Return empty list NHƯNG không cho phép save (sẽ check trong __init__)
-        # Raise exception để user biết có vấn đề
-        raise RuntimeError(
-            f"❌ Cannot load scheduled_posts.json!\n"
-            f"📁 Backup saved at: {backup_file}\n"
-            f"Error: {e}\n"
-            f"⚠️ App cannot start to prevent data loss!"
-        )
-
-
-def save_scheduled_posts(posts):
-    """Save scheduled posts to JSON - Safe version with backup"""
-    # ✅ v1.5.37: Removed overly-strict safety check
-    # Backup mechanism (below) is sufficient to prevent accidental data loss
-    # User should be able to delete all posts if they want to
-
-    try:
-        # Backup file cũ trước khi save
-        if os.path.exists(SCHEDULED_POSTS_FILE):
-            backup_file = SCHEDULED_POSTS_FILE + ".backup"
-            import shutil
-            shutil.copy2(SCHEDULED_POSTS_FILE, backup_file)
-
-        # Save new data
-        data = {"posts": [p.to_dict() for p in posts]}
-        with open(SCHEDULED_POSTS_FILE, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-        logging.info(f"💾 Saved {len(posts)} posts to JSON")
-    except Exception as e:
-        logging.error(f"❌ Error saving scheduled posts: {e}")
-        import traceback
-        logging.error(traceback.format_exc())
-
-
-def get_vm_list_with_insta():
-    """Lấy danh sách máy ảo kèm tên Instagram từ data/vm/"""
-    vm_list = []
-    try:
-        if not os.path.exists(VM_DATA_DIR):
-            return vm_list
-
-        files = [f for f in os.listdir(VM_DATA_DIR) if f.endswith(".json")]
-        for f in files:
-            path = os.path.join(VM_DATA_DIR, f)
-            with open(path, "r", encoding="utf-8") as fp:
-                data = json.load(fp)
-                vm_name = data.get("vm_name", "")
-                insta_name = data.get("insta_name", "")
-                port = data.get("port", "")
-                if vm_name and port:  # Only include VMs with valid port
-                    display = f"{vm_name} - {insta_name}" if insta_name else vm_name
-                    vm_list.append({
-                        "vm_name": vm_name,
-                        "display": display,
-                        "port": port
-                    })
-    except Exception as e:
-        logging.error(f"Error reading VM list: {e}")
-
-    return vm_list
-
-
-# ==================== SCHEDULER ====================
-class PostScheduler(threading.Thread):
-    """Background scheduler để check và post video đúng giờ"""
-
-    def __init__(self, posts, ui_queue):
-        super().__init__(daemon=True)
-        self.posts = posts  # List of ScheduledPost
-        self.ui_queue = ui_queue
-        self.stop_event = threading.Event()
-        self.logger = logging.getLogger(__name__)
-        # ✅ FIX BUG #5: Không dùng shared auto_poster nữa
-        # Mỗi thread sẽ tạo InstagramPost riêng với post_id specific callback
-        self.running_posts = set()  # Track posts being processed
-
-    def stop(self):
-        self.stop_event.set()
-
-    def run(self):
-        """Main scheduler loop"""
-        self.logger.info("Post scheduler started")
-
-        while not self.stop_event.is_set():
-            try:
-                now = datetime.now(VN_TZ)
-
-                # Check each pending post
-                for post in self.posts[:]:  # Copy list to avoid modification issues
-                    if post.status != "pending":
-                        continue
-
-                    if post.id in self.running_posts:
-                        continue
-
-                    # Chỉ chạy nếu post đang ở trạng thái running (is_paused=False)
-                    if post.is_paused:
-                        continue
-
-                    # Check if it's time to post
-                    if now >= post.scheduled_time_vn:
-                        # ✅ FIX BUG #2: Skip posts quá cũ (quá 10 phút)
-                        time_diff = (now - post.scheduled_time_vn).total_seconds()
-                        max_delay = 600  # 10 phút
-
-                        if time_diff > max_delay:
-                            # Quá cũ, skip và đánh dấu failed
-                            self.logger.warning(f"Post {post.id} quá cũ ({time_diff/60:.1f} phút), bỏ qua")
-                            post.log(f"⏰ Post quá cũ (trễ {time_diff/60:.1f} phút), tự động bỏ qua")
-                            post.status = "failed"
-                            post.is_paused = True
-                            self.ui_queue.put(("status_update", post.id, "failed"))
-                            save_scheduled_posts(self.posts)
-                            continue
-
-                        # Start posting in a separate thread
-                        self.running_posts.add(post.id)
-                        threading.Thread(
-                            target=self.process_post,
-                            args=(post,),
-                            daemon=True
-                        ).start()
-
-                # Sleep for 30 seconds before next check
-                for _ in range(30):
-                    if self.stop_event.is_set():
-                        break
-                    time.sleep(1)
-
-            except Exception as e:
-                self.logger.exception("Error in scheduler loop")
-                time.sleep(5)
-
-        self.logger.info("Post scheduler stopped")
-
-    def process_post(self, post: ScheduledPost):
-        """Process a single scheduled post"""
-        vm_acquired = False
-        vm_name_cached = None  # ✅ FIX BUG #4: Cache VM info locally
-        try:
-            # ✅ FIX BUG #5: Tạo InstagramPost riêng cho post này với callback dùng post.id
-            def post_specific_log_callback(vm_name, message):
-                """Log callback specific cho post này"""
-                post.log(message)
-
-            auto_poster = InstagramPost(log_callback=post_specific_log_callback)
-
-            post.status = "processing"
-            post.stop_requested = False  # Reset flag
-            post.log(f"🚀 Bắt đầu xử lý post: {post.title}")
-            self.ui_queue.put(("status_update", post.id, "processing"))
-
-            # Check stop request
-            if post.stop_requested:
-                post.log(f"🛑 Đã dừng theo yêu cầu")
-                post.status = "failed"
-                post.is_paused = True
-                self.ui_queue.put(("status_update", post.id, "failed"))
-                self.running_posts.discard(post.id)
-                save_scheduled_posts(self.posts)
-                return
-
-            # ⚡ v1.5.9 OPTIMIZATION: Detect if URL (KHÔNG download ngay) để tối ưu disk usage
-            # Flow mới: Wait → Acquire VM → Download → Post
-            # Thay vì: Download → Wait → Acquire VM → Post
-            is_url = post.video_path.startswith("http")
-            temp_video_path = None
-            original_video_path = post.video_path  # Backup URL/path gốc
-
-            # Nếu local file, check existence ngay (vì không cần download)
-            if not is_url:
-                if not os.path.exists(post.video_path):
-                    post.log(f"❌ File video không tồn tại: {post.video_path}")
-                    post.status = "failed"
-                    self.ui_queue.put(("status_update", post.id, "failed"))
-                    self.running_posts.discard(post.id)
-                    save_scheduled_posts(self.posts)
-                    return
-
-            # ✅ v1.5.36: Tìm VM ID từ tên máy ảo
-            vm_id = get_vm_id_from_name(post.vm_name)
-            if not vm_id:
-                post.log(f"❌ Không tìm thấy file cấu hình cho VM: {post.vm_name}")
-                post.status = "failed"
-                self.ui_queue.put(("status_update", post.id, "failed"))
-                self.running_posts.discard(post.id)
-                save_scheduled_posts(self.posts)
-                return
-
-            # Get VM info
-            vm_file = os.path.join(VM_DATA_DIR, f"{vm_id}.json")
-            if not os.path.exists(vm_file):
-                post.log(f"❌ Không tìm thấy thông tin VM: {post.vm_name}")
-                post.status = "failed"
-                self.ui_queue.put(("status_update", post.id, "failed"))
-                self.running_posts.discard(post.id)
-                save_scheduled_posts(self.posts)
-                return
-
-            with open(vm_file, "r", encoding="utf-8") as f:
-                vm_info = json.load(f)
-
-            port = vm_info.get("port")
-            if not port:
-                post.log(f"❌ VM không có port: {post.vm_name}")
-                post.status = "failed"
-                self.ui_queue.put(("status_update", post.id, "failed"))
-                self.running_posts.discard(post.id)
-                save_scheduled_posts(self.posts)
-                return
-
-            adb_address = f"emulator-{port}"
-
-            # ========== ACQUIRE VM LOCK ==========
-            post.log(f"🔒 Chờ máy ảo '{post.vm_name}' sẵn sàng...")
-            if not vm_manager.acquire_vm(post.vm_name, timeout=5400, caller=f"Post:{post.title[:20]}"):
-                post.log(f"⏱️ Timeout chờ máy ảo '{post.vm_name}' sau 1.5 giờ")
-                post.status = "failed"
-                self.ui_queue.put(("status_update", post.id, "failed"))
-                self.running_posts.discard(post.id)
-                save_scheduled_posts(self.posts)
-                return
-
-            vm_acquired = True
-            post.log(f"✅ Đã khóa máy ảo '{post.vm_name}'")
-
-            # ========== RETRY LOOP: Thử tối đa 2 lần ==========
-            max_attempts = 2
-            final_success = False
-
-            for attempt in range(1, max_attempts + 1):
-                attempt_success = False
-                attempt_temp_video_path = None
-
-                try:
-                    if attempt > 1:
-                        post.log(f"🔄 Retry lần {attempt}/{max_attempts}")
-                        # Reset video path về URL gốc để download lại
-                        if is_url:
-                            post.video_path = original_video_path
-                    else:
-                        post.log(f"📝 Lần thử {attempt}/{max_attempts}")
-
-                    # Check if VM is running
-                    try:
-                        result = subprocess.run(
-                            [LDCONSOLE_EXE, "list2"],
-                            capture_output=True,
-                            text=True,
-                            creationflags=subprocess.CREATE_NO_WINDOW
-                        )
-                        is_running = False
-                        for line in result.stdout.splitlines():
-                            parts = line.split(",")
-                            if len(parts) >= 5 and parts[1].strip() == post.vm_name:
-                                is_running = (parts[4].strip() == "1")
-                                break
-        
-                        if is_running:
-                            # VM đang chạy → Reboot để đảm bảo trạng thái sạch (QUEUE-BASED)
-                            post.log(f"⚠️ Máy ảo '{post.vm_name}' đang chạy - Reboot để đảm bảo trạng thái sạch")
-
-                            # ✅ KHÔNG reset ADB server toàn cục (ảnh hưởng tất cả VMs khác!)
-                            # LDPlayer sẽ tự động setup lại ADB connection khi reboot
-
-                            result = subprocess.run(
-                                [LDCONSOLE_EXE, "reboot", "--name", post.vm_name],
-                                creationflags=subprocess.CREATE_NO_WINDOW,
-                                capture_output=True,
-                                text=True,
-                                encoding="utf-8",
-                                errors="ignore"
-                            )
-                            if result.returncode != 0:
-                                post.log(f"⚠️ Reboot command returncode: {result.returncode}")
-                                if result.stderr:
-                                    post.log(f"⚠️ Reboot stderr: {result.stderr.strip()}")
-                                if result.stdout:
-                                    post.log(f"ℹ️ Reboot stdout: {result.stdout.strip()}")
-                        else:
-                            # VM chưa chạy → Bật mới
-                            post.log(f"🚀 Bật máy ảo '{post.vm_name}'...")
-
-                            # ✅ KHÔNG reset ADB server toàn cục (ảnh hưởng tất cả VMs khác!)
-                            # LDPlayer sẽ tự động setup lại ADB connection khi launch
-
-                            result = subprocess.run(
-                                [LDCONSOLE_EXE, "launch", "--name", post.vm_name],
-                                creationflags=subprocess.CREATE_NO_WINDOW,
-                                capture_output=True,
-                                text=True,
-                                encoding="utf-8",
-                                errors="ignore"
-                            )
-                            if result.returncode != 0:
-                                post.log(f"⚠️ Launch command returncode: {result.returncode}")
-                                if result.stderr:
-                                    post.log(f"⚠️ Launch stderr: {result.stderr.strip()}")
-                                if result.stdout:
-                                    post.log(f"ℹ️ Launch stdout: {result.stdout.strip()}")
-        
-                    except Exception as e:
-                        post.log(f"⚠️ Không thể kiểm tra trạng thái VM: {e}")
-                        # Nếu lỗi kiểm tra, cố gắng bật VM
-                        post.log(f"🚀 Bật máy ảo '{post.vm_name}'...")
-                        result = subprocess.run(
-                            [LDCONSOLE_EXE, "launch", "--name", post.vm_name],
-                            creationflags=subprocess.CREATE_NO_WINDOW,
-                            capture_output=True,
-                            text=True,
-                            encoding="utf-8",
-                            errors="ignore"
-                        )
-                        if result.returncode != 0:
-                            post.log(f"⚠️ Launch command returncode: {result.returncode}")
-                            if result.stderr:
-                                post.log(f"⚠️ Launch stderr: {result.stderr.strip()}")
-                            if result.stdout:
-                                post.log(f"ℹ️ Launch stdout: {result.stdout.strip()}")
-        
-                    # Wait for VM to be fully ready
-                    post.log(f"⏳ Chờ máy ảo '{post.vm_name}' khởi động hoàn toàn...")
-                    if not vm_manager.wait_vm_ready(post.vm_name, LDCONSOLE_EXE, timeout=120, log_callback=post.log):
-                        post.log(f"⏱️ Timeout - Máy ảo '{post.vm_name}' không khởi động được")
-                        post.status = "failed"
-                        self.ui_queue.put(("status_update", post.id, "failed"))
-                        raise Exception("Attempt failed")
-        
-                    # Ensure ADB connection (force connect nếu cần)
-                    post.log(f"🔌 Đang kết nối ADB...")
-                    if not vm_manager.ensure_adb_connected(adb_address, ADB_EXE, max_retries=3, log_callback=post.log):
-                        post.log(f"❌ Không thể kết nối ADB đến '{adb_address}'")
-                        post.log(f"🛑 Đang tắt máy ảo...")
-                        subprocess.run(
-                            [LDCONSOLE_EXE, "quit", "--name", post.vm_name],
-                            creationflags=subprocess.CREATE_NO_WINDOW
-                        )
-                        vm_manager.wait_vm_stopped(post.vm_name, LDCONSOLE_EXE, timeout=60)
-                        time.sleep(WAIT_EXTRA_LONG)
-                        post.status = "failed"
-                        self.ui_queue.put(("status_update", post.id, "failed"))
-                        self.running_posts.discard(post.id)
-                        save_scheduled_posts(self.posts)
-                        raise Exception("Attempt failed")
-
-                    # Wait for ADB to be fully ready
-                    post.log(f"⏳ Chờ ADB sẵn sàng...")
-                    if not vm_manager.wait_adb_ready(adb_address, ADB_EXE, timeout=30, log_callback=post.log):
-                        post.log(f"⏱️ Timeout - ADB không kết nối được đến '{adb_address}'")
-                        post.log(f"🛑 Đang tắt máy ảo...")
-                        subprocess.run(
-                            [LDCONSOLE_EXE, "quit", "--name", post.vm_name],
-                            creationflags=subprocess.CREATE_NO_WINDOW
-                        )
-                        vm_manager.wait_vm_stopped(post.vm_name, LDCONSOLE_EXE, timeout=60)  # Đợi VM tắt hoàn toàn
-                        time.sleep(WAIT_EXTRA_LONG)
-                        post.status = "failed"
-                        self.ui_queue.put(("status_update", post.id, "failed"))
-                        self.running_posts.discard(post.id)
-                        save_scheduled_posts(self.posts)
-                        raise Exception("Attempt failed")
-        
-                    # Check stop request after VM start
-                    if post.stop_requested:
-                        post.log(f"🛑 Đã dừng theo yêu cầu - Đang tắt máy ảo...")
-                        subprocess.run(
-                            [LDCONSOLE_EXE, "quit", "--name", post.vm_name],
-                            creationflags=subprocess.CREATE_NO_WINDOW
-                        )
-                        vm_manager.wait_vm_stopped(post.vm_name, LDCONSOLE_EXE, timeout=60)  # Đợi VM tắt hoàn toàn
-                        time.sleep(WAIT_EXTRA_LONG)
-                        post.status = "failed"
-                        post.is_paused = True
-                        self.ui_queue.put(("status_update", post.id, "failed"))
-                        self.running_posts.discard(post.id)
-                        save_scheduled_posts(self.posts)
-                        raise Exception("Attempt failed")
-        
-                    # ⚡ v1.5.9: DOWNLOAD VIDEO SAU KHI ACQUIRE VM (tối ưu disk usage)
-                    # Flow mới: Chỉ download khi đã có VM sẵn sàng → Không tốn disk khi chờ
-                    if is_url:
-                        # Detect platform from URL
-                        is_youtube = "youtube.com" in original_video_path or "youtu.be" in original_video_path
-        
-                        if is_youtube:
-                            # Download YouTube video
-                            post.log(f"📥 Đang tải video YouTube từ URL...")
-                            try:
-                                video_path = download_video_api(
-                                    original_video_path,
-                                    log_callback=lambda msg: post.log(msg)
-                                )
-        
-                                if not video_path or not os.path.exists(video_path):
-                                    post.log(f"❌ Không thể tải video YouTube")
-                                    post.status = "failed"
-                                    self.ui_queue.put(("status_update", post.id, "failed"))
-                                    self.running_posts.discard(post.id)
-                                    save_scheduled_posts(self.posts)
-                                    # Cleanup VM
-                                    subprocess.run(
-                                        [LDCONSOLE_EXE, "quit", "--name", post.vm_name],
-                                        creationflags=subprocess.CREATE_NO_WINDOW
-                                    )
-                                    vm_manager.wait_vm_stopped(post.vm_name, LDCONSOLE_EXE, timeout=60)
-                                    time.sleep(WAIT_EXTRA_LONG)
-                                    raise Exception("Attempt failed")
-        
-                                post.log(f"✅ Đã tải video YouTube: {os.path.basename(video_path)}")
-                                temp_video_path = video_path  # Mark for cleanup later
-                                post.video_path = video_path  # Update to local path
-        
-                            except Exception as e:
-                                post.log(f"❌ Lỗi khi tải video YouTube: {e}")
-                                post.status = "failed"
-                                self.ui_queue.put(("status_update", post.id, "failed"))
-                                self.running_posts.discard(post.id)
-                                save_scheduled_posts(self.posts)
-                                # Cleanup VM
-                                subprocess.run(
-                                    [LDCONSOLE_EXE, "quit", "--name", post.vm_name],
-                                    creationflags=subprocess.CREATE_NO_WINDOW
-                                )
-                                vm_manager.wait_vm_stopped(post.vm_name, LDCONSOLE_EXE, timeout=60)
-                                time.sleep(WAIT_EXTRA_LONG)
-                                raise Exception("Attempt failed")
-        
-                        else:
-                            # Default: TikTok (hoặc bất kỳ URL nào không phải YouTube)
-                            post.log(f"📥 Đang tải video TikTok từ URL...")
-                            try:
-                                # Get TikTok API key
-                                tiktok_key = multi_api_manager.get_next_tiktok_key()
-                                if not tiktok_key:
-                                    post.log(f"❌ Không có TikTok API key")
-                                    post.status = "failed"
-                                    self.ui_queue.put(("status_update", post.id, "failed"))
-                                    self.running_posts.discard(post.id)
-                                    save_scheduled_posts(self.posts)
-                                    # Cleanup VM
-                                    subprocess.run(
-                                        [LDCONSOLE_EXE, "quit", "--name", post.vm_name],
-                                        creationflags=subprocess.CREATE_NO_WINDOW
-                                    )
-                                    vm_manager.wait_vm_stopped(post.vm_name, LDCONSOLE_EXE, timeout=60)
-                                    time.sleep(WAIT_EXTRA_LONG)
-                                    raise Exception("Attempt failed")
-
-                                # Download TikTok video using RapidAPI
-                                video_path = download_tiktok_video(
-                                    original_video_path,
-                                    tiktok_key,
-                                    log_callback=lambda msg: post.log(msg)
-                                )
-
-                                if not video_path or not os.path.exists(video_path):
-                                    post.log(f"❌ Không thể tải video TikTok")
-                                    post.status = "failed"
-                                    self.ui_queue.put(("status_update", post.id, "failed"))
-                                    self.running_posts.discard(post.id)
-                                    save_scheduled_posts(self.posts)
-                                    # Cleanup VM
-                                    subprocess.run(
-                                        [LDCONSOLE_EXE, "quit", "--name", post.vm_name],
-                                        creationflags=subprocess.CREATE_NO_WINDOW
-                                    )
-                                    vm_manager.wait_vm_stopped(post.vm_name, LDCONSOLE_EXE, timeout=60)
-                                    time.sleep(WAIT_EXTRA_LONG)
-                                    raise Exception("Attempt failed")
-
-                                post.log(f"✅ Đã tải video TikTok: {os.path.basename(video_path)}")
-                                temp_video_path = video_path  # Mark for cleanup later
-                                post.video_path = video_path  # Update to local path
-
-                            except Exception as e:
-                                post.log(f"❌ Lỗi khi tải video TikTok: {e}")
-                                post.status = "failed"
-                                self.ui_queue.put(("status_update", post.id, "failed"))
-                                self.running_posts.discard(post.id)
-                                save_scheduled_posts(self.posts)
-                                # Cleanup VM
-                                subprocess.run(
-                                    [LDCONSOLE_EXE, "quit", "--name", post.vm_name],
-                                    creationflags=subprocess.CREATE_NO_WINDOW
-                                )
-                                vm_manager.wait_vm_stopped(post.vm_name, LDCONSOLE_EXE, timeout=60)
-                                time.sleep(WAIT_EXTRA_LONG)
-                                raise Exception("Attempt failed")
-        
-                        time.sleep(WAIT_SHORT)
-        
-                    # Clear DCIM and Pictures folders before sending file
-                    post.log(f"🗑️ Xóa DCIM và Pictures...")
-                    try:
-                        clear_dcim(adb_address, log_callback=lambda msg: post.log(msg))
-                        clear_pictures(adb_address, log_callback=lambda msg: post.log(msg))
-                        post.log(f"✅ Đã xóa DCIM và Pictures")
-                    except Exception as e:
-                        post.log(f"⚠️ Lỗi khi xóa DCIM/Pictures: {e}")
-        
-                    # Send file to VM
-                    post.log(f"📤 Gửi file vào máy ảo...")
-                    try:
-                        success_push = send_file_api(
-                            post.video_path,
-                            post.vm_name,
-                            adb_path=ADB_EXE,  # Dùng ADB_EXE từ config, không hardcode
-                            log_callback=lambda msg: post.log(msg)
-                        )
-                    except Exception as e:
-                        success_push = False
-                        post.log(f"❌ Lỗi gửi file: {e}")
-        
-                    if not success_push:
-                        post.log(f"❌ Gửi file thất bại")
-                        post.status = "failed"
-                        self.ui_queue.put(("status_update", post.id, "failed"))
-
-                        # Cleanup
-                        subprocess.run(
-                            [LDCONSOLE_EXE, "quit", "--name", post.vm_name],
-                            creationflags=subprocess.CREATE_NO_WINDOW
-                        )
-                        vm_manager.wait_vm_stopped(post.vm_name, LDCONSOLE_EXE, timeout=60)  # Đợi VM tắt hoàn toàn
-                        time.sleep(WAIT_EXTRA_LONG)
-                        self.running_posts.discard(post.id)
-                        save_scheduled_posts(self.posts)
-                        raise Exception("Attempt failed")
-
-                    post.log(f"✅ Đã gửi file thành công")
-
-                    # ✅ v1.5.30: Verify file đã có trong VM sau khi push
-                    filename = os.path.basename(post.video_path)
-                    remote_path = f"/sdcard/DCIM/{filename}"
-
-                    # Get expected file size
-                    try:
-                        local_size_mb = os.path.getsize(post.video_path) / (1024 * 1024)
-                    except:
-                        local_size_mb = None  # Nếu không lấy được size, chỉ check tồn tại
-
-                    # Verify với retry mechanism (wait 5s, retry 3 lần nếu chưa có)
-                    post.log(f"🔍 Đang verify file trong VM...")
-                    verified = verify_file_after_push(
-                        post.vm_name,
-                        remote_path,
-                        expected_size_mb=local_size_mb,
-                        wait_seconds=5,
-                        max_retries=3,
-                        log_callback=lambda msg: post.log(msg)
-                    )
-
-                    if not verified:
-                        post.log(f"❌ File verification FAILED - File không có trong VM sau khi push!")
-                        post.status = "failed"
-                        self.ui_queue.put(("status_update", post.id, "failed"))
-
-                        # Cleanup
-                        subprocess.run(
-                            [LDCONSOLE_EXE, "quit", "--name", post.vm_name],
-                            creationflags=subprocess.CREATE_NO_WINDOW
-                        )
-                        vm_manager.wait_vm_stopped(post.vm_name, LDCONSOLE_EXE, timeout=60)
-                        time.sleep(WAIT_EXTRA_LONG)
-                        self.running_posts.discard(post.id)
-                        save_scheduled_posts(self.posts)
-                        raise Exception("Attempt failed")
-
-                    time.sleep(WAIT_MEDIUM)
-        
-                    # Check stop request after sending file
-                    if post.stop_requested:
-                        post.log(f"🛑 Đã dừng theo yêu cầu - Đang tắt máy ảo...")
-                        subprocess.run(
-                            [LDCONSOLE_EXE, "quit", "--name", post.vm_name],
-                            creationflags=subprocess.CREATE_NO_WINDOW
-                        )
-                        vm_manager.wait_vm_stopped(post.vm_name, LDCONSOLE_EXE, timeout=60)  # Đợi VM tắt hoàn toàn
-                        time.sleep(WAIT_EXTRA_LONG)
-                        post.status = "failed"
-                        post.is_paused = True
-                        self.ui_queue.put(("status_update", post.id, "failed"))
-                        self.running_posts.discard(post.id)
-                        save_scheduled_posts(self.posts)
-                        raise Exception("Attempt failed")
-        
-                    # Check stop request before posting
-                    if post.stop_requested:
-                        post.log(f"🛑 Đã dừng theo yêu cầu - Đang tắt máy ảo...")
-                        subprocess.run(
-                            [LDCONSOLE_EXE, "quit", "--name", post.vm_name],
-                            creationflags=subprocess.CREATE_NO_WINDOW
-                        )
-                        vm_manager.wait_vm_stopped(post.vm_name, LDCONSOLE_EXE, timeout=60)  # Đợi VM tắt hoàn toàn
-                        time.sleep(WAIT_EXTRA_LONG)
-                        post.status = "failed"
-                        post.is_paused = True
-                        self.ui_queue.put(("status_update", post.id, "failed"))
-                        self.running_posts.discard(post.id)
-                        save_scheduled_posts(self.posts)
-                        raise Exception("Attempt failed")
-        
-                    # Post to Instagram
-                    post.log(f"📲 Đang đăng video: {post.title}")
-                    # Extract video filename for MediaStore broadcast retry
-                    video_filename = os.path.basename(post.video_path) if post.video_path else None
-                    # ✅ FIX BUG #5: Dùng auto_poster local thay vì shared
-                    success = auto_poster.auto_post(
-                        post.vm_name, adb_address, post.title,
-                        use_launchex=True, ldconsole_exe=LDCONSOLE_EXE,
-                        video_filename=video_filename
-                    )
-        
-                    if not success:
-                        post.log(f"❌ Đăng bài thất bại")
-                        post.status = "failed"
-                        self.ui_queue.put(("status_update", post.id, "failed"))
-        
-                        # Cleanup
-                        subprocess.run(
-                            [LDCONSOLE_EXE, "quit", "--name", post.vm_name],
-                            creationflags=subprocess.CREATE_NO_WINDOW
-                        )
-                        vm_manager.wait_vm_stopped(post.vm_name, LDCONSOLE_EXE, timeout=60)  # Đợi VM tắt hoàn toàn
-                        time.sleep(WAIT_EXTRA_LONG)
-                        self.running_posts.discard(post.id)
-                        save_scheduled_posts(self.posts)
-                        raise Exception("Attempt failed")
-        
-                    post.log(f"✅ Đã đăng thành công!")
-        
-                    # Check stop request after posting
-                    if post.stop_requested:
-                        post.log(f"🛑 Đã dừng theo yêu cầu - Đang tắt máy ảo...")
-                        subprocess.run(
-                            [LDCONSOLE_EXE, "quit", "--name", post.vm_name],
-                            creationflags=subprocess.CREATE_NO_WINDOW
-                        )
-                        vm_manager.wait_vm_stopped(post.vm_name, LDCONSOLE_EXE, timeout=60)  # Đợi VM tắt hoàn toàn
-                        time.sleep(WAIT_EXTRA_LONG)
-                        post.status = "failed"
-                        post.is_paused = True
-                        self.ui_queue.put(("status_update", post.id, "failed"))
-                        self.running_posts.discard(post.id)
-                        save_scheduled_posts(self.posts)
-                        raise Exception("Attempt failed")
-        
-                    # Delete file from VM
-                    post.log(f"🗑️ Xóa file trong máy ảo...")
-                    try:
-                        clear_dcim(adb_address, log_callback=lambda msg: post.log(msg))
-                    except Exception as e:
-                        post.log(f"⚠️ Lỗi khi xóa file: {e}")
-        
-                    time.sleep(WAIT_MEDIUM)
-        
-                    # Check stop request after deleting files
-                    if post.stop_requested:
-                        post.log(f"🛑 Đã dừng theo yêu cầu - Đang tắt máy ảo...")
-                        subprocess.run(
-                            [LDCONSOLE_EXE, "quit", "--name", post.vm_name],
-                            creationflags=subprocess.CREATE_NO_WINDOW
-                        )
-                        vm_manager.wait_vm_stopped(post.vm_name, LDCONSOLE_EXE, timeout=60)  # Đợi VM tắt hoàn toàn
-                        time.sleep(WAIT_EXTRA_LONG)
-                        post.status = "failed"
-                        post.is_paused = True
-                        self.ui_queue.put(("status_update", post.id, "failed"))
-                        self.running_posts.discard(post.id)
-                        save_scheduled_posts(self.posts)
-                        raise Exception("Attempt failed")
-        
-                    # Turn off VM
-                    post.log(f"🛑 Tắt máy ảo...")
-                    subprocess.run(
-                        [LDCONSOLE_EXE, "quit", "--name", post.vm_name],
-                        creationflags=subprocess.CREATE_NO_WINDOW
-                    )
-                    vm_manager.wait_vm_stopped(post.vm_name, LDCONSOLE_EXE, timeout=60)  # Đợi VM tắt hoàn toàn
-                    time.sleep(WAIT_EXTRA_LONG)
-                    post.log(f"✅ Đã tắt máy ảo hoàn toàn")
-        
-                    # Mark as posted
-                    post.status = "posted"
-                    attempt_success = True
-                    attempt_temp_video_path = temp_video_path
-                    post.log(f"✅ Lần thử {attempt} thành công!")
-
-                except Exception as attempt_error:
-                    post.log(f"⚠️ Lần thử {attempt} thất bại: {attempt_error}")
-                    attempt_success = False
-
-                    # Nếu user nhấn stop, KHÔNG retry
-                    if post.stop_requested:
-                        post.log(f"🛑 User yêu cầu dừng - Không retry")
-                        break
-
-                    # Cleanup giữa các retry (nếu không phải lần cuối)
-                    if attempt < max_attempts:
-                        post.log(f"🔄 Đang cleanup để retry...")
-
-                        # Xóa file trong VM
-                        try:
-                            post.log(f"🗑️ Xóa file trong máy ảo...")
-                            clear_dcim(adb_address, log_callback=lambda msg: post.log(msg))
-                        except Exception as e:
-                            post.log(f"⚠️ Không thể xóa file trong VM: {e}")
-
-                        # Quit VM
-                        try:
-                            post.log(f"🛑 Tắt máy ảo để retry...")
-                            subprocess.run(
-                                [LDCONSOLE_EXE, "quit", "--name", post.vm_name],
-                                creationflags=subprocess.CREATE_NO_WINDOW
-                            )
-                            vm_manager.wait_vm_stopped(post.vm_name, LDCONSOLE_EXE, timeout=60)
-                            time.sleep(WAIT_EXTRA_LONG)
-                        except Exception as e:
-                            post.log(f"⚠️ Không thể tắt VM: {e}")
-
-                        # Xóa temp file
-                        if attempt_temp_video_path and os.path.exists(attempt_temp_video_path):
-                            try:
-                                os.remove(attempt_temp_video_path)
-                                post.log(f"🗑️ Đã xóa file temp để retry")
-                            except Exception as e:
-                                post.log(f"⚠️ Không thể xóa temp file: {e}")
-
-                        post.log(f"⏳ Chờ 5 giây trước khi retry...")
-                        time.sleep(5)
-
-                # Check if attempt succeeded
-                if attempt_success:
-                    final_success = True
-                    temp_video_path = attempt_temp_video_path
-                    break  # Exit retry loop
-
-            # ========== KẾT THÚC RETRY LOOP ==========
-
-            # Kiểm tra kết quả cuối cùng
-            if not final_success:
-                post.log(f"❌ Đăng bài thất bại sau {max_attempts} lần thử")
-                post.status = "failed"
-                self.ui_queue.put(("status_update", post.id, "failed"))
-
-                # Final cleanup
-                try:
-                    subprocess.run(
-                        [LDCONSOLE_EXE, "quit", "--name", post.vm_name],
-                        creationflags=subprocess.CREATE_NO_WINDOW
-                    )
-                    vm_manager.wait_vm_stopped(post.vm_name, LDCONSOLE_EXE, timeout=60)
-                    time.sleep(WAIT_EXTRA_LONG)
-                except:
-                    pass
-
-                self.running_posts.discard(post.id)
-                save_scheduled_posts(self.posts)
-                return
-
-            post.log(f"✅ Hoàn tất!")
-            self.ui_queue.put(("status_update", post.id, "posted"))
-
-        except Exception as e:
-            self.logger.exception(f"Error processing post {post.id}")
-            post.log(f"❌ Lỗi: {e}")
-            post.status = "failed"
-            self.ui_queue.put(("status_update", post.id, "failed"))
-
-            # Cleanup VM
-            try:
-                subprocess.run(
-                    [LDCONSOLE_EXE, "quit", "--name", post.vm_name],
-                    creationflags=subprocess.CREATE_NO_WINDOW
-                )
-                vm_manager.wait_vm_stopped(post.vm_name, LDCONSOLE_EXE, timeout=60)  # Đợi VM tắt hoàn toàn
-                time.sleep(WAIT_EXTRA_LONG)
-            except:
-                pass
-
-        finally:
-            # ========== RELEASE VM LOCK ==========
-            if vm_acquired:
-                vm_manager.release_vm(post.vm_name, caller=f"Post:{post.title[:20]}")
-                post.log(f"🔓 Đã giải phóng máy ảo '{post.vm_name}'")
-
-            # ========== CLEANUP TEMP FILE ==========
-            if temp_video_path and os.path.exists(temp_video_path):
-                try:
-                    os.remove(temp_video_path)
-                    post.log(f"🗑️ Đã xóa file temp: {os.path.basename(temp_video_path)}")
-                except Exception as e:
-                    post.log(f"⚠️ Không thể xóa file temp: {e}")
-
-            self.running_posts.discard(post.id)
-            save_scheduled_posts(self.posts)
-
-
 # ==================== GUI ====================
 class PostTab(ctk.CTkFrame):
     """Scheduled Post Tab UI - Modern Windows 11 Style"""
@@ -1070,21 +177,8 @@ class PostTab(ctk.CTkFrame):
         self.logger = logging.getLogger(__name__)
         self.ui_queue = queue.Queue()
 
-        # ⚠️ SAFE LOAD: Load posts with error handling to prevent data loss
-        try:
-            self.posts = load_scheduled_posts()
-        except RuntimeError as e:
-            # Critical error loading data - show error to user
-            self.logger.error(f"Failed to load scheduled posts: {e}")
-            messagebox.showerror(
-                "Lỗi tải dữ liệu",
-                f"❌ Không thể tải file scheduled_posts.json!\n\n"
-                f"{str(e)}\n\n"
-                f"App sẽ khởi động với danh sách rỗng.\n"
-                f"Vui lòng kiểm tra file backup để khôi phục dữ liệu."
-            )
-            self.posts = []
-
+        self.posts = []  # Được gán khi thread nền load xong (_finish_loading_posts)
+        self.posts_loaded = False
         self.scheduler = None
         self.log_windows = {}
         self.checked_posts = {}  # Dictionary để lưu trạng thái checkbox {post_id: True/False}
@@ -1097,31 +191,75 @@ class PostTab(ctk.CTkFrame):
         self.view_mode = "flat"  # View mode: "flat" hoặc "grouped" (grouped by VM)
         self.expanded_vms = set()  # Track which VM groups are expanded
 
+        # ⚡ Load scheduled_posts.json ở thread nền - tab hiện placeholder trong lúc chờ,
+        # build UI + start scheduler khi load xong (tránh treo UI với file lớn)
+        self.loading_label = ctk.CTkLabel(
+            self,
+            text="⏳ Đang tải danh sách bài đăng...",
+            font=(FONTS["family"], FONTS["size_medium"]),
+            text_color=COLORS["text_secondary"]
+        )
+        self.loading_label.pack(expand=True)
+        self._load_result = {}
+        threading.Thread(target=self._load_posts_background, daemon=True, name="LoadScheduledPosts").start()
+        self.after(50, self._poll_posts_loaded)
+        self.after(200, self.process_ui_queue)
+
+    def _load_posts_background(self):
+        """Thread nền: đọc + dựng ScheduledPost (không đụng tới widget Tk)"""
+        try:
+            self._load_result["posts"] = load_scheduled_posts()
+        except Exception as e:
+            self._load_result["error"] = e
+
+    def _poll_posts_loaded(self):
+        """Main thread: chờ thread nền load xong rồi hoàn tất khởi tạo tab"""
+        if self.is_shutting_down:
+            return
+        if not self._load_result:
+            self.after(50, self._poll_posts_loaded)
+            return
+        self._finish_loading_posts()
+
+    def _finish_loading_posts(self):
+        """Gán posts, reset state sau restart, build UI, start scheduler (main thread)"""
+        # ⚠️ SAFE LOAD: Load posts with error handling to prevent data loss
+        error = self._load_result.get("error")
+        if error is not None:
+            # Critical error loading data - show error to user
+            self.logger.error(f"Failed to load scheduled posts: {error}")
+            messagebox.showerror(
+                "Lỗi tải dữ liệu",
+                f"❌ Không thể tải file scheduled_posts.json!\n\n"
+                f"{str(error)}\n\n"
+                f"App sẽ khởi động với danh sách rỗng.\n"
+                f"Vui lòng kiểm tra file backup để khôi phục dữ liệu."
+            )
+        self.posts = self._load_result.get("posts") or []
+        self._load_result = {}
+
         # ✅ FIX BUG #1: Reset state khi load app
-        # Khi app restart, force pause tất cả posts để tránh tự động chạy
+        reset_posts_after_restart(self.posts)
         for post in self.posts:
-            if post.status in ["pending", "processing"]:
-                post.is_paused = True  # Force pause
-                post.status = "pending"  # Reset về pending
-                self.logger.info(f"Reset post {post.id} to paused state after app restart")
             post.log_callback = self.append_log_line
 
         # ⚠️ SAFE SAVE: Chỉ save nếu có data (tránh save empty list)
-        # save_scheduled_posts() đã có safety check bên trong
         if self.posts:
             save_scheduled_posts(self.posts)
 
+        self.loading_label.destroy()
         self.build_ui()
+        self.posts_loaded = True
         self.load_posts_to_table(auto_sort=True)  # ✅ Sort lần đầu khi load app
         self.start_scheduler()
-        self.after(200, self.process_ui_queue)
 
-    def append_log_line(self, post_id, line):
-        """Append log line realtime to log window if open"""
+    def append_log_line(self, post_id, event):
+        """Append trace event realtime to log window if open"""
         if hasattr(self, "log_windows") and post_id in self.log_windows:
             win = self.log_windows[post_id]
             if win.winfo_exists():
                 txt = win.text_log
+                line = format_event(event)
 
                 def safe_append():
                     # Kiểm tra widget còn tồn tại
@@ -1280,6 +418,17 @@ class PostTab(ctk.CTkFrame):
             width=140
         ).pack(side=tk.LEFT, padx=DIMENSIONS["spacing_sm"], pady=DIMENSIONS["spacing_sm"])
 
+        # ♨️ Warm VM mode: giữ máy ảo chạy giữa các post liên tiếp
+        self.warm_vm_var = tk.BooleanVar(value=warm_vm_pool.enabled)
+        ctk.CTkCheckBox(
+            row3,
+            text="♨️ Giữ máy ảo chạy (warm)",
+            variable=self.warm_vm_var,
+            command=lambda: warm_vm_pool.set_enabled(self.warm_vm_var.get()),
+            font=(FONTS["family"], FONTS["size_normal"]),
+            text_color=COLORS["text_primary"]
+        ).pack(side=tk.LEFT, padx=DIMENSIONS["spacing_sm"], pady=DIMENSIONS["spacing_sm"])
+
         # ====== FILTER BAR ======
         filter_bar = ctk.CTkFrame(self, fg_color="transparent")
         filter_bar.pack(fill=tk.X, padx=DIMENSIONS["spacing_md"], pady=(DIMENSIONS["spacing_sm"], 0))
@@ -1908,7 +1057,7 @@ class PostTab(ctk.CTkFrame):
         # Dialog - CustomTkinter style
         dialog = ctk.CTkToplevel(self)
         dialog.title("Lên lịch hàng loạt")
-        dialog.geometry("550x530")
+        dialog.geometry("550x640")
         dialog.grab_set()
         dialog.configure(fg_color=COLORS["bg_primary"])
 
@@ -2008,8 +1157,125 @@ class PostTab(ctk.CTkFrame):
         entry_time_slots.insert(0, "06:00, 10:00, 18:00, 22:00")
         entry_time_slots.pack(padx=10, pady=(5, 10))
 
+        # ========== TỐI ƯU ==========
+        optimize_frame = ctk.CTkFrame(dialog, fg_color=COLORS["bg_secondary"], corner_radius=DIMENSIONS["corner_radius_medium"])
+        optimize_frame.pack(fill="x", padx=20, pady=5)
+
+        # 🧠 Xếp theo thời gian đăng đo được của từng máy ảo thay vì video thứ i → khung giờ thứ i
+        optimize_var = tk.BooleanVar(value=True)
+        ctk.CTkCheckBox(
+            optimize_frame,
+            text="🧠 Tối ưu theo thời gian đăng của từng máy ảo",
+            variable=optimize_var,
+            font=(FONTS["family"], FONTS["size_normal"]),
+            text_color=COLORS["text_primary"]
+        ).pack(anchor="w", padx=10, pady=(10, 5))
+
+        per_slot_row = ctk.CTkFrame(optimize_frame, fg_color="transparent")
+        per_slot_row.pack(fill="x", padx=10, pady=(0, 10))
+        ctk.CTkLabel(per_slot_row, text="Tối đa video / máy ảo / khung giờ:", anchor="w").pack(side="left")
+        entry_per_slot = ctk.CTkEntry(per_slot_row, width=60)
+        entry_per_slot.insert(0, "1")
+        entry_per_slot.pack(side="left", padx=5)
+
         result = {"ok": False}
 
+        def parse_inputs():
+            """Đọc phạm vi, ngày bắt đầu, khung giờ, số video/khung giờ. Returns: dict hoặc None nếu lỗi"""
+            # Parse start and end index
+            try:
+                start_idx = int(entry_start_index.get())
+                end_idx = int(entry_end_index.get())
+
+                if start_idx < 1:
+                    messagebox.showerror("Lỗi", "Chỉ số bắt đầu phải >= 1", parent=dialog)
+                    return None
+
+                if end_idx < start_idx:
+                    messagebox.showerror("Lỗi", "Chỉ số kết thúc phải >= chỉ số bắt đầu", parent=dialog)
+                    return None
+            except ValueError:
+                messagebox.showerror("Lỗi", "Chỉ số không hợp lệ", parent=dialog)
+                return None
+
+            # Parse start date
+            try:
+                start_date = datetime.strptime(entry_start_date.get().strip(), "%d/%m/%Y")
+                start_date = start_date.replace(tzinfo=VN_TZ)
+            except:
+                messagebox.showerror("Lỗi", "Ngày bắt đầu không hợp lệ. Dùng định dạng dd/mm/yyyy", parent=dialog)
+                return None
+
+            # Parse time slots
+            time_slots_str = entry_time_slots.get().strip()
+            if not time_slots_str:
+                messagebox.showerror("Lỗi", "Vui lòng nhập khung giờ", parent=dialog)
+                return None
+
+            time_slots = []
+            for slot in time_slots_str.split(","):
+                slot = slot.strip()
+                try:
+                    # Parse HH:MM
+                    parts = slot.split(":")
+                    if len(parts) != 2:
+                        raise ValueError
+                    hour = int(parts[0])
+                    minute = int(parts[1])
+                    if not (0 <= hour <= 23 and 0 <= minute <= 59):
+                        raise ValueError
+                    time_slots.append((hour, minute))
+                except:
+                    messagebox.showerror("Lỗi", f"Khung giờ '{slot}' không hợp lệ. Dùng định dạng HH:MM", parent=dialog)
+                    return None
+
+            if not time_slots:
+                messagebox.showerror("Lỗi", "Không có khung giờ nào hợp lệ", parent=dialog)
+                return None
+
+            try:
+                per_slot = int(entry_per_slot.get())
+                if per_slot < 1:
+                    raise ValueError
+            except ValueError:
+                messagebox.showerror("Lỗi", "Số video / máy ảo / khung giờ phải là số >= 1", parent=dialog)
+                return None
+
+            return {"start_idx": start_idx, "end_idx": end_idx, "start_date": start_date,
+                    "time_slots": time_slots, "per_slot": per_slot}
+
+        def build_plan(inputs):
+            """Lịch tối ưu cho video trong phạm vi. Returns: (posts trong phạm vi, list PlannedPost)"""
+            in_range = [post for idx, post in enumerate(self.displayed_posts, start=1)
+                        if inputs["start_idx"] <= idx <= inputs["end_idx"]]
+            in_range_ids = {post.id for post in in_range}
+            # Post đã hẹn giờ khác trên cùng VM → khoảng VM bận
+            others = [(post.vm_name, post.scheduled_time_vn) for post in self.posts
+                      if post.id not in in_range_ids and post.status in ("pending", "processing")]
+            profiles = measure_vm_profiles({post.vm_name for post in in_range} | {vm for vm, _ in others})
+            now = datetime.now(VN_TZ)
+            slots = (slot for slot in iter_slots(inputs["start_date"], inputs["time_slots"]) if slot > now)
+            # Video chưa có máy ảo (vm_name None) được xếp như 1 máy ảo riêng
+            plan = optimize_schedule([(post.id, post.vm_name) for post in in_range], slots, profiles,
+                                     busy=busy_intervals(others, profiles), per_slot=inputs["per_slot"])
+            if any(planned is None for planned in plan):
+                messagebox.showerror("Lỗi", "Không còn khung giờ nào sau thời điểm hiện tại", parent=dialog)
+                return in_range, None
+            return in_range, plan
+
+        def on_preview():
+            """Bảng giờ bắt đầu / xong dự kiến của lịch tối ưu (chưa áp dụng)"""
+            inputs = parse_inputs()
+            if inputs is None:
+                return
+            in_range, plan = build_plan(inputs)
+            if plan is None:
+                return
+            if not in_range:
+                messagebox.showinfo("Thông báo", "Không có video nào trong phạm vi!", parent=dialog)
+                return
+            self.show_schedule_preview(dialog, in_range, plan)
+
         def on_clear_all():
             """Huỷ tất cả thời gian đã đặt trong phạm vi"""
             # Parse start and end index
@@ -2073,74 +1339,14 @@ class PostTab(ctk.CTkFrame):
             dialog.destroy()
 
         def on_apply():
-            # Parse start and end index
-            try:
-                start_idx = int(entry_start_index.get())
-                end_idx = int(entry_end_index.get())
-
-                if start_idx < 1:
-                    messagebox.showerror("Lỗi", "Chỉ số bắt đầu phải >= 1", parent=dialog)
-                    return
-
-                if end_idx < start_idx:
-                    messagebox.showerror("Lỗi", "Chỉ số kết thúc phải >= chỉ số bắt đầu", parent=dialog)
-                    return
-            except ValueError:
-                messagebox.showerror("Lỗi", "Chỉ số không hợp lệ", parent=dialog)
+            inputs = parse_inputs()
+            if inputs is None:
                 return
+            start_idx = inputs["start_idx"]
+            end_idx = inputs["end_idx"]
+            time_slots = inputs["time_slots"]
 
-            # Parse start date
-            try:
-                start_date = datetime.strptime(entry_start_date.get().strip(), "%d/%m/%Y")
-                start_date = start_date.replace(tzinfo=VN_TZ)
-            except:
-                messagebox.showerror("Lỗi", "Ngày bắt đầu không hợp lệ. Dùng định dạng dd/mm/yyyy", parent=dialog)
-                return
-
-            # Parse time slots
-            time_slots_str = entry_time_slots.get().strip()
-            if not time_slots_str:
-                messagebox.showerror("Lỗi", "Vui lòng nhập khung giờ", parent=dialog)
-                return
-
-            time_slots = []
-            for slot in time_slots_str.split(","):
-                slot = slot.strip()
-                try:
-                    # Parse HH:MM
-                    parts = slot.split(":")
-                    if len(parts) != 2:
-                        raise ValueError
-                    hour = int(parts[0])
-                    minute = int(parts[1])
-                    if not (0 <= hour <= 23 and 0 <= minute <= 59):
-                        raise ValueError
-                    time_slots.append((hour, minute))
-                except:
-                    messagebox.showerror("Lỗi", f"Khung giờ '{slot}' không hợp lệ. Dùng định dạng HH:MM", parent=dialog)
-                    return
-
-            if not time_slots:
-                messagebox.showerror("Lỗi", "Không có khung giờ nào hợp lệ", parent=dialog)
-                return
-
-            # Apply schedule to posts (only within range)
-            current_date = start_date
-            slot_index = 0
-            now = datetime.now(VN_TZ)
-
-            # Đếm số video được áp dụng
-            applied_count = 0
-
-            # ✅ Sử dụng thứ tự hiển thị trên UI thay vì thứ tự gốc
-            for idx, post in enumerate(self.displayed_posts, start=1):
-                # Chỉ áp dụng cho video trong phạm vi
-                if idx < start_idx or idx > end_idx:
-                    continue
-
-                hour, minute = time_slots[slot_index]
-                scheduled_time = current_date.replace(hour=hour, minute=minute)
-
+            def apply_time(post, scheduled_time):
                 # Chỉ cập nhật thời gian, không thay đổi vm_name
                 post.scheduled_time_vn = scheduled_time
 
@@ -2152,13 +1358,36 @@ class PostTab(ctk.CTkFrame):
                 else:
                     post.status = "draft"
 
-                applied_count += 1
+            # Đếm số video được áp dụng
+            applied_count = 0
+
+            if optimize_var.get():
+                in_range, plan = build_plan(inputs)
+                if plan is None:
+                    return
+                for post, planned in zip(in_range, plan):
+                    apply_time(post, planned.slot)
+                    applied_count += 1
+            else:
+                # Apply schedule to posts (only within range)
+                current_date = inputs["start_date"]
+                slot_index = 0
+
+                # ✅ Sử dụng thứ tự hiển thị trên UI thay vì thứ tự gốc
+                for idx, post in enumerate(self.displayed_posts, start=1):
+                    # Chỉ áp dụng cho video trong phạm vi
+                    if idx < start_idx or idx > end_idx:
+                        continue
 
-                # Move to next slot
-                slot_index += 1
-                if slot_index >= len(time_slots):
-                    slot_index = 0
-                    current_date += timedelta(days=1)
+                    hour, minute = time_slots[slot_index]
+                    apply_time(post, current_date.replace(hour=hour, minute=minute))
+                    applied_count += 1
+
+                    # Move to next slot
+                    slot_index += 1
+                    if slot_index >= len(time_slots):
+                        slot_index = 0
+                        current_date += timedelta(days=1)
 
             result["ok"] = True
             result["applied_count"] = applied_count
@@ -2170,6 +1399,14 @@ class PostTab(ctk.CTkFrame):
         btn_frame = ctk.CTkFrame(dialog, fg_color="transparent")
         btn_frame.pack(pady=20)
 
+        ctk.CTkButton(
+            btn_frame,
+            text="👁 Xem trước",
+            command=on_preview,
+            **get_button_style("primary"),
+            width=120
+        ).pack(side=tk.LEFT, padx=5)
+
         ctk.CTkButton(
             btn_frame,
             text="✅ Áp dụng",
@@ -2215,6 +1452,66 @@ class PostTab(ctk.CTkFrame):
                 f"✔️ Đã áp dụng: {applied_count} video"
             )
 
+    def show_schedule_preview(self, parent, posts, plan):
+        """Cửa sổ xem trước lịch tối ưu: giờ hẹn, bắt đầu / xong dự kiến, trễ của từng video"""
+        stats = plan_stats(plan)
+        measured = measure_vm_profiles({post.vm_name for post in posts if post.vm_name})
+
+        window = ctk.CTkToplevel(parent)
+        window.title("Xem trước lịch")
+        window.geometry("900x560")
+        window.configure(fg_color=COLORS["bg_primary"])
+        window.transient(parent)
+
+        last_finish = stats["last_finish"].strftime("%d/%m/%Y %H:%M") if stats["last_finish"] else "-"
+        summary = (f"📊 {stats['posts']} video · {len(stats['per_vm'])} máy ảo · xong dự kiến {last_finish} · "
+                   f"trễ TB {stats['mean_lateness'] / 60:.1f} phút · lỡ hẹn (> {POST_MAX_LATE_SECONDS // 60} phút): "
+                   f"{stats['late']}")
+        ctk.CTkLabel(
+            window,
+            text=summary,
+            font=(FONTS["family"], FONTS["size_normal"], FONTS["weight_semibold"]),
+            text_color=COLORS["danger"] if stats["late"] else COLORS["text_primary"]
+        ).pack(anchor="w", padx=15, pady=(12, 2))
+
+        unmeasured = sorted(vm for vm, profile in measured.items() if not profile.measured)
+        if unmeasured:
+            ctk.CTkLabel(
+                window,
+                text=f"💡 Chưa đo được thời gian đăng (dùng ước lượng): {', '.join(unmeasured[:8])}"
+                     f"{'...' if len(unmeasured) > 8 else ''}",
+                font=(FONTS["family"], FONTS["size_small"]),
+                text_color=COLORS["text_secondary"]
+            ).pack(anchor="w", padx=15, pady=(0, 4))
+
+        frame = tk.Frame(window, bg=COLORS["bg_tertiary"])
+        frame.pack(fill=tk.BOTH, expand=True, padx=15, pady=(4, 15))
+        columns = (("idx", "#", 50), ("title", "Video", 260), ("vm", "Máy ảo", 110), ("slot", "Giờ hẹn", 120),
+                   ("start", "Bắt đầu (dự kiến)", 120), ("finish", "Xong (dự kiến)", 120), ("late", "Trễ", 70))
+        tree = ttk.Treeview(frame, columns=[c[0] for c in columns], show="headings")
+        tree.tag_configure("oddrow", background=COLORS["bg_tertiary"])
+        tree.tag_configure("evenrow", background=COLORS["bg_secondary"])
+        tree.tag_configure("late", foreground=COLORS["danger"])
+        for name, heading, width in columns:
+            tree.heading(name, text=heading)
+            tree.column(name, width=width, anchor=tk.W if name == "title" else tk.CENTER)
+        vsb = ttk.Scrollbar(frame, orient="vertical", command=tree.yview)
+        tree.configure(yscroll=vsb.set)
+        tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        vsb.pack(side=tk.RIGHT, fill=tk.Y)
+
+        def fmt(ts):
+            return datetime.fromtimestamp(ts, VN_TZ).strftime("%d/%m %H:%M:%S")
+
+        for idx, (post, planned) in enumerate(zip(posts, plan), start=1):
+            tags = ["evenrow" if idx % 2 == 0 else "oddrow"]
+            if planned.is_late():
+                tags.append("late")
+            tree.insert("", tk.END, values=(
+                idx, post.title, post.vm_name or "Chưa chọn", planned.slot.strftime("%d/%m %H:%M"),
+                fmt(planned.start), fmt(planned.finish), f"{max(0.0, planned.lateness) / 60:.1f}p"
+            ), tags=tags)
+
     def bulk_assign_vm(self):
         """Đặt máy ảo hàng loạt cho các video trong table - chỉ áp máy ảo"""
         # ✅ Block khi đang chạy tất cả
@@ -2324,14 +1621,23 @@ class PostTab(ctk.CTkFrame):
         )
         scrollable_frame.pack(fill="both", expand=True, padx=10, pady=(0, 10))
 
-        # Checkboxes for each VM
+        # Checkboxes for each VM (kèm hàng chờ + kết quả đăng gần nhất cho chế độ tự cân bằng)
+        vm_names = [vm_info["vm_name"] for vm_info in vm_list]
+        health = vm_health(vm_names)
+        depths = queue_depths(self.posts, vm_names)
         vm_vars = []
         for vm_info in vm_list:
             var = tk.BooleanVar(value=True)  # Default: all selected
             vm_vars.append((vm_info, var))
+            vm_health_info = health[vm_info["vm_name"]]
+            load_text = f"   ⏳ {depths[vm_info['vm_name']]} chờ"
+            if vm_health_info.samples:
+                load_text += f" · ✅ {vm_health_info.ok}/{vm_health_info.samples}"
+            if vm_health_info.failing:
+                load_text += " · ⚠️ lỗi liên tục"
             ctk.CTkCheckBox(
                 scrollable_frame,
-                text=vm_info["display"],
+                text=vm_info["display"] + load_text,
                 variable=var,
                 font=(FONTS["family"], FONTS["size_normal"]),
                 text_color=COLORS["text_primary"],
@@ -2367,6 +1673,18 @@ class PostTab(ctk.CTkFrame):
             width=140
         ).pack(side="left", padx=5)
 
+        # ⚖️ Chia theo tải + tỉ lệ thành công thay vì round-robin
+        balance_var = tk.BooleanVar(value=True)
+        ctk.CTkCheckBox(
+            vm_outer_frame,
+            text="⚖️ Tự cân bằng (hàng chờ, tỉ lệ thành công, "
+                 + (f"tối đa {ACCOUNT_MAX_POSTS_PER_DAY} post/tài khoản/ngày)" if ACCOUNT_MAX_POSTS_PER_DAY
+                    else "không giới hạn post/ngày)"),
+            variable=balance_var,
+            font=(FONTS["family"], FONTS["size_normal"]),
+            text_color=COLORS["text_primary"]
+        ).pack(anchor="w", padx=10, pady=(0, 10))
+
         result = {"ok": False}
 
         def on_clear_all_vm():
@@ -2405,6 +1723,7 @@ class PostTab(ctk.CTkFrame):
                 # Gỡ máy ảo
                 post.vm_name = None
                 post.account_display = "Chưa chọn"
+                post.auto_vm = False
 
                 # Set status về draft nếu không có time
                 if not post.scheduled_time_vn:
@@ -2457,17 +1776,38 @@ class PostTab(ctk.CTkFrame):
             # Apply VMs to posts (only within range)
             vm_index = 0
             applied_count = 0
+            skipped_count = 0
 
             # ✅ Sử dụng thứ tự hiển thị trên UI thay vì thứ tự gốc
-            for idx, post in enumerate(self.displayed_posts, start=1):
-                # Chỉ áp dụng cho video trong phạm vi
-                if idx < start_idx or idx > end_idx:
-                    continue
+            in_range = [post for idx, post in enumerate(self.displayed_posts, start=1) if start_idx <= idx <= end_idx]
+            balanced = None
+            if balance_var.get():
+                in_range_ids = {post.id for post in in_range}
+                balanced = assign_balanced(in_range, [vm_info["vm_name"] for vm_info in selected_vms],
+                                           [post for post in self.posts if post.id not in in_range_ids])
+                displays = {vm_info["vm_name"]: vm_info["display"] for vm_info in selected_vms}
+
+            for post in in_range:
+                if balanced is not None:
+                    vm_name = balanced[post.id]
+                    if vm_name is None:
+                        # Mọi tài khoản đã đủ post ngày đó → giữ nguyên video này
+                        skipped_count += 1
+                        continue
+                    post.vm_name = vm_name
+                    post.account_display = displays[vm_name]
+                    post.auto_vm = True
+                else:
+                    # Áp dụng máy ảo theo round-robin
+                    vm_info = selected_vms[vm_index]
+                    post.vm_name = vm_info["vm_name"]
+                    post.account_display = vm_info["display"]
+                    post.auto_vm = False
 
-                # Áp dụng máy ảo theo round-robin
-                vm_info = selected_vms[vm_index]
-                post.vm_name = vm_info["vm_name"]
-                post.account_display = vm_info["display"]
+                    # Move to next VM
+                    vm_index += 1
+                    if vm_index >= len(selected_vms):
+                        vm_index = 0
 
                 # Nếu đã có thời gian thì set pending, chưa thì để draft
                 if post.scheduled_time_vn:
@@ -2479,13 +1819,9 @@ class PostTab(ctk.CTkFrame):
 
                 applied_count += 1
 
-                # Move to next VM
-                vm_index += 1
-                if vm_index >= len(selected_vms):
-                    vm_index = 0
-
             result["ok"] = True
             result["applied_count"] = applied_count
+            result["skipped_count"] = skipped_count
             result["start_idx"] = start_idx
             result["end_idx"] = min(end_idx, len(self.posts))
             result["vm_count"] = len(selected_vms)
@@ -2533,6 +1869,7 @@ class PostTab(ctk.CTkFrame):
             start_idx = result.get("start_idx", 1)
             end_idx = result.get("end_idx", len(self.posts))
             vm_count = result.get("vm_count", 0)
+            skipped_count = result.get("skipped_count", 0)
 
             messagebox.showinfo(
                 "Thành công",
@@ -2540,6 +1877,8 @@ class PostTab(ctk.CTkFrame):
                 f"📊 Phạm vi: Video {start_idx} đến {end_idx}\n"
                 f"✔️ Đã áp dụng: {applied_count} video\n"
                 f"🖥️ Số máy ảo: {vm_count}"
+                + (f"\n⚠️ Giữ nguyên {skipped_count} video (các tài khoản đã đủ "
+                   f"{ACCOUNT_MAX_POSTS_PER_DAY} post/ngày)" if skipped_count else "")
             )
 
     def bulk_edit_titles(self):
@@ -3674,6 +3013,8 @@ class PostTab(ctk.CTkFrame):
         # Xóa các video đã chọn
         # ⚠️ CRITICAL FIX v1.5.8: Dùng slice assignment để modify in-place
         self.posts[:] = [post for post in self.posts if post.id not in selected_ids]
+        for post_id in selected_ids:
+            trace_log.clear(post_id)
 
         # ✅ FIX v1.5.13: Cập nhật displayed_posts để sync với posts
         if hasattr(self, 'displayed_posts') and self.displayed_posts:
@@ -3981,6 +3322,8 @@ class PostTab(ctk.CTkFrame):
 
             # Update post
             vm_info = vm_list[vm_idx]
+            if post.vm_name != vm_info["vm_name"]:
+                post.auto_vm = False  # Người dùng tự chọn máy ảo
             post.vm_name = vm_info["vm_name"]
             post.account_display = vm_info["display"]
             post.scheduled_time_vn = scheduled_time
@@ -4021,9 +3364,11 @@ class PostTab(ctk.CTkFrame):
         txt.pack(fill=tk.BOTH, expand=True)
 
         # Show existing logs
-        if post.logs:
+        # Ring buffer trong RAM; log cũ hơn (đã spill xuống đĩa) tải theo trang khi bấm nút
+        events, older_cursor = trace_log.snapshot(post.id)
+        if events:
             txt.config(state="normal")
-            txt.insert("1.0", "\n".join(post.logs))
+            txt.insert("1.0", "\n".join(format_event(e) for e in events))
             txt.see("end")
             txt.config(state="disabled")
 
@@ -4034,12 +3379,30 @@ class PostTab(ctk.CTkFrame):
         btns = tk.Frame(win)
         btns.pack(fill=tk.X, pady=5)
 
+        paging = {"cursor": older_cursor}
+
+        def load_older():
+            older, paging["cursor"] = trace_log.page(post.id, before=paging["cursor"])
+            if older:
+                txt.config(state="normal")
+                txt.insert("1.0", "\n".join(format_event(e) for e in older) + "\n")
+                txt.see("1.0")
+                txt.config(state="disabled")
+            if not paging["cursor"]:
+                btn_older.state(["disabled"])
+
         def clear_logs():
-            post.logs.clear()
+            trace_log.clear(post.id)
+            paging["cursor"] = 0
+            btn_older.state(["disabled"])
             txt.config(state="normal")
             txt.delete("1.0", tk.END)
             txt.config(state="disabled")
 
+        btn_older = ttk.Button(btns, text="⬆ Tải log cũ hơn", command=load_older)
+        btn_older.pack(side=tk.LEFT, padx=4)
+        if not older_cursor:
+            btn_older.state(["disabled"])
         ttk.Button(btns, text="Xóa lịch sử", command=clear_logs).pack(side=tk.LEFT, padx=4)
         ttk.Button(btns, text="Đóng", command=win.destroy).pack(side=tk.RIGHT, padx=4)
 
@@ -4051,6 +3414,7 @@ class PostTab(ctk.CTkFrame):
 
         # Xóa trực tiếp không cần confirm
         self.posts.remove(post)
+        trace_log.clear(post.id)
         save_scheduled_posts(self.posts)
         self.load_posts_to_table(auto_sort=True)  # ← FIX: Force reload sau delete
 
@@ -4086,6 +3450,14 @@ class PostTab(ctk.CTkFrame):
                     except:
                         pass
 
+                elif msg_type == "account_update":
+                    # Post được chuyển sang VM khác (failover)
+                    _, post_id, account_display = msg
+                    try:
+                        self.tree.set(post_id, "account", account_display)
+                    except:
+                        pass
+
         except:
             pass
 
@@ -4140,9 +3512,14 @@ class PostTab(ctk.CTkFrame):
                 if remaining > 0:
                     self.logger.warning(f"⚠️ Còn {remaining} threads chưa kết thúc sau 10s")
 
+            # ♨️ Tắt các VM đang giữ warm
+            try:
+                warm_vm_pool.shutdown(quit_vms=True)
+            except Exception as e:
+                self.logger.error(f"❌ Lỗi khi tắt VM warm: {e}")
+
             # 4️⃣ Tắt TẤT CẢ VMs đang được sử dụng bởi posts
             self.logger.info("🛑 Đang tắt tất cả VMs...")
-            import subprocess
             from config import get_ldconsole_path
 
             # Collect tất cả VMs từ posts
@@ -4177,16 +3554,12 @@ class PostTab(ctk.CTkFrame):
 
                     self.logger.info(f"🔍 Tìm thấy {len(running_vms)} VMs đang chạy: {running_vms}")
 
-                    # Tắt từng VM đang chạy
+                    # Tắt từng VM đang chạy (VM job / process khác còn giữ khóa → bỏ qua)
                     for vm_name in running_vms:
                         try:
                             self.logger.info(f"   🛑 Tắt VM: {vm_name}")
-                            subprocess.run(
-                                [ldconsole, "quit", "--name", vm_name],
-                                creationflags=subprocess.CREATE_NO_WINDOW,
-                                timeout=10
-                            )
-                            self.logger.info(f"   ✅ Đã gửi lệnh tắt VM: {vm_name}")
+                            if warm_vm_pool.quit_if_free(vm_name, caller="PostTab.cleanup"):
+                                self.logger.info(f"   ✅ Đã gửi lệnh tắt VM: {vm_name}")
                         except Exception as e:
                             self.logger.error(f"   ❌ Lỗi khi tắt VM {vm_name}: {e}")
 
@@ -4199,9 +3572,11 @@ class PostTab(ctk.CTkFrame):
                     self.logger.error(f"❌ Lỗi khi check/tắt VMs: {e}")
 
             # 5️⃣ Save state cuối cùng
-            self.logger.info("💾 Lưu state cuối cùng...")
-            save_scheduled_posts(self.posts)
-            self.logger.info("✅ Đã lưu state")
+            # Đóng app khi thread nền chưa load xong → self.posts còn rỗng, không được ghi đè file
+            if self.posts_loaded:
+                self.logger.info("💾 Lưu state cuối cùng...")
+                save_scheduled_posts(self.posts)
+                self.logger.info("✅ Đã lưu state")
 
             self.logger.info("=" * 50)
             self.logger.info("✅ CLEANUP TAB_POST HOÀN TẤT")
@@ -1,5 +1,4 @@
 import os
-import json
 import subprocess
 import threading
 import time
@@ -11,7 +10,9 @@ import customtkinter as ctk
 from ui_theme import *
 
 from utils.login import InstagramLogin
-from config import LDCONSOLE_EXE, ADB_EXE, VM_DATA_DIR, get_vm_id_from_name
+from utils.cancel_token import CancelToken
+from utils.vm_registry import vm_registry
+from config import LDCONSOLE_EXE, ADB_EXE, VM_DATA_DIR
 from constants import (
     MAX_RETRY_VM_STATUS, VM_STATUS_CHECK_INTERVAL
 )
@@ -28,7 +29,10 @@ class UsersTab(ctk.CTkFrame):
     def __init__(self, parent):
         super().__init__(parent, fg_color=COLORS["bg_primary"], corner_radius=0)
         self.logger = logging.getLogger(__name__)
-        self.login_handler = InstagramLogin(log_callback=self.write_log)
+        # Token dùng chung cho mọi lượt đăng nhập → cleanup() dừng ngay các login đang chạy
+        self.login_cancel_token = CancelToken()
+        self.login_handler = InstagramLogin(log_callback=self.write_log,
+                                            cancel_token=self.login_cancel_token)
 
         # VM logs
         self.vm_logs = {}
@@ -145,6 +149,10 @@ class UsersTab(ctk.CTkFrame):
         # Nạp dữ liệu
         self.refresh_list()
 
+    def cleanup(self):
+        """Dừng các lượt đăng nhập đang chạy khi đóng app"""
+        self.login_cancel_token.cancel("app closing")
+
     # === Helpers (UI & device id) ===
     def _ui(self, func, *args, **kwargs):
         """Chạy cập nhật UI an toàn trên main thread."""
@@ -272,7 +280,8 @@ class UsersTab(ctk.CTkFrame):
             json_path = os.path.join(VM_DATA_DIR, f"{vm_id}.json")
 
             # Nếu chưa có file JSON, tạo mới
-            if not os.path.exists(json_path):
+            current = vm_registry.get_by_id(vm_id)
+            if current is None and not os.path.exists(json_path):
                 self.logger.info(f"Creating new JSON file for VM: {vm_name} (ID: {vm_id})")
                 new_data = {
                     "id": vm_id,
@@ -284,22 +293,16 @@ class UsersTab(ctk.CTkFrame):
                     "port": ""
                 }
                 try:
-                    with open(json_path, "w", encoding="utf-8") as fp:
-                        json.dump(new_data, fp, ensure_ascii=False, indent=2)
+                    vm_registry.save(vm_id, new_data)
                 except Exception as e:
                     self.logger.error(f"Failed to create JSON for {vm_name}: {e}")
                     continue
             else:
                 # ✅ v1.5.36: Cập nhật vm_name nếu đã đổi tên
                 try:
-                    with open(json_path, "r", encoding="utf-8") as fp:
-                        data = json.load(fp)
-
-                    old_name = data.get("vm_name", "")
+                    old_name = (current or {}).get("vm_name", "")
                     if old_name != vm_name:
-                        data["vm_name"] = vm_name
-                        with open(json_path, "w", encoding="utf-8") as fp:
-                            json.dump(data, fp, ensure_ascii=False, indent=2)
+                        vm_registry.update(vm_id, {"vm_name": vm_name})
                         self.logger.info(f"Updated vm_name: {vm_id} ({old_name} -> {vm_name})")
                 except Exception as e:
                     self.logger.error(f"Failed to update vm_name for {vm_id}: {e}")
@@ -311,8 +314,7 @@ class UsersTab(ctk.CTkFrame):
                 if filename.endswith(".json"):
                     file_id = filename.replace(".json", "")
                     if file_id not in existing_ids:
-                        orphan_path = os.path.join(VM_DATA_DIR, filename)
-                        os.remove(orphan_path)
+                        vm_registry.remove(file_id)
                         self.logger.info(f"Removed orphaned file: {filename} (VM khong con ton tai)")
         except Exception as e:
             self.logger.error(f"Error during orphaned files cleanup: {e}")
@@ -325,10 +327,11 @@ class UsersTab(ctk.CTkFrame):
             # ✅ v1.5.36: Đọc file theo {vm_id}.json
             json_path = os.path.join(VM_DATA_DIR, f"{vm_id}.json")
 
-            # Đọc thông tin từ file JSON
+            # Đọc thông tin từ VM registry (cache của file JSON)
             try:
-                with open(json_path, "r", encoding="utf-8") as fp:
-                    data = json.load(fp)
+                data = vm_registry.get_by_id(vm_id)
+                if data is None:
+                    raise FileNotFoundError(json_path)
 
                 insta = data.get("insta_name", "")
                 username = data.get("username", "")
@@ -586,26 +589,24 @@ class UsersTab(ctk.CTkFrame):
         """Fixed version với logic rõ ràng hơn"""
 
         # ✅ v1.5.36: Tìm VM ID từ tên máy ảo
-        vm_id = get_vm_id_from_name(name)
+        vm_id = vm_registry.get_vm_id(name)
         if not vm_id:
             messagebox.showerror("Lỗi", f"Không tìm thấy file cấu hình cho máy ảo '{name}'")
             return
 
-        # Đọc dữ liệu cũ từ JSON
-        path = os.path.join(VM_DATA_DIR, f"{vm_id}.json")
+        # Đọc dữ liệu cũ từ VM registry
         existing_data = ""
         existing_port = ""
 
         try:
-            with open(path, "r", encoding="utf-8") as fp:
-                data = json.load(fp)
-                username = data.get("username", "")
-                password = data.get("password", "")
-                key_2fa = data.get("2fa", "")
-                existing_port = data.get("port", "")
-                
-                if username or password or key_2fa:
-                    existing_data = f"{username}|{password}|{key_2fa}"
+            data = vm_registry.get_by_id(vm_id) or {}
+            username = data.get("username", "")
+            password = data.get("password", "")
+            key_2fa = data.get("2fa", "")
+            existing_port = data.get("port", "")
+            
+            if username or password or key_2fa:
+                existing_data = f"{username}|{password}|{key_2fa}"
         except Exception:
             pass
         
@@ -710,25 +711,17 @@ class UsersTab(ctk.CTkFrame):
         def save_to_json(port_value, username=None, password=None, key_2fa=None):
             """Lưu data vào JSON file"""
             try:
-                # Đọc data hiện tại
-                try:
-                    with open(path, "r", encoding="utf-8") as fp:
-                        data = json.load(fp)
-                except:
-                    data = {}
-                
                 # Update port
-                data["port"] = port_value
+                changes = {"port": port_value}
                 
                 # Update login info nếu có
                 if username and password and key_2fa:
-                    data["username"] = username
-                    data["password"] = password
-                    data["2fa"] = key_2fa
+                    changes["username"] = username
+                    changes["password"] = password
+                    changes["2fa"] = key_2fa
                 
-                # Ghi file
-                with open(path, "w", encoding="utf-8") as fp:
-                    json.dump(data, fp, ensure_ascii=False, indent=2)
+                # Ghi file qua registry (write-through)
+                vm_registry.update(vm_id, changes)
                 
                 return True
             except Exception as e:
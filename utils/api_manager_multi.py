@@ -5,6 +5,8 @@ Quản lý API keys cho YouTube và TikTok
 import os
 import json
 
+from utils.persistence import atomic_write_json
+
 
 class MultiAPIManager:
     """
@@ -33,8 +35,7 @@ class MultiAPIManager:
                 "youtube": [],
                 "tiktok": []
             }
-            with open(self.api_file, 'w', encoding='utf-8') as f:
-                json.dump(default_data, f, ensure_ascii=False, indent=2)
+            atomic_write_json(self.api_file, default_data)
 
     def load_all(self):
         """Load tất cả API keys"""
@@ -46,8 +47,7 @@ class MultiAPIManager:
 
     def save_all(self, data):
         """Lưu tất cả API keys"""
-        with open(self.api_file, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        atomic_write_json(self.api_file, data)
         self.data = data
 
     def get_keys(self, platform):
@@ -0,0 +1,189 @@
+"""
+Async Logging - Root logger ghi qua hàng đợi, disk I/O chạy ở 1 thread riêng.
+
+Trước đây root logger gắn thẳng FileHandler + StreamHandler: mỗi lần log từ hàng chục
+worker thread (BaseInstagramAutomation.log, vm_manager, pipeline) phải tranh lock của
+handler và ghi file ngay trong thread đang tự động hóa → thời gian log lẫn vào thời
+gian từng bước.
+
+- BoundedQueueHandler: thread gọi log chỉ đẩy record vào queue có giới hạn (không chờ)
+- Queue đầy: bỏ record DEBUG/INFO mới; WARNING trở lên đẩy record cũ nhất ra để có chỗ.
+  Số record bị bỏ được báo lại bằng 1 dòng WARNING khi queue có chỗ
+- QueueListener (1 thread) format + ghi ra:
+    - logs/app.log xoay vòng theo dung lượng (RotatingFileHandler)
+    - console
+    - logs/vm/<vm>.log cho record có gắn VM (logger.info(..., extra={"vm": vm_name}))
+
+Sử dụng:
+    listener = setup_async_logging(level, fmt, log_file)   # main.setup_logging
+    logging.getLogger(__name__).info("...", extra={"vm": "VM1"})
+    stop_async_logging()                                    # khi đóng app - ghi nốt queue
+"""
+import os
+import re
+import queue
+import atexit
+import logging
+import threading
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+from config import LOG_VM_DIR, LOG_MAX_BYTES, LOG_BACKUP_COUNT, LOG_VM_MAX_BYTES, LOG_VM_BACKUP_COUNT
+from constants import LOG_QUEUE_SIZE
+
+_listener = None
+_queue_handler = None
+_listener_lock = threading.Lock()
+
+
+class BoundedQueueHandler(QueueHandler):
+    """QueueHandler không bao giờ block thread gọi log (queue có giới hạn + bỏ record)"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self._drop_lock = threading.Lock()
+
+    def prepare(self, record):
+        # Queue trong cùng process → không cần format sẵn (việc format để listener làm).
+        # Chỉ chốt message để args thay đổi sau đó không ảnh hưởng
+        if record.args:
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+    def enqueue(self, record):
+        if record.levelno >= logging.WARNING and self.queue.full():
+            # Nhường chỗ cho WARNING+: bỏ record cũ nhất
+            try:
+                self.queue.get_nowait()
+                self._count_dropped(1)
+            except queue.Empty:
+                pass
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self._count_dropped(1)
+            return
+
+        if self.dropped:
+            self._report_dropped()
+
+    def _count_dropped(self, count: int):
+        with self._drop_lock:
+            self.dropped += count
+
+    def _report_dropped(self):
+        """Báo số record đã bỏ bằng 1 dòng WARNING (khi queue đã có chỗ trở lại)"""
+        with self._drop_lock:
+            dropped, self.dropped = self.dropped, 0
+        if not dropped:
+            return
+        notice = logging.LogRecord(
+            __name__, logging.WARNING, __file__, 0,
+            f"⚠️ Log quá tải - đã bỏ {dropped} dòng log", None, None
+        )
+        try:
+            self.queue.put_nowait(notice)
+        except queue.Full:
+            self._count_dropped(dropped)
+
+
+class VMFileHandler(logging.Handler):
+    """Ghi record có thuộc tính `vm` ra logs/vm/<vm>.log (xoay vòng theo dung lượng)"""
+
+    def __init__(self, log_dir: str = LOG_VM_DIR, max_bytes: int = LOG_VM_MAX_BYTES,
+                 backup_count: int = LOG_VM_BACKUP_COUNT):
+        super().__init__()
+        self.log_dir = log_dir
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self._handlers = {}  # {vm_name: RotatingFileHandler}
+
+    def emit(self, record):
+        vm_name = getattr(record, "vm", None)
+        if not vm_name:
+            return
+        try:
+            handler = self._handlers.get(vm_name)
+            if handler is None:
+                os.makedirs(self.log_dir, exist_ok=True)
+                filename = re.sub(r'[\\/:*?"<>|\s]+', "_", str(vm_name)) + ".log"
+                handler = RotatingFileHandler(
+                    os.path.join(self.log_dir, filename),
+                    maxBytes=self.max_bytes, backupCount=self.backup_count, encoding="utf-8"
+                )
+                handler.setFormatter(self.formatter)
+                self._handlers[vm_name] = handler
+            handler.emit(record)
+        except Exception:
+            self.handleError(record)
+
+    def close(self):
+        for handler in self._handlers.values():
+            try:
+                handler.close()
+            except Exception:
+                pass
+        self._handlers.clear()
+        super().close()
+
+
+def setup_async_logging(level: int, fmt: str, log_file: str) -> QueueListener:
+    """
+    Gắn BoundedQueueHandler vào root logger, start QueueListener ghi file/console/per-VM.
+
+    Args:
+        level: Log level của root logger
+        fmt: Format string (LOG_FORMAT)
+        log_file: Đường dẫn app.log
+
+    Returns:
+        QueueListener: listener đang chạy
+    """
+    global _listener, _queue_handler
+    with _listener_lock:
+        if _listener is not None:
+            return _listener
+
+        formatter = logging.Formatter(fmt)
+        file_handler = RotatingFileHandler(
+            log_file, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding="utf-8"
+        )
+        console_handler = logging.StreamHandler()
+        vm_handler = VMFileHandler()
+        for handler in (file_handler, console_handler, vm_handler):
+            handler.setFormatter(formatter)
+
+        log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+        root = logging.getLogger()
+        root.setLevel(level)
+        for handler in root.handlers[:]:
+            root.removeHandler(handler)
+        _queue_handler = BoundedQueueHandler(log_queue)
+        root.addHandler(_queue_handler)
+
+        _listener = QueueListener(log_queue, file_handler, console_handler, vm_handler,
+                                  respect_handler_level=True)
+        _listener.start()
+        atexit.register(stop_async_logging)
+        return _listener
+
+
+def stop_async_logging():
+    """Dừng listener sau khi ghi hết record còn trong queue (gọi nhiều lần không sao)"""
+    global _listener, _queue_handler
+    with _listener_lock:
+        if _listener is None:
+            return
+        # Gỡ queue handler trước → log sau thời điểm này rơi về logging.lastResort (stderr)
+        logging.getLogger().removeHandler(_queue_handler)
+        _queue_handler = None
+        try:
+            _listener.stop()
+        finally:
+            for handler in _listener.handlers:
+                try:
+                    handler.close()
+                except Exception:
+                    pass
+            _listener = None
@@ -6,10 +6,21 @@ including logging, safe UI element interaction, and error handling.
 """
 import time
 import logging
-from typing import Optional, Callable
-import uiautomator2 as u2
+from collections import deque
+from typing import Optional, Callable, TYPE_CHECKING
 
-from constants import TIMEOUT_DEFAULT, WAIT_SHORT
+if TYPE_CHECKING:
+    # Chỉ dùng cho type hint - import uiautomator2 thật khi connect (login/post)
+    import uiautomator2 as u2
+
+from constants import (
+    TIMEOUT_DEFAULT, WAIT_SHORT, CANCEL_POLL_INTERVAL, FORENSICS_STEPS,
+    UI_RECORD_ENABLED, SELECTOR_INDEX_ENABLED
+)
+from utils.cancel_token import CancelToken, OperationCancelled
+from utils.ui_replay import UIRecorder
+from utils.ui_selector import IndexedDevice
+from utils.vm_lock import LeaseLostError, check_fence
 
 
 class BaseInstagramAutomation:
@@ -20,19 +31,90 @@ class BaseInstagramAutomation:
     - Logging (console + callback + file)
     - Safe UI element clicking
     - Safe text input
+    - Cancellable waits (cancel_token)
     - Error handling
     """
 
-    def __init__(self, log_callback: Optional[Callable[[str, str], None]] = None):
+    FLOW = "flow"  # tên flow trong UI recording (logs/ui_recordings/<FLOW>/)
+
+    def __init__(self, log_callback: Optional[Callable[[str, str], None]] = None,
+                 cancel_token: Optional[CancelToken] = None, mirror_logger: bool = True):
         """
         Initialize base Instagram automation.
 
         Args:
             log_callback: Optional callback function that receives (vm_name, message)
                          for custom logging (e.g., to UI)
+            cancel_token: Optional CancelToken - mọi sleep/chờ element raise
+                         OperationCancelled trong CANCEL_POLL_INTERVAL khi bị dừng
+            mirror_logger: False → log INFO chỉ đi vào log_callback (trace log của pipeline),
+                         root logger chỉ nhận WARNING trở lên
         """
         self.log_callback = log_callback
+        self.cancel_token = cancel_token
+        self.mirror_logger = mirror_logger
         self.logger = logging.getLogger(self.__class__.__name__)
+        self.steps = deque(maxlen=FORENSICS_STEPS)  # (ts, level, msg) gần nhất - đưa vào forensics bundle
+        self.index_selectors = SELECTOR_INDEX_ENABLED
+        self.selector_index = None  # IndexedDevice của lần chạy hiện tại (số liệu tra selector)
+        self.record_ui = UI_RECORD_ENABLED
+        self.recorder = None        # UIRecorder của lần chạy hiện tại (lưu bởi @recorded)
+        self.device_factory = None  # adb_address → device (ReplayDevice khi phát lại offline)
+
+    def connect(self, adb_address: str, vm_name: str = "", **record_args) -> "u2.Device":
+        """
+        Kết nối uiautomator2 tới device.
+
+        index_selectors → bọc device bằng IndexedDevice (.exists của XPath đơn giản tra dict trên
+        1 lần dump dùng chung); record_ui → bọc thêm UIRecorder (ghi hierarchy + thao tác,
+        lưu khi flow kết thúc).
+
+        Args:
+            adb_address: ADB address (e.g., emulator-5555)
+            vm_name: VM name (tên file recording)
+            **record_args: Tham số flow ghi kèm recording để phát lại đúng nhánh
+        """
+        if self.device_factory is not None:
+            d = self.device_factory(adb_address)
+        else:
+            import uiautomator2 as u2  # import lúc dùng - kéo theo adbutils/requests/PIL, chậm startup
+            d = u2.connect(adb_address)
+        if self.index_selectors:
+            d = self.selector_index = IndexedDevice(d, clock=time)
+        if self.record_ui:
+            self.recorder = UIRecorder(d, self.FLOW, vm_name, args=record_args)
+            d = self.recorder.device
+        return d
+
+    def sleep(self, seconds: float):
+        """time.sleep, dừng ngay (raise OperationCancelled) nếu cancel_token bị cancel"""
+        if self.cancel_token is None:
+            time.sleep(seconds)
+        else:
+            self.cancel_token.sleep(seconds)
+
+    def wait_xpath(self, d: "u2.Device", xpath: str, timeout: float) -> bool:
+        """
+        Chờ element xuất hiện (thay cho d.xpath(xpath).wait).
+
+        Có cancel_token → poll .exists, nghỉ CANCEL_POLL_INTERVAL giữa các lần
+        để kịp phản hồi yêu cầu dừng.
+
+        Raises:
+            OperationCancelled: cancel_token bị cancel khi đang chờ
+        """
+        if self.cancel_token is None:
+            return d.xpath(xpath).wait(timeout=timeout)
+
+        deadline = time.monotonic() + timeout
+        while True:
+            self.cancel_token.raise_if_cancelled()
+            if d.xpath(xpath).exists:
+                return True
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            self.cancel_token.sleep(min(CANCEL_POLL_INTERVAL, remaining))
 
     def log(self, vm_name: str, message: str, level: str = "INFO"):
         """
@@ -41,18 +123,19 @@ class BaseInstagramAutomation:
         Logs to:
         1. Python logging system (file + console)
         2. User callback (if provided)
+        3. self.steps (ring buffer cho forensics bundle khi thất bại)
 
         Args:
             vm_name: Name of the virtual machine
             message: Log message
             level: Log level (DEBUG, INFO, WARNING, ERROR, CRITICAL)
         """
-        # Format message with VM name
-        formatted_msg = f"[{vm_name}] {message}"
+        self.steps.append((time.time(), level, message))
 
-        # Log to standard logger
+        # Log to standard logger (bỏ qua INFO khi callback đã ghi vào trace log)
         log_level = getattr(logging, level.upper(), logging.INFO)
-        self.logger.log(log_level, formatted_msg)
+        if self.mirror_logger or log_level >= logging.WARNING:
+            self.logger.log(log_level, f"[{vm_name}] {message}", extra={"vm": vm_name})
 
         # Call user callback if provided (for UI updates)
         if self.log_callback:
@@ -63,7 +146,7 @@ class BaseInstagramAutomation:
 
     def safe_click(
         self,
-        d: u2.Device,
+        d: "u2.Device",
         xpath: str,
         timeout: int = TIMEOUT_DEFAULT,
         vm_name: str = "",
@@ -92,13 +175,14 @@ class BaseInstagramAutomation:
         try:
             el = d.xpath(xpath)
 
-            if el.wait(timeout=timeout):
+            if self.wait_xpath(d, xpath, timeout):
+                check_fence()  # Lease VM đã mất → không click thay process khác
                 el.click()
                 self.log(vm_name, f"✅ Click {desc} thành công")
 
                 if sleep_after:
                     self.log(vm_name, f"⏱️ Chờ {sleep_after}s sau khi click...")
-                    time.sleep(sleep_after)
+                    self.sleep(sleep_after)
 
                 return True
             else:
@@ -115,6 +199,8 @@ class BaseInstagramAutomation:
                 )
                 return False
 
+        except (OperationCancelled, LeaseLostError):
+            raise
         except Exception as e:
             self.log(vm_name, f"⚠️ Lỗi khi click {desc}: {e}", "ERROR")
             self.logger.exception(f"Exception in safe_click for {xpath}")
@@ -122,7 +208,7 @@ class BaseInstagramAutomation:
 
     def safe_send_text(
         self,
-        d: u2.Device,
+        d: "u2.Device",
         xpath: str,
         text: str,
         timeout: int = TIMEOUT_DEFAULT,
@@ -149,10 +235,11 @@ class BaseInstagramAutomation:
         self.log(vm_name, f"⌨️ Đang nhập vào {desc}...")
 
         try:
-            if d.xpath(xpath).wait(timeout=timeout):
+            if self.wait_xpath(d, xpath, timeout):
+                check_fence()
                 d.xpath(xpath).set_text(text)
                 self.log(vm_name, f"✅ Đã nhập text vào {desc}")
-                time.sleep(sleep_after)
+                self.sleep(sleep_after)
                 return True
             else:
                 self.log(
@@ -162,6 +249,8 @@ class BaseInstagramAutomation:
                 )
                 return False
 
+        except (OperationCancelled, LeaseLostError):
+            raise
         except Exception as e:
             self.log(vm_name, f"⚠️ Lỗi khi nhập vào {desc}: {e}", "ERROR")
             self.logger.exception(f"Exception in safe_send_text for {xpath}")
@@ -169,7 +258,7 @@ class BaseInstagramAutomation:
 
     def wait_for_element(
         self,
-        d: u2.Device,
+        d: "u2.Device",
         xpath: str,
         timeout: int = TIMEOUT_DEFAULT,
         vm_name: str = "",
@@ -192,18 +281,20 @@ class BaseInstagramAutomation:
         self.log(vm_name, f"⏳ Chờ {desc}...")
 
         try:
-            if d.xpath(xpath).wait(timeout=timeout):
+            if self.wait_xpath(d, xpath, timeout):
                 self.log(vm_name, f"✅ {desc} đã xuất hiện")
                 return True
             else:
                 self.log(vm_name, f"❌ {desc} không xuất hiện trong {timeout}s", "WARNING")
                 return False
+        except OperationCancelled:
+            raise
         except Exception as e:
             self.log(vm_name, f"⚠️ Lỗi khi chờ {desc}: {e}", "ERROR")
             self.logger.exception(f"Exception in wait_for_element for {xpath}")
             return False
 
-    def element_exists(self, d: u2.Device, xpath: str) -> bool:
+    def element_exists(self, d: "u2.Device", xpath: str) -> bool:
         """
         Check if element exists without waiting.
 
@@ -0,0 +1,275 @@
+"""
+Boot Admission Controller - Giới hạn số máy ảo LDPlayer khởi động cùng lúc.
+
+Trước đây process_post/Stream.worker launch VM ngay khi khóa được VM → nhiều post
+đến giờ cùng lúc làm 20 emulator boot đồng thời, boot chậm vượt timeout 120s.
+
+Controller là 1 counting semaphore có thể đổi kích thước:
+- Trần phần cứng tính từ diagnostics.get_system_info (RAM còn trống, số core, CPU load)
+- Giãn cách (stagger) giữa 2 lần bắt đầu boot
+- Tự điều chỉnh theo thời gian boot đo được: boot chậm → giảm, boot nhanh → tăng.
+  Điều chỉnh lưu thành độ lệch (offset <= 0) so với trần phần cứng, giới hạn = trần + offset
+  tính lại mỗi lần đo → máy rảnh lại thì giới hạn leo về trần (không kẹt ở mức thấp)
+"""
+import os
+import threading
+import logging
+import time
+from collections import deque
+
+from constants import (
+    BOOT_MAX_CONCURRENCY, BOOT_STAGGER_SECONDS, BOOT_TARGET_SECONDS,
+    BOOT_RAM_PER_VM_GB, BOOT_RAM_RESERVE_GB
+)
+
+# Chu kỳ đọc lại tài nguyên hệ thống (giây) - get_system_info mất ~1s vì đo CPU
+CAPACITY_REFRESH_INTERVAL = 30
+
+# Khoảng poll khi chờ slot (giây) - để kịp phản hồi yêu cầu dừng
+WAIT_POLL_INTERVAL = 0.5
+
+# Số mẫu boot gần nhất dùng để điều chỉnh concurrency
+TUNING_WINDOW = 5
+
+# Sau bao lâu không có boot chậm/lỗi thì offset hồi lại 1 bước về 0 (giây)
+OFFSET_RECOVERY_INTERVAL = 300
+
+
+def compute_hardware_limit(info: dict) -> int:
+    """
+    Tính số VM tối đa được boot đồng thời từ thông tin hệ thống.
+
+    Args:
+        info: Dict từ diagnostics.get_system_info()
+
+    Returns:
+        int: Số slot boot (>= 1, <= BOOT_MAX_CONCURRENCY)
+    """
+    cpu_count = info.get("cpu_count") or os.cpu_count() or 2
+    limits = [BOOT_MAX_CONCURRENCY, max(1, cpu_count // 2)]
+
+    ram_available = info.get("ram_available_gb")
+    if ram_available is not None:
+        limits.append(int((ram_available - BOOT_RAM_RESERVE_GB) // BOOT_RAM_PER_VM_GB))
+
+    limit = max(1, min(limits))
+
+    # Live load: CPU đang quá tải → giảm một nửa
+    cpu_percent = info.get("cpu_percent")
+    if cpu_percent is not None and cpu_percent >= 85:
+        limit = max(1, limit // 2)
+
+    return limit
+
+
+class BootAdmissionController:
+    """
+    Singleton semaphore cho việc boot máy ảo.
+
+    Sử dụng:
+        if boot_admission.acquire(vm_name, log_callback=log, stop_check=lambda: stopped):
+            boot_start = time.monotonic()
+            ... launch/reboot + wait_vm_ready + wait_adb_ready ...
+            boot_admission.release(vm_name, boot_seconds=time.monotonic() - boot_start)
+    """
+
+    _instance = None
+    _creation_lock = threading.Lock()
+
+    def __new__(cls):
+        if cls._instance is None:
+            with cls._creation_lock:
+                if cls._instance is None:
+                    cls._instance = super().__new__(cls)
+        return cls._instance
+
+    def __init__(self):
+        if not hasattr(self, '_initialized'):
+            self._cond = threading.Condition()
+            self._active = {}            # {vm_name: boot start (monotonic)}
+            self._waiting = 0
+            self._hw_limit = None        # Trần theo phần cứng
+            self._limit = None           # Giới hạn hiện tại = clamp(_hw_limit + _offset)
+            self._offset = 0             # Điều chỉnh theo thời gian boot (<= 0)
+            self._last_penalty = 0.0     # Lần cuối giảm offset (monotonic)
+            self._last_capacity_check = 0.0
+            self._refreshing = False
+            self._last_boot_start = 0.0
+            self._durations = deque(maxlen=TUNING_WINDOW)
+            self.logger = logging.getLogger(__name__)
+            self._initialized = True
+
+    # ==================== CAPACITY ====================
+    def _refresh_capacity(self, force: bool = False):
+        """Đọc lại tài nguyên hệ thống (không giữ lock trong lúc đo CPU)"""
+        with self._cond:
+            now = time.monotonic()
+            if self._refreshing:
+                return
+            if not force and self._hw_limit is not None and now - self._last_capacity_check < CAPACITY_REFRESH_INTERVAL:
+                return
+            self._refreshing = True
+
+        try:
+            try:
+                from utils.diagnostics import get_system_info
+                info = get_system_info()
+            except Exception as e:
+                self.logger.warning(f"Không đọc được system info, dùng số core: {e}")
+                info = {}
+            hw_limit = compute_hardware_limit(info)
+        finally:
+            with self._cond:
+                self._refreshing = False
+
+        with self._cond:
+            self._last_capacity_check = time.monotonic()
+            if hw_limit != self._hw_limit:
+                self.logger.info(f"🚦 Boot capacity: {hw_limit} VM đồng thời "
+                                 f"(RAM trống {info.get('ram_available_gb', '?')}GB, "
+                                 f"{info.get('cpu_count', '?')} cores, CPU {info.get('cpu_percent', '?')}%)")
+            self._hw_limit = hw_limit
+            # Lâu rồi không có boot chậm/lỗi → nới dần offset về 0
+            if self._offset < 0 and self._last_capacity_check - self._last_penalty >= OFFSET_RECOVERY_INTERVAL:
+                self._offset += 1
+                self._last_penalty = self._last_capacity_check
+            self._apply_limit()
+            self._cond.notify_all()
+
+    def _apply_limit(self):
+        """Tính lại giới hạn từ trần phần cứng + offset (gọi khi đang giữ _cond)"""
+        self._limit = max(1, min(self._hw_limit + self._offset, self._hw_limit))
+
+    def refresh_capacity(self, force: bool = False):
+        """Đọc lại trần phần cứng nếu đã quá CAPACITY_REFRESH_INTERVAL (blocking ~1s)"""
+        self._refresh_capacity(force=force)
+
+    # ==================== ACQUIRE / RELEASE ====================
+    def try_acquire(self, vm_name: str) -> bool:
+        """
+        Lấy lượt boot nếu còn slot và đã qua stagger, KHÔNG chờ.
+
+        Dùng cho vòng poll async (post_pipeline). Không tự đo lại tài nguyên
+        (get_system_info blocking) - gọi refresh_capacity() ở executor trước.
+
+        Returns:
+            bool: True nếu được phép boot
+        """
+        with self._cond:
+            now = time.monotonic()
+            if (len(self._active) < (self._limit or 1)
+                    and now - self._last_boot_start >= BOOT_STAGGER_SECONDS):
+                self._active[vm_name] = now
+                self._last_boot_start = now
+                return True
+            return False
+
+    def acquire(self, vm_name: str, log_callback=None, stop_check=None, timeout: float = None) -> bool:
+        """
+        Chờ đến lượt boot máy ảo.
+
+        Args:
+            vm_name: Tên máy ảo
+            log_callback: Optional log function
+            stop_check: Optional callable → True nếu cần dừng chờ
+            timeout: Thời gian chờ tối đa (giây), None = chờ đến khi có slot
+
+        Returns:
+            bool: True nếu được phép boot, False nếu bị dừng/timeout
+        """
+        self._refresh_capacity()
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        logged_wait = False
+
+        with self._cond:
+            self._waiting += 1
+            try:
+                while True:
+                    if stop_check and stop_check():
+                        return False
+
+                    now = time.monotonic()
+                    stagger_left = BOOT_STAGGER_SECONDS - (now - self._last_boot_start)
+                    if len(self._active) < (self._limit or 1) and stagger_left <= 0:
+                        self._active[vm_name] = now
+                        self._last_boot_start = now
+                        if logged_wait and log_callback:
+                            log_callback(f"🚦 Đến lượt boot máy ảo '{vm_name}'")
+                        return True
+
+                    if deadline is not None and now >= deadline:
+                        if log_callback:
+                            log_callback(f"⏱️ Hết thời gian chờ lượt boot cho '{vm_name}'")
+                        return False
+
+                    if not logged_wait and len(self._active) >= (self._limit or 1):
+                        logged_wait = True
+                        if log_callback:
+                            log_callback(f"🚦 Đang có {len(self._active)}/{self._limit} máy ảo khởi động - Chờ lượt...")
+
+                    wait_for = WAIT_POLL_INTERVAL
+                    if stagger_left > 0:
+                        wait_for = min(wait_for, stagger_left)
+                    self._cond.wait(wait_for)
+
+                    # Đọc lại capacity định kỳ khi chờ lâu (ngoài lock)
+                    if time.monotonic() - self._last_capacity_check >= CAPACITY_REFRESH_INTERVAL:
+                        self._cond.release()
+                        try:
+                            self._refresh_capacity()
+                        finally:
+                            self._cond.acquire()
+            finally:
+                self._waiting -= 1
+
+    def release(self, vm_name: str, boot_seconds: float = None, success: bool = True):
+        """
+        Trả slot boot và cập nhật concurrency theo thời gian boot.
+
+        Args:
+            vm_name: Tên máy ảo
+            boot_seconds: Thời gian boot đo được (launch → ADB ready)
+            success: False nếu boot thất bại/timeout → giảm concurrency mạnh
+        """
+        with self._cond:
+            if self._active.pop(vm_name, None) is None:
+                return
+
+            if self._limit is not None and self._hw_limit is not None:
+                old_limit = self._limit
+                if not success:
+                    self._offset = max(1, self._limit // 2) - self._hw_limit
+                    self._last_penalty = time.monotonic()
+                elif boot_seconds is not None:
+                    self._durations.append(boot_seconds)
+                    avg = sum(self._durations) / len(self._durations)
+                    if avg > BOOT_TARGET_SECONDS * 1.2 and self._limit > 1:
+                        self._offset = self._limit - 1 - self._hw_limit
+                        self._last_penalty = time.monotonic()
+                        self._durations.clear()
+                    elif avg < BOOT_TARGET_SECONDS * 0.6 and self._offset < 0:
+                        self._offset += 1
+                        self._durations.clear()
+                self._apply_limit()
+
+                if self._limit != old_limit:
+                    reason = "boot lỗi" if not success else f"boot {boot_seconds:.0f}s"
+                    self.logger.info(f"🚦 Boot concurrency {old_limit} → {self._limit} ({reason})")
+
+            self._cond.notify_all()
+
+    def get_status(self) -> dict:
+        """Trạng thái hiện tại (để log/hiển thị)"""
+        with self._cond:
+            return {
+                "limit": self._limit,
+                "hardware_limit": self._hw_limit,
+                "offset": self._offset,
+                "booting": list(self._active),
+                "waiting": self._waiting,
+                "recent_boot_s": [round(d, 1) for d in self._durations],
+            }
+
+
+# Global singleton instance
+boot_admission = BootAdmissionController()
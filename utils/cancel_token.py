@@ -0,0 +1,125 @@
+"""
+Cancel Token - Tín hiệu dừng dùng chung cho mọi thao tác chờ.
+
+Trước đây mỗi module tự time.sleep(2..15s) hoặc subprocess.run(timeout=10..120s)
+rồi mới kiểm tra cờ dừng → bấm Dừng phải chờ hết lượt sleep/lệnh hiện tại.
+CancelToken bọc 1 threading.Event:
+- wait()/sleep() trả về NGAY khi bị cancel (Event.wait)
+- run() thay cho subprocess.run: poll process mỗi CANCEL_POLL_INTERVAL, kill khi bị cancel
+- Hàm nhận cancel_token=None → giữ nguyên hành vi cũ khi không truyền token
+
+Sử dụng:
+    token = CancelToken()                      # hoặc CancelToken(stop_event)
+    vm_manager.wait_vm_ready(vm, ldconsole, cancel_token=token)
+    token.cancel()                             # từ thread khác
+"""
+import time
+import threading
+import subprocess
+
+from constants import CANCEL_POLL_INTERVAL
+from utils.vm_lock import check_fence
+
+
+class OperationCancelled(Exception):
+    """Thao tác bị dừng qua CancelToken"""
+
+
+class CancelToken:
+    """
+    Token dừng thread-safe.
+
+    Args:
+        event: threading.Event có sẵn để dùng chung (vd: Stream.stop_event)
+    """
+
+    def __init__(self, event: threading.Event = None):
+        self.event = event if event is not None else threading.Event()
+        self.reason = None
+
+    def cancel(self, reason: str = None):
+        if reason and self.reason is None:
+            self.reason = reason
+        self.event.set()
+
+    def is_cancelled(self) -> bool:
+        return self.event.is_set()
+
+    def raise_if_cancelled(self):
+        if self.event.is_set():
+            raise OperationCancelled(self.reason or "cancelled")
+
+    def wait(self, seconds: float) -> bool:
+        """Chờ tối đa seconds giây. Returns: True nếu bị cancel"""
+        return self.event.wait(seconds)
+
+    def sleep(self, seconds: float):
+        """Như time.sleep nhưng raise OperationCancelled ngay khi bị cancel"""
+        if self.event.wait(seconds):
+            raise OperationCancelled(self.reason or "cancelled")
+
+    def run(self, args, timeout: float = None, **kwargs) -> subprocess.CompletedProcess:
+        """
+        Thay cho subprocess.run: kill process ngay khi bị cancel.
+
+        Hỗ trợ capture_output/check/text/encoding/errors/stdout/stderr/creationflags
+        như subprocess.run (không hỗ trợ input).
+
+        Raises:
+            OperationCancelled: Bị cancel khi lệnh đang chạy
+            subprocess.TimeoutExpired: Hết timeout
+            subprocess.CalledProcessError: check=True và returncode != 0
+        """
+        self.raise_if_cancelled()
+        check = kwargs.pop("check", False)
+        if kwargs.pop("capture_output", False):
+            kwargs["stdout"] = subprocess.PIPE
+            kwargs["stderr"] = subprocess.PIPE
+
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        with subprocess.Popen(args, **kwargs) as process:
+            while True:
+                try:
+                    stdout, stderr = process.communicate(timeout=CANCEL_POLL_INTERVAL)
+                    if check and process.returncode:
+                        raise subprocess.CalledProcessError(process.returncode, args, stdout, stderr)
+                    return subprocess.CompletedProcess(args, process.returncode, stdout, stderr)
+                except subprocess.TimeoutExpired:
+                    pass
+                if self.event.is_set():
+                    _kill(process)
+                    raise OperationCancelled(self.reason or "cancelled")
+                if deadline is not None and time.monotonic() >= deadline:
+                    _kill(process)
+                    raise subprocess.TimeoutExpired(args, timeout)
+
+
+def _kill(process):
+    # Chỉ chờ process thoát, KHÔNG communicate(): process con còn giữ pipe sẽ làm treo
+    try:
+        process.kill()
+        process.wait(timeout=1)
+    except Exception:
+        pass
+
+
+# ==================== HELPERS (token tùy chọn) ====================
+def sleep(seconds: float, token: CancelToken = None):
+    """time.sleep, hoặc token.sleep nếu có token (raise OperationCancelled)"""
+    if token is not None:
+        token.sleep(seconds)
+    else:
+        time.sleep(seconds)
+
+
+def run(args, token: CancelToken = None, **kwargs) -> subprocess.CompletedProcess:
+    """
+    subprocess.run, hoặc token.run nếu có token (raise OperationCancelled).
+
+    Lệnh adb/ldconsole của job đang giữ lease VM (vm_lock.fenced) → kiểm tra fencing token
+    trước khi chạy (raise LeaseLostError nếu lease đã mất).
+    """
+    check_fence()
+    if token is not None:
+        return token.run(args, **kwargs)
+    return subprocess.run(args, **kwargs)
@@ -0,0 +1,80 @@
+"""
+Daemon Client - Gọi API JSON-RPC của headless daemon (core/daemon.py) từ GUI hoặc script.
+
+Sử dụng:
+    from utils.daemon_client import DaemonClient, DaemonError
+    client = DaemonClient()
+    if client.is_alive():
+        posts = client.call("list_posts", status="pending")
+        client.call("add_post", video_path="C:/videos/a.mp4", vm_name="VM1",
+                    scheduled_time="01/12/2025 20:00", start=True)
+        for event in client.iter_events(trace=posts[0]["id"]):   # SSE, block
+            print(event["msg"])
+"""
+import json
+import itertools
+import urllib.parse
+import urllib.request
+import urllib.error
+
+from constants import DAEMON_HOST, DAEMON_PORT, DAEMON_CLIENT_TIMEOUT, DAEMON_PING_TIMEOUT
+
+
+class DaemonError(RuntimeError):
+    """Daemon trả lỗi JSON-RPC hoặc không kết nối được"""
+
+    def __init__(self, message: str, code: int = None):
+        super().__init__(message)
+        self.code = code
+
+
+class DaemonClient:
+    """Client JSON-RPC 2.0 qua HTTP (urllib, không cần thư viện ngoài)"""
+
+    def __init__(self, host: str = DAEMON_HOST, port: int = DAEMON_PORT, timeout: float = DAEMON_CLIENT_TIMEOUT):
+        self.base_url = f"http://{host}:{port}"
+        self.timeout = timeout
+        self._ids = itertools.count(1)
+
+    @classmethod
+    def from_url(cls, url: str, timeout: float = DAEMON_CLIENT_TIMEOUT) -> "DaemonClient":
+        """DaemonClient.from_url("http://10.0.0.5:8765") - dùng cho host agent"""
+        parsed = urllib.parse.urlsplit(url if "://" in url else f"http://{url}")
+        return cls(parsed.hostname or DAEMON_HOST, parsed.port or DAEMON_PORT, timeout)
+
+    def call(self, method: str, timeout: float = None, **params):
+        """Gọi 1 method, trả về "result" - lỗi thì raise DaemonError"""
+        payload = json.dumps({
+            "jsonrpc": "2.0", "id": next(self._ids), "method": method, "params": params
+        }).encode("utf-8")
+        request = urllib.request.Request(
+            self.base_url + "/rpc", data=payload, headers={"Content-Type": "application/json"}
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=timeout or self.timeout) as resp:
+                response = json.loads(resp.read().decode("utf-8"))
+        except (urllib.error.URLError, OSError, ValueError) as e:
+            raise DaemonError(f"Không kết nối được daemon {self.base_url}: {e}")
+        if "error" in response:
+            error = response["error"]
+            raise DaemonError(error.get("message", "Lỗi daemon"), error.get("code"))
+        return response.get("result")
+
+    def is_alive(self, timeout: float = DAEMON_PING_TIMEOUT) -> bool:
+        try:
+            self.call("ping", timeout=timeout)
+            return True
+        except DaemonError:
+            return False
+
+    def iter_events(self, trace: str = None):
+        """Đọc GET /events (Server-Sent Events) - yield dict event, block tới khi daemon ngắt"""
+        url = self.base_url + "/events" + (f"?trace={urllib.request.quote(trace)}" if trace else "")
+        try:
+            with urllib.request.urlopen(url, timeout=None) as resp:
+                for raw in resp:
+                    line = raw.decode("utf-8").rstrip("\n")
+                    if line.startswith("data: "):
+                        yield json.loads(line[6:])
+        except (urllib.error.URLError, OSError) as e:
+            raise DaemonError(f"Mất kết nối /events: {e}")
@@ -1,6 +1,7 @@
 import subprocess
 import sys
 from config import ADB_EXE
+from utils.vm_lock import check_fence
 
 def clear_dcim(device, adb_path=None, log_callback=None):
     """
@@ -18,6 +19,7 @@ def clear_dcim(device, adb_path=None, log_callback=None):
         adb_path = ADB_EXE
 
     try:
+        check_fence()
         # Chạy lệnh xóa
         result = subprocess.run(
             [adb_path, "-s", device, "shell", "rm", "-rf", "/sdcard/DCIM/*"],
@@ -54,6 +56,7 @@ def clear_pictures(device, adb_path=None, log_callback=None):
         adb_path = ADB_EXE
 
     try:
+        check_fence()
         # Chạy lệnh xóa
         result = subprocess.run(
             [adb_path, "-s", device, "shell", "rm", "-rf", "/sdcard/Pictures/*"],
@@ -235,28 +235,31 @@ def check_vm_running(vm_name: str, ldconsole_exe: str) -> bool:
         return False
 
 
-def get_vm_port(vm_name: str, data_dir: str) -> Optional[str]:
+def get_vm_port(vm_name: str, data_dir: str = None) -> Optional[str]:
     """
-    Get VM's ADB port from JSON file.
+    Get VM's ADB port from the VM registry (cached data/vm/{vm_id}.json).
 
     Args:
         vm_name: VM name
-        data_dir: Path to data directory
+        data_dir: Legacy data directory with {vm_name}.json files (fallback only)
 
     Returns:
         Port string or None
     """
     try:
-        import json
-        json_path = os.path.join(data_dir, f"{vm_name}.json")
-
-        if not os.path.exists(json_path):
-            return None
+        from utils.vm_registry import vm_registry
+        port = vm_registry.get_port(vm_name)
+        if port:
+            return port
+
+        # Fallback: legacy layout {vm_name}.json
+        if data_dir:
+            json_path = os.path.join(data_dir, f"{vm_name}.json")
+            if os.path.exists(json_path):
+                from utils.persistence import load_json
+                return (load_json(json_path) or {}).get("port")
 
-        with open(json_path, "r", encoding="utf-8") as f:
-            data = json.load(f)
-
-        return data.get("port")
+        return None
     except Exception as e:
         logger.error(f"Error getting VM port: {e}")
         return None
@@ -2,7 +2,32 @@ import os
 import re
 import uuid
 import subprocess
-from yt_dlp import YoutubeDL
+
+from utils.cancel_token import OperationCancelled, run as cancellable_run
+
+
+def _cancel_hook(cancel_token):
+    """
+    yt-dlp progress hook: raise OperationCancelled khi token bị cancel.
+
+    Hook được gọi sau mỗi chunk tải về → dừng trong vòng 1 chunk thay vì chờ tải hết file.
+    """
+    def hook(_status):
+        cancel_token.raise_if_cancelled()
+    return hook
+
+
+def _remove_partial_files(output_dir, temp_id):
+    """Xóa file tải dở (.part/.ytdl/fragment/converted) có chứa temp_id"""
+    try:
+        for name in os.listdir(output_dir):
+            if temp_id in name:
+                try:
+                    os.remove(os.path.join(output_dir, name))
+                except Exception:
+                    pass
+    except Exception:
+        pass
 
 
 class YouTubeDownloader:
@@ -13,10 +38,11 @@ class YouTubeDownloader:
     - Tự động merge audio + video và chuyển mã sang H.264 nếu cần
     """
 
-    def __init__(self, output_dir="temp", log_callback=None):
+    def __init__(self, output_dir="temp", log_callback=None, cancel_token=None):
         self.output_dir = output_dir
         os.makedirs(self.output_dir, exist_ok=True)
         self.log_callback = log_callback or (lambda msg: print(msg))
+        self.cancel_token = cancel_token
 
     def log(self, msg):
         try:
@@ -25,8 +51,8 @@ class YouTubeDownloader:
             print(msg)
 
     def download_video(self, url):
+        temp_id = uuid.uuid4().hex[:8]
         try:
-            temp_id = uuid.uuid4().hex[:8]
             output_template = os.path.join(self.output_dir, f"{temp_id}.%(ext)s")
             self.log(f"📥 Đang tải video từ: {url}")
 
@@ -52,12 +78,17 @@ class YouTubeDownloader:
                 },
                 "extractor_args": {"youtube": {"player_client": ["android", "web"]}},
             }
+            if self.cancel_token is not None:
+                ydl_opts["progress_hooks"] = [_cancel_hook(self.cancel_token)]
 
             # ====== Bắt đầu tải ======
+            from yt_dlp import YoutubeDL  # import lúc tải - yt_dlp nạp hàng trăm extractor, chậm startup
             with YoutubeDL(ydl_opts) as ydl:
                 info = ydl.extract_info(url, download=True)
                 video_path = info["requested_downloads"][0]["filepath"]
                 title = info.get("title", "unknown")
+            if self.cancel_token is not None:
+                self.cancel_token.raise_if_cancelled()
 
             video_path = os.path.abspath(video_path)
             if not os.path.exists(video_path):
@@ -71,7 +102,7 @@ class YouTubeDownloader:
 
             # ====== Kiểm tra codec ======
             try:
-                probe = subprocess.run(
+                probe = cancellable_run(
                     [
                         "ffprobe", "-v", "error",
                         "-select_streams", "v:0",
@@ -79,6 +110,7 @@ class YouTubeDownloader:
                         "-of", "default=noprint_wrappers=1:nokey=1",
                         video_path
                     ],
+                    token=self.cancel_token,
                     capture_output=True, text=True, encoding="utf-8", errors="ignore",
                     creationflags=subprocess.CREATE_NO_WINDOW
                 )
@@ -90,7 +122,7 @@ class YouTubeDownloader:
                     converted_path = os.path.join(self.output_dir, f"converted_{temp_id}.mp4")
                     self.log(f"⚙️ Đang chuyển mã {codec or 'unknown'} → H.264 ...")
 
-                    subprocess.run(
+                    cancellable_run(
                         [
                             "ffmpeg", "-y", "-i", video_path,
                             "-c:v", "libx264", "-preset", "fast",
@@ -98,6 +130,7 @@ class YouTubeDownloader:
                             "-movflags", "+faststart",
                             converted_path,
                         ],
+                        token=self.cancel_token,
                         check=True,
                         stdout=subprocess.DEVNULL,
                         stderr=subprocess.DEVNULL,
@@ -112,6 +145,8 @@ class YouTubeDownloader:
                     video_path = converted_path
                     self.log("✅ Đã chuyển mã sang H.264 thành công.")
 
+            except OperationCancelled:
+                raise
             except FileNotFoundError:
                 self.log("⚠️ Không tìm thấy ffprobe/ffmpeg - Bỏ qua kiểm tra codec")
                 self.log("💡 Video vẫn có thể đăng được, nhưng nên cài ffmpeg để đảm bảo tương thích")
@@ -122,6 +157,10 @@ class YouTubeDownloader:
             return video_path
 
         except Exception as e:
+            if self.cancel_token is not None and self.cancel_token.is_cancelled():
+                self.log("🛑 Đã dừng tải video")
+                _remove_partial_files(self.output_dir, temp_id)
+                return None
             self.log(f"❌ Lỗi tải video: {e}")
             return None
 
@@ -129,9 +168,11 @@ class YouTubeDownloader:
 # ==========================================================
 # 🟣 HÀM TẢI VIDEO TIKTOK RIÊNG BIỆT
 # ==========================================================
-def download_tiktok_video(url, output_dir="temp", log_callback=None):
+def download_tiktok_video(url, output_dir="temp", log_callback=None, cancel_token=None):
     """
     Tải video TikTok (có cả hình + tiếng, merge như YouTube).
+
+    cancel_token: Optional CancelToken - dừng tải/chuyển mã và xóa file dở khi bị cancel
     """
     log = log_callback or (lambda msg: print(msg))
     os.makedirs(output_dir, exist_ok=True)
@@ -160,12 +201,17 @@ def download_tiktok_video(url, output_dir="temp", log_callback=None):
         },
         "extractor_args": {"youtube": {"player_client": ["android", "web"]}},
     }
+    if cancel_token is not None:
+        ydl_opts["progress_hooks"] = [_cancel_hook(cancel_token)]
 
     try:
         log(f"📥 [TikTok] Đang tải video từ: {url}")
+        from yt_dlp import YoutubeDL
         with YoutubeDL(ydl_opts) as ydl:
             info = ydl.extract_info(url, download=True)
             video_path = info["requested_downloads"][0]["filepath"]
+        if cancel_token is not None:
+            cancel_token.raise_if_cancelled()
 
         video_path = os.path.abspath(video_path)
         if not os.path.exists(video_path):
@@ -173,7 +219,7 @@ def download_tiktok_video(url, output_dir="temp", log_callback=None):
 
         # ====== Kiểm tra codec ======
         try:
-            probe = subprocess.run(
+            probe = cancellable_run(
                 [
                     "ffprobe", "-v", "error",
                     "-select_streams", "v:0",
@@ -181,6 +227,7 @@ def download_tiktok_video(url, output_dir="temp", log_callback=None):
                     "-of", "default=noprint_wrappers=1:nokey=1",
                     video_path
                 ],
+                token=cancel_token,
                 capture_output=True, text=True, encoding="utf-8", errors="ignore",
                 creationflags=subprocess.CREATE_NO_WINDOW
             )
@@ -192,7 +239,7 @@ def download_tiktok_video(url, output_dir="temp", log_callback=None):
                 converted = os.path.join(output_dir, f"converted_tiktok_{temp_id}.mp4")
                 log(f"⚙️ [TikTok] Đang chuyển mã {codec or 'unknown'} → H.264 ...")
 
-                subprocess.run(
+                cancellable_run(
                     [
                         "ffmpeg", "-y", "-i", video_path,
                         "-c:v", "libx264", "-preset", "fast",
@@ -200,6 +247,7 @@ def download_tiktok_video(url, output_dir="temp", log_callback=None):
                         "-movflags", "+faststart",
                         converted,
                     ],
+                    token=cancel_token,
                     check=True,
                     stdout=subprocess.DEVNULL,
                     stderr=subprocess.DEVNULL,
@@ -209,6 +257,8 @@ def download_tiktok_video(url, output_dir="temp", log_callback=None):
                 video_path = converted
                 log("✅ [TikTok] Đã chuyển mã sang H.264 thành công.")
 
+        except OperationCancelled:
+            raise
         except FileNotFoundError:
             log("⚠️ [TikTok] Không tìm thấy ffprobe/ffmpeg - Bỏ qua kiểm tra codec")
         except Exception as e:
@@ -218,14 +268,20 @@ def download_tiktok_video(url, output_dir="temp", log_callback=None):
         return video_path
 
     except Exception as e:
+        if cancel_token is not None and cancel_token.is_cancelled():
+            log("🛑 [TikTok] Đã dừng tải video")
+            _remove_partial_files(output_dir, temp_id)
+            return None
         log(f"❌ [TikTok] Lỗi tải video: {e}")
         return None
 
 
-def download_tiktok_direct_url(url, output_dir="temp", log_callback=None):
+def download_tiktok_direct_url(url, output_dir="temp", log_callback=None, cancel_token=None):
     """
     Download TikTok video từ direct URL (url_list[1] từ DumplingAI API)
     Sử dụng curl thay vì yt-dlp
+
+    cancel_token: Optional CancelToken - kill curl/ffmpeg và xóa file dở khi bị cancel
     """
     log = log_callback or (lambda msg: print(msg))
 
@@ -245,8 +301,9 @@ def download_tiktok_direct_url(url, output_dir="temp", log_callback=None):
             "-o", output_path
         ]
 
-        result = subprocess.run(
+        result = cancellable_run(
             cmd,
+            token=cancel_token,
             capture_output=True,
             text=True,
             encoding='utf-8',
@@ -265,7 +322,7 @@ def download_tiktok_direct_url(url, output_dir="temp", log_callback=None):
 
         # ====== Kiểm tra codec ======
         try:
-            probe = subprocess.run(
+            probe = cancellable_run(
                 [
                     "ffprobe", "-v", "error",
                     "-select_streams", "v:0",
@@ -273,6 +330,7 @@ def download_tiktok_direct_url(url, output_dir="temp", log_callback=None):
                     "-of", "default=noprint_wrappers=1:nokey=1",
                     output_path
                 ],
+                token=cancel_token,
                 capture_output=True, text=True, encoding="utf-8", errors="ignore",
                 creationflags=subprocess.CREATE_NO_WINDOW
             )
@@ -284,7 +342,7 @@ def download_tiktok_direct_url(url, output_dir="temp", log_callback=None):
                 converted = os.path.join(output_dir, f"converted_tiktok_{temp_id}.mp4")
                 log(f"⚙️ [TikTok Direct] Đang chuyển mã {codec or 'unknown'} → H.264 ...")
 
-                subprocess.run(
+                cancellable_run(
                     [
                         "ffmpeg", "-y", "-i", output_path,
                         "-c:v", "libx264", "-preset", "fast",
@@ -292,6 +350,7 @@ def download_tiktok_direct_url(url, output_dir="temp", log_callback=None):
                         "-movflags", "+faststart",
                         converted,
                     ],
+                    token=cancel_token,
                     check=True,
                     stdout=subprocess.DEVNULL,
                     stderr=subprocess.DEVNULL,
@@ -301,6 +360,8 @@ def download_tiktok_direct_url(url, output_dir="temp", log_callback=None):
                 output_path = converted
                 log("✅ [TikTok Direct] Đã chuyển mã sang H.264 thành công.")
 
+        except OperationCancelled:
+            raise
         except FileNotFoundError:
             log("⚠️ [TikTok Direct] Không tìm thấy ffprobe/ffmpeg - Bỏ qua kiểm tra codec")
         except Exception as e:
@@ -309,6 +370,10 @@ def download_tiktok_direct_url(url, output_dir="temp", log_callback=None):
         log(f"🏁 [TikTok Direct] Hoàn tất: {output_path}")
         return os.path.abspath(output_path)
 
+    except OperationCancelled:
+        log("🛑 [TikTok Direct] Đã dừng tải video")
+        _remove_partial_files(output_dir, temp_id)
+        return None
     except subprocess.TimeoutExpired:
         log(f"⏱️ [TikTok Direct] Timeout khi tải video")
         return None
@@ -320,18 +385,19 @@ def download_tiktok_direct_url(url, output_dir="temp", log_callback=None):
 # ==========================================================
 # 🟢 API CHÍNH DÙNG CHUNG CHO CẢ YOUTUBE & TIKTOK
 # ==========================================================
-def download_video_api(url, output_dir="temp", log_callback=None):
+def download_video_api(url, output_dir="temp", log_callback=None, cancel_token=None):
     """
     API: tải video YouTube hoặc TikTok tùy theo URL.
-    Trả về đường dẫn file mp4 tuyệt đối hoặc None nếu lỗi.
+    Trả về đường dẫn file mp4 tuyệt đối hoặc None nếu lỗi/bị dừng (cancel_token).
     """
     try:
         # 🧠 Phân loại nền tảng
         if "tiktok.com" in url.lower():
-            return download_tiktok_video(url, output_dir, log_callback)
+            return download_tiktok_video(url, output_dir, log_callback, cancel_token=cancel_token)
 
         # Mặc định là YouTube
-        downloader = YouTubeDownloader(output_dir=output_dir, log_callback=log_callback)
+        downloader = YouTubeDownloader(output_dir=output_dir, log_callback=log_callback,
+                                       cancel_token=cancel_token)
         path = downloader.download_video(url)
         return os.path.abspath(path) if path and os.path.exists(path) else None
 
@@ -4,13 +4,18 @@ File Checker Utility - Kiểm tra file tồn tại trong Android VM qua ADB
 Sử dụng ADB shell commands để verify file đã được push thành công.
 """
 import subprocess
-import json
 import os
 import shlex
-from config import ADB_EXE, VM_DATA_DIR, get_vm_id_from_name
+import hashlib
+from functools import lru_cache
+from config import ADB_EXE
+from constants import PUSH_VERIFY_RETRIES, PUSH_VERIFY_RETRY_WAIT, LOCAL_HASH_CACHE_SIZE
+from utils.vm_registry import vm_registry
+from utils.cancel_token import OperationCancelled, sleep as cancellable_sleep, run as cancellable_run
+from utils.media_store import scan_media
 
 
-def check_file_exists_in_vm(vm_name, file_path, log_callback=None):
+def check_file_exists_in_vm(vm_name, file_path, log_callback=None, cancel_token=None):
     """
     Kiểm tra file tồn tại trong VM qua ADB shell test
 
@@ -18,9 +23,10 @@ def check_file_exists_in_vm(vm_name, file_path, log_callback=None):
         vm_name: Tên máy ảo
         file_path: Path trong Android (vd: /sdcard/DCIM/video.mp4)
         log_callback: Optional log function
+        cancel_token: Optional CancelToken - kill lệnh adb ngay khi bị dừng
 
     Returns:
-        bool: True nếu file tồn tại
+        bool: True nếu file tồn tại (False nếu bị dừng)
 
     Example:
         >>> check_file_exists_in_vm("test1", "/sdcard/DCIM/video.mp4")
@@ -29,21 +35,12 @@ def check_file_exists_in_vm(vm_name, file_path, log_callback=None):
     log = log_callback or (lambda msg: print(msg))
 
     try:
-        # ✅ v1.5.36: Tìm VM ID từ tên máy ảo
-        vm_id = get_vm_id_from_name(vm_name)
-        if not vm_id:
+        # 1. Get VM port from registry
+        vm_info = vm_registry.get(vm_name)
+        if not vm_info:
             log(f"❌ Không tìm thấy file cấu hình VM cho: {vm_name}")
             return False
 
-        # 1. Get VM port from config
-        vm_file = os.path.join(VM_DATA_DIR, f"{vm_id}.json")
-        if not os.path.exists(vm_file):
-            log(f"❌ Không tìm thấy file cấu hình VM: {vm_file}")
-            return False
-
-        with open(vm_file, "r", encoding="utf-8") as f:
-            vm_info = json.load(f)
-
         port = vm_info.get("port")
         if not port:
             log(f"❌ VM config không có port")
@@ -54,8 +51,9 @@ def check_file_exists_in_vm(vm_name, file_path, log_callback=None):
         # 2. Check file via ADB shell test -e
         # Quote path để handle khoảng trắng và ký tự đặc biệt
         quoted_path = shlex.quote(file_path)
-        result = subprocess.run(
+        result = cancellable_run(
             [ADB_EXE, "-s", device, "shell", f"test -e {quoted_path}"],
+            token=cancel_token,
             capture_output=True,
             creationflags=subprocess.CREATE_NO_WINDOW,
             timeout=10
@@ -70,6 +68,8 @@ def check_file_exists_in_vm(vm_name, file_path, log_callback=None):
 
         return exists
 
+    except OperationCancelled:
+        return False
     except subprocess.TimeoutExpired:
         log(f"⚠️ Timeout khi kiểm tra file")
         return False
@@ -78,7 +78,7 @@ def check_file_exists_in_vm(vm_name, file_path, log_callback=None):
         return False
 
 
-def check_file_with_size(vm_name, file_path, log_callback=None):
+def check_file_with_size(vm_name, file_path, log_callback=None, cancel_token=None):
     """
     Kiểm tra file và lấy kích thước
 
@@ -86,6 +86,7 @@ def check_file_with_size(vm_name, file_path, log_callback=None):
         vm_name: Tên máy ảo
         file_path: Path trong Android
         log_callback: Optional log function
+        cancel_token: Optional CancelToken - kill lệnh adb ngay khi bị dừng
 
     Returns:
         tuple: (exists: bool, size_mb: float)
@@ -98,21 +99,12 @@ def check_file_with_size(vm_name, file_path, log_callback=None):
     log = log_callback or (lambda msg: print(msg))
 
     try:
-        # ✅ v1.5.36: Tìm VM ID từ tên máy ảo
-        vm_id = get_vm_id_from_name(vm_name)
-        if not vm_id:
+        # 1. Get VM port from registry
+        vm_info = vm_registry.get(vm_name)
+        if not vm_info:
             log(f"❌ Không tìm thấy file cấu hình VM cho: {vm_name}")
             return False, 0.0
 
-        # 1. Get VM port
-        vm_file = os.path.join(VM_DATA_DIR, f"{vm_id}.json")
-        if not os.path.exists(vm_file):
-            log(f"❌ Không tìm thấy file cấu hình VM: {vm_file}")
-            return False, 0.0
-
-        with open(vm_file, "r", encoding="utf-8") as f:
-            vm_info = json.load(f)
-
         port = vm_info.get("port")
         if not port:
             log(f"❌ VM config không có port")
@@ -123,8 +115,9 @@ def check_file_with_size(vm_name, file_path, log_callback=None):
         # 2. Get file size via stat -c %s
         # Quote path để handle khoảng trắng và ký tự đặc biệt
         quoted_path = shlex.quote(file_path)
-        result = subprocess.run(
+        result = cancellable_run(
             [ADB_EXE, "-s", device, "shell", f"stat -c %s {quoted_path}"],
+            token=cancel_token,
             capture_output=True,
             text=True,
             creationflags=subprocess.CREATE_NO_WINDOW,
@@ -142,6 +135,8 @@ def check_file_with_size(vm_name, file_path, log_callback=None):
         log(f"   ✅ Đã xác nhận: {os.path.basename(file_path)} ({size_mb:.2f} MB)")
         return True, size_mb
 
+    except OperationCancelled:
+        return False, 0.0
     except subprocess.TimeoutExpired:
         log(f"⚠️ Timeout khi kiểm tra file")
         return False, 0.0
@@ -154,7 +149,7 @@ def check_file_with_size(vm_name, file_path, log_callback=None):
 
 
 def verify_file_after_push(vm_name, remote_path, expected_size_mb=None,
-                           wait_seconds=5, max_retries=3, log_callback=None):
+                           wait_seconds=5, max_retries=3, log_callback=None, cancel_token=None):
     """
     Verify file đã được push thành công vào VM với retry mechanism
 
@@ -171,9 +166,10 @@ def verify_file_after_push(vm_name, remote_path, expected_size_mb=None,
         wait_seconds: Thời gian chờ trước khi verify (default 5s)
         max_retries: Số lần retry nếu file chưa xuất hiện (default 3)
         log_callback: Optional log function
+        cancel_token: Optional CancelToken - dừng chờ/retry ngay khi bị dừng
 
     Returns:
-        bool: True nếu file verify OK
+        bool: True nếu file verify OK (False nếu bị dừng)
 
     Example:
         >>> # Sau khi send_file_api()
@@ -183,12 +179,21 @@ def verify_file_after_push(vm_name, remote_path, expected_size_mb=None,
     """
     log = log_callback or (lambda msg: print(msg))
 
-    import time
+    try:
+        return _verify_file_after_push(vm_name, remote_path, expected_size_mb,
+                                       wait_seconds, max_retries, log, cancel_token)
+    except OperationCancelled:
+        log("🛑 Dừng verify file")
+        return False
+
 
+def _verify_file_after_push(vm_name, remote_path, expected_size_mb,
+                            wait_seconds, max_retries, log, cancel_token):
+    """Thân verify_file_after_push - raise OperationCancelled khi bị dừng"""
     # Wait for file to settle
     if wait_seconds > 0:
         log(f"⏳ Đợi {wait_seconds}s để file settle...")
-        time.sleep(wait_seconds)
+        cancellable_sleep(wait_seconds, cancel_token)
 
     # Retry logic
     for attempt in range(1, max_retries + 1):
@@ -196,13 +201,13 @@ def verify_file_after_push(vm_name, remote_path, expected_size_mb=None,
 
         # Check with size
         if expected_size_mb is not None:
-            exists, actual_size = check_file_with_size(vm_name, remote_path, log_callback)
+            exists, actual_size = check_file_with_size(vm_name, remote_path, log, cancel_token)
 
             if not exists:
                 if attempt < max_retries:
                     log(f"⚠️ File chưa xuất hiện - Retry broadcast MediaStore...")
-                    _retry_broadcast_mediastore(vm_name, remote_path, log_callback)
-                    time.sleep(2)  # Đợi 2s sau mỗi broadcast
+                    _retry_broadcast_mediastore(vm_name, remote_path, log, cancel_token)
+                    cancellable_sleep(2, cancel_token)  # Đợi 2s sau mỗi broadcast
                     continue
                 else:
                     log(f"❌ Verify FAILED: File không tồn tại sau {max_retries} lần thử!")
@@ -219,7 +224,7 @@ def verify_file_after_push(vm_name, remote_path, expected_size_mb=None,
 
             # ✅ v1.5.32: Check file permissions
             log(f"🔍 Kiểm tra file permissions...")
-            has_perms, perm_str = check_file_permissions(vm_name, remote_path, log_callback)
+            has_perms, perm_str = check_file_permissions(vm_name, remote_path, log, cancel_token)
             if not has_perms:
                 log(f"⚠️ WARNING: File có thể không có read permission cho Instagram")
                 # Vẫn tiếp tục, chỉ warning
@@ -229,7 +234,7 @@ def verify_file_after_push(vm_name, remote_path, expected_size_mb=None,
 
         # Check existence only
         else:
-            exists = check_file_exists_in_vm(vm_name, remote_path, log_callback)
+            exists = check_file_exists_in_vm(vm_name, remote_path, log, cancel_token)
 
             if exists:
                 log(f"✅ Verify thành công: File đã có trong VM")
@@ -237,8 +242,8 @@ def verify_file_after_push(vm_name, remote_path, expected_size_mb=None,
             else:
                 if attempt < max_retries:
                     log(f"⚠️ File chưa xuất hiện - Retry broadcast MediaStore...")
-                    _retry_broadcast_mediastore(vm_name, remote_path, log_callback)
-                    time.sleep(2)
+                    _retry_broadcast_mediastore(vm_name, remote_path, log, cancel_token)
+                    cancellable_sleep(2, cancel_token)
                     continue
                 else:
                     log(f"❌ Verify FAILED: File không tồn tại sau {max_retries} lần thử!")
@@ -247,7 +252,7 @@ def verify_file_after_push(vm_name, remote_path, expected_size_mb=None,
     return False
 
 
-def check_file_permissions(vm_name, file_path, log_callback=None):
+def check_file_permissions(vm_name, file_path, log_callback=None, cancel_token=None):
     """
     Kiểm tra permissions của file trong VM
 
@@ -255,6 +260,7 @@ def check_file_permissions(vm_name, file_path, log_callback=None):
         vm_name: Tên máy ảo
         file_path: Path trong Android
         log_callback: Optional log function
+        cancel_token: Optional CancelToken - kill lệnh adb ngay khi bị dừng
 
     Returns:
         tuple: (has_permissions: bool, permission_string: str)
@@ -263,27 +269,20 @@ def check_file_permissions(vm_name, file_path, log_callback=None):
     log = log_callback or (lambda msg: print(msg))
 
     try:
-        # ✅ v1.5.36: Tìm VM ID từ tên máy ảo
-        vm_id = get_vm_id_from_name(vm_name)
-        if not vm_id:
+        # Get VM port from registry
+        vm_info = vm_registry.get(vm_name)
+        if not vm_info:
             return False, ""
 
-        # Get VM port
-        vm_file = os.path.join(VM_DATA_DIR, f"{vm_id}.json")
-        if not os.path.exists(vm_file):
-            return False, ""
-
-        with open(vm_file, "r", encoding="utf-8") as f:
-            vm_info = json.load(f)
-
         port = vm_info.get("port")
         device = f"emulator-{port}"
 
         # Get file permissions via stat
         # Quote path để handle khoảng trắng và ký tự đặc biệt
         quoted_path = shlex.quote(file_path)
-        result = subprocess.run(
+        result = cancellable_run(
             [ADB_EXE, "-s", device, "shell", f"stat -c %A {quoted_path}"],
+            token=cancel_token,
             capture_output=True,
             text=True,
             creationflags=subprocess.CREATE_NO_WINDOW,
@@ -306,12 +305,14 @@ def check_file_permissions(vm_name, file_path, log_callback=None):
 
         return is_readable, permissions
 
+    except OperationCancelled:
+        return False, ""
     except Exception as e:
         log(f"⚠️ Lỗi check permissions: {e}")
         return False, ""
 
 
-def _retry_broadcast_mediastore(vm_name, remote_path, log_callback=None):
+def _retry_broadcast_mediastore(vm_name, remote_path, log_callback=None, cancel_token=None):
     """
     Retry broadcast MediaStore scan khi file chưa xuất hiện
 
@@ -319,34 +320,161 @@ def _retry_broadcast_mediastore(vm_name, remote_path, log_callback=None):
         vm_name: Tên máy ảo
         remote_path: Path trong Android
         log_callback: Optional log function
+        cancel_token: Optional CancelToken - kill lệnh adb ngay khi bị dừng
     """
     log = log_callback or (lambda msg: print(msg))
 
     try:
-        # ✅ v1.5.36: Tìm VM ID từ tên máy ảo
-        vm_id = get_vm_id_from_name(vm_name)
-        if not vm_id:
+        # Get VM port from registry
+        vm_info = vm_registry.get(vm_name)
+        if not vm_info:
             log(f"⚠️ Không tìm thấy file cấu hình VM cho: {vm_name}")
             return
 
-        # Get VM port
-        vm_file = os.path.join(VM_DATA_DIR, f"{vm_id}.json")
-        with open(vm_file, "r", encoding="utf-8") as f:
-            vm_info = json.load(f)
-
         port = vm_info.get("port")
         device = f"emulator-{port}"
 
         # Broadcast MediaStore scan
         log(f"   📡 Broadcasting MediaStore scan: {remote_path}")
-        subprocess.run([
-            ADB_EXE, "-s", device, "shell",
-            "am", "broadcast", "-a", "android.intent.action.MEDIA_SCANNER_SCAN_FILE",
-            "-d", f"file://{remote_path}"
-        ],
-        creationflags=subprocess.CREATE_NO_WINDOW,
-        timeout=10
-        )
+        scan_media(device, [remote_path], cancel_token=cancel_token, timeout=10)
 
+    except OperationCancelled:
+        pass
     except Exception as e:
         log(f"⚠️ Lỗi broadcast MediaStore: {e}")
+
+
+class RemoteFileInfo:
+    """Kết quả stat + md5 của 1 file trong VM (stat_remote_file)"""
+
+    __slots__ = ("exists", "size", "mode", "md5")
+
+    def __init__(self, exists=False, size=0, mode="", md5=None):
+        self.exists = exists
+        self.size = size
+        self.mode = mode
+        self.md5 = md5  # None nếu ROM không có md5sum
+
+    @property
+    def readable(self) -> bool:
+        # Instagram cần ít nhất read permission
+        return len(self.mode) >= 4 and self.mode[1] == "r"
+
+
+def stat_remote_file(device, remote_path, cancel_token=None, timeout=30):
+    """
+    Lấy size, mode và md5 của file trong VM bằng 1 lệnh adb shell.
+
+    Args:
+        device: ADB device (vd: emulator-5554) - không đọc lại VM registry
+        remote_path: Path trong Android
+        cancel_token: Optional CancelToken - kill lệnh adb ngay khi bị dừng
+
+    Returns:
+        RemoteFileInfo: exists=False nếu file không tồn tại / không truy cập được
+
+    Raises:
+        OperationCancelled: Bị dừng khi đang chạy lệnh
+        subprocess.TimeoutExpired: Hết timeout
+    """
+    quoted_path = shlex.quote(remote_path)
+    result = cancellable_run(
+        [ADB_EXE, "-s", device, "shell",
+         f"stat -c '%s %A' {quoted_path} && (md5sum {quoted_path} 2>/dev/null || echo -)"],
+        token=cancel_token,
+        capture_output=True, text=True, encoding="utf-8", errors="ignore",
+        creationflags=subprocess.CREATE_NO_WINDOW,
+        timeout=timeout
+    )
+    lines = (result.stdout or "").split("\n")
+    if result.returncode != 0 or len(lines) < 2:
+        return RemoteFileInfo()
+
+    size, _, mode = lines[0].strip().partition(" ")
+    digest = lines[1].split()[0].lower() if lines[1].split() else "-"
+    return RemoteFileInfo(
+        exists=True,
+        size=int(size),
+        mode=mode,
+        md5=digest if len(digest) == 32 else None
+    )
+
+
+@lru_cache(maxsize=LOCAL_HASH_CACHE_SIZE)
+def _md5_of(path, size, mtime_ns):
+    digest = hashlib.md5()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def local_md5(path):
+    """md5 của file trên PC - cache theo (path, size, mtime) nên file không đổi chỉ hash 1 lần"""
+    st = os.stat(path)
+    return _md5_of(os.path.abspath(path), st.st_size, st.st_mtime_ns)
+
+
+def verify_pushed_file(device, remote_path, local_path, max_retries=PUSH_VERIFY_RETRIES,
+                       log_callback=None, cancel_token=None):
+    """
+    Verify file vừa push: size + md5 khớp file gốc, có read permission - mỗi lần thử 1 lệnh adb shell.
+
+    Thay cho verify_file_after_push (chờ 5s + 2-3 lệnh adb + broadcast MediaStore mỗi lần thử):
+    send_files_api đã xác nhận MediaStore index nên ở đây chỉ kiểm tra nội dung file.
+
+    Args:
+        device: ADB device (vd: emulator-5554)
+        remote_path: Path trong Android
+        local_path: File gốc trên PC
+        max_retries: Số lần thử nếu file chưa có / sai size (sai md5 = lỗi ngay)
+        log_callback: Optional log function
+        cancel_token: Optional CancelToken - dừng chờ/retry ngay khi bị dừng
+
+    Returns:
+        bool: True nếu file khớp (False nếu bị dừng)
+    """
+    log = log_callback or (lambda msg: print(msg))
+
+    try:
+        expected_size = os.path.getsize(local_path)
+        expected_md5 = local_md5(local_path)
+
+        for attempt in range(1, max_retries + 1):
+            if attempt > 1:
+                cancellable_sleep(PUSH_VERIFY_RETRY_WAIT, cancel_token)
+            log(f"🔍 Đang verify file (lần {attempt}/{max_retries})...")
+            try:
+                info = stat_remote_file(device, remote_path, cancel_token)
+            except subprocess.TimeoutExpired:
+                log("⚠️ Timeout khi kiểm tra file")
+                continue
+
+            if not info.exists:
+                log(f"   ❌ File KHÔNG tồn tại trong VM: {remote_path}")
+                continue
+            if info.size != expected_size:
+                log(f"   ⚠️ Sai kích thước: Expected {expected_size} bytes, Got {info.size} bytes")
+                continue
+
+            if info.md5 is None:
+                log("   ⚠️ VM không có md5sum - chỉ so sánh kích thước")
+            elif info.md5 != expected_md5:
+                log(f"❌ Verify FAILED: md5 khác file gốc ({info.md5} ≠ {expected_md5})")
+                return False
+
+            if not info.readable:
+                log(f"   ⚠️ File không có read permission: {info.mode}")
+            log(f"✅ Verify thành công: {os.path.basename(remote_path)} "
+                f"({expected_size / (1024 * 1024):.2f} MB{', md5 khớp' if info.md5 else ''}, {info.mode})")
+            return True
+
+        log(f"❌ Verify FAILED: File không khớp sau {max_retries} lần thử!")
+        return False
+
+    except OperationCancelled:
+        log("🛑 Dừng verify file")
+        return False
+    except Exception as e:
+        log(f"⚠️ Lỗi verify file: {e}")
+        return False
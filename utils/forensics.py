@@ -0,0 +1,291 @@
+"""
+Failure Forensics - Bundle chẩn đoán khi automation thất bại (thay cho 1 screenshot đơn lẻ).
+
+Trước đây InstagramPost._capture_failure_screenshot chụp 1 ảnh đồng bộ (3 lệnh adb + ghi file)
+ngay trong nhánh lỗi, lúc vẫn đang giữ khóa VM, và không có gì khác để biết vì sao lỗi.
+
+Mỗi bundle gồm:
+- screen.png      - `adb exec-out screencap -p`
+- hierarchy.xml   - UI hierarchy (uiautomator2 đang kết nối, fallback `uiautomator dump`)
+- logcat.txt      - FORENSICS_LOGCAT_LINES dòng logcat gần nhất
+- steps.jsonl     - các bước log gần nhất của InstagramPost (BaseInstagramAutomation.steps)
+- meta.json       - post, vm, device, lý do, thời điểm
+
+Chụp nhanh (giữ VM): screenshot + logcat chạy song song, hierarchy lấy qua kết nối u2 sẵn có,
+chỉ giữ bytes trong RAM. Nén zip + ghi file do 1 thread nền làm sau (hàng đợi giới hạn
+FORENSICS_QUEUE_MAX - đầy thì bỏ bundle mới thay vì chặn luồng đăng).
+
+Lưu tại logs/forensics/<YYYY-MM-DD>/<id>_<post>_<lý do>.zip (id = <YYYYmmdd-HHMMSS>-<số thứ tự>), index JSONL
+logs/forensics/index.jsonl (1 dòng / bundle) để tra theo post / lý do:
+    from utils.forensics import forensics
+    forensics.find(post_id="abc")              # bundle của 1 post
+    forensics.find(reason="Profile tab")       # lý do chứa chuỗi này
+"""
+import os
+import re
+import json
+import time
+import queue
+import zipfile
+import threading
+import subprocess
+import logging
+import concurrent.futures
+from collections import deque
+
+from config import ADB_EXE, LOG_DIR
+from constants import (
+    FORENSICS_ENABLED, FORENSICS_LOGCAT_LINES, FORENSICS_QUEUE_MAX, FORENSICS_KEEP_BUNDLES
+)
+from utils.screenshot import capture_png
+
+FORENSICS_DIR = os.path.join(LOG_DIR, "forensics")
+INDEX_FILE = os.path.join(FORENSICS_DIR, "index.jsonl")
+
+# Lệnh adb chụp nhanh chạy song song (screenshot + logcat + hierarchy fallback)
+_SNAPSHOT_WORKERS = 3
+_SNAPSHOT_TIMEOUT = 15
+
+
+def _slug(text: str, limit: int = 40) -> str:
+    slug = re.sub(r"[^\w-]+", "_", str(text), flags=re.UNICODE).strip("_")
+    return slug[:limit] or "unknown"
+
+
+def _adb_bytes(device: str, args: list, adb_path: str = None) -> bytes:
+    result = subprocess.run(
+        [adb_path or ADB_EXE, "-s", device, *args],
+        capture_output=True,
+        creationflags=subprocess.CREATE_NO_WINDOW,
+        timeout=_SNAPSHOT_TIMEOUT
+    )
+    return result.stdout if result.returncode == 0 else None
+
+
+def _dump_hierarchy(device: str, u2_device=None, adb_path: str = None) -> bytes:
+    if u2_device is not None:
+        try:
+            return u2_device.dump_hierarchy().encode("utf-8")
+        except Exception:
+            pass  # u2 server chết → dùng uiautomator dump của hệ thống
+    raw = _adb_bytes(device, ["exec-out", "uiautomator", "dump", "/dev/tty"], adb_path)
+    if not raw:
+        return None
+    # Output: "<?xml ...>...</hierarchy>UI hierchary dumped to: /dev/tty"
+    end = raw.rfind(b"</hierarchy>")
+    return raw[:end + len(b"</hierarchy>")] if end >= 0 else raw
+
+
+class ForensicsCollector:
+    """Singleton: chụp bundle nhanh + writer nền nén/ghi/index/xóa bundle cũ"""
+
+    _instance = None
+    _creation_lock = threading.Lock()
+
+    def __new__(cls):
+        if cls._instance is None:
+            with cls._creation_lock:
+                if cls._instance is None:
+                    cls._instance = super().__new__(cls)
+        return cls._instance
+
+    def __init__(self):
+        if not hasattr(self, '_initialized'):
+            self.enabled = FORENSICS_ENABLED
+            self._queue = queue.Queue(maxsize=FORENSICS_QUEUE_MAX)
+            self._pool = None
+            self._writer_thread = None
+            self._lock = threading.Lock()
+            self._index = None  # deque[dict] cũ → mới (lazy load từ index.jsonl)
+            self._seq = 0
+            self.captured = 0
+            self.dropped = 0
+            self.written = 0
+            self.logger = logging.getLogger(__name__)
+            self._initialized = True
+
+    # ==================== CHỤP NHANH (ĐANG GIỮ VM) ====================
+    def capture(self, device: str, vm_name: str, reason: str, post_id=None, u2_device=None,
+                steps=None, extra: dict = None, adb_path: str = None):
+        """
+        Chụp bundle chẩn đoán - chỉ lấy dữ liệu vào RAM, nén + ghi file ở thread nền.
+
+        Args:
+            device: ADB device (vd: emulator-5554)
+            vm_name: Tên máy ảo
+            reason: Lý do thất bại
+            post_id: ID post / job (index để tra cứu)
+            u2_device: uiautomator2 device đang kết nối (dump hierarchy nhanh hơn)
+            steps: Các bước log gần nhất [(ts, level, msg)]
+            extra: Thông tin thêm ghi vào meta.json
+
+        Returns:
+            str: ID bundle (None nếu tắt / hàng đợi đầy)
+        """
+        if not self.enabled:
+            return None
+        started = time.monotonic()
+        pool = self._ensure_pool()
+        screen = pool.submit(capture_png, device, adb_path)
+        logcat = pool.submit(_adb_bytes, device, ["logcat", "-d", "-t", str(FORENSICS_LOGCAT_LINES)], adb_path)
+        hierarchy = pool.submit(_dump_hierarchy, device, u2_device, adb_path)
+
+        with self._lock:
+            self._seq += 1
+            bundle_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{self._seq}"
+        meta = {
+            "id": bundle_id, "ts": time.time(), "post": post_id, "vm": vm_name,
+            "device": device, "reason": reason, **(extra or {}),
+        }
+        files = {}
+        for name, future in (("screen.png", screen), ("logcat.txt", logcat), ("hierarchy.xml", hierarchy)):
+            try:
+                data = future.result(timeout=_SNAPSHOT_TIMEOUT + 5)
+            except Exception as e:
+                data = None
+                meta.setdefault("errors", {})[name] = str(e)
+            if data:
+                files[name] = data
+        if steps:
+            files["steps.jsonl"] = "\n".join(
+                json.dumps({"ts": ts, "level": level, "msg": msg}, ensure_ascii=False)
+                for ts, level, msg in steps
+            ).encode("utf-8")
+        meta["snapshot_seconds"] = round(time.monotonic() - started, 3)
+
+        self.captured += 1
+        try:
+            self._queue.put_nowait((meta, files))
+        except queue.Full:
+            self.dropped += 1
+            self.logger.warning(f"⚠️ Hàng đợi forensics đầy - bỏ bundle {bundle_id} ({reason})")
+            return None
+        self._ensure_writer()
+        return bundle_id
+
+    def _ensure_pool(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=_SNAPSHOT_WORKERS, thread_name_prefix="ForensicsSnapshot")
+            return self._pool
+
+    def _ensure_writer(self):
+        with self._lock:
+            if self._writer_thread is None or not self._writer_thread.is_alive():
+                self._writer_thread = threading.Thread(target=self._writer_loop, daemon=True,
+                                                       name="ForensicsWriter")
+                self._writer_thread.start()
+
+    # ==================== GHI NỀN ====================
+    def _writer_loop(self):
+        while True:
+            meta, files = self._queue.get()
+            try:
+                self._write_bundle(meta, files)
+            except Exception as e:
+                self.logger.error(f"❌ Lỗi ghi forensics bundle: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _write_bundle(self, meta: dict, files: dict):
+        day_dir = os.path.join(FORENSICS_DIR, time.strftime("%Y-%m-%d", time.localtime(meta["ts"])))
+        os.makedirs(day_dir, exist_ok=True)
+        # id có số thứ tự → 2 bundle cùng post + lý do trong cùng 1 giây không ghi đè nhau
+        name = f"{meta['id']}_{_slug(meta.get('post') or meta['vm'], 24)}_{_slug(meta['reason'])}.zip"
+        path = os.path.join(day_dir, name)
+        tmp = path + ".tmp"
+
+        meta["files"] = sorted(files)
+        with zipfile.ZipFile(tmp, "w", zipfile.ZIP_DEFLATED) as bundle:
+            for file_name, data in files.items():
+                # PNG đã nén sẵn → lưu nguyên
+                compress = zipfile.ZIP_STORED if file_name.endswith(".png") else zipfile.ZIP_DEFLATED
+                bundle.writestr(file_name, data, compress_type=compress)
+            bundle.writestr("meta.json", json.dumps(meta, ensure_ascii=False, indent=2))
+        os.replace(tmp, path)
+
+        entry = {key: meta.get(key) for key in ("id", "ts", "post", "vm", "reason")}
+        entry["path"] = os.path.relpath(path, FORENSICS_DIR)
+        entry["size"] = os.path.getsize(path)
+        with self._lock:
+            self._load_index()
+            self._index.append(entry)
+            with open(INDEX_FILE, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self._enforce_retention()
+        self.written += 1
+        self.logger.info(f"🧾 Forensics bundle: {path} ({entry['size'] / 1024:.0f} KB)")
+
+    # ==================== INDEX + RETENTION ====================
+    def _load_index(self):
+        if self._index is not None:
+            return
+        self._index = deque()
+        if not os.path.exists(INDEX_FILE):
+            return
+        with open(INDEX_FILE, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    self._index.append(json.loads(line))
+                except ValueError:
+                    continue  # dòng ghi dở lúc tắt app
+
+    def _enforce_retention(self):
+        if len(self._index) <= FORENSICS_KEEP_BUNDLES:
+            return
+        while len(self._index) > FORENSICS_KEEP_BUNDLES:
+            old = self._index.popleft()
+            try:
+                os.remove(os.path.join(FORENSICS_DIR, old["path"]))
+            except OSError:
+                pass
+        # Ghi lại index (chỉ khi vừa xóa bundle cũ)
+        tmp = INDEX_FILE + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            for entry in self._index:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        os.replace(tmp, INDEX_FILE)
+
+    def find(self, post_id=None, reason: str = None, vm_name: str = None) -> list:
+        """
+        Tra bundle theo post / lý do (chứa chuỗi, không phân biệt hoa thường) / VM.
+
+        Returns:
+            list[dict]: Entry index (mới nhất trước), "path" là đường dẫn đầy đủ
+        """
+        with self._lock:
+            self._load_index()
+            entries = list(self._index)
+        reason = reason.lower() if reason else None
+        result = []
+        for entry in reversed(entries):
+            if post_id is not None and entry.get("post") != post_id:
+                continue
+            if vm_name is not None and entry.get("vm") != vm_name:
+                continue
+            if reason and reason not in (entry.get("reason") or "").lower():
+                continue
+            result.append(dict(entry, path=os.path.join(FORENSICS_DIR, entry["path"])))
+        return result
+
+    def flush(self, timeout: float = 30) -> bool:
+        """Chờ ghi xong các bundle đang chờ. Returns: True nếu hàng đợi đã rỗng"""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+    def shutdown(self, timeout: float = 10):
+        """Ghi nốt bundle đang chờ (gọi khi đóng app)"""
+        if self._writer_thread is not None and self._writer_thread.is_alive():
+            self.flush(timeout)
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+            self._pool = None
+
+
+# Global singleton instance
+forensics = ForensicsCollector()
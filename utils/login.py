@@ -3,15 +3,13 @@ Instagram login automation module.
 
 Handles automatic Instagram login with 2FA support using UIAutomator2.
 """
-import time
 import re
-import os
-import json
 import requests
-import uiautomator2 as u2
 
-from config import VM_DATA_DIR, get_vm_id_from_name
 from utils.base_instagram import BaseInstagramAutomation
+from utils.cancel_token import OperationCancelled
+from utils.vm_registry import vm_registry
+from utils.ui_replay import recorded
 from constants import (
     WAIT_SHORT, WAIT_MEDIUM, WAIT_LONG, WAIT_EXTRA_LONG,
     TIMEOUT_DEFAULT, TIMEOUT_SHORT, TIMEOUT_MEDIUM,
@@ -32,14 +30,17 @@ class InstagramLogin(BaseInstagramAutomation):
     Inherits from BaseInstagramAutomation for shared functionality.
     """
 
-    def __init__(self, log_callback=None):
+    FLOW = "login"
+
+    def __init__(self, log_callback=None, cancel_token=None):
         """
         Initialize Instagram login handler.
 
         Args:
             log_callback: Optional callback function for logging (vm_name, message)
+            cancel_token: Optional CancelToken - auto_login dừng và trả về False khi bị cancel
         """
-        super().__init__(log_callback)
+        super().__init__(log_callback, cancel_token)
 
     def get_2fa_code(self, key_2fa: str) -> str:
         """
@@ -73,6 +74,7 @@ class InstagramLogin(BaseInstagramAutomation):
             self.logger.exception(f"Error calling 2FA API: {e}")
             return None
 
+    @recorded
     def auto_login(self, vm_name: str, adb_address: str, username: str,
                    password: str, key_2fa: str) -> bool:
         """
@@ -91,7 +93,7 @@ class InstagramLogin(BaseInstagramAutomation):
         d = None
         try:
             self.log(vm_name, f"🔌 Kết nối tới {adb_address}")
-            d = u2.connect(adb_address)
+            d = self.connect(adb_address, vm_name)
 
             self.log(vm_name, "🔄 Bắt đầu đăng nhập...")
 
@@ -100,7 +102,9 @@ class InstagramLogin(BaseInstagramAutomation):
                 if d(resourceId=CHROME_TITLE_ID).exists:
                     d.app_stop(CHROME_PACKAGE)
                     self.log(vm_name, f"Đã đóng {CHROME_PACKAGE}")
-                    time.sleep(WAIT_SHORT)
+                    self.sleep(WAIT_SHORT)
+            except OperationCancelled:
+                raise
             except Exception as e:
                 self.logger.warning(f"Error checking/closing Chrome: {e}")
 
@@ -207,14 +211,17 @@ class InstagramLogin(BaseInstagramAutomation):
 
             # Wait and close app
             self.log(vm_name, "✅ Chờ 5s trước khi kết thúc...")
-            time.sleep(WAIT_MEDIUM)
+            self.sleep(WAIT_MEDIUM)
             d.app_stop(INSTAGRAM_PACKAGE)
             self.log(vm_name, "🛑 Đóng ứng dụng Instagram")
             return True
 
         except Exception as e:
-            self.log(vm_name, f"❌ Lỗi tự động đăng nhập: {e}", "ERROR")
-            self.logger.exception("Exception in auto_login")
+            if isinstance(e, OperationCancelled):
+                self.log(vm_name, "🛑 Đã dừng đăng nhập theo yêu cầu", "WARNING")
+            else:
+                self.log(vm_name, f"❌ Lỗi tự động đăng nhập: {e}", "ERROR")
+                self.logger.exception("Exception in auto_login")
 
             # Try to close app on error
             if d:
@@ -238,20 +245,15 @@ class InstagramLogin(BaseInstagramAutomation):
             bool: True if saved successfully
         """
         # ✅ v1.5.36: Tìm VM ID từ tên máy ảo
-        vm_id = get_vm_id_from_name(vm_name)
+        vm_id = vm_registry.get_vm_id(vm_name)
         if not vm_id:
             self.log(vm_name, f"⚠️ Không tìm thấy file cấu hình cho máy ảo: {vm_name}", "ERROR")
             return False
 
-        path = os.path.join(VM_DATA_DIR, f"{vm_id}.json")
+        path = vm_registry.path_for(vm_id)
         try:
-            with open(path, "r", encoding="utf-8") as fp:
-                file_data = json.load(fp)
-
-            file_data["insta_name"] = insta_name
-
-            with open(path, "w", encoding="utf-8") as fp:
-                json.dump(file_data, fp, ensure_ascii=False, indent=2)
+            # ✅ Ghi qua registry (write-through: cập nhật file + cache)
+            vm_registry.update(vm_id, {"insta_name": insta_name})
 
             self.log(vm_name, f"💾 Đã lưu insta_name vào {path}")
             return True
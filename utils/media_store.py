@@ -0,0 +1,148 @@
+"""
+MediaStore helpers - quét media + xác nhận file đã được index qua content://media
+
+Trước đây sau mỗi lần push: broadcast MEDIA_SCANNER_SCAN_FILE cho từng file rồi sleep 2-3s
+(retry tối đa 3 lần) với hy vọng Gallery/Instagram đã thấy file. Ở đây:
+
+- scan_media: 1 lệnh adb shell cho cả thư mục / danh sách file (nối các broadcast trong 1 shell)
+- query_indexed: 1 lệnh `content query` trả về các file MediaStore đã index trong thư mục
+- wait_media_indexed: query cho tới khi mọi file đã được index (không sleep cố định) -
+  file nào chưa có sau MEDIA_RESCAN_AFTER giây thì broadcast lại riêng từng file (1 lần)
+"""
+import posixpath
+import re
+import shlex
+import subprocess
+import time
+
+from config import ADB_EXE
+from constants import DCIM_PATH, MEDIA_INDEX_TIMEOUT, MEDIA_INDEX_POLL, MEDIA_RESCAN_AFTER
+from utils.cancel_token import sleep as cancellable_sleep, run as cancellable_run
+
+MEDIA_SCANNER_ACTION = "android.intent.action.MEDIA_SCANNER_SCAN_FILE"
+MEDIA_FILES_URI = "content://media/external/file"
+
+_DATA_RE = re.compile(r"_data=(.*?)\s*$")
+
+
+def _storage_dir(remote_dir: str) -> str:
+    """/sdcard/DCIM → /DCIM (MediaStore lưu _data dạng /storage/emulated/0/DCIM/...)"""
+    remote_dir = remote_dir.rstrip("/")
+    for prefix in ("/sdcard", "/storage/emulated/0", "/storage/self/primary"):
+        if remote_dir.startswith(prefix + "/"):
+            return remote_dir[len(prefix):]
+    return remote_dir
+
+
+def scan_media(device: str, paths=(DCIM_PATH,), adb_path=None, cancel_token=None, timeout: float = 15) -> bool:
+    """
+    Broadcast MEDIA_SCANNER_SCAN_FILE cho thư mục / file - tất cả trong 1 lệnh adb shell.
+
+    Args:
+        device: ADB device (vd: emulator-5554)
+        paths: Thư mục hoặc file trong Android (mặc định cả DCIM)
+
+    Returns:
+        bool: True nếu lệnh chạy thành công
+
+    Raises:
+        OperationCancelled: Bị dừng khi đang chạy lệnh
+    """
+    commands = [f"am broadcast -a {MEDIA_SCANNER_ACTION} -d {shlex.quote('file://' + path)}" for path in paths]
+    if not commands:
+        return True
+    try:
+        result = cancellable_run(
+            [adb_path or ADB_EXE, "-s", device, "shell", " ; ".join(commands)],
+            token=cancel_token,
+            capture_output=True, text=True, encoding="utf-8", errors="ignore",
+            creationflags=subprocess.CREATE_NO_WINDOW,
+            timeout=timeout
+        )
+        return result.returncode == 0
+    except subprocess.TimeoutExpired:
+        return False
+
+
+def query_indexed(device: str, remote_dir: str = DCIM_PATH, adb_path=None, cancel_token=None):
+    """
+    Tên các file MediaStore đã index nằm trực tiếp trong remote_dir (1 lệnh content query).
+
+    Returns:
+        set[str] | None: Tên file (basename), None nếu query lỗi (ROM không có lệnh content...)
+
+    Raises:
+        OperationCancelled: Bị dừng khi đang chạy lệnh
+    """
+    storage_dir = _storage_dir(remote_dir)
+    where = "_data LIKE '%{}/%'".format(storage_dir.replace("'", "''"))
+    command = f"content query --uri {MEDIA_FILES_URI} --projection _data --where {shlex.quote(where)}"
+    try:
+        result = cancellable_run(
+            [adb_path or ADB_EXE, "-s", device, "shell", command],
+            token=cancel_token,
+            capture_output=True, text=True, encoding="utf-8", errors="ignore",
+            creationflags=subprocess.CREATE_NO_WINDOW,
+            timeout=10
+        )
+    except subprocess.TimeoutExpired:
+        return None
+    output = result.stdout or ""
+    if result.returncode != 0 or ("Row:" not in output and "No result found" not in output):
+        return None
+
+    names = set()
+    for line in output.splitlines():
+        match = _DATA_RE.search(line)
+        if match and posixpath.dirname(match.group(1)).endswith(storage_dir):
+            names.add(posixpath.basename(match.group(1)))
+    return names
+
+
+def wait_media_indexed(device: str, remote_paths, timeout: float = MEDIA_INDEX_TIMEOUT,
+                       rescan_after: float = MEDIA_RESCAN_AFTER, adb_path=None,
+                       log_callback=None, cancel_token=None):
+    """
+    Chờ tới khi MediaStore đã index mọi file trong remote_paths.
+
+    Args:
+        device: ADB device (vd: emulator-5554)
+        remote_paths: Path file trong Android (vd: /sdcard/DCIM/video.mp4)
+        timeout: Chờ tối đa (giây)
+        rescan_after: Sau khoảng này file nào chưa được index → broadcast lại từng file (1 lần, None = không)
+
+    Returns:
+        set[str] | None: remote path đã được index, None nếu không query được MediaStore
+                         (caller quay về cách cũ: chờ cố định)
+
+    Raises:
+        OperationCancelled: Bị dừng khi đang chờ
+    """
+    log = log_callback or (lambda msg: print(msg))
+    by_dir = {}
+    for path in remote_paths:
+        by_dir.setdefault(posixpath.dirname(path), set()).add(path)
+
+    indexed = set()
+    rescanned = rescan_after is None
+    start = time.monotonic()
+    while True:
+        for remote_dir, paths in by_dir.items():
+            names = query_indexed(device, remote_dir, adb_path=adb_path, cancel_token=cancel_token)
+            if names is None:
+                return None
+            indexed.update(path for path in paths if posixpath.basename(path) in names)
+
+        missing = [path for paths in by_dir.values() for path in paths if path not in indexed]
+        if not missing:
+            return indexed
+
+        elapsed = time.monotonic() - start
+        if elapsed >= timeout:
+            log(f"⚠️ MediaStore chưa index {len(missing)} file sau {timeout:g}s")
+            return indexed
+        if not rescanned and elapsed >= rescan_after:
+            rescanned = True
+            log(f"   📡 Broadcast lại {len(missing)} file chưa được index...")
+            scan_media(device, missing, adb_path=adb_path, cancel_token=cancel_token)
+        cancellable_sleep(MEDIA_INDEX_POLL, cancel_token)
@@ -0,0 +1,391 @@
+"""
+Metrics Registry - Đo thời gian từng stage của vòng đời post (histogram + counter).
+
+Trước đây chỉ có log emoji theo từng post → không biết tổng thể thời gian dồn vào
+boot, kết nối ADB, tải video, push, verify, đăng hay tắt máy trên 50 VM.
+
+- Histogram / counter theo label (stage, vm, result...)
+- HTTP local: GET /metrics (định dạng Prometheus text), GET /summary (JSON, stage chậm nhất trước)
+- CSV cuộn theo ngày: mỗi lần đo 1 dòng (metrics_YYYY-MM-DD.csv), giữ METRICS_CSV_KEEP_DAYS ngày
+
+Sử dụng:
+    from utils.metrics import metrics
+    metrics.observe("post_stage_seconds", 12.3, stage="boot", vm="VM1")
+    metrics.inc("post_stage_total", stage="boot", vm="VM1", result="ok")
+    with metrics.time("stream_scan_seconds", platform="youtube"):
+        ...
+"""
+import os
+import csv
+import json
+import time
+import bisect
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from config import LOG_DIR
+from constants import (
+    METRICS_HTTP_ENABLED, METRICS_HTTP_HOST, METRICS_HTTP_PORT,
+    METRICS_CSV_ENABLED, METRICS_CSV_FLUSH_INTERVAL, METRICS_CSV_KEEP_DAYS
+)
+
+METRICS_DIR = os.path.join(LOG_DIR, "metrics")
+
+# Bucket (giây) - phủ từ lệnh adb nhanh đến boot/đăng bài lâu
+DEFAULT_BUCKETS = (0.1, 0.5, 1, 2, 5, 10, 20, 30, 60, 90, 120, 180, 300, 600, 900)
+
+# Số dòng CSV tối đa chờ ghi (bỏ dòng cũ nhất nếu writer không kịp)
+CSV_BUFFER_MAX = 100_000
+
+# Counter giữ thêm các lần tăng gần nhất (tỉ lệ thành công "cuốn chiếu" - utils/vm_balancer.py)
+RECENT_COUNTERS = ("posts_total",)
+RECENT_MAX = 5000
+
+CSV_HEADER = ["timestamp", "metric", "value", "labels"]
+
+HELP = {
+    "post_stage_seconds": "Thời gian chạy từng stage của pipeline đăng bài (boot gồm cả boot_wait)",
+    "post_stage_total": "Số lần chạy stage theo kết quả (ok/failed/timeout/stopped/cancelled)",
+    "post_duration_seconds": "Tổng thời gian 1 post trong pipeline (chờ khóa VM → dọn dẹp xong)",
+    "posts_total": "Số post theo kết quả cuối (posted/failed/stopped)",
+    "post_start_delay_seconds": "Độ trễ từ giờ hẹn đến lúc post bắt đầu chạy",
+    "stream_scan_seconds": "Thời gian quét kênh của 1 luồng theo dõi",
+}
+
+
+class Histogram:
+    """Histogram bucket cố định (cộng dồn kiểu Prometheus khi xuất)"""
+
+    __slots__ = ("buckets", "counts", "count", "sum", "max")
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Phần tử cuối = +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other: "Histogram"):
+        for i, c in enumerate(other.counts):
+            self.counts[i] += c
+        self.count += other.count
+        self.sum += other.sum
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q: float) -> float:
+        """Ước lượng phân vị bằng nội suy tuyến tính trong bucket"""
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        lower = 0.0
+        for i, c in enumerate(self.counts):
+            upper = self.buckets[i] if i < len(self.buckets) else self.max
+            if seen + c >= rank and c > 0:
+                return min(lower + (upper - lower) * (rank - seen) / c, self.max)
+            seen += c
+            lower = upper
+        return self.max
+
+
+def _label_key(labels: dict) -> tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items() if v is not None))
+
+
+def _format_labels(key: tuple, extra: tuple = ()) -> str:
+    items = key + extra
+    if not items:
+        return ""
+    parts = []
+    for k, v in items:
+        v = v.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+        parts.append(f'{k}="{v}"')
+    return "{" + ",".join(parts) + "}"
+
+
+def _format_le(bound) -> str:
+    return "+Inf" if bound is None else repr(float(bound))
+
+
+class MetricsRegistry:
+    """Singleton registry: histogram + counter, exporter HTTP và CSV"""
+
+    _instance = None
+    _creation_lock = threading.Lock()
+
+    def __new__(cls):
+        if cls._instance is None:
+            with cls._creation_lock:
+                if cls._instance is None:
+                    cls._instance = super().__new__(cls)
+        return cls._instance
+
+    def __init__(self):
+        if not hasattr(self, '_initialized'):
+            self._lock = threading.Lock()
+            self._histograms = {}  # {name: {label_key: Histogram}}
+            self._counters = {}    # {name: {label_key: float}}
+            self._recent = deque(maxlen=RECENT_MAX)  # (timestamp, name, label_key) của RECENT_COUNTERS
+            self._csv_buffer = deque(maxlen=CSV_BUFFER_MAX)
+            self._csv_enabled = False
+            self._csv_thread = None
+            self._stop_event = threading.Event()
+            self._http_server = None
+            self.logger = logging.getLogger(__name__)
+            self._initialized = True
+
+    # ==================== RECORD ====================
+    def observe(self, name: str, value: float, **labels):
+        """Ghi 1 giá trị (giây) vào histogram name với labels"""
+        key = _label_key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            hist = series.get(key)
+            if hist is None:
+                hist = series[key] = Histogram()
+            hist.observe(value)
+        if self._csv_enabled:
+            self._csv_buffer.append((time.time(), name, value, key))
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        """Tăng counter name với labels"""
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+            if name in RECENT_COUNTERS:
+                self._recent.append((time.time(), name, key))
+
+    @contextmanager
+    def time(self, name: str, **labels):
+        """Context manager: observe thời gian chạy của khối lệnh"""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(name, time.monotonic() - start, **labels)
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+            self._recent.clear()
+
+    # ==================== QUERY ====================
+    def render_prometheus(self) -> str:
+        """Xuất toàn bộ metrics theo Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            for name in sorted(self._counters):
+                lines.append(f"# HELP {name} {HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} counter")
+                for key, value in sorted(self._counters[name].items()):
+                    lines.append(f"{name}{_format_labels(key)} {value:g}")
+            for name in sorted(self._histograms):
+                lines.append(f"# HELP {name} {HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} histogram")
+                for key, hist in sorted(self._histograms[name].items()):
+                    cumulative = 0
+                    bounds = list(hist.buckets) + [None]
+                    for bound, c in zip(bounds, hist.counts):
+                        cumulative += c
+                        le = (("le", _format_le(bound)),)
+                        lines.append(f"{name}_bucket{_format_labels(key, le)} {cumulative}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {hist.sum:.6f}")
+                    lines.append(f"{name}_count{_format_labels(key)} {hist.count}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self, name: str = "post_stage_seconds", group_by: str = "stage") -> list:
+        """
+        Thống kê histogram name gộp theo 1 label (mặc định: stage, gộp mọi VM).
+
+        Returns:
+            list[dict]: {group, count, mean, p50, p95, max, total} - sắp xếp theo p95 giảm dần
+        """
+        groups = {}
+        with self._lock:
+            for key, hist in self._histograms.get(name, {}).items():
+                group = dict(key).get(group_by, "")
+                merged = groups.get(group)
+                if merged is None:
+                    merged = groups[group] = Histogram(hist.buckets)
+                merged.merge(hist)
+
+        rows = []
+        for group, hist in groups.items():
+            if hist.count == 0:
+                continue
+            rows.append({
+                group_by: group,
+                "count": hist.count,
+                "mean": round(hist.sum / hist.count, 3),
+                "p50": round(hist.quantile(0.5), 3),
+                "p95": round(hist.quantile(0.95), 3),
+                "max": round(hist.max, 3),
+                "total": round(hist.sum, 3),
+            })
+        rows.sort(key=lambda r: r["p95"], reverse=True)
+        return rows
+
+    def recent(self, name: str, since: float = None) -> list:
+        """Các lần tăng gần nhất của counter trong RECENT_COUNTERS. Returns: list (timestamp, labels dict), cũ trước"""
+        with self._lock:
+            events = [(ts, key) for ts, n, key in self._recent if n == name and (since is None or ts >= since)]
+        return [(ts, dict(key)) for ts, key in events]
+
+    def mean(self, name: str, default: float = None, **labels):
+        """Trung bình histogram name gộp mọi series có đủ labels (chưa có mẫu → default)"""
+        wanted = set(_label_key(labels))
+        count = 0
+        total = 0.0
+        with self._lock:
+            for key, hist in self._histograms.get(name, {}).items():
+                if wanted.issubset(key):
+                    count += hist.count
+                    total += hist.sum
+        return total / count if count else default
+
+    def format_summary(self, name: str = "post_stage_seconds", group_by: str = "stage") -> str:
+        """Bảng text (để log) - stage chậm nhất trước"""
+        rows = self.summary(name, group_by)
+        if not rows:
+            return "(chưa có dữ liệu)"
+        lines = [f"{group_by:<12} {'count':>6} {'mean':>8} {'p50':>8} {'p95':>8} {'max':>8}"]
+        for r in rows:
+            lines.append(f"{r[group_by]:<12} {r['count']:>6} {r['mean']:>8.1f} "
+                         f"{r['p50']:>8.1f} {r['p95']:>8.1f} {r['max']:>8.1f}")
+        return "\n".join(lines)
+
+    # ==================== EXPORTERS ====================
+    def start_exporters(self):
+        """Bật HTTP /metrics và CSV cuộn theo cấu hình trong constants.py (gọi 1 lần khi mở app)"""
+        if METRICS_CSV_ENABLED and self._csv_thread is None:
+            os.makedirs(METRICS_DIR, exist_ok=True)
+            self._csv_enabled = True
+            self._stop_event.clear()
+            self._csv_thread = threading.Thread(target=self._csv_loop, daemon=True, name="MetricsCSV")
+            self._csv_thread.start()
+        if METRICS_HTTP_ENABLED and self._http_server is None:
+            self.start_http_server(METRICS_HTTP_HOST, METRICS_HTTP_PORT)
+
+    def start_http_server(self, host: str = "127.0.0.1", port: int = 9464) -> bool:
+        """
+        Mở HTTP server local (thread daemon).
+
+        Returns:
+            bool: False nếu không mở được (vd: port đã bị chiếm)
+        """
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = self.path.split("?", 1)[0]
+                if path == "/metrics":
+                    body = registry.render_prometheus().encode("utf-8")
+                    content_type = "text/plain; version=0.0.4; charset=utf-8"
+                elif path == "/summary":
+                    body = json.dumps({
+                        "by_stage": registry.summary(group_by="stage"),
+                        "by_vm": registry.summary(group_by="vm"),
+                    }, ensure_ascii=False).encode("utf-8")
+                    content_type = "application/json; charset=utf-8"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # Không spam log mỗi lần scrape
+
+        try:
+            server = ThreadingHTTPServer((host, port), Handler)
+        except OSError as e:
+            self.logger.warning(f"⚠️ Không mở được metrics endpoint {host}:{port}: {e}")
+            return False
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True, name="MetricsHTTP").start()
+        self._http_server = server
+        self.logger.info(f"📊 Metrics endpoint: http://{host}:{server.server_address[1]}/metrics")
+        return True
+
+    def _csv_loop(self):
+        while not self._stop_event.wait(METRICS_CSV_FLUSH_INTERVAL):
+            self.flush_csv()
+        self.flush_csv()
+
+    def flush_csv(self):
+        """Ghi các lần đo đang chờ vào CSV của ngày hiện tại, xóa file quá hạn"""
+        if not self._csv_buffer:
+            return
+        rows = []
+        while self._csv_buffer:
+            try:
+                rows.append(self._csv_buffer.popleft())
+            except IndexError:
+                break
+
+        by_day = {}
+        for ts, name, value, key in rows:
+            day = datetime.fromtimestamp(ts).strftime("%Y-%m-%d")
+            by_day.setdefault(day, []).append(
+                [datetime.fromtimestamp(ts).isoformat(timespec="seconds"), name,
+                 f"{value:.3f}", ";".join(f"{k}={v}" for k, v in key)]
+            )
+        try:
+            os.makedirs(METRICS_DIR, exist_ok=True)
+            for day, day_rows in by_day.items():
+                path = os.path.join(METRICS_DIR, f"metrics_{day}.csv")
+                is_new = not os.path.exists(path)
+                with open(path, "a", encoding="utf-8", newline="") as f:
+                    writer = csv.writer(f)
+                    if is_new:
+                        writer.writerow(CSV_HEADER)
+                    writer.writerows(day_rows)
+            self._remove_old_csv()
+        except Exception as e:
+            self.logger.warning(f"⚠️ Lỗi ghi metrics CSV: {e}")
+
+    def _remove_old_csv(self):
+        cutoff = (datetime.now() - timedelta(days=METRICS_CSV_KEEP_DAYS)).strftime("%Y-%m-%d")
+        for name in os.listdir(METRICS_DIR):
+            if name.startswith("metrics_") and name.endswith(".csv") and name[8:18] < cutoff:
+                try:
+                    os.remove(os.path.join(METRICS_DIR, name))
+                except Exception:
+                    pass
+
+    def shutdown(self):
+        """Dừng exporter, ghi nốt CSV và log bảng stage chậm nhất"""
+        if self._csv_thread is not None:
+            self._stop_event.set()
+            self._csv_thread.join(timeout=5)
+            self._csv_thread = None
+            self._csv_enabled = False
+        if self._http_server is not None:
+            try:
+                self._http_server.shutdown()
+                self._http_server.server_close()
+            except Exception:
+                pass
+            self._http_server = None
+        if self.summary():
+            self.logger.info("📊 Thời gian theo stage (chậm nhất trước):\n" + self.format_summary())
+
+
+# Global singleton instance
+metrics = MetricsRegistry()
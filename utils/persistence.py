@@ -0,0 +1,183 @@
+"""
+Persistence Utilities - Đọc/ghi JSON dùng chung cho toàn tool
+
+- JSON compact (không indent) → file nhỏ hơn, serialize nhanh hơn
+- Dùng orjson nếu đã cài, fallback về json (stdlib) nếu không có
+- Ghi atomic: ghi ra file tmp riêng (mkstemp, cùng thư mục) + fsync rồi os.replace
+  → không bao giờ để lại file ghi dở, nhiều thread ghi cùng file không trộn nội dung
+- Streaming writer cho list lớn (vd: hàng chục nghìn scheduled posts)
+"""
+import os
+import json
+import logging
+import tempfile
+
+try:
+    import orjson  # optional - pip install orjson
+except ImportError:
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+# Separators compact cho stdlib json (bỏ khoảng trắng thừa)
+_COMPACT_SEPARATORS = (",", ":")
+
+# Số phần tử encode mỗi lần ghi khi streaming
+STREAM_CHUNK_SIZE = 500
+
+
+# ==================== ENCODE / DECODE ====================
+def dumps(data) -> bytes:
+    """
+    Serialize data thành JSON compact (UTF-8 bytes).
+
+    Args:
+        data: Object JSON-serializable
+
+    Returns:
+        bytes: JSON đã encode UTF-8
+    """
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, ensure_ascii=False, separators=_COMPACT_SEPARATORS).encode("utf-8")
+
+
+def loads(raw):
+    """
+    Parse JSON từ bytes hoặc str.
+
+    Args:
+        raw: bytes/str chứa JSON
+
+    Returns:
+        Object đã parse
+    """
+    if orjson is not None:
+        return orjson.loads(raw)
+    if isinstance(raw, (bytes, bytearray)):
+        raw = raw.decode("utf-8")
+    return json.loads(raw)
+
+
+def load_json(path, default=None):
+    """
+    Đọc file JSON, trả về default nếu file không tồn tại.
+
+    Lỗi parse (file hỏng) vẫn raise để caller tự quyết định backup/báo lỗi.
+
+    Args:
+        path: Đường dẫn file JSON
+        default: Giá trị trả về khi file không tồn tại
+
+    Returns:
+        Object đã parse hoặc default
+    """
+    if not os.path.exists(path):
+        return default
+    with open(path, "rb") as f:
+        return loads(f.read())
+
+
+# ==================== ATOMIC WRITE ====================
+def _ensure_parent_dir(path):
+    parent = os.path.dirname(path)
+    if parent:
+        os.makedirs(parent, exist_ok=True)
+
+
+def _open_tmp(path):
+    """File tmp tên riêng cùng thư mục với path (mỗi lần ghi 1 file → các thread không ghi đè nhau)"""
+    fd, tmp = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp",
+                               dir=os.path.dirname(path) or ".")
+    return os.fdopen(fd, "wb"), tmp
+
+
+def _finish(f, fsync):
+    """Flush + fsync trên chính handle đang ghi (mở lại O_RDONLY để fsync không chạy trên Windows)"""
+    f.flush()
+    if fsync:
+        os.fsync(f.fileno())
+
+
+def _discard(tmp):
+    try:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    except OSError:
+        pass
+
+
+def atomic_write_json(path, data, fsync=True):
+    """
+    Ghi JSON compact ra file theo kiểu atomic (tmp + os.replace).
+
+    Args:
+        path: Đường dẫn file đích
+        data: Object JSON-serializable
+        fsync: True = flush xuống đĩa trước khi replace
+
+    Returns:
+        int: Số bytes đã ghi
+    """
+    _ensure_parent_dir(path)
+    payload = dumps(data)
+    f, tmp = _open_tmp(path)
+    try:
+        with f:
+            f.write(payload)
+            _finish(f, fsync)
+        os.replace(tmp, path)  # atomic trên Windows/Unix
+    except Exception:
+        _discard(tmp)
+        raise
+    return len(payload)
+
+
+def atomic_write_json_stream(path, items, wrap_key=None, chunk_size=STREAM_CHUNK_SIZE, fsync=True):
+    """
+    Ghi list lớn ra JSON theo từng chunk, không dựng cả chuỗi JSON trong RAM.
+
+    Kết quả giống hệt atomic_write_json(path, list(items)) hoặc
+    atomic_write_json(path, {wrap_key: list(items)}) nếu có wrap_key.
+
+    Args:
+        path: Đường dẫn file đích
+        items: Iterable các object JSON-serializable (có thể là generator)
+        wrap_key: Nếu có, ghi dạng {"wrap_key": [...]} (vd: "posts")
+        chunk_size: Số phần tử encode mỗi lần ghi
+        fsync: True = flush xuống đĩa trước khi replace
+
+    Returns:
+        int: Số phần tử đã ghi
+    """
+    _ensure_parent_dir(path)
+    f, tmp = _open_tmp(path)
+    count = 0
+    try:
+        with f:
+            if wrap_key is not None:
+                f.write(b"{" + dumps(wrap_key) + b":[")
+            else:
+                f.write(b"[")
+
+            buf = []
+            for item in items:
+                buf.append(dumps(item))
+                count += 1
+                if len(buf) >= chunk_size:
+                    if count > len(buf):
+                        f.write(b",")
+                    f.write(b",".join(buf))
+                    buf = []
+            if buf:
+                if count > len(buf):
+                    f.write(b",")
+                f.write(b",".join(buf))
+
+            f.write(b"]}" if wrap_key is not None else b"]")
+            _finish(f, fsync)
+        os.replace(tmp, path)
+    except Exception:
+        _discard(tmp)
+        raise
+    return count
@@ -3,12 +3,11 @@ Instagram post automation module.
 
 Handles automatic Instagram post creation using UIAutomator2.
 """
-import time
-import subprocess
-import uiautomator2 as u2
-
 from utils.base_instagram import BaseInstagramAutomation
-from utils.screenshot import take_screenshot
+from utils.cancel_token import OperationCancelled, run as cancellable_run
+from utils.forensics import forensics
+from utils.media_store import scan_media, wait_media_indexed
+from utils.ui_replay import recorded
 from config import ADB_EXE
 from constants import (
     WAIT_SHORT, WAIT_MEDIUM, WAIT_LONG, WAIT_EXTRA_LONG,
@@ -20,7 +19,7 @@ from constants import (
     XPATH_ACTION_BAR_TEXT, XPATH_SHARE_BUTTON, XPATH_SHARE_BUTTON_2,XPATH_ALLOW_2, XPATH_CANCEL_BUTTON_ID,XPATH_SHARE_TO,XPATH_NOT_SHARE,
     XPATH_PENDING_MEDIA, XPATH_ACTION_LEFT_CONTAINER,XPATH_POST,XPATH_FIRST_BOX,XPATH_progress_bar,
     CONTENT_DESC_CREATE_NEW, CONTENT_DESC_CREATE_POST,
-    CHROME_PACKAGE, INSTAGRAM_PACKAGE, RESOURCE_ID_LEFT_ACTION
+    CHROME_PACKAGE, INSTAGRAM_PACKAGE, RESOURCE_ID_LEFT_ACTION, DCIM_PATH
 )
 
 
@@ -31,14 +30,23 @@ class InstagramPost(BaseInstagramAutomation):
     Inherits from BaseInstagramAutomation for shared functionality.
     """
 
-    def __init__(self, log_callback=None):
+    FLOW = "post"
+
+    def __init__(self, log_callback=None, cancel_token=None, mirror_logger=True, post_id=None):
         """
         Initialize Instagram post handler.
 
         Args:
             log_callback: Optional callback function for logging (vm_name, message)
+            cancel_token: Optional CancelToken - auto_post dừng và trả về False khi bị cancel
+            mirror_logger: False → log INFO không ghi lại vào root logger (đã có trong trace log)
+            post_id: ID post / job - index của forensics bundle khi thất bại
         """
-        super().__init__(log_callback)
+        super().__init__(log_callback, cancel_token, mirror_logger)
+        self.post_id = post_id
+        self._device = None  # uiautomator2 device của auto_post đang chạy (dump hierarchy cho forensics)
+        self.shared = False    # Đã nhấn Share → không được đăng lại video này (pipeline không retry)
+        self.rejected = False  # Instagram báo đăng thất bại (nút Retry) sau khi Share
 
     def _retry_mediastore_broadcast(self, adb_address: str, video_filename: str, vm_name: str, max_retries: int = 3):
         """
@@ -47,6 +55,7 @@ class InstagramPost(BaseInstagramAutomation):
         Strategy:
         - Lần 1-2: Scan file cụ thể
         - Lần 3: Scan toàn bộ DCIM folder (force full refresh)
+        - Sau mỗi lần: query content://media (tối đa 3s) - đã index thì dừng, chưa thì sang lần kế
 
         Args:
             adb_address: ADB device address (e.g., "emulator-5554")
@@ -55,7 +64,7 @@ class InstagramPost(BaseInstagramAutomation):
             max_retries: Maximum number of retries (default: 3)
 
         Returns:
-            bool: True if broadcast successful
+            bool: True if MediaStore indexed the file (or broadcast OK when MediaStore can't be queried)
         """
         if not video_filename:
             self.log(vm_name, "⚠️ Không có video_filename để retry broadcast")
@@ -68,59 +77,57 @@ class InstagramPost(BaseInstagramAutomation):
                 # ✅ v1.5.32: Lần cuối cùng scan toàn bộ DCIM folder thay vì từng file
                 if attempt == max_retries:
                     self.log(vm_name, f"🔁 Retry {attempt}/{max_retries}: Scan toàn bộ DCIM folder...")
-                    # Scan entire DCIM folder
-                    subprocess.run([
-                        ADB_EXE, "-s", adb_address, "shell",
-                        "am", "broadcast", "-a", "android.intent.action.MEDIA_SCANNER_SCAN_FILE",
-                        "-d", "file:///sdcard/DCIM"
-                    ],
-                    capture_output=True, text=True, encoding="utf-8", errors="ignore",
-                    creationflags=subprocess.CREATE_NO_WINDOW,
-                    timeout=15  # Timeout lâu hơn cho folder scan
-                    )
+                    scan_media(adb_address, [DCIM_PATH], cancel_token=self.cancel_token,
+                               timeout=15)  # Timeout lâu hơn cho folder scan
                 else:
                     self.log(vm_name, f"🔁 Retry {attempt}/{max_retries}: Scan file {video_filename}...")
-                    # Scan specific file
-                    subprocess.run([
-                        ADB_EXE, "-s", adb_address, "shell",
-                        "am", "broadcast", "-a", "android.intent.action.MEDIA_SCANNER_SCAN_FILE",
-                        "-d", f"file://{remote_path}"
-                    ],
-                    capture_output=True, text=True, encoding="utf-8", errors="ignore",
-                    creationflags=subprocess.CREATE_NO_WINDOW,
-                    timeout=10
-                    )
+                    scan_media(adb_address, [remote_path], cancel_token=self.cancel_token, timeout=10)
 
                 self.log(vm_name, f"✅ Đã broadcast MediaStore (lần {attempt})")
-                time.sleep(3)  # Tăng từ 2s lên 3s để đợi MediaStore update
-                return True
+                # Query content://media thay vì sleep 3s cố định - trả về ngay khi đã index
+                indexed = wait_media_indexed(adb_address, [remote_path], timeout=3, rescan_after=None,
+                                             log_callback=lambda msg: self.log(vm_name, msg),
+                                             cancel_token=self.cancel_token)
+                if indexed is None:
+                    self.sleep(3)  # Không query được MediaStore → chờ như cũ
+                    return True
+                if indexed:
+                    self.log(vm_name, f"✅ MediaStore đã index {video_filename}")
+                    return True
+            except OperationCancelled:
+                raise
             except Exception as e:
                 self.log(vm_name, f"⚠️ Lỗi retry broadcast (lần {attempt}): {e}")
                 if attempt < max_retries:
-                    time.sleep(1)
+                    self.sleep(1)
 
         return False
 
     def _capture_failure_screenshot(self, adb_address: str, vm_name: str, reason: str):
         """
-        Chụp màn hình khi automation thất bại để debug UI changes.
+        Chụp forensics bundle khi automation thất bại để debug UI changes.
+
+        Chỉ lấy screenshot + UI hierarchy + logcat + các bước log vào RAM (vài trăm ms);
+        nén và ghi file ở thread nền sau (utils/forensics.py) - không kéo dài thời gian giữ VM.
 
         Args:
             adb_address: ADB device address (e.g., "emulator-5554")
             vm_name: Virtual machine name
-            reason: Lý do thất bại (để log)
+            reason: Lý do thất bại (để log + index bundle)
         """
         try:
-            screenshot_path = take_screenshot(adb_address, ADB_EXE, vm_name)
-            if screenshot_path:
-                self.log(vm_name, f"📸 Screenshot đã lưu: {screenshot_path}")
+            bundle_id = forensics.capture(adb_address, vm_name, reason, post_id=self.post_id,
+                                          u2_device=self._device, steps=list(self.steps), adb_path=ADB_EXE)
+            if bundle_id:
+                self.log(vm_name, f"📸 Đã chụp forensics bundle {bundle_id} (screenshot + UI + logcat)")
                 self.log(vm_name, f"   💡 Lý do: {reason}")
-                self.log(vm_name, f"   🔍 Kiểm tra ảnh để xem Instagram có đổi UI không")
+                self.log(vm_name, "   🔍 Kiểm tra logs/forensics/ để xem Instagram có đổi UI không")
             else:
-                self.log(vm_name, "⚠️ Không thể chụp screenshot")
+                self.log(vm_name, "⚠️ Không thể chụp forensics bundle")
         except Exception as e:
-            self.log(vm_name, f"⚠️ Lỗi khi chụp screenshot: {e}")
+            self.log(vm_name, f"⚠️ Lỗi khi chụp forensics: {e}")
 
+    @recorded
     def auto_post(self, vm_name: str, adb_address: str, title: str, use_launchex: bool = False,
                   ldconsole_exe: str = None, video_filename: str = None) -> bool:
         """
@@ -138,9 +145,13 @@ class InstagramPost(BaseInstagramAutomation):
             bool: True if post successful
         """
         d = None
+        self.shared = False
+        self.rejected = False
         try:
             self.log(vm_name, f"🔌 Kết nối tới {adb_address}")
-            d = u2.connect(adb_address)
+            d = self.connect(adb_address, vm_name, use_launchex=bool(use_launchex and ldconsole_exe),
+                             video_filename=bool(video_filename))
+            self._device = d
 
             self.log(vm_name, "🔄 Bắt đầu đăng bài...")
 
@@ -150,14 +161,17 @@ class InstagramPost(BaseInstagramAutomation):
                 self.log(vm_name, "📱 Mở ứng dụng Instagram bằng launchex...")
                 import subprocess
                 try:
-                    subprocess.run(
+                    cancellable_run(
                         [ldconsole_exe, "launchex", "--name", vm_name,
                          "--packagename", "com.instagram.android"],
+                        token=self.cancel_token,
                         creationflags=subprocess.CREATE_NO_WINDOW,
                         timeout=10
                     )
-                    time.sleep(WAIT_EXTRA_LONG)
+                    self.sleep(WAIT_EXTRA_LONG)
                     self.log(vm_name, "✅ Đã mở Instagram app")
+                except OperationCancelled:
+                    raise
                 except Exception as e:
                     self.log(vm_name, f"❌ Lỗi mở Instagram bằng launchex: {e}", "ERROR")
                     return False
@@ -174,7 +188,7 @@ class InstagramPost(BaseInstagramAutomation):
                     else:
                         d.app_stop(CHROME_PACKAGE)
                         self.log(vm_name, f"Thử lại lần {i+1}/{MAX_RETRY_OPEN_APP}...")
-                        time.sleep(WAIT_SHORT)
+                        self.sleep(WAIT_SHORT)
                 else:
                     self.log(vm_name, f"❌ Không tìm thấy app Instagram sau {MAX_RETRY_OPEN_APP} lần thử", "ERROR")
                     return False
@@ -244,7 +258,7 @@ class InstagramPost(BaseInstagramAutomation):
                             return False
                         break
 
-                    time.sleep(WAIT_SHORT)
+                    self.sleep(WAIT_SHORT)
                 else:
                     self.log(vm_name, f"❌ Không tìm thấy Create tab hoặc nút trái sau {MAX_RETRY_FIND_TAB} lần", "ERROR")
                     self._capture_failure_screenshot(adb_address, vm_name, "Không tìm thấy Create tab - Instagram có thể đã đổi layout")
@@ -281,12 +295,12 @@ class InstagramPost(BaseInstagramAutomation):
 
                         # Back ra khỏi gallery picker
                         d.press("back")
-                        time.sleep(2)
+                        self.sleep(2)
 
                         # Vào lại Post gallery
                         self.log(vm_name, "🔄 Mở lại gallery picker...")
                         self.safe_click(d, XPATH_POST, sleep_after=WAIT_SHORT, vm_name=vm_name, description="Post selector (retry)")
-                        time.sleep(2)
+                        self.sleep(2)
 
                         # Check lần cuối
                         if not self.wait_for_element(d, XPATH_FIRST_BOX, vm_name=vm_name, description="first box (after refresh)", timeout=WAIT_LONG):
@@ -305,7 +319,7 @@ class InstagramPost(BaseInstagramAutomation):
                 self.log(vm_name, "✅ File đã có trong gallery")
 
 
-            time.sleep(3)
+            self.sleep(3)
             # Click Next (top)
             self.log(vm_name, "Nhấn Next (trên)")
             if not self.safe_click(d, XPATH_NEXT_BUTTON, sleep_after=WAIT_LONG,
@@ -360,6 +374,7 @@ class InstagramPost(BaseInstagramAutomation):
                         self.log(vm_name, "❌ Nút share đã enable nhưng không ấn được", "ERROR")
                         self._capture_failure_screenshot(adb_address, vm_name, "Nút share đã enable nhưng không ấn được - UI upload có thể đã thay đổi")
                         return False
+                    self.shared = True
                 else:
                     self.log(vm_name,"❌ Nút share không enable","ERROR")
                     self._capture_failure_screenshot(adb_address, vm_name, "Nút share không enable")
@@ -414,6 +429,7 @@ class InstagramPost(BaseInstagramAutomation):
                 
                 if d.xpath(XPATH_RETRY_MEDIA).exists:
                     self.log(vm_name, "❌ Đăng không thành công - Instagram từ chối post")
+                    self.rejected = True
                     self._capture_failure_screenshot(adb_address, vm_name, "Instagram từ chối đăng bài - Có thể video vi phạm guidelines hoặc UI thay đổi")
                     return False
 
@@ -421,13 +437,16 @@ class InstagramPost(BaseInstagramAutomation):
                     self.safe_click(d, XPATH_CANCEL_BUTTON_ID, sleep_after=1,
                           vm_name=vm_name, optional=True, timeout=3)
 
-                time.sleep(WAIT_SHORT)
+                self.sleep(WAIT_SHORT)
             else:
                 self.log(vm_name, "⚠️ Không thấy thông báo đăng bài, nhưng có thể đã post thành công", "WARNING")
 
-            time.sleep(WAIT_MEDIUM)
+            self.sleep(WAIT_MEDIUM)
             return True
 
+        except OperationCancelled:
+            self.log(vm_name, "🛑 Đã dừng đăng bài theo yêu cầu", "WARNING")
+            return False
         except Exception as e:
             self.log(vm_name, f"❌ Lỗi tự động đăng bài: {e}", "ERROR")
             self.logger.exception("Exception in auto_post")
@@ -0,0 +1,825 @@
+"""
+Post Pipeline - Chạy vòng đời 1 post bằng asyncio thay vì 1 thread/post.
+
+Trước đây PostScheduler tạo 1 thread cho mỗi post và Stream.worker chạy tuần tự
+toàn bộ flow blocking (time.sleep, subprocess, uiautomator2). Post đang chờ khóa
+VM hay chờ lượt boot vẫn chiếm nguyên 1 thread, và yêu cầu dừng chỉ có hiệu lực
+ở vài checkpoint giữa các bước dài.
+
+Pipeline gồm các stage, mỗi stage có timeout riêng (PIPELINE_STAGE_TIMEOUTS):
+    acquire → boot → adb_ready → prefetch → push → verify → post → teardown
+
+- 1 event loop (thread riêng) điều phối mọi post đang chạy
+- Chờ khóa VM / lượt boot / VM status / ADB state = poll async, không giữ thread
+- Lệnh blocking (adb, ldconsole, download, uiautomator2) chạy trong executor
+  giới hạn PIPELINE_MAX_WORKERS thread
+- prefetch (tải video) chạy song song với boot, chỉ sau khi đã khóa được VM
+- Yêu cầu dừng: job bị cancel trong PIPELINE_STOP_POLL giây, teardown luôn chạy;
+  job.cancel_token bị cancel theo → lệnh blocking trong executor cũng thoát ngay
+- Khóa VM = lease có fencing token (utils/vm_lock): mọi stage sau acquire chạy trong fence,
+  lệnh adb/ldconsole bị chặn (LeaseLostError) nếu lease đã hết hạn và bị process khác lấy
+- Trace: mỗi stage là 1 span (utils/trace_log) - log trong stage mang span/stage,
+  kết thúc stage ghi event kind="span" (dur, result), kết thúc job ghi kind="post"
+
+Sử dụng:
+    job = PostJob(post.id, post.vm_name, post.video_path, post.title, log=post.log,
+                  stop_check=lambda: post.stop_requested)
+    post_pipeline.submit(job, on_done=handle_result)   # non-blocking
+    job = post_pipeline.run(job)                        # blocking (trong worker thread)
+"""
+import os
+import asyncio
+import threading
+import logging
+import subprocess
+import time
+import contextvars
+import concurrent.futures
+
+from config import ADB_EXE, LDCONSOLE_EXE
+from constants import (
+    WAIT_SHORT, WAIT_EXTRA_LONG,
+    PIPELINE_MAX_WORKERS, PIPELINE_STOP_POLL, PIPELINE_LOCK_POLL, PIPELINE_STAGE_TIMEOUTS,
+    VM_PRIORITY_STREAM
+)
+from utils.vm_manager import vm_manager
+from utils.vm_registry import vm_registry
+from utils.warm_vm import warm_vm_pool
+from utils.remote_media import remote_media, remote_path_for
+from utils.boot_admission import boot_admission
+from utils.cancel_token import CancelToken
+from utils.vm_lock import vm_locks, check_fence, set_fence, reset_fence
+from utils.metrics import metrics
+from utils.trace_log import new_span_id
+
+# Kết quả cuối cùng của job
+OUTCOME_POSTED = "posted"
+OUTCOME_FAILED = "failed"
+OUTCOME_STOPPED = "stopped"
+
+STAGES = ("acquire", "boot", "adb_ready", "prefetch", "push", "verify", "post", "teardown")
+
+# Thời gian tối đa chờ các lệnh blocking còn dở (sau khi đã tắt VM) trước khi nhả khóa VM
+DRAIN_TIMEOUT = 30
+
+# Chu kỳ poll trạng thái VM / ADB (giây)
+STATUS_POLL_INTERVAL = 2
+
+_DEFAULT = object()
+
+# (span_id, stage) của stage đang chạy - riêng cho từng task (prefetch chạy song song boot)
+# và được copy sang executor thread → log từ download/verify/auto_post mang đúng span
+_current_span = contextvars.ContextVar("post_pipeline_span", default=None)
+
+
+class StageError(Exception):
+    """Stage thất bại (lỗi hoặc timeout) - attempt hiện tại thất bại"""
+
+    def __init__(self, stage: str, reason: str):
+        super().__init__(f"[{stage}] {reason}")
+        self.stage = stage
+        self.reason = reason
+
+
+class PostJob:
+    """
+    1 lần đăng video lên 1 máy ảo.
+
+    Args:
+        job_id: ID duy nhất (post.id hoặc stream:video)
+        vm_name: Tên máy ảo
+        source: Đường dẫn file local hoặc URL (YouTube/TikTok)
+        title: Caption
+        log: Callable(msg, level="INFO", kind="log", **fields) - ScheduledPost.log / Stream.log
+             (fields: post, span, stage, vm, dur, result... cho trace log)
+        stop_check: Callable → True nếu cần dừng ngay
+        has_more_work: Callable → True nếu VM còn việc kế tiếp (warm mode)
+        caller: Tên người gọi (log của vm_manager)
+        platform: "youtube" / "tiktok" / None (tự nhận diện từ URL)
+        max_attempts: Số lần thử tối đa
+        priority: Độ ưu tiên khi nhiều job chờ cùng VM (VM_PRIORITY_SCHEDULED / VM_PRIORITY_STREAM)
+        deadline: Epoch giây - hạn chót bắt đầu (post hẹn giờ), xếp trước khi cùng ưu tiên
+    """
+
+    def __init__(self, job_id, vm_name, source, title, log=None, stop_check=None,
+                 has_more_work=None, caller="", platform=None, max_attempts=2,
+                 priority=VM_PRIORITY_STREAM, deadline=None):
+        self.job_id = job_id
+        self.vm_name = vm_name
+        self.source = source
+        self.title = title
+        self._log = log or (lambda msg, **fields: None)
+        self.stop_check = stop_check
+        self.has_more_work = has_more_work
+        self.caller = caller or f"Pipeline:{str(title)[:20]}"
+        self.platform = platform
+        self.max_attempts = max_attempts
+        self.priority = priority
+        self.deadline = deadline
+
+        self.is_url = str(source).startswith("http")
+        self.adb_address = None
+        self.video_path = None if self.is_url else source
+        self.temp_video_path = None  # File tải về - xóa khi xong
+
+        # Trạng thái runtime
+        self.stage = None  # Stage chính đang chạy (prefetch chạy nền không ghi đè)
+        self.prefetching = False  # Task prefetch nền còn đang tải
+        self.attempt = 0
+        self.vm_acquired = False
+        self.vm_lease = None  # VMLease (fencing token) - lệnh adb/ldconsole kiểm tra trước khi chạy
+        self.boot_slot = False
+        self.boot_start = 0.0
+        self.warm_reuse = False
+        self.stage_times = {}  # {stage: giây}
+        self._pending = set()  # concurrent.futures đang chạy trong executor
+        self.cancel_token = CancelToken()  # Mới mỗi attempt - cancel khi attempt dừng/lỗi
+        self.poster = None  # InstagramPost của attempt hiện tại (đã nhấn Share chưa)
+
+        # Kết quả
+        self.outcome = None
+        self.failed_stage = None
+        self.error = None
+
+    @property
+    def shared(self) -> bool:
+        """Đã nhấn Share ở attempt hiện tại → video có thể đã lên Instagram, không được đăng lại"""
+        return self.poster is not None and self.poster.shared
+
+    def log(self, msg: str, level: str = "INFO"):
+        """Log 1 dòng, gắn post/span/stage hiện tại"""
+        span = _current_span.get()
+        span_id, stage = span if span else (None, self.stage)
+        self._log(msg, level=level, post=self.job_id, span=span_id, stage=stage, vm=self.vm_name)
+
+    def record(self, kind: str, **fields):
+        """Ghi event có cấu trúc (span/post) vào trace của job"""
+        self._log(None, kind=kind, post=self.job_id, vm=self.vm_name, **fields)
+
+    def stopped(self) -> bool:
+        try:
+            return bool(self.stop_check and self.stop_check())
+        except Exception:
+            return False
+
+
+class PostPipeline:
+    """Singleton: 1 event loop + 1 executor cho tất cả post đang chạy"""
+
+    _instance = None
+    _creation_lock = threading.Lock()
+
+    def __new__(cls):
+        if cls._instance is None:
+            with cls._creation_lock:
+                if cls._instance is None:
+                    cls._instance = super().__new__(cls)
+        return cls._instance
+
+    def __init__(self):
+        if not hasattr(self, '_initialized'):
+            self._loop = None
+            self._thread = None
+            self._executor = None
+            self._watcher = None
+            self._jobs = {}  # {job_id: (PostJob, asyncio.Task)} - chỉ truy cập trong loop thread
+            self._lock = threading.Lock()
+            self.logger = logging.getLogger(__name__)
+            self._initialized = True
+
+    # ==================== EVENT LOOP ====================
+    def _ensure_loop(self):
+        with self._lock:
+            if self._loop is not None and self._thread is not None and self._thread.is_alive():
+                return self._loop
+            self._executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=PIPELINE_MAX_WORKERS, thread_name_prefix="PipelineIO"
+            )
+            loop = asyncio.new_event_loop()
+            ready = threading.Event()
+
+            def run_loop():
+                asyncio.set_event_loop(loop)
+                loop.call_soon(ready.set)
+                loop.run_forever()
+                loop.close()
+
+            self._thread = threading.Thread(target=run_loop, daemon=True, name="PostPipelineLoop")
+            self._thread.start()
+            ready.wait(5)
+            self._loop = loop
+            self.logger.info(f"🧵 Post pipeline started (executor={PIPELINE_MAX_WORKERS} threads)")
+            return loop
+
+    def submit(self, job: PostJob, on_done=None) -> concurrent.futures.Future:
+        """
+        Đưa job vào pipeline (thread-safe, không chờ).
+
+        Args:
+            job: PostJob
+            on_done: Optional callable(job) - chạy trong executor khi job kết thúc
+
+        Returns:
+            concurrent.futures.Future → PostJob
+        """
+        loop = self._ensure_loop()
+        return asyncio.run_coroutine_threadsafe(self._run_job(job, on_done), loop)
+
+    def run(self, job: PostJob) -> PostJob:
+        """Chạy job và chờ kết quả (gọi từ worker thread, KHÔNG gọi trong loop thread)"""
+        return self.submit(job).result()
+
+    def cancel(self, job_id):
+        """Yêu cầu dừng 1 job (thread-safe)"""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._cancel_job, job_id)
+
+    def _cancel_job(self, job_id):
+        entry = self._jobs.get(job_id)
+        if entry and not entry[1].done():
+            entry[1].cancel()
+
+    def in_flight(self) -> dict:
+        """{job_id: stage hiện tại} của các job đang chạy"""
+        return {job_id: job.stage for job_id, (job, _) in list(self._jobs.items())}
+
+    def shutdown(self, timeout: float = 10):
+        """Cancel tất cả job (teardown vẫn chạy), chờ tối đa timeout giây rồi dừng loop"""
+        loop = self._loop
+        if loop is None or not loop.is_running():
+            return
+
+        async def _cancel_all():
+            tasks = [task for _, task in self._jobs.values() if not task.done()]
+            for task in tasks:
+                task.cancel()
+            if tasks:
+                await asyncio.wait(tasks, timeout=timeout)
+            if self._watcher is not None:
+                self._watcher.cancel()
+                self._watcher = None
+
+        try:
+            asyncio.run_coroutine_threadsafe(_cancel_all(), loop).result(timeout + 5)
+        except Exception as e:
+            self.logger.warning(f"⚠️ Pipeline shutdown: {e}")
+        loop.call_soon_threadsafe(loop.stop)
+        with self._lock:
+            self._loop = None
+            if self._executor:
+                self._executor.shutdown(wait=False)
+        self.logger.info("🧵 Post pipeline stopped")
+
+    async def _watch_stop_requests(self):
+        """1 task duy nhất kiểm tra stop_check của mọi job → cancel trong PIPELINE_STOP_POLL giây"""
+        while self._jobs:
+            for job, task in list(self._jobs.values()):
+                if not task.done() and job.outcome is None and job.stopped():
+                    job.outcome = OUTCOME_STOPPED
+                    task.cancel()
+            await asyncio.sleep(PIPELINE_STOP_POLL)
+        self._watcher = None
+
+    # ==================== HELPERS ====================
+    async def _blocking(self, job, func, *args, **kwargs):
+        """Chạy hàm blocking trong executor, theo dõi future để teardown chờ/drain"""
+        future = self._executor.submit(contextvars.copy_context().run, func, *args, **kwargs)
+        if job is not None:
+            job._pending.add(future)
+            future.add_done_callback(job._pending.discard)
+        return await asyncio.wrap_future(future)
+
+    async def _stage(self, job, name, coro, timeout=_DEFAULT, background=False):
+        """
+        Chạy 1 stage với timeout riêng, ghi lại thời gian chạy.
+
+        background=True: stage chạy song song stage chính (prefetch) → không ghi job.stage,
+        để failed_stage / lý do cancel / in_flight vẫn là stage chính.
+        """
+        if timeout is _DEFAULT:
+            timeout = PIPELINE_STAGE_TIMEOUTS.get(name)
+        if not background:
+            job.stage = name
+        span_id = new_span_id()
+        token = _current_span.set((span_id, name))
+        start = time.monotonic()
+        result = "failed"
+        try:
+            if timeout:
+                value = await asyncio.wait_for(coro, timeout)
+            else:
+                value = await coro
+            result = "ok"
+            return value
+        except asyncio.TimeoutError:
+            result = "timeout"
+            raise StageError(name, f"⏱️ Timeout {timeout}s ở bước {name}")
+        except asyncio.CancelledError:
+            result = "stopped" if job.outcome == OUTCOME_STOPPED else "cancelled"
+            raise
+        finally:
+            elapsed = time.monotonic() - start
+            _current_span.reset(token)
+            job.stage_times[name] = job.stage_times.get(name, 0.0) + elapsed
+            job.record("span", span=span_id, stage=name, dur=elapsed, result=result, attempt=job.attempt or None)
+            metrics.observe("post_stage_seconds", elapsed, stage=name, vm=job.vm_name)
+            metrics.inc("post_stage_total", stage=name, vm=job.vm_name, result=result)
+
+    async def _run_cmd(self, job, args, timeout=60):
+        """Chạy lệnh ldconsole/adb trong executor, log returncode nếu lỗi"""
+        def run():
+            check_fence()
+            return subprocess.run(
+                args,
+                creationflags=subprocess.CREATE_NO_WINDOW,
+                capture_output=True,
+                text=True,
+                encoding="utf-8",
+                errors="ignore",
+                timeout=timeout
+            )
+        result = await self._blocking(job, run)
+        if result.returncode != 0:
+            job.log(f"⚠️ {args[1].capitalize()} command returncode: {result.returncode}")
+            if result.stderr:
+                job.log(f"⚠️ {args[1].capitalize()} stderr: {result.stderr.strip()}")
+            if result.stdout:
+                job.log(f"ℹ️ {args[1].capitalize()} stdout: {result.stdout.strip()}")
+        return result
+
+    async def _vm_status(self, job):
+        try:
+            return await self._blocking(job, vm_manager.query_vm_status, job.vm_name, LDCONSOLE_EXE)
+        except Exception as e:
+            self.logger.warning(f"ldconsole list2 lỗi khi check VM '{job.vm_name}': {e}", extra={"vm": job.vm_name})
+            return "?"
+
+    async def _wait_vm_status(self, job, wanted: tuple, log_progress: bool = True):
+        """Poll ldconsole list2 đến khi status thuộc wanted (timeout do stage quyết định)"""
+        start = time.monotonic()
+        last_status = None
+        last_progress_log = 0
+        while True:
+            status = await self._vm_status(job)
+            elapsed = int(time.monotonic() - start)
+            if status in wanted:
+                return status
+            if log_progress and status != last_status:
+                status_name = {"0": "Tắt", "1": "Đang chạy", "2": "Đang khởi động"}.get(status, status)
+                job.log(f"   📊 VM status: {status_name} (sau {elapsed}s)")
+                last_status = status
+            if log_progress and elapsed - last_progress_log >= 15:
+                job.log(f"   ⏳ Vẫn đang chờ... ({elapsed}s, status={last_status})")
+                last_progress_log = elapsed
+            await asyncio.sleep(STATUS_POLL_INTERVAL)
+
+    async def _quit_vm(self, job):
+        """Tắt VM, chờ tắt hẳn rồi nghỉ WAIT_EXTRA_LONG như flow cũ (không giữ thread khi chờ)"""
+        warm_vm_pool.claim(job.vm_name)  # Không còn warm
+        start = time.monotonic()
+        try:
+            await self._run_cmd(job, [LDCONSOLE_EXE, "quit", "--name", job.vm_name], timeout=30)
+        except Exception as e:
+            job.log(f"⚠️ Lỗi tắt máy ảo: {e}")
+        try:
+            await asyncio.wait_for(self._wait_vm_status(job, ("0", None), log_progress=False), 60)
+        except asyncio.TimeoutError:
+            self.logger.warning(f"⏱️ Máy ảo '{job.vm_name}' chưa tắt hẳn sau 60s", extra={"vm": job.vm_name})
+        await asyncio.sleep(WAIT_EXTRA_LONG)
+        warm_vm_pool.record_shutdown(time.monotonic() - start)
+
+    def _release_boot_slot(self, job, boot_seconds=None, success=True):
+        if job.boot_slot:
+            boot_admission.release(job.vm_name, boot_seconds=boot_seconds, success=success)
+            job.boot_slot = False
+
+    def _remove_temp(self, job):
+        path = job.temp_video_path
+        job.temp_video_path = None
+        if path and os.path.exists(path):
+            try:
+                os.remove(path)
+                job.log(f"🗑️ Đã xóa file temp: {os.path.basename(path)}")
+            except Exception as e:
+                job.log(f"⚠️ Không thể xóa file temp: {e}")
+
+    # ==================== STAGES ====================
+    async def _acquire(self, job):
+        """Chờ khóa máy ảo (poll non-blocking, không giữ thread)"""
+        job.log(f"🔒 Chờ máy ảo '{job.vm_name}' sẵn sàng...")
+        waiter = vm_locks.enqueue(job.vm_name, job.caller, priority=job.priority, deadline=job.deadline)
+        last_position = None
+        try:
+            while True:
+                lease = vm_manager.try_acquire_vm(job.vm_name, caller=job.caller, waiter=waiter)
+                if lease:
+                    break
+                position = vm_locks.position(waiter)
+                if position and position != last_position and position[1] > 1:
+                    job.log(f"⏳ Hàng chờ máy ảo '{job.vm_name}': vị trí {position[0]}/{position[1]}")
+                    last_position = position
+                await asyncio.sleep(PIPELINE_LOCK_POLL)
+        finally:
+            vm_locks.dequeue(waiter)  # Bị dừng / timeout khi đang chờ
+        job.vm_lease = lease
+        job.vm_acquired = True
+        # Thread gia hạn thấy mất lease → dừng ngay lệnh blocking của attempt hiện tại
+        lease.on_lost(lambda: job.cancel_token.cancel("lease_lost"))
+        job.log(f"✅ Đã khóa máy ảo '{job.vm_name}' (token {lease.token})")
+
+    async def _admit_boot(self, job):
+        """Chờ lượt boot (boot admission) - không tính vào timeout của stage boot"""
+        wait_start = time.monotonic()
+        await self._blocking(job, boot_admission.refresh_capacity)
+        logged_wait = False
+        while not boot_admission.try_acquire(job.vm_name):
+            if not logged_wait:
+                status = boot_admission.get_status()
+                if len(status["booting"]) >= (status["limit"] or 1):
+                    job.log(f"🚦 Đang có {len(status['booting'])}/{status['limit']} máy ảo khởi động - Chờ lượt...")
+                    logged_wait = True
+            await asyncio.sleep(PIPELINE_LOCK_POLL)
+            await self._blocking(job, boot_admission.refresh_capacity)
+        if logged_wait:
+            job.log(f"🚦 Đến lượt boot máy ảo '{job.vm_name}'")
+        # Phần chờ lượt nằm trong stage boot → đo riêng để tách khỏi thời gian boot thật
+        metrics.observe("post_stage_seconds", time.monotonic() - wait_start, stage="boot_wait", vm=job.vm_name)
+        job.boot_slot = True
+        job.boot_start = time.monotonic()
+
+    async def _boot(self, job):
+        """Warm reuse (reset Instagram) hoặc reboot/launch → chờ VM status = 1"""
+        job.warm_reuse = warm_vm_pool.claim(job.vm_name)
+        status = await self._vm_status(job)
+        if status == "?":
+            job.log("⚠️ Không thể kiểm tra trạng thái VM - Bật máy ảo")
+        is_running = status == "1"
+
+        if is_running and job.warm_reuse:
+            # VM warm → chỉ reset trạng thái Instagram
+            job.log(f"♨️ Máy ảo '{job.vm_name}' đang chạy sẵn (warm) - Bỏ qua reboot")
+            if await self._blocking(job, warm_vm_pool.reset_instagram, job.adb_address, log_callback=job.log):
+                saved = warm_vm_pool.record_boot_avoided()
+                job.log(f"⚡ Tiết kiệm ~{saved:.0f}s - {warm_vm_pool.format_stats()}")
+                return
+            job.log("⚠️ Reset Instagram thất bại - Reboot máy ảo")
+        job.warm_reuse = False
+
+        # 🚦 Chờ lượt boot (giới hạn số VM khởi động cùng lúc)
+        await self._admit_boot(job)
+
+        async def launch_and_wait():
+            if is_running:
+                # VM đang chạy → Reboot để đảm bảo trạng thái sạch
+                # ✅ KHÔNG reset ADB server toàn cục (ảnh hưởng tất cả VMs khác!)
+                job.log(f"⚠️ Máy ảo '{job.vm_name}' đang chạy - Reboot để đảm bảo trạng thái sạch")
+                await self._run_cmd(job, [LDCONSOLE_EXE, "reboot", "--name", job.vm_name])
+            else:
+                job.log(f"🚀 Bật máy ảo '{job.vm_name}'...")
+                await self._run_cmd(job, [LDCONSOLE_EXE, "launch", "--name", job.vm_name])
+
+            job.log(f"⏳ Chờ máy ảo '{job.vm_name}' khởi động hoàn toàn...")
+            await self._wait_vm_status(job, ("1",))
+            job.log(f"✅ Máy ảo đã sẵn sàng (sau {time.monotonic() - job.boot_start:.0f}s)")
+
+        timeout = PIPELINE_STAGE_TIMEOUTS.get("boot")
+        try:
+            await asyncio.wait_for(launch_and_wait(), timeout)
+        except asyncio.TimeoutError:
+            raise StageError("boot", f"Máy ảo '{job.vm_name}' không khởi động được sau {timeout}s")
+
+    async def _adb_ready(self, job):
+        """ensure_adb_connected + chờ state = device, rồi trả lượt boot"""
+        job.log("🔌 Đang kết nối ADB...")
+        if not await self._blocking(job, vm_manager.ensure_adb_connected, job.adb_address, ADB_EXE,
+                                    max_retries=3, log_callback=job.log,
+                                    cancel_token=job.cancel_token):
+            raise StageError("adb_ready", f"Không thể kết nối ADB đến '{job.adb_address}'")
+
+        job.log("⏳ Chờ ADB sẵn sàng...")
+        start = time.monotonic()
+        last_state = None
+        while True:
+            try:
+                state = await self._blocking(job, vm_manager.query_adb_state, job.adb_address, ADB_EXE)
+            except Exception as e:
+                self.logger.warning(f"adb devices lỗi khi check '{job.adb_address}': {e}", extra={"vm": job.vm_name})
+                state = None
+            if state != last_state:
+                job.log(f"   📱 Device state: {state} (sau {time.monotonic() - start:.0f}s)")
+                last_state = state
+            if state == "device":
+                break
+            await asyncio.sleep(STATUS_POLL_INTERVAL)
+
+        if not job.warm_reuse:
+            boot_seconds = time.monotonic() - job.boot_start
+            warm_vm_pool.record_boot(boot_seconds)
+            self._release_boot_slot(job, boot_seconds=boot_seconds)
+
+    async def _prefetch(self, job):
+        """Tải video từ URL (chạy song song với boot). File tải về được xóa ở teardown."""
+        if not job.is_url:
+            return
+        from utils.api_manager_multi import multi_api_manager
+
+        platform = job.platform
+        if platform is None:
+            is_youtube = "youtube.com" in job.source or "youtu.be" in job.source
+            platform = "youtube" if is_youtube else "tiktok"
+
+        if platform == "tiktok":
+            from utils.tiktok_api_rapidapi import download_tiktok_video
+            tiktok_key = multi_api_manager.get_next_tiktok_key()
+            if not tiktok_key:
+                raise StageError("prefetch", "Không có TikTok API key")
+            job.log("📥 Đang tải video TikTok từ URL...")
+            func, args = download_tiktok_video, (job.source, tiktok_key)
+        else:
+            from utils.download_dlp import download_video_api
+            job.log("📥 Đang tải video YouTube từ URL...")
+            func, args = download_video_api, (job.source,)
+
+        future = self._executor.submit(contextvars.copy_context().run, func, *args,
+                                       log_callback=job.log, cancel_token=job.cancel_token)
+        job._pending.add(future)
+        future.add_done_callback(job._pending.discard)
+        try:
+            video_path = await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            # Thread tải vẫn chạy nốt → xóa file khi tải xong
+            future.add_done_callback(_remove_abandoned_download)
+            raise
+        except Exception as e:
+            raise StageError("prefetch", f"Lỗi khi tải video: {e}")
+
+        if not video_path or not os.path.exists(video_path):
+            raise StageError("prefetch", "Không thể tải video")
+        job.temp_video_path = video_path
+        job.video_path = video_path
+        job.log(f"✅ Đã tải video: {os.path.basename(video_path)}")
+        await asyncio.sleep(WAIT_SHORT)
+
+    async def _push(self, job):
+        """Dọn file cũ tool đã push (remote_media) rồi push file vào VM - bỏ qua nếu file đã có sẵn"""
+        from utils.send_file import send_file_api
+        from utils.file_checker import local_md5, stat_remote_file
+
+        remote_path = remote_path_for(job.video_path)
+        job.log("🗑️ Dọn file cũ trong DCIM...")
+        try:
+            await self._blocking(job, remote_media.prune, job.adb_address, keep=[remote_path],
+                                 adb_path=ADB_EXE, log_callback=job.log, cancel_token=job.cancel_token)
+        except Exception as e:
+            job.log(f"⚠️ Lỗi khi dọn DCIM/Pictures: {e}")
+
+        # File cùng nội dung đã có trong VM (retry sau lỗi đăng / warm) → không push lại.
+        # Chỉ hash video khi manifest có file cùng path + cùng size (đa số post: file mới → push luôn)
+        size = os.path.getsize(job.video_path)
+        entry = remote_media.files(job.adb_address).get(remote_path)
+        if entry and entry.get("size") == size:
+            md5 = await self._blocking(job, local_md5, job.video_path)
+            if remote_media.has_file(job.adb_address, remote_path, md5):
+                try:
+                    info = await self._blocking(job, stat_remote_file, job.adb_address, remote_path, job.cancel_token)
+                    if info.exists and info.md5 in (md5, None) and info.size == size:
+                        job.log("♻️ File đã có sẵn trong máy ảo - Bỏ qua push")
+                        return
+                except Exception:
+                    pass  # Không stat được → push lại như bình thường
+
+        job.log("📤 Gửi file vào máy ảo...")
+        remote_media.record(job.adb_address, remote_path, size)
+        try:
+            success_push = await self._blocking(job, send_file_api, job.video_path, job.vm_name,
+                                                adb_path=ADB_EXE, log_callback=job.log,
+                                                cancel_token=job.cancel_token)
+        except Exception as e:
+            raise StageError("push", f"Lỗi gửi file: {e}")
+        if not success_push:
+            raise StageError("push", "Gửi file thất bại")
+        job.log("✅ Đã gửi file thành công")
+
+    async def _verify(self, job):
+        """Verify file trong VM: size + md5 + mode trong 1 lệnh adb shell (retry nếu chưa có)"""
+        from utils.file_checker import local_md5, verify_pushed_file
+
+        remote_path = remote_path_for(job.video_path)
+        job.log("🔍 Đang verify file trong VM...")
+        verified = await self._blocking(
+            job, verify_pushed_file, job.adb_address, remote_path, job.video_path,
+            log_callback=job.log, cancel_token=job.cancel_token
+        )
+        if not verified:
+            raise StageError("verify", "File verification FAILED - File trong VM không khớp file gốc sau khi push!")
+        # verify đã hash file gốc (local_md5 cache) → ghi md5 vào manifest cho lần push sau so khớp
+        md5 = await self._blocking(job, local_md5, job.video_path)
+        remote_media.record(job.adb_address, remote_path, os.path.getsize(job.video_path), md5)
+
+    async def _post(self, job):
+        """Đăng bài bằng uiautomator2 (InstagramPost.auto_post trong executor)"""
+        from utils.post import InstagramPost
+
+        job.log(f"📲 Đang đăng video: {job.title}")
+        auto_poster = InstagramPost(log_callback=lambda vm, message: job.log(message),
+                                    cancel_token=job.cancel_token, mirror_logger=False, post_id=job.job_id)
+        video_filename = os.path.basename(job.video_path) if job.video_path else None
+        job.poster = auto_poster
+        success = await self._blocking(
+            job, auto_poster.auto_post, job.vm_name, job.adb_address, job.title,
+            use_launchex=True, ldconsole_exe=LDCONSOLE_EXE, video_filename=video_filename
+        )
+        if not success:
+            raise StageError("post", "Đăng bài thất bại")
+        job.log("✅ Đã đăng thành công!")
+
+    async def _teardown(self, job):
+        """Trả lượt boot, xóa file / giữ warm hoặc tắt VM, chờ lệnh dở, nhả khóa VM"""
+        # Slot còn giữ ở đây = bị dừng giữa lúc boot (không phải boot lỗi) hoặc lỗi bất ngờ
+        self._release_boot_slot(job, success=job.outcome == OUTCOME_STOPPED)
+        try:
+            if not job.vm_acquired:
+                return
+            if job.vm_lease.lost:
+                # Process khác đã khóa VM (lease hết hạn) → không tắt / dọn VM của họ
+                job.log(f"⚠️ Mất khóa máy ảo '{job.vm_name}' - Bỏ qua dọn dẹp VM", "WARNING")
+                return
+
+            if job.outcome == OUTCOME_POSTED and job.video_path:
+                # Chỉ xóa video vừa đăng (file tool khác vẫn được prune ở lần push sau)
+                job.log("🗑️ Xóa file trong máy ảo...")
+                try:
+                    await self._blocking(job, remote_media.remove, job.adb_address,
+                                         [remote_path_for(job.video_path)], adb_path=ADB_EXE, log_callback=job.log)
+                except Exception as e:
+                    job.log(f"⚠️ Lỗi khi xóa file: {e}")
+
+            keep_warm = False
+            if job.outcome == OUTCOME_POSTED and job.has_more_work:
+                try:
+                    keep_warm = warm_vm_pool.should_keep_warm(job.has_more_work())
+                except Exception:
+                    keep_warm = False
+
+            if keep_warm:
+                warm_vm_pool.keep_warm(job.vm_name)
+                job.log("♨️ Giữ máy ảo chạy cho việc kế tiếp (warm mode)")
+            else:
+                job.log("🛑 Tắt máy ảo...")
+                await self._quit_vm(job)
+                job.log("✅ Đã tắt máy ảo hoàn toàn")
+
+            # Lệnh blocking còn dở (vd: auto_post bị dừng giữa chừng) sẽ lỗi nhanh khi VM đã tắt
+            if job._pending:
+                await asyncio.wait([asyncio.wrap_future(f) for f in list(job._pending)],
+                                   timeout=DRAIN_TIMEOUT)
+        finally:
+            if job.vm_acquired:
+                vm_manager.release_vm(job.vm_name, caller=job.caller, token=job.vm_lease.token)
+                job.vm_acquired = False
+                job.log(f"🔓 Đã giải phóng máy ảo '{job.vm_name}'")
+            self._remove_temp(job)
+
+    # ==================== JOB ====================
+    async def _run_attempt(self, job):
+        job.cancel_token = CancelToken()
+        job.poster = None
+        prefetch = None
+        if job.is_url:
+            job.video_path = None
+            job.prefetching = True
+            prefetch = asyncio.ensure_future(self._stage(job, "prefetch", self._prefetch(job), background=True))
+            prefetch.add_done_callback(lambda _: setattr(job, "prefetching", False))
+        try:
+            await self._stage(job, "boot", self._boot(job), timeout=None)
+            await self._stage(job, "adb_ready", self._adb_ready(job))
+            if prefetch is not None:
+                job.stage = "prefetch"  # Boot xong, giờ chỉ còn chờ tải video
+                await prefetch
+            await self._stage(job, "push", self._push(job))
+            await self._stage(job, "verify", self._verify(job))
+            await self._stage(job, "post", self._post(job))
+        except BaseException:
+            # Attempt bị dừng/lỗi/timeout → lệnh blocking còn dở (tải video, verify,
+            # auto_post) thoát trong CANCEL_POLL_INTERVAL thay vì chạy nốt trong executor
+            job.cancel_token.cancel(job.stage)
+            raise
+        finally:
+            if prefetch is not None:
+                if not prefetch.done():
+                    prefetch.cancel()
+                await asyncio.gather(prefetch, return_exceptions=True)
+
+    async def _run_job(self, job: PostJob, on_done=None) -> PostJob:
+        job_start = time.monotonic()
+        fence = None
+        self._jobs[job.job_id] = (job, asyncio.current_task())
+        if self._watcher is None:
+            self._watcher = asyncio.ensure_future(self._watch_stop_requests())
+
+        try:
+            # Kiểm tra trước khi chờ khóa VM
+            if not job.is_url and not os.path.exists(job.source):
+                raise StageError("acquire", f"File video không tồn tại: {job.source}")
+            job.adb_address = vm_registry.get_adb_address(job.vm_name)
+            if not job.adb_address:
+                raise StageError("acquire", f"Không tìm thấy cấu hình/port cho VM: {job.vm_name}")
+
+            await self._stage(job, "acquire", self._acquire(job))
+            # Mọi stage sau (task con + executor copy context) gửi lệnh kèm fencing token
+            fence = set_fence(job.vm_lease)
+
+            for attempt in range(1, job.max_attempts + 1):
+                job.attempt = attempt
+                if job.max_attempts > 1:
+                    job.log(f"🔄 Retry lần {attempt}/{job.max_attempts}" if attempt > 1
+                            else f"📝 Lần thử {attempt}/{job.max_attempts}")
+                try:
+                    await self._run_attempt(job)
+                    job.outcome = OUTCOME_POSTED
+                    break
+                except StageError as e:
+                    job.failed_stage, job.error = e.stage, e.reason
+                    job.log(f"❌ {e.reason}", "ERROR")
+                    job.log(f"⚠️ Lần thử {attempt} thất bại ({e.stage})", "WARNING")
+                    self._release_boot_slot(job, success=False)
+                    if job.shared:
+                        # Đã nhấn Share: retry sẽ push + đăng lại đúng video này (đăng trùng)
+                        if job.poster.rejected:
+                            job.log("❌ Instagram từ chối video - Không retry", "ERROR")
+                        else:
+                            # Timeout / lỗi khi đang chờ upload → như auto_post khi hết lượt chờ:
+                            # coi như đã đăng
+                            job.outcome = OUTCOME_POSTED
+                            job.log("⚠️ Đã nhấn Share nhưng không xác nhận được kết quả - "
+                                    "Coi như đã đăng, không retry để tránh đăng trùng", "WARNING")
+                        break
+                    if job.vm_lease.lost:
+                        job.log(f"❌ Mất khóa máy ảo '{job.vm_name}' - Không retry", "ERROR")
+                        break
+                    if attempt < job.max_attempts:
+                        job.log("🔄 Đang cleanup để retry...")
+                        job.log("🛑 Tắt máy ảo để retry...")
+                        await self._quit_vm(job)
+                        self._remove_temp(job)
+                        job.log("⏳ Chờ 5 giây trước khi retry...")
+                        await asyncio.sleep(5)
+
+            if job.outcome is None:
+                job.outcome = OUTCOME_FAILED
+                if job.max_attempts > 1:
+                    job.log(f"❌ Đăng bài thất bại sau {job.max_attempts} lần thử")
+
+        except asyncio.CancelledError:
+            job.outcome = OUTCOME_STOPPED
+            job.failed_stage = job.stage
+            job.log(f"🛑 Đã dừng theo yêu cầu (stage: {job.stage}) - Đang dọn dẹp...")
+        except StageError as e:
+            job.outcome = OUTCOME_FAILED
+            job.failed_stage, job.error = e.stage, e.reason
+            job.log(f"❌ {e.reason}", "ERROR")
+        except Exception as e:
+            self.logger.exception(f"Error in pipeline job {job.job_id}", extra={"vm": job.vm_name})
+            job.outcome = OUTCOME_FAILED
+            job.failed_stage, job.error = job.stage, str(e)
+            job.log(f"❌ Lỗi: {e}", "ERROR")
+
+        try:
+            # Teardown luôn chạy hết kể cả khi bị cancel lần nữa (shutdown)
+            await asyncio.shield(self._stage(job, "teardown", self._teardown(job)))
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            self.logger.exception(f"Error in teardown of job {job.job_id}", extra={"vm": job.vm_name})
+            job.log(f"⚠️ Lỗi khi dọn dẹp: {e}")
+        finally:
+            self._jobs.pop(job.job_id, None)
+            if fence is not None:
+                reset_fence(fence)
+
+        duration = time.monotonic() - job_start
+        job.record("post", dur=duration, result=job.outcome, failed_stage=job.failed_stage,
+                   error=job.error, attempts=job.attempt)
+        metrics.observe("post_duration_seconds", duration, vm=job.vm_name, outcome=job.outcome)
+        metrics.inc("posts_total", vm=job.vm_name, outcome=job.outcome, failed_stage=job.failed_stage)
+
+        if on_done is not None:
+            try:
+                await self._blocking(None, on_done, job)
+            except Exception:
+                self.logger.exception(f"Error in on_done of job {job.job_id}", extra={"vm": job.vm_name})
+        return job
+
+
+def _remove_abandoned_download(future):
+    """Xóa file được tải xong sau khi job đã bị dừng"""
+    try:
+        path = future.result()
+        if path and os.path.exists(path):
+            os.remove(path)
+    except Exception:
+        pass
+
+
+# Global singleton instance
+post_pipeline = PostPipeline()
@@ -0,0 +1,194 @@
+"""
+Remote Media Manager - Quản lý file tool đưa vào DCIM của từng device thay vì xóa sạch mỗi post.
+
+Flow cũ: clear_dcim + clear_pictures trước mỗi lần push và clear_dcim sau khi đăng → MediaStore
+phải index lại, gallery picker của Instagram (XPATH_FIRST_BOX) load lại từ đầu.
+
+Ở đây mỗi device có 1 manifest (data/media/<device>.json) ghi các file tool đã push:
+- prune(device, keep): xóa file tool đã push mà không còn cần (không nằm trong keep) + dọn Pictures,
+  tất cả trong 1 lệnh adb shell; không có gì để xóa thì không chạy lệnh nào
+- Lần đầu gặp device (chưa có manifest): xóa sạch DCIM 1 lần như cũ để bắt đầu từ trạng thái sạch
+- has_file: file cùng md5 đã có sẵn trong VM (retry / warm) → bỏ qua push
+- File được ghi vào manifest TRƯỚC khi push → push dở / crash vẫn được dọn ở lần prune sau
+
+Mỗi device 1 file manifest riêng: VM chỉ được 1 process dùng tại 1 thời điểm (vm_lock) nên
+không có 2 process cùng ghi 1 manifest.
+"""
+import os
+import re
+import shlex
+import subprocess
+import threading
+import time
+import logging
+
+from config import ADB_EXE, MEDIA_MANIFEST_DIR
+from constants import DCIM_PATH, PICTURES_PATH
+from utils.cancel_token import run as cancellable_run
+from utils.persistence import load_json, atomic_write_json
+
+
+def remote_path_for(local_path, remote_dir=DCIM_PATH) -> str:
+    """Path trong Android của file local sau khi push vào remote_dir"""
+    return f"{remote_dir.rstrip('/')}/{os.path.basename(local_path)}"
+
+
+class RemoteMediaManager:
+    """
+    Singleton giữ manifest file media của các device (cache RAM + file JSON).
+
+    Gọi khi ĐANG giữ khóa VM (vm_manager) của device.
+    """
+
+    _instance = None
+    _creation_lock = threading.Lock()
+
+    def __new__(cls):
+        if cls._instance is None:
+            with cls._creation_lock:
+                if cls._instance is None:
+                    cls._instance = super().__new__(cls)
+        return cls._instance
+
+    def __init__(self):
+        if not hasattr(self, '_initialized'):
+            self._manifests = {}  # {device: {remote_path: {"size", "md5", "ts"}} hoặc None (chưa adopt)}
+            self._lock = threading.RLock()
+            self.logger = logging.getLogger(__name__)
+            self._initialized = True
+
+    # ==================== MANIFEST ====================
+    def _path(self, device: str) -> str:
+        return os.path.join(MEDIA_MANIFEST_DIR, re.sub(r"[^\w.-]", "_", device) + ".json")
+
+    def _files(self, device: str):
+        """Manifest của device (None nếu device chưa từng được tool dọn)"""
+        if device not in self._manifests:
+            try:
+                data = load_json(self._path(device))
+            except Exception as e:
+                self.logger.warning(f"⚠️ Manifest media của {device} bị hỏng, coi như chưa có: {e}")
+                data = None
+            self._manifests[device] = data.get("files", {}) if isinstance(data, dict) else None
+        return self._manifests[device]
+
+    def _save(self, device: str):
+        files = self._manifests.get(device)
+        if files is None:
+            return
+        try:
+            atomic_write_json(self._path(device), {"device": device, "files": files}, fsync=False)
+        except Exception as e:
+            self.logger.warning(f"⚠️ Không ghi được manifest media của {device}: {e}")
+
+    def files(self, device: str) -> dict:
+        """Bản sao {remote_path: {"size", "md5", "ts"}} các file tool đang có trong device"""
+        with self._lock:
+            return dict(self._files(device) or {})
+
+    def record(self, device: str, remote_path: str, size: int = None, md5: str = None):
+        """Ghi nhận file sắp push (gọi TRƯỚC khi push)"""
+        with self._lock:
+            files = self._files(device)
+            if files is None:
+                files = self._manifests[device] = {}
+            files[remote_path] = {"size": size, "md5": md5, "ts": time.time()}
+            self._save(device)
+
+    def forget(self, device: str, remote_paths):
+        with self._lock:
+            files = self._files(device)
+            if files and any(files.pop(path, None) is not None for path in list(remote_paths)):
+                self._save(device)
+
+    def has_file(self, device: str, remote_path: str, md5: str) -> bool:
+        """True nếu manifest ghi file này đã push với cùng md5 (nên stat lại trước khi tin)"""
+        with self._lock:
+            entry = (self._files(device) or {}).get(remote_path)
+            return bool(entry and md5 and entry.get("md5") == md5)
+
+    # ==================== DỌN FILE ====================
+    def prune(self, device: str, keep=(), adb_path=None, log_callback=None, cancel_token=None) -> int:
+        """
+        Xóa file tool đã push không nằm trong keep + dọn Pictures (1 lệnh adb shell).
+
+        Device chưa có manifest → xóa sạch DCIM 1 lần (file sót lại từ trước khi có manifest).
+
+        Args:
+            device: ADB device (vd: emulator-5554)
+            keep: remote path cần giữ (file sắp đăng / đã nạp trước)
+
+        Returns:
+            int: Số file tool đã xóa (-1 nếu xóa sạch DCIM lần đầu / lệnh lỗi)
+
+        Raises:
+            OperationCancelled: Bị dừng khi đang chạy lệnh
+        """
+        log = log_callback or (lambda msg: print(msg))
+        keep = set(keep)
+        with self._lock:
+            files = self._files(device)
+            adopt = files is None
+            stale = [] if adopt else [path for path in files if path not in keep]
+
+        commands = []
+        if adopt:
+            commands.append(f"rm -rf {shlex.quote(DCIM_PATH)}/*")
+        elif stale:
+            commands.append("rm -f " + " ".join(shlex.quote(path) for path in stale))
+        # Pictures chỉ chứa file Instagram tự lưu - lệnh rỗng khi không có gì
+        commands.append(f"rm -rf {shlex.quote(PICTURES_PATH)}/*")
+
+        result = cancellable_run(
+            [adb_path or ADB_EXE, "-s", device, "shell", " ; ".join(commands)],
+            token=cancel_token,
+            capture_output=True, text=True, encoding="utf-8", errors="ignore",
+            creationflags=subprocess.CREATE_NO_WINDOW,
+            timeout=30
+        )
+        if result.returncode != 0:
+            log(f"⚠️ Lỗi khi dọn media trong máy ảo: {(result.stderr or '').strip()}")
+            return -1
+
+        with self._lock:
+            if adopt:
+                self._manifests[device] = {}
+                self._save(device)
+                log("🗑️ Đã xóa sạch DCIM lần đầu - từ giờ chỉ xóa file tool đã push")
+                return -1
+            self.forget(device, stale)
+        if stale:
+            log(f"🗑️ Đã xóa {len(stale)} file cũ trong DCIM (giữ {len(keep & set(files))} file)")
+        return len(stale)
+
+    def remove(self, device: str, remote_paths, adb_path=None, log_callback=None, cancel_token=None) -> bool:
+        """
+        Xóa các file chỉ định (vd: video vừa đăng xong) - 1 lệnh adb shell.
+
+        Returns:
+            bool: True nếu lệnh xóa thành công
+
+        Raises:
+            OperationCancelled: Bị dừng khi đang chạy lệnh
+        """
+        log = log_callback or (lambda msg: print(msg))
+        remote_paths = list(remote_paths)
+        if not remote_paths:
+            return True
+        result = cancellable_run(
+            [adb_path or ADB_EXE, "-s", device, "shell",
+             "rm -f " + " ".join(shlex.quote(path) for path in remote_paths)],
+            token=cancel_token,
+            capture_output=True, text=True, encoding="utf-8", errors="ignore",
+            creationflags=subprocess.CREATE_NO_WINDOW,
+            timeout=30
+        )
+        if result.returncode != 0:
+            log(f"⚠️ Lỗi khi xóa file trong máy ảo: {(result.stderr or '').strip()}")
+            return False
+        self.forget(device, remote_paths)
+        return True
+
+
+# Global singleton
+remote_media = RemoteMediaManager()
@@ -0,0 +1,335 @@
+"""
+Schedule Optimizer - Xếp giờ cho "Lên lịch hàng loạt" theo thời gian đo được của từng VM.
+
+Cách cũ: video thứ i nhận khung giờ thứ i (xoay vòng theo ngày), không quan tâm VM của video
+đăng mất bao lâu → nhiều video rơi vào lúc VM còn bận, bắt đầu trễ quá POST_MAX_LATE_SECONDS.
+
+Mô hình dự đoán (mỗi VM chạy tuần tự, giống pipeline thật):
+- Bắt đầu = max(giờ hẹn, lúc VM rảnh); VM nghỉ (không warm) → cần boot, qua boot admission
+  (BOOT_STAGGER_SECONDS giữa 2 lần boot, tối đa BOOT_MAX_CONCURRENCY VM boot cùng lúc)
+- Xong = bắt đầu + boot (nếu cần) + thời gian đăng (adb_ready → teardown) của VM đó
+- Trễ = bắt đầu - giờ hẹn; > max_late là lỡ hẹn
+- Post pending khác (ngoài phạm vi) trên cùng VM được tính là khoảng VM bận
+
+Optimizer xét khung giờ theo thứ tự thời gian; ở mỗi khung giờ mỗi VM nhận tối đa per_slot video
+(theo thứ tự trên bảng) nếu còn bắt đầu kịp trong max_late, VM còn nhiều video chờ nhất được xếp
+trước (cân tải, giảm số ngày). Kết quả là dự đoán - giờ hẹn vẫn là khung giờ người dùng nhập.
+
+Sử dụng:
+    profiles = measure_vm_profiles({p.vm_name for p in posts})
+    plan = optimize_schedule([(p.id, p.vm_name) for p in posts], iter_slots(start_date, [(6, 0), (18, 0)]),
+                             profiles, busy=busy_intervals(other_posts, profiles))
+"""
+import bisect
+from collections import deque
+from datetime import datetime, timedelta
+
+from constants import (
+    POST_MAX_LATE_SECONDS, BOOT_MAX_CONCURRENCY, BOOT_STAGGER_SECONDS,
+    WARM_VM_MODE, WARM_VM_IDLE_TTL, WARM_VM_BOOT_ESTIMATE,
+    SCHEDULE_DEFAULT_POST_SECONDS, SCHEDULE_SAFETY_SECONDS, SCHEDULE_MAX_DAYS
+)
+from utils.metrics import metrics
+
+# Stage tính vào thời gian đăng (boot tính riêng vì VM warm thì bỏ qua)
+WORK_STAGES = ("adb_ready", "push", "verify", "post", "teardown")
+
+
+class VMProfile:
+    """Thời gian đo được của 1 VM (giây)"""
+
+    __slots__ = ("post_seconds", "boot_seconds", "measured")
+
+    def __init__(self, post_seconds=SCHEDULE_DEFAULT_POST_SECONDS, boot_seconds=WARM_VM_BOOT_ESTIMATE,
+                 measured=False):
+        self.post_seconds = post_seconds
+        self.boot_seconds = boot_seconds
+        self.measured = measured  # False = ước lượng (VM chưa chạy post nào từ lúc mở tool)
+
+
+class PlannedPost:
+    """Dự đoán cho 1 post: khung giờ, bắt đầu / xong (epoch giây), trễ"""
+
+    __slots__ = ("post_id", "vm_name", "slot", "start", "finish", "booted")
+
+    def __init__(self, post_id, vm_name, slot, start, finish, booted):
+        self.post_id = post_id
+        self.vm_name = vm_name
+        self.slot = slot      # datetime - giờ hẹn
+        self.start = start
+        self.finish = finish
+        self.booted = booted
+
+    @property
+    def lateness(self) -> float:
+        return self.start - self.slot.timestamp()
+
+    def is_late(self, max_late=POST_MAX_LATE_SECONDS) -> bool:
+        return self.lateness > max_late
+
+
+def _stage_mean(stage, vm=None):
+    labels = {"stage": stage}
+    if vm is not None:
+        labels["vm"] = vm
+    return metrics.mean("post_stage_seconds", **labels)
+
+
+def measure_vm_profiles(vm_names) -> dict:
+    """
+    Thời gian đăng / boot trung bình của từng VM từ metrics (post_stage_seconds).
+
+    VM chưa có mẫu → trung bình mọi VM → mặc định (SCHEDULE_DEFAULT_POST_SECONDS, WARM_VM_BOOT_ESTIMATE).
+
+    Returns:
+        dict: {vm_name: VMProfile}
+    """
+    def work_and_boot(vm):
+        stages = [_stage_mean(s, vm) for s in WORK_STAGES]
+        work = sum(s for s in stages if s is not None) if any(s is not None for s in stages) else None
+        boot = _stage_mean("boot", vm)
+        if boot is not None:
+            boot = max(0.0, boot - (_stage_mean("boot_wait", vm) or 0.0))  # admission mô phỏng riêng
+        return work, boot
+
+    global_work, global_boot = work_and_boot(None)
+    profiles = {}
+    for vm in vm_names:
+        work, boot = work_and_boot(vm)
+        profiles[vm] = VMProfile(
+            post_seconds=work if work is not None else (global_work or SCHEDULE_DEFAULT_POST_SECONDS),
+            boot_seconds=boot if boot is not None else (global_boot or WARM_VM_BOOT_ESTIMATE),
+            measured=work is not None,
+        )
+    return profiles
+
+
+def iter_slots(start_date: datetime, time_slots, days: int = SCHEDULE_MAX_DAYS):
+    """Các khung giờ (hour, minute) lặp mỗi ngày từ start_date, theo thứ tự thời gian"""
+    ordered = sorted(set(time_slots))
+    day = start_date.replace(hour=0, minute=0, second=0, microsecond=0)
+    for _ in range(days):
+        for hour, minute in ordered:
+            yield day.replace(hour=hour, minute=minute)
+        day += timedelta(days=1)
+
+
+def busy_intervals(posts, profiles: dict) -> dict:
+    """
+    Khoảng VM bận dự kiến của các post pending (ngoài phạm vi lên lịch).
+
+    Args:
+        posts: iterable (vm_name, datetime giờ hẹn)
+
+    Returns:
+        dict: {vm_name: [(start, end)]} - epoch giây, đã sắp xếp
+    """
+    busy = {}
+    for vm_name, scheduled in posts:
+        if not vm_name or scheduled is None:
+            continue
+        profile = profiles.get(vm_name) or VMProfile()
+        start = scheduled.timestamp()
+        busy.setdefault(vm_name, []).append((start, start + profile.boot_seconds + profile.post_seconds))
+    for vm_name, intervals in busy.items():
+        # Gộp khoảng chồng nhau → _skip_busy chỉ cần xét từ khoảng ngay trước start
+        intervals.sort()
+        merged = [intervals[0]]
+        for start, end in intervals[1:]:
+            if start <= merged[-1][1]:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+            else:
+                merged.append((start, end))
+        busy[vm_name] = merged
+    return busy
+
+
+class _Farm:
+    """Trạng thái mô phỏng: lúc rảnh của từng VM + boot admission chung"""
+
+    def __init__(self, profiles, busy, warm_ttl, boot_concurrency, boot_stagger):
+        self.profiles = profiles
+        self.busy = busy or {}
+        self.warm_ttl = warm_ttl  # None = không warm: post nào cũng boot
+        self.boot_concurrency = boot_concurrency
+        self.boot_stagger = boot_stagger
+        self.free_at = {}
+        self._boots = []  # [(start, end)] các lần boot đã xếp, sắp theo start
+        self._longest_boot = 0.0
+        self._admit_cache = {}  # {(t, limit): kết quả} - xóa khi xếp thêm boot
+
+    def _admit(self, t: float, limit: float = float("inf")) -> float:
+        """
+        Thời điểm sớm nhất >= t được bắt đầu boot (cách các lần boot khác >= stagger, số VM
+        đang boot < concurrency). Vượt limit → trả về ngay (post không kịp, khỏi tìm tiếp)
+        """
+        key = (t, limit)
+        cached = self._admit_cache.get(key)
+        if cached is not None:
+            return cached
+        boots = self._boots
+        stagger = self.boot_stagger
+        while t <= limit:
+            # Lần boot khác bắt đầu quá gần → lùi ra sau nó
+            i = bisect.bisect_right(boots, (t - stagger, float("inf")))
+            if i < len(boots) and boots[i][0] < t + stagger:
+                t = boots[i][0] + stagger
+                continue
+            # Giống boot admission thật: chỉ xét số VM đang boot lúc bắt đầu
+            lo = bisect.bisect_left(boots, (t - self._longest_boot,))
+            hi = bisect.bisect_right(boots, (t, float("inf")))
+            active = sorted(end for _, end in boots[lo:hi] if end > t)
+            if len(active) < self.boot_concurrency:
+                break
+            t = active[len(active) - self.boot_concurrency]
+        self._admit_cache[key] = t
+        return t
+
+    def _skip_busy(self, vm_name, start, length) -> float:
+        """Đẩy start qua các khoảng bận có sẵn của VM chồng lên [start, start + length)"""
+        intervals = self.busy.get(vm_name)
+        if not intervals:
+            return start
+        i = max(0, bisect.bisect_left(intervals, (start,)) - 1)
+        while i < len(intervals):
+            busy_start, busy_end = intervals[i]
+            if busy_start >= start + length:
+                break
+            if busy_end > start:
+                start = busy_end
+            i += 1
+        return start
+
+    def predict(self, vm_name, slot_ts: float, limit: float = float("inf")):
+        """Returns: (start, finish, booted) nếu post trên vm_name được hẹn lúc slot_ts (start > limit = không kịp)"""
+        profile = self.profiles.get(vm_name) or VMProfile()
+        free_at = self.free_at.get(vm_name)
+        start = slot_ts if free_at is None else max(slot_ts, free_at)
+        booted = self.warm_ttl is None or free_at is None or start - free_at > self.warm_ttl
+        length = profile.post_seconds + (profile.boot_seconds if booted else 0.0)
+        while True:
+            moved = self._skip_busy(vm_name, start, length)
+            if booted:
+                moved = self._admit(moved, limit)
+            if moved == start or moved > limit:
+                return moved, moved + length, booted
+            start = moved
+
+    def commit(self, vm_name, start, finish, booted):
+        self.free_at[vm_name] = finish
+        if booted:
+            profile = self.profiles.get(vm_name) or VMProfile()
+            bisect.insort(self._boots, (start, start + profile.boot_seconds))
+            self._admit_cache.clear()
+            self._longest_boot = max(self._longest_boot, profile.boot_seconds)
+
+
+def _farm(profiles, busy, warm, boot_concurrency, boot_stagger):
+    warm_ttl = WARM_VM_IDLE_TTL if (WARM_VM_MODE if warm is None else warm) else None
+    return _Farm(profiles, busy, warm_ttl, boot_concurrency, boot_stagger)
+
+
+def optimize_schedule(posts, slots, profiles: dict, busy: dict = None,
+                      max_late: float = POST_MAX_LATE_SECONDS - SCHEDULE_SAFETY_SECONDS,
+                      per_slot: int = 1, warm: bool = None, boot_concurrency: int = BOOT_MAX_CONCURRENCY,
+                      boot_stagger: float = BOOT_STAGGER_SECONDS) -> list:
+    """
+    Xếp khung giờ cho từng post (VM giữ nguyên).
+
+    Args:
+        posts: list (post_id, vm_name) theo thứ tự trên bảng - video cùng VM giữ thứ tự này
+        slots: iterable datetime tăng dần (iter_slots)
+        busy: busy_intervals() của post pending không nằm trong phạm vi
+        max_late: trễ tối đa chấp nhận khi xếp (chừa SCHEDULE_SAFETY_SECONDS cho sai số dự đoán)
+        per_slot: số video tối đa của 1 VM trong cùng 1 khung giờ
+        warm: VM giữ chạy giữa 2 post gần nhau (None = theo WARM_VM_MODE)
+
+    Returns:
+        list[PlannedPost] theo thứ tự posts. Hết khung giờ mà VM vẫn không kịp → post được xếp
+        vào khung giờ cuối cùng xét tới (trễ)
+    """
+    farm = _farm(profiles, busy, warm, boot_concurrency, boot_stagger)
+    queues = {}
+    for index, (post_id, vm_name) in enumerate(posts):
+        queues.setdefault(vm_name, deque()).append((index, post_id))
+    plan = [None] * len(posts)
+    remaining = len(posts)
+
+    slot = None
+    for slot in slots:
+        if not remaining:
+            break
+        slot_ts = slot.timestamp()
+        # VM còn nhiều video nhất được xếp trước → các VM xong cùng lúc, ít ngày nhất
+        for vm_name in sorted((vm for vm, q in queues.items() if q), key=lambda vm: (-len(queues[vm]), vm or "")):
+            if farm.free_at.get(vm_name, slot_ts) - slot_ts > max_late:
+                continue  # VM còn bận quá khung giờ này
+            queue = queues[vm_name]
+            for _ in range(per_slot):
+                if not queue:
+                    break
+                start, finish, booted = farm.predict(vm_name, slot_ts, limit=slot_ts + max_late)
+                if start - slot_ts > max_late:
+                    break
+                farm.commit(vm_name, start, finish, booted)
+                index, post_id = queue.popleft()
+                plan[index] = PlannedPost(post_id, vm_name, slot, start, finish, booted)
+                remaining -= 1
+
+    # Không đủ khung giờ: dồn vào khung cuối (preview sẽ báo trễ)
+    if remaining and slot is not None:
+        slot_ts = slot.timestamp()
+        for vm_name, queue in queues.items():
+            while queue:
+                start, finish, booted = farm.predict(vm_name, slot_ts)
+                farm.commit(vm_name, start, finish, booted)
+                index, post_id = queue.popleft()
+                plan[index] = PlannedPost(post_id, vm_name, slot, start, finish, booted)
+    return plan
+
+
+def round_robin_schedule(posts, slots) -> list:
+    """Cách cũ: video thứ i → khung giờ thứ i. Returns: list (post_id, vm_name, slot)"""
+    return [(post_id, vm_name, slot) for (post_id, vm_name), slot in zip(posts, slots)]
+
+
+def predict_schedule(assigned, profiles: dict, busy: dict = None, warm: bool = None,
+                     boot_concurrency: int = BOOT_MAX_CONCURRENCY,
+                     boot_stagger: float = BOOT_STAGGER_SECONDS) -> list:
+    """
+    Dự đoán bắt đầu / xong của lịch có sẵn (không đổi giờ hẹn).
+
+    Args:
+        assigned: list (post_id, vm_name, slot datetime)
+
+    Returns:
+        list[PlannedPost] theo thứ tự assigned
+    """
+    farm = _farm(profiles, busy, warm, boot_concurrency, boot_stagger)
+    plan = [None] * len(assigned)
+    order = sorted(range(len(assigned)), key=lambda i: assigned[i][2])
+    for index in order:
+        post_id, vm_name, slot = assigned[index]
+        start, finish, booted = farm.predict(vm_name, slot.timestamp())
+        farm.commit(vm_name, start, finish, booted)
+        plan[index] = PlannedPost(post_id, vm_name, slot, start, finish, booted)
+    return plan
+
+
+def plan_stats(plan, max_late: float = POST_MAX_LATE_SECONDS) -> dict:
+    """Tóm tắt cho preview / benchmark: số lỡ hẹn, trễ TB / max, xong cuối cùng, số post mỗi VM"""
+    plan = [p for p in plan if p is not None]
+    if not plan:
+        return {"posts": 0, "late": 0, "mean_lateness": 0.0, "max_lateness": 0.0, "last_finish": None, "per_vm": {}}
+    per_vm = {}
+    for p in plan:
+        per_vm[p.vm_name] = per_vm.get(p.vm_name, 0) + 1
+    lateness = [max(0.0, p.lateness) for p in plan]
+    return {
+        "posts": len(plan),
+        "late": sum(1 for p in plan if p.is_late(max_late)),
+        "mean_lateness": sum(lateness) / len(lateness),
+        "max_lateness": max(lateness),
+        "last_finish": datetime.fromtimestamp(max(p.finish for p in plan), plan[0].slot.tzinfo),
+        "per_vm": per_vm,
+    }
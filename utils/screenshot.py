@@ -2,89 +2,322 @@
 Screenshot utility for capturing Android emulator screen via ADB.
 
 Used for debugging automation failures and detecting UI changes.
+
+- `adb exec-out screencap -p` stream PNG thẳng vào RAM (1 lệnh adb, không ghi file trên máy ảo,
+  không sleep chờ ghi, không pull / rm)
+- Encode tùy chọn: thu nhỏ + JPEG/WebP (cần Pillow), mặc định giữ PNG gốc
+- ScreenshotStore: lưu vào logs/screenshots/, tự xóa ảnh cũ khi vượt số lượng / dung lượng
+- ScreenRecorder: chụp liên tục 1 VM để debug (thread nền, không nhanh hơn
+  SCREENSHOT_MIN_INTERVAL, bỏ frame trùng frame trước)
+
+Chạy từ thư mục gốc của tool (debug VM đang lỗi):
+    python -m utils.screenshot emulator-5554
+    python -m utils.screenshot emulator-5554 --watch 2 --format jpeg --max-width 540
 """
 import os
+import io
 import time
+import hashlib
+import threading
 import subprocess
 import logging
+from collections import deque
+
+from config import ADB_EXE, LOG_DIR
+from constants import (
+    SCREENSHOT_FORMAT, SCREENSHOT_MAX_WIDTH, SCREENSHOT_QUALITY,
+    SCREENSHOT_KEEP_FILES, SCREENSHOT_KEEP_MB, SCREENSHOT_MIN_INTERVAL
+)
 
 logger = logging.getLogger(__name__)
 
-SCREENSHOT_DIR = "D:/temp"
+SCREENSHOT_DIR = os.path.join(LOG_DIR, "screenshots")
+
+PNG_MAGIC = b"\x89PNG\r\n\x1a\n"
+_EXTENSIONS = {"png": "png", "jpeg": "jpg", "jpg": "jpg", "webp": "webp"}
+
+# Ngừng ScreenRecorder sau chừng này lần chụp lỗi liên tiếp (VM tắt / mất ADB)
+RECORDER_MAX_ERRORS = 5
 
 
-def take_screenshot(device: str, adb_path: str, vm_name: str = None) -> str:
+# ==================== CHỤP + ENCODE ====================
+def capture_png(device: str, adb_path: str = None, timeout: float = 10) -> bytes:
     """
-    Chụp màn hình emulator và lưu về PC.
+    Chụp màn hình bằng `adb exec-out screencap -p` (PNG stream thẳng vào RAM).
 
-    Args:
-        device: Device name (e.g., "emulator-5554")
-        adb_path: Đường dẫn adb.exe
-        vm_name: Tên máy ảo (để đặt tên file)
+    Returns:
+        bytes: Ảnh PNG, hoặc None nếu thất bại
+    """
+    try:
+        result = subprocess.run(
+            [adb_path or ADB_EXE, "-s", device, "exec-out", "screencap", "-p"],
+            capture_output=True,
+            creationflags=subprocess.CREATE_NO_WINDOW,
+            timeout=timeout
+        )
+    except subprocess.TimeoutExpired:
+        logger.error(f"Screenshot timeout ({device})")
+        return None
+
+    data = result.stdout
+    if result.returncode != 0 or not data.startswith(PNG_MAGIC):
+        logger.error(f"Failed to capture screen ({device}): {result.stderr.decode('utf-8', 'ignore').strip()}")
+        return None
+    return data
+
+
+def encode_image(png: bytes, fmt: str = None, max_width: int = None, quality: int = None):
+    """
+    Thu nhỏ / đổi định dạng ảnh PNG (trong RAM).
+
+    Không có Pillow hoặc encode lỗi → trả về PNG gốc.
 
     Returns:
-        str: Đường dẫn file ảnh đã lưu, hoặc None nếu thất bại
+        tuple: (data: bytes, extension: str)
     """
+    fmt = (fmt or SCREENSHOT_FORMAT).lower()
+    if fmt not in _EXTENSIONS:
+        raise ValueError(f"Định dạng ảnh không hỗ trợ: {fmt}")
+    if fmt == "png" and not max_width:
+        return png, "png"
+
     try:
-        # Tạo tên file với timestamp
-        port = device.split('-')[-1]
-        timestamp = time.strftime("%Y%m%d_%H%M%S")
+        from PIL import Image  # optional - cài sẵn theo uiautomator2
+    except ImportError:
+        logger.warning("Pillow chưa được cài - lưu PNG gốc")
+        return png, "png"
 
-        if vm_name:
-            filename = f"{vm_name}-{port}-{timestamp}.png"
+    try:
+        image = Image.open(io.BytesIO(png))
+        if max_width and image.width > max_width:
+            image = image.resize((max_width, round(image.height * max_width / image.width)), Image.BILINEAR)
+        out = io.BytesIO()
+        if fmt == "png":
+            image.save(out, "PNG", optimize=False)
         else:
-            filename = f"{port}-{timestamp}.png"
+            if image.mode not in ("RGB", "L"):
+                image = image.convert("RGB")
+            image.save(out, "JPEG" if fmt in ("jpeg", "jpg") else "WEBP",
+                       quality=quality or SCREENSHOT_QUALITY)
+        return out.getvalue(), _EXTENSIONS[fmt]
+    except Exception as e:
+        logger.warning(f"Encode ảnh lỗi, lưu PNG gốc: {e}")
+        return png, "png"
 
-        save_path = os.path.join(SCREENSHOT_DIR, filename)
-        remote_path = "/storage/emulated/0/screen.png"
 
-        # Tạo thư mục nếu chưa có
-        os.makedirs(SCREENSHOT_DIR, exist_ok=True)
+def _filename(device: str, vm_name: str, ext: str) -> str:
+    port = device.split('-')[-1].replace(":", "_")
+    # Thêm mili giây: chụp liên tục nhiều ảnh / giây không bị trùng tên
+    timestamp = time.strftime("%Y%m%d_%H%M%S") + f"_{int(time.time() * 1000) % 1000:03d}"
+    if vm_name:
+        return f"{vm_name}-{port}-{timestamp}.{ext}"
+    return f"{port}-{timestamp}.{ext}"
 
-        # 1. Chụp màn hình trên emulator
-        logger.info(f"Taking screenshot on {device}...")
-        result = subprocess.run(
-            [adb_path, "-s", device, "shell", "screencap", "-p", remote_path],
-            capture_output=True,
-            text=True,
-            creationflags=subprocess.CREATE_NO_WINDOW,
-            timeout=10
-        )
 
-        if result.returncode != 0:
-            logger.error(f"Failed to capture screen: {result.stderr}")
-            return None
+# ==================== LƯU + RETENTION ====================
+class ScreenshotStore:
+    """
+    Thư mục lưu ảnh có giới hạn số file / dung lượng (xóa ảnh cũ nhất khi vượt).
 
-        # Đợi file được ghi xong
-        time.sleep(0.5)
+    Index (path, size) giữ trong RAM - chỉ quét thư mục 1 lần khi lưu ảnh đầu tiên.
+    """
 
-        # 2. Pull file về PC
-        logger.info(f"Pulling screenshot to {save_path}...")
-        result = subprocess.run(
-            [adb_path, "-s", device, "pull", remote_path, save_path],
-            capture_output=True,
-            text=True,
-            creationflags=subprocess.CREATE_NO_WINDOW,
-            timeout=10
-        )
+    def __init__(self, directory: str = SCREENSHOT_DIR, max_files: int = SCREENSHOT_KEEP_FILES,
+                 max_mb: float = SCREENSHOT_KEEP_MB):
+        self.directory = directory
+        self.max_files = max_files
+        self.max_bytes = int(max_mb * 1024 * 1024) if max_mb else None
+        self._lock = threading.Lock()
+        self._index = None  # deque[(path, size)] cũ → mới
+        self._total = 0
 
-        if result.returncode != 0:
-            logger.error(f"Failed to pull screenshot: {result.stderr}")
-            return None
+    def _load(self):
+        os.makedirs(self.directory, exist_ok=True)
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file():
+                st = entry.stat()
+                entries.append((st.st_mtime, entry.path, st.st_size))
+        entries.sort()
+        self._index = deque((path, size) for _, path, size in entries)
+        self._total = sum(size for _, size in self._index)
 
-        # 3. Xóa file tạm trên emulator
-        subprocess.run(
-            [adb_path, "-s", device, "shell", "rm", "-f", remote_path],
-            creationflags=subprocess.CREATE_NO_WINDOW,
-            timeout=5
-        )
+    def _enforce(self):
+        while self._index and (
+            (self.max_files and len(self._index) > self.max_files)
+            or (self.max_bytes and self._total > self.max_bytes and len(self._index) > 1)
+        ):
+            path, size = self._index.popleft()
+            self._total -= size
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def save(self, data: bytes, filename: str) -> str:
+        """Ghi ảnh và xóa ảnh cũ nếu vượt giới hạn. Returns: đường dẫn file đã lưu"""
+        with self._lock:
+            if self._index is None:
+                self._load()
+            path = os.path.join(self.directory, filename)
+            with open(path, "wb") as f:
+                f.write(data)
+            self._index.append((path, len(data)))
+            self._total += len(data)
+            self._enforce()
+            return path
+
+    def files(self) -> list:
+        """Đường dẫn ảnh đang giữ, mới nhất trước"""
+        with self._lock:
+            if self._index is None:
+                self._load()
+            return [path for path, _ in reversed(self._index)]
+
+
+# Store mặc định (logs/screenshots/)
+screenshot_store = ScreenshotStore()
+
+
+def take_screenshot(device: str, adb_path: str = None, vm_name: str = None, fmt: str = None,
+                    max_width: int = SCREENSHOT_MAX_WIDTH, store: ScreenshotStore = None) -> str:
+    """
+    Chụp màn hình emulator và lưu về PC.
+
+    Args:
+        device: Device name (e.g., "emulator-5554")
+        adb_path: Đường dẫn adb.exe (defaults to ADB_EXE from config)
+        vm_name: Tên máy ảo (để đặt tên file)
+        fmt: png / jpeg / webp (mặc định SCREENSHOT_FORMAT)
+        max_width: Thu nhỏ ảnh về chiều rộng này (None = giữ nguyên)
+        store: ScreenshotStore (mặc định logs/screenshots/)
 
+    Returns:
+        str: Đường dẫn file ảnh đã lưu, hoặc None nếu thất bại
+    """
+    try:
+        logger.info(f"Taking screenshot on {device}...")
+        png = capture_png(device, adb_path)
+        if png is None:
+            return None
+        data, ext = encode_image(png, fmt, max_width)
+        save_path = (store or screenshot_store).save(data, _filename(device, vm_name, ext))
         logger.info(f"Screenshot saved: {save_path}")
         return save_path
 
-    except subprocess.TimeoutExpired:
-        logger.error("Screenshot timeout")
-        return None
     except Exception as e:
         logger.error(f"Failed to take screenshot: {e}")
         return None
+
+
+# ==================== CHỤP LIÊN TỤC (DEBUG) ====================
+class ScreenRecorder:
+    """
+    Chụp liên tục màn hình 1 VM ở thread nền để debug VM đang lỗi.
+
+    - Không chụp nhanh hơn SCREENSHOT_MIN_INTERVAL (dù interval nhỏ hơn)
+    - Frame giống hệt frame trước (cùng md5 PNG) → không lưu
+    - Dừng khi stop(), đủ max_frames, hết duration hoặc lỗi RECORDER_MAX_ERRORS lần liên tiếp
+    """
+
+    def __init__(self, device: str, vm_name: str = None, interval: float = SCREENSHOT_MIN_INTERVAL,
+                 adb_path: str = None, fmt: str = None, max_width: int = SCREENSHOT_MAX_WIDTH,
+                 store: ScreenshotStore = None, max_frames: int = None, duration: float = None):
+        self.device = device
+        self.vm_name = vm_name
+        self.interval = max(interval or 0, SCREENSHOT_MIN_INTERVAL)
+        self.adb_path = adb_path
+        self.fmt = fmt
+        self.max_width = max_width
+        self.store = store or screenshot_store
+        self.max_frames = max_frames
+        self.duration = duration
+        self.saved = 0        # số ảnh đã lưu
+        self.duplicates = 0   # số frame trùng bị bỏ
+        self.errors = 0       # số lần chụp lỗi
+        self.last_path = None
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return self
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name=f"ScreenRecorder-{self.device}", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, wait: float = 5):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(wait)
+
+    @property
+    def running(self) -> bool:
+        return bool(self._thread and self._thread.is_alive())
+
+    def _run(self):
+        deadline = time.monotonic() + self.duration if self.duration else None
+        last_digest = None
+        consecutive_errors = 0
+        logger.info(f"🎥 Bắt đầu chụp liên tục {self.device} (mỗi {self.interval:g}s)")
+        while not self._stop_event.is_set():
+            started = time.monotonic()
+            png = capture_png(self.device, self.adb_path)
+            if png is None:
+                self.errors += 1
+                consecutive_errors += 1
+                if consecutive_errors >= RECORDER_MAX_ERRORS:
+                    logger.warning(f"⚠️ Dừng chụp {self.device}: lỗi {consecutive_errors} lần liên tiếp")
+                    break
+            else:
+                consecutive_errors = 0
+                digest = hashlib.md5(png).digest()
+                if digest == last_digest:
+                    self.duplicates += 1
+                else:
+                    last_digest = digest
+                    try:
+                        data, ext = encode_image(png, self.fmt, self.max_width)
+                        self.last_path = self.store.save(data, _filename(self.device, self.vm_name, ext))
+                        self.saved += 1
+                    except Exception as e:
+                        self.errors += 1
+                        logger.error(f"Failed to save screenshot: {e}")
+                    if self.max_frames and self.saved >= self.max_frames:
+                        break
+
+            now = time.monotonic()
+            if deadline and now >= deadline:
+                break
+            wait = self.interval - (now - started)
+            if deadline:
+                wait = min(wait, deadline - now)
+            self._stop_event.wait(max(0.0, wait))
+        logger.info(f"🎥 Dừng chụp {self.device}: {self.saved} ảnh, {self.duplicates} frame trùng, {self.errors} lỗi")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Chụp màn hình máy ảo qua adb exec-out (debug)")
+    parser.add_argument("device", help="ADB device, vd: emulator-5554")
+    parser.add_argument("--vm", help="Tên máy ảo (đặt tên file)")
+    parser.add_argument("--watch", type=float, help="Chụp liên tục mỗi N giây tới khi Ctrl+C")
+    parser.add_argument("--format", default=None, choices=sorted(_EXTENSIONS))
+    parser.add_argument("--max-width", type=int, default=SCREENSHOT_MAX_WIDTH)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s | %(message)s")
+
+    if args.watch is None:
+        print(take_screenshot(args.device, vm_name=args.vm, fmt=args.format, max_width=args.max_width))
+    else:
+        recorder = ScreenRecorder(args.device, args.vm, interval=args.watch, fmt=args.format,
+                                  max_width=args.max_width).start()
+        try:
+            while recorder.running:
+                time.sleep(0.5)
+        except KeyboardInterrupt:
+            pass
+        recorder.stop()
+        print(f"{recorder.saved} ảnh → {recorder.store.directory}")
@@ -1,10 +1,14 @@
 import os
+import posixpath
 import subprocess
-import json
-from config import ADB_EXE, VM_DATA_DIR, get_vm_id_from_name
+from config import ADB_EXE
+from constants import DCIM_PATH, ADB_PUSH_MAX_CMDLINE
+from utils.vm_registry import vm_registry
+from utils.cancel_token import OperationCancelled, run as cancellable_run
+from utils.media_store import scan_media, wait_media_indexed
 
 
-def send_file_api(local_path, vm_name, adb_path=None, log_callback=None):
+def send_file_api(local_path, vm_name, adb_path=None, log_callback=None, cancel_token=None):
     """
     Gửi file từ PC sang LDPlayer dựa vào file /data/vm/{vm_id}.json
 
@@ -13,6 +17,32 @@ def send_file_api(local_path, vm_name, adb_path=None, log_callback=None):
         vm_name: Tên máy ảo (vd: mayaotest1)
         adb_path: Path to adb.exe (defaults to ADB_EXE from config)
         log_callback: Hàm callback để ghi log
+        cancel_token: Optional CancelToken - kill lệnh adb ngay khi bị dừng
+    """
+    return local_path in send_files_api([local_path], vm_name, adb_path=adb_path,
+                                        log_callback=log_callback, cancel_token=cancel_token)
+
+
+def send_files_api(local_paths, vm_name, remote_dir=DCIM_PATH, adb_path=None, log_callback=None,
+                   cancel_token=None, confirm_index=True):
+    """
+    Gửi nhiều file sang LDPlayer trong 1 phiên adb push (carousel / nạp trước nhiều post).
+
+    - 1 lệnh `adb push f1 f2 ... remote_dir/` (chia nhỏ nếu command line quá dài)
+    - 1 broadcast quét cả remote_dir thay vì từng file
+    - Xác nhận MediaStore đã index bằng query content://media (không sleep cố định)
+
+    Args:
+        local_paths: Danh sách file trên PC (tên file không được trùng nhau)
+        vm_name: Tên máy ảo (vd: mayaotest1)
+        remote_dir: Thư mục đích trong Android
+        adb_path: Path to adb.exe (defaults to ADB_EXE from config)
+        log_callback: Hàm callback để ghi log
+        cancel_token: Optional CancelToken - kill lệnh adb ngay khi bị dừng
+        confirm_index: False → chỉ push + broadcast, không chờ MediaStore
+
+    Returns:
+        dict: {local_path: remote_path} các file đã push thành công ({} nếu lỗi / bị dừng)
     """
     # ✅ Fallback cho log
     log = log_callback or (lambda msg: print(msg))
@@ -22,86 +52,119 @@ def send_file_api(local_path, vm_name, adb_path=None, log_callback=None):
         adb_path = ADB_EXE
 
     try:
-        # 🔹 1️⃣ Kiểm tra file tồn tại
-        if not os.path.exists(local_path):
-            log(f"❌ File không tồn tại: {local_path}")
-            return False
-
-        # ✅ v1.5.36: Tìm VM ID từ tên máy ảo
-        vm_id = get_vm_id_from_name(vm_name)
-        if not vm_id:
-            log(f"❌ Không tìm thấy file cấu hình cho máy ảo: {vm_name}")
-            return False
-
-        # 🔹 2️⃣ Đọc thông tin máy ảo từ /data/vm/{vm_id}.json
-        vm_file = os.path.join(VM_DATA_DIR, f"{vm_id}.json")
-        if not os.path.exists(vm_file):
-            log(f"❌ Không tìm thấy file cấu hình: {vm_file}")
-            return False
-
-        with open(vm_file, "r", encoding="utf-8") as f:
-            vm_info = json.load(f)
-
-        port = vm_info.get("port")
-        if not port or not str(port).isdigit():
-            log(f"❌ File cấu hình máy ảo không có port hợp lệ.")
-            return False
-
-        device = f"emulator-{port}"
-        log(f"🔹 Device: {device}")
-
-        # 🔹 3️⃣ Kiểm tra kết nối ADB
-        log(f"   🔍 Kiểm tra ADB connection...")
-        result = subprocess.run(
-            [adb_path, "devices"],
-            capture_output=True, text=True, encoding="utf-8", errors="ignore",
-            creationflags=subprocess.CREATE_NO_WINDOW
-        )
-        if device not in result.stdout:
-            log(f"❌ Device '{device}' không có trong 'adb devices'")
-            log(f"   📋 Output: {result.stdout.strip()}")
-            return False
-        log(f"   ✅ Device '{device}' đã kết nối ADB")
-
-        # 🔹 4️⃣ Thực hiện adb push
-        filename = os.path.basename(local_path)
-        remote_path = f"/sdcard/DCIM/{filename}"
-        log(f"🚀 Đang gửi file {filename} sang {device} ...")
-
-        push = subprocess.run(
-            [adb_path, "-s", device, "push", local_path, remote_path],
+        # 🔹 1️⃣ Kiểm tra file tồn tại + tên file không trùng (cùng đích sẽ ghi đè nhau)
+        local_paths = list(local_paths)
+        if not local_paths:
+            return {}
+        for local_path in local_paths:
+            if not os.path.exists(local_path):
+                log(f"❌ File không tồn tại: {local_path}")
+                return {}
+        names = [os.path.basename(path) for path in local_paths]
+        if len(set(names)) != len(names):
+            log(f"❌ Có file trùng tên - không thể gửi chung vào {remote_dir}")
+            return {}
+
+        # 🔹 2️⃣ Lấy device + kiểm tra kết nối ADB
+        device = _resolve_device(vm_name, adb_path, log)
+        if not device:
+            return {}
+
+        # 🔹 3️⃣ Push + quét MediaStore + xác nhận index
+        return _push_batch(local_paths, device, remote_dir, adb_path, log, cancel_token, confirm_index)
+
+    except OperationCancelled:
+        log("🛑 Dừng gửi file")
+        return {}
+    except Exception as e:
+        log(f"❌ Lỗi khi gửi file sang máy ảo: {e}")
+        return {}
+
+
+def _resolve_device(vm_name, adb_path, log):
+    """VM registry → emulator-{port}, kiểm tra device có trong 'adb devices' (None nếu lỗi)"""
+    # Lấy thông tin máy ảo từ VM registry (cache của /data/vm/{vm_id}.json)
+    vm_info = vm_registry.get(vm_name)
+    if not vm_info:
+        log(f"❌ Không tìm thấy file cấu hình cho máy ảo: {vm_name}")
+        return None
+
+    port = vm_info.get("port")
+    if not port or not str(port).isdigit():
+        log("❌ File cấu hình máy ảo không có port hợp lệ.")
+        return None
+
+    device = f"emulator-{port}"
+    log(f"🔹 Device: {device}")
+
+    log("   🔍 Kiểm tra ADB connection...")
+    result = subprocess.run(
+        [adb_path, "devices"],
+        capture_output=True, text=True, encoding="utf-8", errors="ignore",
+        creationflags=subprocess.CREATE_NO_WINDOW
+    )
+    if device not in result.stdout:
+        log(f"❌ Device '{device}' không có trong 'adb devices'")
+        log(f"   📋 Output: {result.stdout.strip()}")
+        return None
+    log(f"   ✅ Device '{device}' đã kết nối ADB")
+    return device
+
+
+def _chunks(local_paths, budget=ADB_PUSH_MAX_CMDLINE):
+    """Chia danh sách file để mỗi lệnh adb push không vượt giới hạn độ dài command line"""
+    chunk, size = [], 0
+    for path in local_paths:
+        if chunk and size + len(path) + 3 > budget:
+            yield chunk
+            chunk, size = [], 0
+        chunk.append(path)
+        size += len(path) + 3
+    if chunk:
+        yield chunk
+
+
+def _push_batch(local_paths, device, remote_dir, adb_path, log, cancel_token, confirm_index=True):
+    remote_dir = remote_dir.rstrip("/")
+    pushed = {}
+    total = len(local_paths)
+    label = os.path.basename(local_paths[0]) if total == 1 else f"{total} file"
+    log(f"🚀 Đang gửi {label} sang {device} ...")
+
+    # 🔹 adb push nhiều nguồn vào 1 thư mục = 1 phiên sync
+    for chunk in _chunks(local_paths):
+        push = cancellable_run(
+            [adb_path, "-s", device, "push", *chunk, remote_dir + "/"],
+            token=cancel_token,
             capture_output=True, text=True, encoding="utf-8", errors="ignore",
             creationflags=subprocess.CREATE_NO_WINDOW
         )
-
-        if push.returncode == 0:
-            log(f"✅ Gửi file thành công → {remote_path}")
-
-            # 🔹 5️⃣ Quét lại MediaStore để Gallery/Instagram nhận ra file ngay
-            log(f"🔁 Đang refresh MediaStore...")
-            try:
-                subprocess.run([
-                    adb_path, "-s", device, "shell",
-                    "am", "broadcast", "-a", "android.intent.action.MEDIA_SCANNER_SCAN_FILE",
-                    "-d", f"file://{remote_path}"
-                ],
-                text=True, encoding="utf-8", errors="ignore",
-                creationflags=subprocess.CREATE_NO_WINDOW,
-                timeout=10
-                )
-                log(f"✅ Đã refresh MediaStore — Instagram sẽ thấy video ngay")
-            except Exception as e:
-                log(f"⚠️ Lỗi khi refresh MediaStore: {e}")
-
-            return True
-        else:
+        if push.returncode != 0:
             log(f"❌ Gửi file thất bại (returncode: {push.returncode})")
             if push.stderr:
                 log(f"   📋 Error: {push.stderr.strip()}")
             if push.stdout:
                 log(f"   📋 Output: {push.stdout.strip()}")
-            return False
-
-    except Exception as e:
-        log(f"❌ Lỗi khi gửi file sang máy ảo: {e}")
-        return False
+            break
+        for path in chunk:
+            pushed[path] = posixpath.join(remote_dir, os.path.basename(path))
+
+    if not pushed:
+        return {}
+    log(f"✅ Gửi file thành công → {next(iter(pushed.values())) if len(pushed) == 1 else remote_dir}"
+        f"{'' if len(pushed) == total else f' ({len(pushed)}/{total} file)'}")
+
+    # 🔹 Quét lại MediaStore 1 lần cho cả thư mục để Gallery/Instagram nhận ra file ngay
+    log("🔁 Đang refresh MediaStore...")
+    if not scan_media(device, [remote_dir], adb_path=adb_path, cancel_token=cancel_token):
+        log("⚠️ Lỗi khi refresh MediaStore")
+    if not confirm_index:
+        return pushed
+
+    indexed = wait_media_indexed(device, list(pushed.values()), adb_path=adb_path,
+                                 log_callback=log, cancel_token=cancel_token)
+    if indexed is None:
+        log("⚠️ Không query được MediaStore - bỏ qua bước xác nhận index")
+    elif len(indexed) == len(pushed):
+        log(f"✅ MediaStore đã index {len(indexed)} file — Instagram sẽ thấy video ngay")
+    return pushed
@@ -1,10 +1,11 @@
 # utils/tiktok_api.py
 from datetime import datetime, timezone
-import yt_dlp
 
 
 def fetch_tiktok_videos(url, max_videos=30):
     """Lấy danh sách video TikTok từ tài khoản"""
+    import yt_dlp  # import lúc dùng - tránh nạp yt_dlp khi khởi động app
+
     ydl_opts = {
         'quiet': True,
         'no_warnings': True,
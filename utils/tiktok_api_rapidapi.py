@@ -13,6 +13,8 @@ import os
 import time
 from datetime import datetime, timezone
 
+from utils.cancel_token import OperationCancelled, run as cancellable_run
+
 
 def extract_tiktok_username(url):
     """
@@ -540,7 +542,7 @@ def check_tiktok_api_key_valid(api_key, timeout=15):
         }
 
 
-def download_tiktok_video(video_url, api_key, log_callback=None):
+def download_tiktok_video(video_url, api_key, log_callback=None, cancel_token=None):
     """
     Download video TikTok từ URL
 
@@ -548,11 +550,13 @@ def download_tiktok_video(video_url, api_key, log_callback=None):
         video_url: URL video TikTok (https://www.tiktok.com/@username/video/ID)
         api_key: RapidAPI key
         log_callback: Hàm log (optional)
+        cancel_token: Optional CancelToken - kill curl và xóa file dở khi bị dừng
 
     Returns:
-        str: Path to downloaded file hoặc None nếu lỗi
+        str: Path to downloaded file hoặc None nếu lỗi/bị dừng
     """
     log = log_callback or (lambda msg: print(msg))
+    output_path = None
 
     try:
         # Step 1: Get direct download link
@@ -582,8 +586,9 @@ def download_tiktok_video(video_url, api_key, log_callback=None):
             direct_link
         ]
 
-        result = subprocess.run(
+        result = cancellable_run(
             cmd,
+            token=cancel_token,
             capture_output=True,
             text=True,
             creationflags=subprocess.CREATE_NO_WINDOW,
@@ -611,6 +616,14 @@ def download_tiktok_video(video_url, api_key, log_callback=None):
 
         return output_path
 
+    except OperationCancelled:
+        log("🛑 Đã dừng tải video")
+        if output_path and os.path.exists(output_path):
+            try:
+                os.remove(output_path)
+            except Exception:
+                pass
+        return None
     except subprocess.TimeoutExpired:
         log(f"⏱️ Timeout khi tải video (quá 5 phút)")
         return None
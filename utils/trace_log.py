@@ -0,0 +1,422 @@
+"""
+Trace Log - Log có cấu trúc theo từng post (JSONL) thay cho chuỗi emoji tự do.
+
+Trước đây ScheduledPost.log / Stream.log format sẵn "[dd/mm/YYYY HH:MM:SS] msg" cho
+MỌI dòng (kể cả khi không mở cửa sổ log), giữ list 1000 chuỗi, và message của
+InstagramPost còn bị root logger format thêm 1 lần nữa. Muốn tìm post chậm thì
+phải grep log tiếng Việt.
+
+Mỗi event là 1 dict:
+    {"ts": 1700000000.123, "trace": "<post id | stream:row>", "post": "<job id>",
+     "span": "a1b2c3d4", "stage": "push", "vm": "VM1", "level": "INFO",
+     "kind": "log" | "span" | "post", "msg": "...", "dur": 12.3, "result": "ok"}
+
+- kind="log": 1 dòng log (msg)
+- kind="span": kết thúc 1 stage của pipeline (dur, result) - các log trong stage có cùng span
+- kind="post": kết thúc 1 post (dur, result=outcome, failed_stage)
+
+- RAM: ring buffer (deque maxlen=TRACE_MEMORY_EVENTS) mỗi trace, event lưu dạng tuple gọn
+  (không phải dict) → cửa sổ log render từ đây, chỉ format khi cửa sổ đang mở
+- Event bị đẩy khỏi ring → spill xuống logs/trace/spill/<trace>.jsonl (writer thread ghi theo lô),
+  cửa sổ log đọc ngược lại từng trang khi bấm "Tải log cũ hơn" (page)
+- Ghi file theo lô bằng thread riêng: logs/trace/trace_YYYY-MM-DD.jsonl, giữ TRACE_KEEP_DAYS ngày
+
+Sử dụng:
+    from utils.trace_log import trace_log, format_event
+    event = trace_log.event(post.id, "📤 Gửi file...", vm="VM1", stage="push", span=span_id)
+    trace_log.event(post.id, kind="span", stage="push", span=span_id, dur=3.2, result="ok")
+    lines = [format_event(e) for e in trace_log.recent(post.id)]
+    events, cursor = trace_log.snapshot(post.id)          # mở cửa sổ: RAM + cursor spill
+    older, cursor = trace_log.page(post.id, before=cursor)  # "Tải log cũ hơn"
+    trace_log.subscribe(callback)                          # nhận mọi event mới (daemon /events)
+
+Phân tích:
+    jq -c 'select(.kind=="span") | [.vm, .stage, .dur]' logs/trace/trace_2024-01-01.jsonl
+"""
+import os
+import re
+import json
+import time
+import uuid
+import hashlib
+import logging
+import threading
+from collections import deque
+from datetime import datetime, timedelta, timezone
+
+from config import LOG_DIR
+from constants import (
+    TRACE_LOG_ENABLED, TRACE_FLUSH_INTERVAL, TRACE_BATCH_SIZE,
+    TRACE_KEEP_DAYS, TRACE_MEMORY_EVENTS, TRACE_PAGE_SIZE, TRACE_SPILL_MAX_BYTES
+)
+
+TRACE_DIR = os.path.join(LOG_DIR, "trace")
+SPILL_DIR = os.path.join(TRACE_DIR, "spill")
+
+# Field cố định của 1 record trong ring: tuple thay cho dict
+_FIELDS = ("ts", "kind", "level", "msg", "post", "span", "stage", "vm")
+_FIELD_SET = frozenset(_FIELDS)
+
+# Đọc ngược spill file theo khối này (byte)
+_READ_CHUNK = 64 * 1024
+
+# 1 encoder dùng chung (nhanh hơn json.dumps mỗi lần), JSON gọn không khoảng trắng
+_encode = json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).encode
+
+# Số event tối đa chờ ghi file (bỏ event cũ nhất nếu writer không kịp)
+WRITE_BUFFER_MAX = 100_000
+
+VN_TZ = timezone(timedelta(hours=7))
+
+
+def format_event(event: dict) -> str:
+    """Render 1 event thành dòng hiển thị trong cửa sổ log (giống format cũ)"""
+    stamp = datetime.fromtimestamp(event["ts"], VN_TZ).strftime("%d/%m/%Y %H:%M:%S")
+    kind = event.get("kind", "log")
+    if kind == "span":
+        text = f"⏱️ {event.get('stage')}: {event.get('dur', 0):.1f}s ({event.get('result')})"
+    elif kind == "post":
+        text = f"⏱️ Tổng thời gian: {event.get('dur', 0):.1f}s ({event.get('result')})"
+        if event.get("failed_stage"):
+            text += f" - lỗi ở bước {event['failed_stage']}"
+    else:
+        text = event.get("msg", "")
+    return f"[{stamp}] {text}"
+
+
+def _pack(event: dict) -> tuple:
+    """dict event → tuple (field cố định + dict phụ cho dur/result... nếu có)"""
+    extra = None
+    if len(event) > 4:
+        for key, value in event.items():
+            if key not in _FIELD_SET and key != "trace":
+                if extra is None:
+                    extra = {}
+                extra[key] = value
+    get = event.get
+    msg = get("msg")
+    # msg giữ dạng UTF-8 bytes: chuỗi có emoji bị Python lưu 4 byte/ký tự, bytes chỉ ~1 byte/ký tự
+    return (event["ts"], event["kind"], event["level"], msg.encode("utf-8") if msg else msg,
+            get("post"), get("span"), get("stage"), get("vm"), extra)
+
+
+def _unpack(trace_id, record: tuple) -> dict:
+    event = {"trace": trace_id}
+    for key, value in zip(_FIELDS, record):
+        if value is not None:
+            event[key] = value
+    if record[3]:
+        event["msg"] = record[3].decode("utf-8")
+    if record[-1]:
+        event.update(record[-1])
+    return event
+
+
+def _spill_path(trace_id) -> str:
+    """Tên file spill an toàn cho mọi trace id (có ký tự lạ/Unicode) - thêm hash tránh trùng"""
+    safe = re.sub(r"[^\w.-]+", "_", str(trace_id))[:80]
+    digest = hashlib.md5(str(trace_id).encode("utf-8")).hexdigest()[:8]
+    return os.path.join(SPILL_DIR, f"{safe}_{digest}.jsonl")
+
+
+def new_span_id() -> str:
+    """ID ngắn cho 1 span (stage) - đủ để nhóm log trong 1 file ngày"""
+    return uuid.uuid4().hex[:8]
+
+
+class TraceLog:
+    """Singleton: buffer event theo trace + writer JSONL chạy nền"""
+
+    _instance = None
+    _creation_lock = threading.Lock()
+
+    def __new__(cls):
+        if cls._instance is None:
+            with cls._creation_lock:
+                if cls._instance is None:
+                    cls._instance = super().__new__(cls)
+        return cls._instance
+
+    def __init__(self):
+        if not hasattr(self, '_initialized'):
+            self._lock = threading.Lock()
+            self._recent = {}  # {trace_id: deque[tuple]} - ring buffer
+            self._write_buffer = deque(maxlen=WRITE_BUFFER_MAX)
+            self._spill_buffer = deque(maxlen=WRITE_BUFFER_MAX)  # (trace_id, tuple) bị đẩy khỏi ring
+            self._spill_lock = threading.Lock()  # ghi/đọc/xóa spill file
+            self._write_enabled = False
+            self._writer_thread = None
+            self._wake_event = threading.Event()
+            self._stop_event = threading.Event()
+            self._cleaned_day = None  # Ngày đã xóa file quá hạn (chỉ quét thư mục 1 lần/ngày)
+            self._subscribers = ()  # callback(event) - tuple thay mới khi (un)subscribe, đọc không cần lock
+            self.logger = logging.getLogger(__name__)
+            self._initialized = True
+
+    # ==================== RECORD ====================
+    def event(self, trace_id, msg: str = None, level: str = "INFO", kind: str = "log", **fields) -> dict:
+        """
+        Ghi 1 event vào trace.
+
+        Args:
+            trace_id: ID của trace (post.id hoặc "stream:<row_id>")
+            msg: Nội dung (kind="log")
+            level: INFO / WARNING / ERROR
+            kind: "log" / "span" / "post"
+            **fields: post, span, stage, vm, dur, result, failed_stage... (None bị bỏ qua)
+
+        Returns:
+            dict: event vừa ghi
+        """
+        event = {"ts": time.time(), "trace": trace_id, "kind": kind, "level": level}
+        if msg is not None:
+            event["msg"] = msg
+        for key, value in fields.items():
+            if value is not None:
+                event[key] = round(value, 3) if key == "dur" else value
+
+        record = _pack(event)
+        with self._lock:
+            ring = self._recent.get(trace_id)
+            if ring is None:
+                ring = self._recent[trace_id] = deque(maxlen=TRACE_MEMORY_EVENTS)
+            if len(ring) == TRACE_MEMORY_EVENTS and self._write_enabled:
+                self._spill_buffer.append((trace_id, ring[0]))
+            ring.append(record)
+        if self._write_enabled:
+            self._write_buffer.append(event)
+            if len(self._write_buffer) >= TRACE_BATCH_SIZE and not self._wake_event.is_set():
+                self._wake_event.set()
+        for callback in self._subscribers:
+            try:
+                callback(event)
+            except Exception:
+                pass  # Subscriber lỗi không được làm hỏng thread đang ghi log
+        return event
+
+    def subscribe(self, callback):
+        """Đăng ký callback(event) cho mọi event mới (gọi trong thread ghi event - phải nhanh)"""
+        with self._lock:
+            self._subscribers = self._subscribers + (callback,)
+
+    def unsubscribe(self, callback):
+        with self._lock:
+            self._subscribers = tuple(cb for cb in self._subscribers if cb is not callback)
+
+    # ==================== QUERY ====================
+    def recent(self, trace_id) -> list:
+        """Các event trong RAM của trace (cũ → mới)"""
+        with self._lock:
+            ring = self._recent.get(trace_id)
+            records = list(ring) if ring else []
+        return [_unpack(trace_id, r) for r in records]
+
+    def snapshot(self, trace_id):
+        """
+        Event trong RAM + cursor của spill file tại cùng thời điểm (mở cửa sổ log).
+
+        Returns:
+            (list[dict] cũ → mới, cursor cho page() - 0 nếu không có log cũ hơn)
+        """
+        with self._spill_lock:
+            with self._lock:
+                items = self._take_spill(trace_id)
+                ring = self._recent.get(trace_id)
+                records = list(ring) if ring else []
+            self._append_spill(items)
+            try:
+                cursor = os.path.getsize(_spill_path(trace_id))
+            except OSError:
+                cursor = 0
+        return [_unpack(trace_id, r) for r in records], cursor
+
+    def page(self, trace_id, before: int = None, limit: int = TRACE_PAGE_SIZE):
+        """
+        Đọc 1 trang event cũ hơn ring từ spill file (đọc ngược từ cuối file).
+
+        Args:
+            trace_id: ID của trace
+            before: Cursor từ snapshot()/lần page() trước (None = cuối spill file hiện tại)
+            limit: Số event tối đa
+
+        Returns:
+            (list[dict] cũ → mới, cursor cho trang kế tiếp - 0 nếu đã hết)
+        """
+        if before is None:
+            _, before = self.snapshot(trace_id)
+        if before <= 0:
+            return [], 0
+        path = _spill_path(trace_id)
+        with self._spill_lock:
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                return [], 0
+            end = min(before, size)
+            buf, pos = b"", end
+            with open(path, "rb") as f:
+                while pos > 0 and buf.count(b"\n") <= limit:
+                    read_from = max(0, pos - _READ_CHUNK)
+                    f.seek(read_from)
+                    buf = f.read(pos - read_from) + buf
+                    pos = read_from
+
+        lines = buf.split(b"\n")[:-1]  # buf kết thúc bằng "\n"
+        if pos > 0 and lines:
+            # Dòng đầu có thể bị cắt giữa chừng → để trang sau đọc
+            pos += len(lines.pop(0)) + 1
+        if len(lines) > limit:
+            pos += sum(len(line) + 1 for line in lines[:-limit])
+            lines = lines[-limit:]
+        events = []
+        for line in lines:
+            try:
+                event = json.loads(line)
+                event["trace"] = trace_id
+                events.append(event)
+            except Exception:
+                continue
+        return events, pos
+
+    def clear(self, trace_id):
+        """Xóa log của trace trong RAM + spill file (nút 'Xóa lịch sử') - file JSONL theo ngày giữ nguyên"""
+        with self._spill_lock:
+            with self._lock:
+                self._recent.pop(trace_id, None)
+                self._take_spill(trace_id)
+            try:
+                os.remove(_spill_path(trace_id))
+            except OSError:
+                pass
+
+    # ==================== WRITER ====================
+    def start(self):
+        """Bật writer JSONL chạy nền theo cấu hình trong constants.py (gọi 1 lần khi mở app)"""
+        if not TRACE_LOG_ENABLED or self._writer_thread is not None:
+            return
+        os.makedirs(TRACE_DIR, exist_ok=True)
+        self._write_enabled = True
+        self._stop_event.clear()
+        self._writer_thread = threading.Thread(target=self._writer_loop, daemon=True, name="TraceWriter")
+        self._writer_thread.start()
+
+    def _writer_loop(self):
+        while not self._stop_event.is_set():
+            self._wake_event.wait(TRACE_FLUSH_INTERVAL)
+            self._wake_event.clear()
+            self.flush()
+        self.flush()
+
+    def flush(self):
+        """Ghi các event đang chờ vào file JSONL của ngày hiện tại (1 lần open/ngày/lô) + spill file"""
+        if self._spill_buffer:
+            with self._spill_lock:
+                with self._lock:
+                    items = self._take_spill()
+                self._append_spill(items)
+        if not self._write_buffer:
+            return
+        events = []
+        while self._write_buffer:
+            try:
+                events.append(self._write_buffer.popleft())
+            except IndexError:
+                break
+
+        first_day = datetime.fromtimestamp(events[0]["ts"]).strftime("%Y-%m-%d")
+        last_day = datetime.fromtimestamp(events[-1]["ts"]).strftime("%Y-%m-%d")
+        if first_day == last_day:
+            by_day = {first_day: [_encode(event) for event in events]}
+        else:
+            by_day = {}
+            for event in events:
+                day = datetime.fromtimestamp(event["ts"]).strftime("%Y-%m-%d")
+                by_day.setdefault(day, []).append(_encode(event))
+        try:
+            os.makedirs(TRACE_DIR, exist_ok=True)
+            for day, lines in by_day.items():
+                with open(os.path.join(TRACE_DIR, f"trace_{day}.jsonl"), "a", encoding="utf-8") as f:
+                    f.write("\n".join(lines) + "\n")
+            today = datetime.now().strftime("%Y-%m-%d")
+            if self._cleaned_day != today:
+                self._remove_old_files()
+                self._cleaned_day = today
+        except Exception as e:
+            self.logger.warning(f"⚠️ Lỗi ghi trace log: {e}")
+
+    def _take_spill(self, trace_id=None) -> list:
+        """Lấy event chờ spill (gọi khi đang giữ _lock). trace_id=None → lấy hết"""
+        if trace_id is None:
+            items = list(self._spill_buffer)
+            self._spill_buffer.clear()
+            return items
+        items = [item for item in self._spill_buffer if item[0] == trace_id]
+        if items:
+            kept = [item for item in self._spill_buffer if item[0] != trace_id]
+            self._spill_buffer.clear()
+            self._spill_buffer.extend(kept)
+        return items
+
+    def _append_spill(self, items: list):
+        """Ghi event bị đẩy khỏi ring vào spill file của từng trace (gọi khi đang giữ _spill_lock)"""
+        if not items:
+            return
+        by_trace = {}
+        for tid, record in items:
+            event = _unpack(tid, record)
+            del event["trace"]
+            by_trace.setdefault(tid, []).append(_encode(event))
+        try:
+            os.makedirs(SPILL_DIR, exist_ok=True)
+            for tid, lines in by_trace.items():
+                path = _spill_path(tid)
+                with open(path, "a", encoding="utf-8") as f:
+                    f.write("\n".join(lines) + "\n")
+                if os.path.getsize(path) > TRACE_SPILL_MAX_BYTES:
+                    self._trim_spill(path)
+        except Exception as e:
+            self.logger.warning(f"⚠️ Lỗi ghi trace spill: {e}")
+
+    @staticmethod
+    def _trim_spill(path: str):
+        """Spill file quá TRACE_SPILL_MAX_BYTES → giữ nửa mới nhất (cắt tại đầu dòng)"""
+        with open(path, "rb") as f:
+            f.seek(-(TRACE_SPILL_MAX_BYTES // 2), os.SEEK_END)
+            data = f.read()
+        data = data[data.find(b"\n") + 1:]
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def _remove_old_files(self):
+        cutoff = (datetime.now() - timedelta(days=TRACE_KEEP_DAYS)).strftime("%Y-%m-%d")
+        for name in os.listdir(TRACE_DIR):
+            if name.startswith("trace_") and name.endswith(".jsonl") and name[6:16] < cutoff:
+                try:
+                    os.remove(os.path.join(TRACE_DIR, name))
+                except Exception:
+                    pass
+        # Spill file của post đã lâu không ghi thêm
+        if os.path.isdir(SPILL_DIR):
+            cutoff_ts = time.time() - TRACE_KEEP_DAYS * 86400
+            for name in os.listdir(SPILL_DIR):
+                path = os.path.join(SPILL_DIR, name)
+                try:
+                    if os.path.getmtime(path) < cutoff_ts:
+                        os.remove(path)
+                except Exception:
+                    pass
+
+    def shutdown(self):
+        """Dừng writer và ghi nốt event đang chờ"""
+        if self._writer_thread is not None:
+            self._stop_event.set()
+            self._wake_event.set()
+            self._writer_thread.join(timeout=5)
+            self._writer_thread = None
+            self._write_enabled = False
+
+
+# Global singleton instance
+trace_log = TraceLog()
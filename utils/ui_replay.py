@@ -0,0 +1,725 @@
+"""
+UI Replay - Ghi lại UI hierarchy + thao tác khi chạy thật, phát lại offline để đo flow.
+
+Trước đây muốn đo / thử tối ưu InstagramPost.auto_post, InstagramLogin.auto_login phải có
+LDPlayer đang chạy. Ở đây:
+
+- UIRecorder (bật UI_RECORD_ENABLED): bọc uiautomator2 device của flow, ghi
+  + các màn hình khác nhau (dump_hierarchy) - dump ngay sau mỗi thao tác, còn lại tối đa
+    1 lần / UI_RECORD_MIN_INTERVAL khi flow hỏi element (qua IndexedDevice: lấy đúng dump
+    vừa trả lời truy vấn, không tốn thêm)
+  + thao tác (click / set_text / press / app_stop) và thao tác nào làm đổi màn hình, sau bao lâu
+  + kết quả các lần hỏi element (exists / wait) để kiểm tra bộ match offline có khớp u2 không
+  Lưu gzip JSON: logs/ui_recordings/<flow>/<YYYYmmdd-HHMMSS>_<vm>.json.gz (text đã nhập KHÔNG lưu)
+- ReplayDevice: thay u2.Device khi phát lại - màn hình chuyển theo thao tác (khớp op + selector)
+  hoặc theo thời gian, trên đồng hồ giả lập SimClock (sleep không chờ thật)
+- replay_flow: chạy lại đúng code auto_post / auto_login trên ReplayDevice, trả về số liệu:
+  thời gian match selector, số lần dump hierarchy, tổng thời gian chờ giả lập, thao tác lệch bản ghi
+
+Benchmark: benchmarks/bench_ui_replay.py (không có bản ghi thật → synthetic_recording).
+"""
+import os
+import re
+import json
+import gzip
+import glob
+import time
+import random
+import logging
+import functools
+import subprocess
+import xml.etree.ElementTree as ET
+
+from config import LOG_DIR
+from constants import UI_RECORD_MIN_INTERVAL, UI_RECORD_KEEP
+from utils.cancel_token import CancelToken
+from utils.ui_selector import HierarchyIndex, IndexedDevice, ui_selector_xpath
+
+RECORDINGS_DIR = os.path.join(LOG_DIR, "ui_recordings")
+RECORDING_VERSION = 1
+
+# uiautomator2 XPathSelector.wait() poll .exists mỗi 0.2s
+U2_WAIT_POLL = 0.2
+U2_WAIT_TIMEOUT = 10  # wait() không truyền timeout
+
+# Attribute hierarchy → key trong .info của u2
+_INFO_KEYS = {"resource-id": "resourceId", "content-desc": "description", "class": "className"}
+_BOOL = {"true": True, "false": False}
+
+
+def selector_key(selector) -> str:
+    """Key ổn định của selector: XPath giữ nguyên, d(**kwargs) → 'ui:{json}'"""
+    if isinstance(selector, dict):
+        return "ui:" + json.dumps(selector, sort_keys=True, ensure_ascii=False)
+    return selector
+
+
+def element_info(el) -> dict:
+    """Giống .info của u2 cho 1 node: 'true'/'false' → bool"""
+    return {_INFO_KEYS.get(key, key): _BOOL.get(value, value) for key, value in el.attrib.items()}
+
+
+class ElementTreeMatcher:
+    """
+    Match selector bằng XPath tổng quát (ElementTree) trên toàn bộ cây - như u2 làm với mỗi dump.
+
+    Interface chung cho ReplayDevice: parse(xml) → cây, match(cây, selector) → list node
+    (utils.ui_selector.IndexedMatcher: selector đơn giản tra dict). Selector không hỗ trợ → ValueError.
+    """
+
+    name = "etree"
+
+    def parse(self, xml) -> HierarchyIndex:
+        return HierarchyIndex(xml)
+
+    def match(self, index: HierarchyIndex, selector) -> list:
+        if isinstance(selector, dict):
+            selector = ui_selector_xpath(selector)
+        return index.find_xpath(selector)
+
+
+# ==================== GHI (CHẠY THẬT) ====================
+class UIRecorder:
+    """
+    Ghi 1 lần chạy flow. Dùng recorder.device thay cho device thật, gọi save() khi flow xong.
+
+    Mọi lỗi khi dump / lưu chỉ ghi log debug - không làm hỏng flow đang đăng.
+    """
+
+    def __init__(self, device, flow: str, vm_name: str = "", args: dict = None):
+        self.flow = flow
+        self.vm_name = vm_name
+        self.args = args or {}
+        self.device = RecordingDevice(self, device)
+        self.screens = []   # {"t", "after": index action làm đổi màn hình | None, "xml"}
+        self.actions = []   # {"t", "op", "sel", "screen"}
+        self.queries = []   # {"t", "op", "sel", "screen", "result"}
+        self.logger = logging.getLogger(__name__)
+        self._real = device
+        self._start = time.monotonic()
+        self._started_at = time.time()
+        self._last_dump = None
+        self._dirty = False     # có thao tác mới chưa dump lại
+        self._pending = None    # thao tác gần nhất chưa thấy đổi màn hình
+        self._dump_seconds = []
+
+    def _elapsed(self) -> float:
+        return round(time.monotonic() - self._start, 3)
+
+    def _snapshot(self):
+        now = time.monotonic()
+        t = self._elapsed()
+        # IndexedDevice: dùng lại đúng dump vừa trả lời truy vấn (không tốn thêm dump)
+        xml = self._real.cached_hierarchy() if isinstance(self._real, IndexedDevice) else None
+        if xml is None:
+            if (self.screens and not self._dirty and self._last_dump is not None
+                    and now - self._last_dump < UI_RECORD_MIN_INTERVAL):
+                return
+            try:
+                xml = self._real.dump_hierarchy()
+            except Exception as e:
+                self.logger.debug(f"UI recorder: dump hierarchy lỗi: {e}")
+                return
+            self._dump_seconds.append(time.monotonic() - now)
+        self._last_dump = now
+        self._dirty = False
+        if self.screens and xml == self.screens[-1]["xml"]:
+            return
+        self.screens.append({"t": t, "after": self._pending, "xml": xml})
+        self._pending = None
+
+    def query(self, op: str, selector, result):
+        self._snapshot()
+        self.queries.append({"t": self._elapsed(), "op": op, "sel": selector,
+                             "screen": len(self.screens) - 1, "result": result})
+        return result
+
+    def action(self, op: str, selector):
+        self.actions.append({"t": self._elapsed(), "op": op, "sel": selector,
+                             "screen": len(self.screens) - 1})
+        self._pending = len(self.actions) - 1
+        self._dirty = True
+
+    def save(self, result=None):
+        """Ghi bản ghi ra RECORDINGS_DIR/<flow>/ (xóa bản cũ quá UI_RECORD_KEEP). Returns: path | None"""
+        try:
+            data = {
+                "version": RECORDING_VERSION, "flow": self.flow, "vm": self.vm_name,
+                "started": self._started_at, "duration": self._elapsed(), "result": result,
+                "args": self.args,
+                "dump_seconds": round(sum(self._dump_seconds) / len(self._dump_seconds), 4)
+                                if self._dump_seconds else 0.0,
+                "screens": self.screens, "actions": self.actions, "queries": self.queries,
+            }
+            flow_dir = os.path.join(RECORDINGS_DIR, self.flow)
+            os.makedirs(flow_dir, exist_ok=True)
+            vm_slug = re.sub(r"[^\w-]+", "_", self.vm_name or "vm").strip("_") or "vm"
+            path = os.path.join(flow_dir, f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(self._started_at))}"
+                                          f"_{vm_slug}.json.gz")
+            with gzip.open(path + ".tmp", "wt", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(path + ".tmp", path)
+
+            old = sorted(glob.glob(os.path.join(flow_dir, "*.json.gz")))[:-UI_RECORD_KEEP]
+            for old_path in old:
+                try:
+                    os.remove(old_path)
+                except OSError:
+                    pass
+            self.logger.info(f"🎞️ UI recording: {path} ({len(self.screens)} màn hình, "
+                             f"{len(self.actions)} thao tác)")
+            return path
+        except Exception as e:
+            self.logger.warning(f"⚠️ Không lưu được UI recording: {e}")
+            return None
+
+
+class RecordingDevice:
+    """Proxy u2.Device: ghi xpath / d(**kwargs) / press / app_stop, còn lại chuyển thẳng"""
+
+    def __init__(self, recorder: UIRecorder, device):
+        self._recorder = recorder
+        self._device = device
+
+    def xpath(self, xpath: str):
+        return _RecordingSelector(self._recorder, xpath, self._device.xpath(xpath))
+
+    def __call__(self, **kwargs):
+        return _RecordingSelector(self._recorder, kwargs, self._device(**kwargs))
+
+    def press(self, key, *args, **kwargs):
+        self._recorder.action("press", key)
+        return self._device.press(key, *args, **kwargs)
+
+    def app_stop(self, package: str):
+        self._recorder.action("app_stop", package)
+        return self._device.app_stop(package)
+
+    def __getattr__(self, name):
+        return getattr(self._device, name)
+
+
+class _RecordingSelector:
+    def __init__(self, recorder: UIRecorder, selector, real):
+        self._recorder = recorder
+        self._selector = selector
+        self._real = real
+
+    @property
+    def exists(self) -> bool:
+        return self._recorder.query("exists", self._selector, bool(self._real.exists))
+
+    def wait(self, timeout=None):
+        result = self._real.wait(timeout=timeout)
+        self._recorder.query("wait", self._selector, bool(result))
+        return result
+
+    @property
+    def info(self):
+        info = self._real.info
+        self._recorder.query("info", self._selector, None)
+        return info
+
+    def get_text(self):
+        text = self._real.get_text()
+        self._recorder.query("get_text", self._selector, None)
+        return text
+
+    def click(self, *args, **kwargs):
+        self._recorder.action("click", self._selector)
+        return self._real.click(*args, **kwargs)
+
+    def set_text(self, text, *args, **kwargs):
+        self._recorder.action("set_text", self._selector)  # không lưu nội dung (password / 2FA)
+        return self._real.set_text(text, *args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._real, name)
+
+
+def recorded(func):
+    """Decorator cho auto_post / auto_login: lưu UI recording (nếu đang ghi) kèm kết quả flow"""
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        result = None
+        try:
+            result = func(self, *args, **kwargs)
+            return result
+        finally:
+            recorder, self.recorder = getattr(self, "recorder", None), None
+            if recorder is not None:
+                recorder.save(result)
+    return wrapper
+
+
+# ==================== PHÁT LẠI (OFFLINE) ====================
+class SimClock:
+    """Đồng hồ giả lập - có time()/monotonic()/sleep() để thay module time khi phát lại"""
+
+    def __init__(self, start: float = 0.0):
+        self.now = start
+        self.slept = 0.0
+
+    def time(self) -> float:
+        return self.now
+
+    monotonic = time
+
+    def sleep(self, seconds: float):
+        if seconds and seconds > 0:
+            self.now += seconds
+            self.slept += seconds
+
+
+class SimCancelToken(CancelToken):
+    """CancelToken chờ trên SimClock (flow chạy nhánh có cancel_token như trong pipeline)"""
+
+    def __init__(self, clock: SimClock):
+        super().__init__()
+        self.clock = clock
+
+    def wait(self, seconds: float) -> bool:
+        if not self.is_cancelled():
+            self.clock.sleep(seconds)
+        return self.is_cancelled()
+
+    def sleep(self, seconds: float):
+        self.raise_if_cancelled()
+        self.clock.sleep(seconds)
+
+
+class ReplayStats:
+    def __init__(self):
+        self.queries = 0
+        self.dumps = 0          # lần u2 phải dump hierarchy (mọi truy vấn xpath)
+        self.dump_wait = 0.0    # giây giả lập tốn cho dump (dump_latency x dumps)
+        self.parse_seconds = 0.0
+        self.match_seconds = 0.0
+        self.actions = 0
+        self.unmatched = []     # thao tác không có trong bản ghi ở màn hình đó
+        self.unsupported = set()
+        self.per_selector = {}  # {key: [số lần, giây match]}
+
+    def record(self, key: str, seconds: float):
+        self.queries += 1
+        self.match_seconds += seconds
+        entry = self.per_selector.setdefault(key, [0, 0.0])
+        entry[0] += 1
+        entry[1] += seconds
+
+
+class ReplayDevice:
+    """
+    u2.Device giả phát lại 1 bản ghi - tất định, thời gian chạy trên SimClock.
+
+    Màn hình i → i+1 khi:
+    - screens[i+1]["after"] = index thao tác: flow làm đúng thao tác đó (op + selector) ở màn hình i,
+      cộng độ trễ đã ghi (t màn hình mới - t thao tác)
+    - "after" = None: sau (t màn hình mới - t màn hình i) kể từ lúc vào màn hình i
+
+    Args:
+        recording: dict bản ghi (load_recording / synthetic_recording)
+        matcher: object có parse(xml) + match(cây, selector) (mặc định ElementTreeMatcher)
+        dump_latency: giây mỗi lần dump hierarchy cộng vào SimClock (None = trung bình lúc ghi)
+    """
+
+    def __init__(self, recording: dict, clock: SimClock = None, matcher=None, dump_latency: float = None):
+        self.recording = recording
+        self.clock = clock or SimClock()
+        self.matcher = matcher or ElementTreeMatcher()
+        self.dump_latency = recording.get("dump_seconds", 0.0) if dump_latency is None else dump_latency
+        self.stats = ReplayStats()
+        self._screens = recording["screens"]
+        self._actions = recording.get("actions", [])
+        self._screen_actions = {}
+        for action in self._actions:
+            self._screen_actions.setdefault(action["screen"], set()).add(
+                (action["op"], selector_key(action["sel"])))
+        self._trees = {}
+        self._index = 0
+        self._entered = self.clock.now
+        self._triggered_at = None
+
+    @property
+    def screen_index(self) -> int:
+        return self._advance()
+
+    def _advance(self) -> int:
+        screens = self._screens
+        while self._index + 1 < len(screens):
+            current, nxt = screens[self._index], screens[self._index + 1]
+            if nxt.get("after") is None:
+                due = self._entered + (nxt["t"] - current["t"])
+            elif self._triggered_at is not None:
+                due = self._triggered_at + max(0.0, nxt["t"] - self._actions[nxt["after"]]["t"])
+            else:
+                break
+            if due > self.clock.now:
+                break
+            self._index += 1
+            self._entered = due
+            self._triggered_at = None
+        return self._index
+
+    def _tree(self, index: int, cached: bool = False):
+        tree = self._trees.get(index) if cached else None
+        if tree is None:
+            started = time.perf_counter()
+            tree = self.matcher.parse(self._screens[index]["xml"])
+            self.stats.parse_seconds += time.perf_counter() - started
+            if cached:
+                self._trees[index] = tree
+        return tree
+
+    def _find(self, selector) -> list:
+        ui_object = isinstance(selector, dict)
+        if not ui_object:
+            # u2 xpath: mỗi truy vấn = 1 lần dump + parse hierarchy
+            self.stats.dumps += 1
+            self.stats.dump_wait += self.dump_latency
+            self.clock.now += self.dump_latency  # thời gian dump trên VM, không phải sleep của flow
+        # d(**kwargs) tìm phía server uiautomator, không dump → dùng cây đã parse sẵn
+        tree = self._tree(self._advance(), cached=ui_object)
+        key = selector_key(selector)
+        started = time.perf_counter()
+        try:
+            found = self.matcher.match(tree, selector)
+        except ValueError:
+            self.stats.unsupported.add(key)
+            found = []
+        self.stats.record(key, time.perf_counter() - started)
+        return found
+
+    def _action(self, op: str, selector):
+        self.stats.actions += 1
+        index = self._advance()
+        key = selector_key(selector)
+        if index + 1 < len(self._screens):
+            after = self._screens[index + 1].get("after")
+            if after is not None and self._triggered_at is None:
+                expected = self._actions[after]
+                if expected["op"] == op and selector_key(expected["sel"]) == key:
+                    self._triggered_at = self.clock.now
+                    return
+        if (op, key) not in self._screen_actions.get(index, ()):
+            self.stats.unmatched.append({"screen": index, "op": op, "sel": key, "t": round(self.clock.now, 3)})
+
+    # ----- API giống u2.Device mà flow dùng -----
+    def xpath(self, xpath: str):
+        return _ReplaySelector(self, xpath)
+
+    def __call__(self, **kwargs):
+        return _ReplaySelector(self, kwargs)
+
+    def press(self, key, *args, **kwargs):
+        self._action("press", key)
+
+    def app_stop(self, package: str):
+        self._action("app_stop", package)
+
+    def dump_hierarchy(self, *args, **kwargs) -> str:
+        self.stats.dumps += 1
+        self.stats.dump_wait += self.dump_latency
+        self.clock.now += self.dump_latency
+        return self._screens[self._advance()]["xml"]
+
+
+class _ReplaySelector:
+    def __init__(self, device: ReplayDevice, selector):
+        self._device = device
+        self._selector = selector
+
+    @property
+    def exists(self) -> bool:
+        return bool(self._device._find(self._selector))
+
+    def wait(self, timeout=None) -> bool:
+        clock = self._device.clock
+        deadline = clock.now + (U2_WAIT_TIMEOUT if timeout is None else timeout)
+        while True:
+            if self._device._find(self._selector):
+                return True
+            if clock.now >= deadline:
+                return False
+            clock.sleep(min(U2_WAIT_POLL, deadline - clock.now))
+
+    def _first(self):
+        found = self._device._find(self._selector)
+        if not found:
+            raise LookupError(f"Replay: không có {selector_key(self._selector)} trên màn hình "
+                              f"{self._device.screen_index}")
+        return found[0]
+
+    @property
+    def info(self) -> dict:
+        return element_info(self._first())
+
+    def get_text(self):
+        return self._first().get("text")
+
+    def click(self, *args, **kwargs):
+        self._first()
+        self._device._action("click", self._selector)
+
+    def set_text(self, text, *args, **kwargs):
+        self._first()
+        self._device._action("set_text", self._selector)
+
+
+# ==================== BẢN GHI ====================
+def load_recording(path: str) -> dict:
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        recording = json.load(f)
+    recording.setdefault("path", path)
+    return recording
+
+
+def find_recordings(paths=None) -> list:
+    """File bản ghi trong các path (file / thư mục, mặc định RECORDINGS_DIR), cũ → mới"""
+    found = []
+    for path in paths or [RECORDINGS_DIR]:
+        if os.path.isdir(path):
+            found.extend(glob.glob(os.path.join(path, "**", "*.json.gz"), recursive=True))
+        elif os.path.exists(path):
+            found.append(path)
+    return sorted(set(found), key=os.path.basename)
+
+
+def verify_recording(recording: dict, matcher=None) -> dict:
+    """
+    So kết quả match offline với kết quả u2 lúc ghi (exists / wait trên đúng màn hình đã dump).
+
+    Returns:
+        dict: {"checked", "mismatches": [{"screen", "sel", "recorded", "replayed"}], "unsupported"}
+    """
+    matcher = matcher or ElementTreeMatcher()
+    trees = {}
+    report = {"checked": 0, "mismatches": [], "unsupported": set()}
+    for query in recording.get("queries", []):
+        if query["op"] not in ("exists", "wait") or query["screen"] < 0:
+            continue
+        index = query["screen"]
+        if index not in trees:
+            trees[index] = matcher.parse(recording["screens"][index]["xml"])
+        try:
+            replayed = bool(matcher.match(trees[index], query["sel"]))
+        except ValueError:
+            report["unsupported"].add(selector_key(query["sel"]))
+            continue
+        report["checked"] += 1
+        if replayed != query["result"]:
+            report["mismatches"].append({"screen": index, "sel": selector_key(query["sel"]),
+                                         "recorded": query["result"], "replayed": replayed})
+    return report
+
+
+def replay_flow(recording: dict, matcher=None, dump_latency: float = None, use_cancel_token: bool = True,
+                index_selectors: bool = None) -> dict:
+    """
+    Chạy lại auto_post / auto_login trên ReplayDevice (không adb, không mạng, không chờ thật).
+
+    Args:
+        recording: Bản ghi (flow "post" / "login")
+        matcher: Bộ match selector (mặc định ElementTreeMatcher)
+        dump_latency: Giây / lần dump cộng vào thời gian giả lập (None = trung bình lúc ghi)
+        use_cancel_token: True → nhánh poll .exists như trong pipeline; False → d.xpath().wait()
+        index_selectors: Bật / tắt IndexedDevice (utils/ui_selector.py), None = SELECTOR_INDEX_ENABLED
+
+    Returns:
+        dict: Kết quả + số liệu (sim_seconds, dumps, match_seconds, unmatched...)
+    """
+    import utils.base_instagram as base_module
+    import utils.post as post_module
+
+    clock = SimClock()
+    device = ReplayDevice(recording, clock, matcher, dump_latency)
+    token = SimCancelToken(clock) if use_cancel_token else None
+    flow = recording["flow"]
+    args = recording.get("args") or {}
+    vm_name = recording.get("vm") or "replay"
+    steps = []
+
+    saved_time, saved_run = base_module.time, post_module.cancellable_run
+    base_module.time = clock
+    post_module.cancellable_run = lambda cmd, **kwargs: subprocess.CompletedProcess(cmd, 0, "", "")
+    started = time.perf_counter()
+    try:
+        if flow == "post":
+            automation = post_module.InstagramPost(cancel_token=token, mirror_logger=False)
+            automation._capture_failure_screenshot = (
+                lambda adb_address, vm, reason: automation.log(vm, f"📸 (replay) {reason}"))
+            automation._retry_mediastore_broadcast = lambda *a, **kw: True
+        elif flow == "login":
+            from utils.login import InstagramLogin
+            automation = InstagramLogin(cancel_token=token)
+            automation.mirror_logger = False
+            automation.get_2fa_code = lambda key: "000000"
+            automation._save_insta_name = lambda vm, name: True
+        else:
+            raise ValueError(f"Flow không hỗ trợ phát lại: {flow}")
+        automation.record_ui = False
+        if index_selectors is not None:
+            automation.index_selectors = index_selectors
+        automation.device_factory = lambda adb_address: device
+        automation.log_callback = lambda vm, message: steps.append(message)
+
+        if flow == "post":
+            use_launchex = bool(args.get("use_launchex"))
+            result = automation.auto_post(
+                vm_name, "replay", "Replay caption", use_launchex=use_launchex,
+                ldconsole_exe="ldconsole" if use_launchex else None,
+                video_filename="replay.mp4" if args.get("video_filename", True) else None)
+        else:
+            result = automation.auto_login(vm_name, "replay", "replay_user", "replay_password", "REPLAYKEY")
+    finally:
+        base_module.time = saved_time
+        post_module.cancellable_run = saved_run
+    wall = time.perf_counter() - started
+
+    stats = device.stats
+    indexed = automation.selector_index
+    return {
+        "flow": flow,
+        "path": recording.get("path"),
+        "result": result,
+        "recorded_result": recording.get("result"),
+        "recorded_seconds": recording.get("duration"),
+        "sim_seconds": clock.now,
+        "sleep_seconds": clock.slept,
+        "screens": len(recording["screens"]),
+        "final_screen": device.screen_index,
+        "queries": stats.queries,
+        "dumps": stats.dumps,
+        "dump_wait_seconds": stats.dump_wait,
+        "parse_seconds": stats.parse_seconds,
+        "match_seconds": stats.match_seconds,
+        "actions": stats.actions,
+        "unmatched": stats.unmatched,
+        "unsupported": sorted(stats.unsupported),
+        "per_selector": stats.per_selector,
+        "indexed": None if indexed is None else {
+            "lookups": indexed.lookups, "fallbacks": indexed.fallbacks, "dumps": indexed.dumps,
+            "reused": indexed.reused, "index_seconds": indexed.index_seconds,
+            "match_seconds": indexed.match_seconds,
+        },
+        "log_lines": len(steps),
+        "wall_seconds": wall,
+    }
+
+
+# ==================== BẢN GHI GIẢ LẬP ====================
+# (màn hình có các selector, thao tác trên màn hình đó, giây tới màn hình kế)
+# Có thao tác → thao tác cuối làm đổi màn hình; không có → đổi theo thời gian
+def _post_script():
+    from constants import (
+        XPATH_INSTAGRAM_APP, XPATH_FEED_TAB, XPATH_CREATE_POST, XPATH_PROFILE_TAB, XPATH_POST,
+        XPATH_FIRST_BOX, XPATH_NEXT_BUTTON, XPATH_RIGHT_ACTION, XPATH_CAPTION_INPUT,
+        XPATH_ACTION_BAR_TEXT, XPATH_SHARE_BUTTON, XPATH_progress_bar, XPATH_PENDING_MEDIA,
+        INSTAGRAM_PACKAGE
+    )
+    return (
+        ([XPATH_INSTAGRAM_APP], [("click", XPATH_INSTAGRAM_APP)], 4.0),
+        ([XPATH_FEED_TAB, XPATH_CREATE_POST, XPATH_PROFILE_TAB], [("click", XPATH_CREATE_POST)], 2.0),
+        ([XPATH_POST, XPATH_FIRST_BOX, XPATH_NEXT_BUTTON],
+         [("click", XPATH_POST), ("click", XPATH_NEXT_BUTTON)], 2.0),
+        ([XPATH_RIGHT_ACTION], [("click", XPATH_RIGHT_ACTION)], 2.0),
+        ([XPATH_CAPTION_INPUT, XPATH_ACTION_BAR_TEXT],
+         [("set_text", XPATH_CAPTION_INPUT), ("click", XPATH_ACTION_BAR_TEXT)], 1.5),
+        ([XPATH_SHARE_BUTTON], [("click", XPATH_SHARE_BUTTON)], 3.0),
+        ([XPATH_FEED_TAB, XPATH_progress_bar], [], 25.0),
+        ([XPATH_FEED_TAB, XPATH_PENDING_MEDIA], [("app_stop", INSTAGRAM_PACKAGE)], None),
+    )
+
+
+def _login_script():
+    from constants import (
+        XPATH_INSTAGRAM_APP, XPATH_ALREADY_HAVE_ACCOUNT, XPATH_USERNAME_INPUT, XPATH_PASSWORD_INPUT,
+        XPATH_LOGIN_BUTTON, XPATH_TRY_ANOTHER_WAY, XPATH_AUTH_APP, XPATH_CONTINUE_BUTTON,
+        XPATH_CODE_INPUT, XPATH_SAVE_BUTTON, XPATH_PROFILE_TAB, XPATH_PROFILE_NAME, INSTAGRAM_PACKAGE
+    )
+    return (
+        ([XPATH_INSTAGRAM_APP], [("click", XPATH_INSTAGRAM_APP)], 5.0),
+        ([XPATH_ALREADY_HAVE_ACCOUNT], [("click", XPATH_ALREADY_HAVE_ACCOUNT)], 2.0),
+        ([XPATH_USERNAME_INPUT, XPATH_PASSWORD_INPUT, XPATH_LOGIN_BUTTON],
+         [("set_text", XPATH_USERNAME_INPUT), ("set_text", XPATH_PASSWORD_INPUT),
+          ("click", XPATH_LOGIN_BUTTON)], 4.0),
+        ([XPATH_TRY_ANOTHER_WAY], [("click", XPATH_TRY_ANOTHER_WAY)], 2.0),
+        ([XPATH_AUTH_APP, XPATH_CONTINUE_BUTTON],
+         [("click", XPATH_AUTH_APP), ("click", XPATH_CONTINUE_BUTTON)], 2.0),
+        ([XPATH_CODE_INPUT, XPATH_CONTINUE_BUTTON],
+         [("set_text", XPATH_CODE_INPUT), ("click", XPATH_CONTINUE_BUTTON)], 4.0),
+        ([XPATH_SAVE_BUTTON], [("click", XPATH_SAVE_BUTTON)], 3.0),
+        ([XPATH_PROFILE_TAB], [("click", XPATH_PROFILE_TAB)], 2.0),
+        ([XPATH_PROFILE_TAB, XPATH_PROFILE_NAME], [("app_stop", INSTAGRAM_PACKAGE)], None),
+    )
+
+
+_SIMPLE_XPATH_RE = re.compile(r'^//\*\[@([\w-]+)="([^"]*)"\]$')
+_FILLER_CLASSES = (
+    "android.widget.FrameLayout", "android.widget.LinearLayout", "android.view.ViewGroup",
+    "android.widget.TextView", "android.widget.ImageView", "androidx.recyclerview.widget.RecyclerView",
+)
+_FILLER_WORDS = ("", "", "", "Home", "Reels", "Search", "Like", "Comment", "Share", "Follow", "2h", "1,024")
+
+
+def _node_attrs(rng: random.Random, index: int, **overrides) -> dict:
+    attrs = {
+        "index": str(index % 8), "text": rng.choice(_FILLER_WORDS),
+        "resource-id": f"com.instagram.android:id/row_{rng.randrange(120)}" if rng.random() < 0.6 else "",
+        "class": rng.choice(_FILLER_CLASSES), "package": "com.instagram.android",
+        "content-desc": "", "checkable": "false", "checked": "false",
+        "clickable": "true" if rng.random() < 0.3 else "false", "enabled": "true",
+        "focusable": "false", "focused": "false", "scrollable": "false", "long-clickable": "false",
+        "password": "false", "selected": "false",
+        "bounds": f"[0,{rng.randrange(1200)}][720,{rng.randrange(1200, 1280)}]",
+    }
+    attrs.update(overrides)
+    return attrs
+
+
+def _synthetic_xml(selectors, nodes: int, rng: random.Random) -> str:
+    root = ET.Element("hierarchy", rotation="0")
+    tree = [root]
+    for i in range(nodes):
+        parent = rng.choice(tree[-24:])  # chọn trong các node gần nhất → cây sâu như app thật
+        tree.append(ET.SubElement(parent, "node", _node_attrs(rng, i)))
+    for selector in selectors:
+        match = _SIMPLE_XPATH_RE.match(selector)
+        if not match:
+            raise ValueError(f"Selector không dựng được node giả: {selector}")
+        attr, value = match.groups()
+        parent = rng.choice(tree[1:]) if len(tree) > 1 else root
+        ET.SubElement(parent, "node", _node_attrs(rng, len(tree), **{attr: value}))
+    return ET.tostring(root, encoding="unicode")
+
+
+def synthetic_recording(flow: str, nodes: int = 400, seed: int = 1, dump_seconds: float = 0.3) -> dict:
+    """
+    Bản ghi dựng sẵn cho đường đi thành công của flow (khi chưa có bản ghi thật).
+
+    Mỗi màn hình = `nodes` node ngẫu nhiên (cây sâu, class / resource-id giống Instagram)
+    + node cho từng selector trong constants.py mà bước đó cần.
+    """
+    scripts = {"post": _post_script, "login": _login_script}
+    if flow not in scripts:
+        raise ValueError(f"Không có kịch bản giả lập cho flow: {flow}")
+    rng = random.Random(seed)
+    screens, actions = [], []
+    t = 0.0
+    for present, screen_actions, delay in scripts[flow]():
+        after = len(actions) - 1 if screens and screens[-1]["trigger"] else None
+        screens.append({"t": round(t, 3), "after": after, "xml": _synthetic_xml(present, nodes, rng),
+                        "trigger": bool(screen_actions)})
+        for op, selector in screen_actions:
+            t += 1.0
+            actions.append({"t": round(t, 3), "op": op, "sel": selector, "screen": len(screens) - 1})
+        t += delay or 0.0
+    for screen in screens:
+        del screen["trigger"]
+    return {
+        "version": RECORDING_VERSION, "flow": flow, "vm": f"synthetic-{flow}", "started": 0,
+        "duration": None, "result": True, "args": {"use_launchex": False, "video_filename": True},
+        "dump_seconds": dump_seconds, "screens": screens, "actions": actions, "queries": [],
+        "path": f"<synthetic:{flow}>",
+    }
@@ -0,0 +1,249 @@
+"""
+UI Selector - Compile XPath đơn giản trong constants.py thành tra dict trên hierarchy đã index.
+
+uiautomator2 xử lý mỗi `d.xpath(X).exists` bằng: dump cả hierarchy (RPC) → parse → chạy XPath
+tổng quát trên toàn bộ cây, dù gần như mọi selector của tool chỉ là //*[@resource-id="..."],
+//*[@text="..."], //*[@content-desc="..."]. Ở đây:
+
+- compile_selector: nhận dạng //* hoặc //<class> + các điều kiện [@attr="value"] (cache theo chuỗi),
+  XPath phức tạp hơn → None (dùng XPath đầy đủ như cũ)
+- HierarchyIndex: parse 1 lần; selector đầu tiên quét 1 lượt, từ lần thứ 2 cùng attribute
+  dựng index {value: [node]} để tra dict
+- IndexedDevice: proxy u2.Device - .exists của selector đơn giản tra trên 1 lần dump dùng chung
+  trong SELECTOR_SNAPSHOT_TTL (xóa ngay sau click / set_text / press / app_stop), còn lại
+  (wait, click, info, XPath phức tạp...) chuyển thẳng cho u2
+
+Đo: benchmarks/bench_selectors.py (từng selector trên các dump đã ghi), bench_ui_replay.py (cả flow).
+"""
+import re
+import time
+import functools
+import xml.etree.ElementTree as ET
+
+from constants import SELECTOR_SNAPSHOT_TTL, SELECTOR_CACHE_SIZE
+
+# d(**kwargs) của u2 → attribute trong hierarchy
+UI_SELECTOR_ATTRS = {
+    "resourceId": "resource-id",
+    "text": "text",
+    "description": "content-desc",
+    "className": "class",
+    "packageName": "package",
+}
+
+_SIMPLE_RE = re.compile(r"""^//(\*|[A-Za-z_][\w.$]*)((?:\[@[\w-]+=(?:"[^"]*"|'[^']*')\])+)$""")
+_PREDICATE_RE = re.compile(r"""\[@([\w-]+)=(?:"([^"]*)"|'([^']*)')\]""")
+
+
+class CompiledSelector:
+    """Selector dạng //tag[@a="x"][@b="y"] → các cặp (attribute, value) phải bằng nhau"""
+
+    __slots__ = ("xpath", "conditions")
+
+    def __init__(self, xpath: str, conditions: tuple):
+        self.xpath = xpath
+        self.conditions = conditions  # ((attr, value), ...) - điều kiện đầu dùng tra index
+
+    def __repr__(self):
+        return f"CompiledSelector({self.xpath!r})"
+
+
+@functools.lru_cache(maxsize=SELECTOR_CACHE_SIZE)
+def compile_selector(xpath: str):
+    """
+    Compile XPath đơn giản (cache theo chuỗi).
+
+    Returns:
+        CompiledSelector | None: None nếu cần XPath đầy đủ (contains(), vị trí, trục cha/con...)
+    """
+    match = _SIMPLE_RE.match(xpath.strip())
+    if not match:
+        return None
+    tag, predicates = match.groups()
+    conditions = [(m.group(1), m.group(2) if m.group(2) is not None else m.group(3))
+                  for m in _PREDICATE_RE.finditer(predicates)]
+    if tag != "*":
+        conditions.append(("class", tag))  # u2 so tag với class của node
+    if any(value == "" for _, value in conditions):
+        return None  # @text="" khớp cả node không có attribute → để XPath xử lý
+    return CompiledSelector(xpath, tuple(conditions))
+
+
+def ui_selector_xpath(kwargs: dict) -> str:
+    """d(resourceId=..., text=...) → XPath tương đương (ValueError nếu không hỗ trợ)"""
+    predicates = []
+    for key, value in kwargs.items():
+        if key not in UI_SELECTOR_ATTRS or '"' in str(value):
+            raise ValueError(f"UiSelector không hỗ trợ: {key}={value!r}")
+        predicates.append(f'[@{UI_SELECTOR_ATTRS[key]}="{value}"]')
+    return "//*" + "".join(predicates)
+
+
+class HierarchyIndex:
+    """
+    1 lần dump hierarchy: parse 1 lần, index theo attribute khi attribute đó được hỏi lần 2.
+
+    find() trả về node theo thứ tự trong tài liệu (giống XPath).
+    """
+
+    def __init__(self, xml):
+        self.xml = xml
+        self.root = ET.fromstring(xml.encode("utf-8") if isinstance(xml, str) else xml)
+        self.nodes = list(self.root.iter("node"))
+        self._by_attr = {}  # {attr: {value: [node]}} - attr đã dùng ≥ 2 lần trên dump này
+        self._used = set()
+        self._renamed = False
+
+    def _candidates(self, attr: str, value: str):
+        index = self._by_attr.get(attr)
+        if index is None:
+            if attr not in self._used:
+                # Lần đầu: quét 1 lượt rẻ hơn dựng dict (đa số dump chỉ được hỏi 1 selector)
+                self._used.add(attr)
+                return [node for node in self.nodes if node.get(attr) == value]
+            index = self._by_attr[attr] = {}
+            for node in self.nodes:
+                node_value = node.get(attr)
+                if node_value:
+                    index.setdefault(node_value, []).append(node)
+        return index.get(value, ())
+
+    def find_compiled(self, selector: CompiledSelector) -> list:
+        (attr, value), rest = selector.conditions[0], selector.conditions[1:]
+        candidates = self._candidates(attr, value)
+        if not rest:
+            return list(candidates)
+        return [node for node in candidates if all(node.get(a) == v for a, v in rest)]
+
+    def find(self, selector) -> list:
+        """XPath (hoặc kwargs của d(...)) → list node. XPath ElementTree không hỗ trợ → ValueError"""
+        if isinstance(selector, dict):
+            selector = ui_selector_xpath(selector)
+        compiled = compile_selector(selector)
+        if compiled is not None:
+            return self.find_compiled(compiled)
+        return self.find_xpath(selector)
+
+    def find_xpath(self, xpath: str) -> list:
+        """XPath đầy đủ (ElementTree) trên cả cây - tag node đổi thành class như u2"""
+        if not self._renamed:
+            for node in self.nodes:
+                node.tag = node.get("class") or "node"
+            self._renamed = True
+        if xpath.startswith("/hierarchy"):
+            path = "." + xpath[len("/hierarchy"):]
+        elif xpath.startswith("/"):
+            path = "." + xpath
+        else:
+            path = xpath
+        try:
+            return self.root.findall(path)
+        except (SyntaxError, KeyError, TypeError) as e:
+            raise ValueError(f"Selector không hỗ trợ: {xpath} ({e})")
+
+
+class IndexedMatcher:
+    """Bộ match cho utils.ui_replay.ReplayDevice / benchmark: parse → HierarchyIndex, match → find"""
+
+    name = "indexed"
+
+    def parse(self, xml) -> HierarchyIndex:
+        return HierarchyIndex(xml)
+
+    def match(self, index: HierarchyIndex, selector) -> list:
+        return index.find(selector)
+
+
+class IndexedDevice:
+    """
+    Proxy u2.Device: d.xpath(X).exists với X đơn giản → tra dict trên snapshot hierarchy dùng chung.
+
+    Args:
+        device: uiautomator2 device (hoặc ReplayDevice)
+        ttl: Giây 1 snapshot được dùng lại cho truy vấn kế tiếp (< CANCEL_POLL_INTERVAL để
+             mỗi lần poll của vòng chờ vẫn dump mới)
+        clock: Nguồn monotonic() (SimClock khi phát lại offline)
+    """
+
+    def __init__(self, device, ttl: float = SELECTOR_SNAPSHOT_TTL, clock=time):
+        self._device = device
+        self._ttl = ttl
+        self._clock = clock
+        self._snapshot = None
+        self._snapshot_at = 0.0
+        self.dumps = 0
+        self.reused = 0
+        self.lookups = 0
+        self.fallbacks = 0
+        self.index_seconds = 0.0
+        self.match_seconds = 0.0
+
+    def snapshot(self) -> HierarchyIndex:
+        if self._snapshot is not None and self._clock.monotonic() - self._snapshot_at < self._ttl:
+            self.reused += 1
+            return self._snapshot
+        xml = self._device.dump_hierarchy()
+        started = time.perf_counter()
+        self._snapshot = HierarchyIndex(xml)
+        self.index_seconds += time.perf_counter() - started
+        self._snapshot_at = self._clock.monotonic()
+        self.dumps += 1
+        return self._snapshot
+
+    def invalidate(self):
+        self._snapshot = None
+
+    def cached_hierarchy(self):
+        """XML của snapshot còn hạn (đúng dump vừa trả lời truy vấn) - None nếu đã hết hạn / vừa thao tác"""
+        if self._snapshot is not None and self._clock.monotonic() - self._snapshot_at < self._ttl:
+            return self._snapshot.xml
+        return None
+
+    def xpath(self, xpath: str):
+        return _IndexedSelector(self, xpath, self._device.xpath(xpath))
+
+    def press(self, *args, **kwargs):
+        self.invalidate()
+        return self._device.press(*args, **kwargs)
+
+    def app_stop(self, *args, **kwargs):
+        self.invalidate()
+        return self._device.app_stop(*args, **kwargs)
+
+    def __call__(self, **kwargs):
+        return self._device(**kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._device, name)
+
+
+class _IndexedSelector:
+    def __init__(self, owner: IndexedDevice, xpath: str, real):
+        self._owner = owner
+        self._xpath = xpath
+        self._real = real
+
+    @property
+    def exists(self) -> bool:
+        compiled = compile_selector(self._xpath)
+        owner = self._owner
+        if compiled is None:
+            owner.fallbacks += 1
+            return self._real.exists
+        index = owner.snapshot()
+        started = time.perf_counter()
+        found = bool(index.find_compiled(compiled))
+        owner.match_seconds += time.perf_counter() - started
+        owner.lookups += 1
+        return found
+
+    def click(self, *args, **kwargs):
+        self._owner.invalidate()
+        return self._real.click(*args, **kwargs)
+
+    def set_text(self, *args, **kwargs):
+        self._owner.invalidate()
+        return self._real.set_text(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._real, name)
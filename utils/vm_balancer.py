@@ -0,0 +1,169 @@
+"""
+VM Balancer - Tự chia video cho các máy ảo đã chọn ("Đặt máy ảo hàng loạt" → ⚖️ Tự cân bằng).
+
+Round-robin cũ chia đều theo thứ tự, không biết VM nào đang dồn việc hay đang lỗi liên tục.
+Mỗi video được giao cho VM có điểm tải thấp nhất:
+
+    tải = (post chờ/đang chạy trên VM + job đang chờ khóa VM + video vừa chia + 1) / tỉ lệ thành công
+
+- Tỉ lệ thành công cuốn chiếu: VM_HEALTH_WINDOW kết quả gần nhất của posts_total (metrics.recent),
+  làm mượt (ok + 1) / (n + 2) → VM chưa chạy post nào = 0.5, ngang nhau
+- VM lỗi (VM_FAILOVER_AFTER lần thất bại liên tiếp / tỉ lệ < VM_MIN_SUCCESS_RATE) không nhận thêm;
+  tất cả đều lỗi thì vẫn chia như thường (không bỏ video)
+- Không vượt ACCOUNT_MAX_POSTS_PER_DAY post / tài khoản / ngày (theo giờ hẹn) - hết chỗ thì video
+  không được chia (giữ nguyên)
+
+Failover: post do balancer chia (post.auto_vm) còn pending trên VM vừa bị coi là lỗi được chia lại
+cho các VM khác trong nhóm tự chia (PostScheduler gọi sau mỗi post thất bại).
+"""
+from collections import Counter
+
+from constants import (
+    ACCOUNT_MAX_POSTS_PER_DAY, VM_HEALTH_WINDOW, VM_FAILOVER_AFTER, VM_MIN_SUCCESS_RATE, VM_PRIORITY_SCHEDULED
+)
+from utils.metrics import metrics
+from utils.vm_manager import vm_manager
+
+# Post còn chiếm chỗ của VM (tính tải + giới hạn / ngày)
+ACTIVE_STATUSES = ("pending", "processing")
+COUNTED_STATUSES = ("pending", "processing", "posted")
+
+
+class VMHealth:
+    """Kết quả đăng gần nhất của 1 VM"""
+
+    __slots__ = ("ok", "failed", "streak")
+
+    def __init__(self):
+        self.ok = 0
+        self.failed = 0
+        self.streak = 0  # số lần thất bại liên tiếp gần nhất
+
+    @property
+    def samples(self) -> int:
+        return self.ok + self.failed
+
+    @property
+    def rate(self) -> float:
+        return (self.ok + 1) / (self.samples + 2)
+
+    @property
+    def failing(self) -> bool:
+        if self.streak >= VM_FAILOVER_AFTER:
+            return True
+        return self.samples >= VM_HEALTH_WINDOW / 2 and self.ok / self.samples < VM_MIN_SUCCESS_RATE
+
+
+def vm_health(vm_names, window: int = VM_HEALTH_WINDOW) -> dict:
+    """
+    Tỉ lệ thành công cuốn chiếu của từng VM (post bị dừng tay không tính).
+
+    Returns:
+        dict: {vm_name: VMHealth}
+    """
+    outcomes = {vm: [] for vm in vm_names}
+    for _, labels in metrics.recent("posts_total"):
+        history = outcomes.get(labels.get("vm"))
+        if history is not None and labels.get("outcome") in ("posted", "failed"):
+            history.append(labels["outcome"] == "posted")
+
+    result = {}
+    for vm, history in outcomes.items():
+        health = result[vm] = VMHealth()
+        for ok in history[-window:]:
+            if ok:
+                health.ok += 1
+                health.streak = 0
+            else:
+                health.failed += 1
+                health.streak += 1
+    return result
+
+
+def is_failing(vm_name: str) -> bool:
+    return vm_health([vm_name])[vm_name].failing
+
+
+def queue_depths(posts, vm_names) -> dict:
+    """Số post chờ / đang chạy của từng VM + job luồng theo dõi đang xếp hàng chờ khóa VM"""
+    depth = {vm: 0 for vm in vm_names}
+    for post in posts:
+        if post.vm_name in depth and post.status in ACTIVE_STATUSES:
+            depth[post.vm_name] += 1
+    for vm in depth:
+        # Post hẹn giờ đang chờ khóa đã được tính ở trên (status processing)
+        depth[vm] += sum(1 for w in vm_manager.get_waiters(vm) if w["priority"] < VM_PRIORITY_SCHEDULED)
+    return depth
+
+
+def _day(post):
+    return post.scheduled_time_vn.date() if post.scheduled_time_vn else None
+
+
+def assign_balanced(posts, vm_names, other_posts, cap: int = ACCOUNT_MAX_POSTS_PER_DAY) -> dict:
+    """
+    Chọn VM cho từng post theo thứ tự.
+
+    Args:
+        posts: post cần chia (ScheduledPost)
+        vm_names: VM được chọn (thứ tự = ưu tiên khi hòa điểm)
+        other_posts: các post còn lại - tính tải hiện tại + số post / ngày đã có
+        cap: post tối đa / VM / ngày (0 = không giới hạn)
+
+    Returns:
+        dict: {post.id: vm_name hoặc None (mọi VM đều đã đủ post ngày đó)}
+    """
+    vm_names = list(dict.fromkeys(vm_names))
+    order = {vm: i for i, vm in enumerate(vm_names)}
+    health = vm_health(vm_names)
+    healthy = [vm for vm in vm_names if not health[vm].failing] or vm_names
+    depth = queue_depths(other_posts, healthy)
+    per_day = Counter((post.vm_name, _day(post)) for post in other_posts
+                      if post.vm_name in depth and post.status in COUNTED_STATUSES and post.scheduled_time_vn)
+
+    result = {}
+    for post in posts:
+        day = _day(post)
+        candidates = [vm for vm in healthy if not cap or day is None or per_day[(vm, day)] < cap]
+        if not candidates:
+            result[post.id] = None
+            continue
+        vm = min(candidates, key=lambda vm: ((depth[vm] + 1) / health[vm].rate, order[vm]))
+        depth[vm] += 1
+        if day is not None:
+            per_day[(vm, day)] += 1
+        result[post.id] = vm
+    return result
+
+
+def failover(all_posts, vm_name: str, displays: dict = None) -> list:
+    """
+    Chuyển post tự chia (auto_vm) còn pending trên vm_name sang VM khác trong nhóm tự chia.
+
+    Args:
+        displays: {vm_name: "VM - insta"} để cập nhật account_display
+
+    Returns:
+        list[ScheduledPost]: post đã được chuyển (vm_name mới đã gán)
+    """
+    movable = [post for post in all_posts if post.vm_name == vm_name and post.auto_vm and post.status == "pending"]
+    if not movable:
+        return []
+    movable_ids = {post.id for post in movable}
+    targets = sorted({post.vm_name for post in all_posts if post.auto_vm and post.vm_name and post.vm_name != vm_name})
+    if not targets:
+        return []
+
+    others = [post for post in all_posts if post.id not in movable_ids]
+    plan = assign_balanced(movable, targets, others)
+    moved = []
+    for post in movable:
+        new_vm = plan.get(post.id)
+        # Mọi VM khác cũng lỗi → assign_balanced trả về VM lỗi; giữ nguyên thay vì chuyển vòng quanh
+        if new_vm is None or is_failing(new_vm):
+            continue
+        post.vm_name = new_vm
+        if displays:
+            post.account_display = displays.get(new_vm, new_vm)
+        moved.append(post)
+    return moved
@@ -0,0 +1,664 @@
+"""
+VM Lock Service - Khóa máy ảo bằng lease có hạn + fencing token.
+
+Trước đây VMManager giữ 1 threading.Lock / VM trong RAM:
+- 2 instance của tool (GUI + daemon, hoặc mở tool 2 lần) cùng điều khiển 1 VM
+- Process treo / crash giữa chừng → không ai biết VM còn bị giữ hay không
+- release_vm không cần giữ khóa vẫn nhả được, is_locked phải thử acquire rồi release
+
+Lease thay cho Lock:
+- Backend dùng chung (VM_LOCK_BACKEND): "memory" (1 process), "file" (data/locks/<vm>.json +
+  OS file lock), "sqlite" (data/locks/vm_locks.db) - thêm backend = subclass LockBackend
+- Mỗi lần khóa được, token của VM tăng 1 (fencing token) - lease hết hạn sau VM_LOCK_TTL
+  nếu không được gia hạn, thread nền gia hạn mọi lease đang giữ mỗi VM_LOCK_RENEW_INTERVAL
+- Lệnh adb/ldconsole chạy trong `fenced(lease)` (contextvar, tự copy sang executor) gọi
+  check_fence() trước khi chạy: lease đã mất / token cũ → LeaseLostError, không gửi lệnh
+  tới VM mà process khác đang điều khiển
+- check_fence() chạy trước MỌI lệnh / click → chỉ so với trạng thái lease trong RAM (cờ lost +
+  hạn từ lần gia hạn gần nhất), không đọc backend. Thread gia hạn phát hiện mất lease →
+  đánh dấu lost + gọi callback on_lost (job cancel CancelToken). Chỉ đọc backend khi hạn
+  trong RAM còn dưới 1 chu kỳ gia hạn (gia hạn đang trễ / backend lỗi)
+- Histogram vm_lock_wait_seconds (chờ khóa) / vm_lock_hold_seconds (giữ khóa) theo VM
+
+Hàng chờ (trong 1 process): trước đây ai poll trúng lúc VM vừa nhả thì được, luồng theo dõi
+còn backlog có thể chiếm VM liên tục làm post hẹn giờ trễ. Job chờ VM đăng ký VMWaiter
+(priority, deadline) - chỉ waiter đứng đầu (pick_waiter) mới khóa được:
+    điểm = priority + VM_PRIORITY_AGING_PER_MIN × phút đã chờ (chống chờ mãi)
+    → cùng điểm: deadline sớm hơn → vào hàng trước
+try_acquire không kèm waiter (reaper) chỉ khóa được khi không ai chờ. waiters() cho UI/API
+xem ai đang chờ VM nào. Giữa các process vẫn chỉ có lease (không xếp hàng chung).
+
+Sử dụng:
+    waiter = vm_locks.enqueue("VM1", caller="Post:abc", priority=VM_PRIORITY_SCHEDULED)
+    lease = vm_locks.try_acquire("VM1", caller="Post:abc", waiter=waiter)   # poll tới khi được
+    if lease:
+        try:
+            with fenced(lease):
+                cancellable_run([ADB_EXE, ...])     # check_fence() trước mỗi lệnh
+        finally:
+            vm_locks.release("VM1", lease.token)
+"""
+import os
+import re
+import json
+import time
+import socket
+import sqlite3
+import logging
+import threading
+import itertools
+import contextvars
+from contextlib import contextmanager
+
+from config import VM_LOCK_DIR, VM_LOCK_DB
+from constants import (
+    VM_LOCK_BACKEND, VM_LOCK_TTL, VM_LOCK_RENEW_INTERVAL, VM_LOCK_FILE_TIMEOUT, CANCEL_POLL_INTERVAL,
+    VM_PRIORITY_STREAM, VM_PRIORITY_AGING_PER_MIN, VM_WAITER_STALE_SECONDS
+)
+from utils.metrics import metrics
+from utils.persistence import atomic_write_json
+
+
+class LeaseLostError(RuntimeError):
+    """Lease của VM đã hết hạn / bị process khác lấy - không được gửi lệnh tới VM nữa"""
+
+
+# ==================== BACKENDS ====================
+class LockBackend:
+    """
+    Kho lease dùng chung. Subclass chỉ cần _transaction/_load/_store, logic lease nằm ở đây.
+
+    Record mỗi VM: {"owner": str | None, "token": int, "expires": epoch giây}.
+    Token giữ nguyên khi nhả → lần khóa sau luôn lớn hơn mọi token đã cấp.
+    Dùng time.time() (không phải monotonic) vì so sánh giữa các process.
+    """
+
+    name = ""
+
+    @contextmanager
+    def _transaction(self, vm_name):
+        """Độc quyền đọc-ghi record của vm_name, yield handle cho _load/_store"""
+        raise NotImplementedError
+
+    def _load(self, handle, vm_name) -> dict:
+        raise NotImplementedError
+
+    def _store(self, handle, vm_name, record: dict):
+        raise NotImplementedError
+
+    def vm_names(self) -> list:
+        raise NotImplementedError
+
+    def try_acquire(self, vm_name, owner, ttl):
+        """Returns: fencing token mới, hoặc None nếu lease khác còn hạn"""
+        with self._transaction(vm_name) as handle:
+            record = self._load(handle, vm_name) or {}
+            now = time.time()
+            if record.get("owner") and record.get("expires", 0) > now:
+                return None
+            token = int(record.get("token", 0)) + 1
+            self._store(handle, vm_name, {"owner": owner, "token": token, "expires": now + ttl})
+            return token
+
+    def renew(self, vm_name, token, ttl) -> bool:
+        """Gia hạn nếu token vẫn là token hiện tại (chưa ai khóa lại sau khi hết hạn)"""
+        with self._transaction(vm_name) as handle:
+            record = self._load(handle, vm_name) or {}
+            if not record.get("owner") or record.get("token") != token:
+                return False
+            record["expires"] = time.time() + ttl
+            self._store(handle, vm_name, record)
+            return True
+
+    def release(self, vm_name, token) -> bool:
+        with self._transaction(vm_name) as handle:
+            record = self._load(handle, vm_name) or {}
+            if not record.get("owner") or record.get("token") != token:
+                return False
+            self._store(handle, vm_name, {"owner": None, "token": token, "expires": 0})
+            return True
+
+    def holder(self, vm_name):
+        """Record của lease còn hạn, hoặc None nếu VM rảnh"""
+        with self._transaction(vm_name) as handle:
+            record = self._load(handle, vm_name)
+        if record and record.get("owner") and record.get("expires", 0) > time.time():
+            return record
+        return None
+
+    def validate(self, vm_name, token) -> bool:
+        """token có phải lease còn hạn hiện tại của VM không"""
+        record = self.holder(vm_name)
+        return record is not None and record.get("token") == token
+
+
+class MemoryLockBackend(LockBackend):
+    """Chỉ trong 1 process (như threading.Lock trước đây, nhưng có hạn + token)"""
+
+    name = "memory"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._records = {}
+
+    @contextmanager
+    def _transaction(self, vm_name):
+        with self._lock:
+            yield None
+
+    def _load(self, handle, vm_name):
+        record = self._records.get(vm_name)
+        return dict(record) if record else None
+
+    def _store(self, handle, vm_name, record):
+        self._records[vm_name] = record
+
+    def vm_names(self):
+        with self._lock:
+            return list(self._records)
+
+
+class FileLockBackend(LockBackend):
+    """1 file JSON / VM trong directory, đọc-ghi dưới OS file lock (<vm>.lock) - nhiều process 1 máy"""
+
+    name = "file"
+
+    def __init__(self, directory: str = VM_LOCK_DIR):
+        self.directory = directory
+        self._thread_locks = {}  # {vm_name: threading.Lock} - VM này không chờ VM khác
+        self._guard = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, vm_name, ext):
+        return os.path.join(self.directory, re.sub(r"[^\w.-]", "_", vm_name) + ext)
+
+    @contextmanager
+    def _transaction(self, vm_name):
+        with self._guard:
+            thread_lock = self._thread_locks.setdefault(vm_name, threading.Lock())
+        with thread_lock, open(self._path(vm_name, ".lock"), "a+b") as fh:
+            _lock_file(fh)
+            try:
+                yield vm_name
+            finally:
+                _unlock_file(fh)
+
+    def _load(self, handle, vm_name):
+        try:
+            with open(self._path(vm_name, ".json"), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _store(self, handle, vm_name, record):
+        atomic_write_json(self._path(vm_name, ".json"), dict(record, vm_name=vm_name), fsync=False)
+
+    def vm_names(self):
+        names = []
+        for filename in os.listdir(self.directory):
+            if filename.endswith(".json"):
+                try:
+                    with open(os.path.join(self.directory, filename), "r", encoding="utf-8") as f:
+                        names.append(json.load(f)["vm_name"])
+                except (OSError, ValueError, KeyError):
+                    pass
+        return names
+
+
+class SqliteLockBackend(LockBackend):
+    """Bảng vm_locks trong SQLite, mỗi thao tác là 1 transaction BEGIN IMMEDIATE"""
+
+    name = "sqlite"
+
+    def __init__(self, path: str = VM_LOCK_DB):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS vm_locks ("
+                         "vm_name TEXT PRIMARY KEY, owner TEXT, token INTEGER NOT NULL, expires REAL NOT NULL)")
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    @contextmanager
+    def _transaction(self, vm_name):
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        finally:
+            conn.close()
+
+    def _load(self, conn, vm_name):
+        row = conn.execute("SELECT owner, token, expires FROM vm_locks WHERE vm_name = ?", (vm_name,)).fetchone()
+        return {"owner": row[0], "token": row[1], "expires": row[2]} if row else None
+
+    def _store(self, conn, vm_name, record):
+        conn.execute("INSERT OR REPLACE INTO vm_locks (vm_name, owner, token, expires) VALUES (?, ?, ?, ?)",
+                     (vm_name, record["owner"], record["token"], record["expires"]))
+
+    def vm_names(self):
+        conn = self._connect()
+        try:
+            return [row[0] for row in conn.execute("SELECT vm_name FROM vm_locks")]
+        finally:
+            conn.close()
+
+
+if os.name == "nt":
+    import msvcrt
+
+    def _lock_file(fh):
+        """LK_NBLCK + backoff (LK_LOCK tự thử lại ~10s) - quá VM_LOCK_FILE_TIMEOUT → TimeoutError"""
+        fh.seek(0)
+        deadline = time.monotonic() + VM_LOCK_FILE_TIMEOUT
+        delay = 0.01
+        while True:
+            try:
+                msvcrt.locking(fh.fileno(), msvcrt.LK_NBLCK, 1)
+                return
+            except OSError:
+                if time.monotonic() >= deadline:
+                    raise TimeoutError(f"Không khóa được {fh.name} sau {VM_LOCK_FILE_TIMEOUT}s")
+                time.sleep(delay)
+                delay = min(delay * 2, 0.5)
+
+    def _unlock_file(fh):
+        fh.seek(0)
+        msvcrt.locking(fh.fileno(), msvcrt.LK_UNLCK, 1)
+else:
+    import fcntl
+
+    def _lock_file(fh):
+        fcntl.flock(fh.fileno(), fcntl.LOCK_EX)
+
+    def _unlock_file(fh):
+        fcntl.flock(fh.fileno(), fcntl.LOCK_UN)
+
+
+BACKENDS = {
+    "memory": MemoryLockBackend,
+    "file": FileLockBackend,
+    "sqlite": SqliteLockBackend,
+}
+
+
+# ==================== SERVICE ====================
+class VMLease:
+    """Lease process này đang giữ"""
+
+    __slots__ = ("vm_name", "owner", "token", "acquired_at", "expires", "lost", "_on_lost")
+
+    def __init__(self, vm_name, owner, token, expires):
+        self.vm_name = vm_name
+        self.owner = owner
+        self.token = token
+        self.acquired_at = time.monotonic()
+        self.expires = expires  # epoch giây - hạn theo lần khóa / gia hạn thành công gần nhất
+        self.lost = False  # gia hạn thất bại / check_fence thấy token cũ
+        self._on_lost = []
+
+    def on_lost(self, callback):
+        """Gọi callback() (từ thread gia hạn) khi lease bị mất - đã mất rồi thì gọi ngay"""
+        self._on_lost.append(callback)
+        if self.lost:
+            callback()
+
+
+class VMWaiter:
+    """1 job đang chờ VM (đăng ký qua vm_locks.enqueue)"""
+
+    __slots__ = ("vm_name", "caller", "priority", "deadline", "enqueued_at", "seq", "last_seen")
+
+    def __init__(self, vm_name, caller, priority, deadline, now, seq):
+        self.vm_name = vm_name
+        self.caller = caller
+        self.priority = priority
+        self.deadline = deadline  # epoch giây - hạn chót bắt đầu (post hẹn giờ), None = không có
+        self.enqueued_at = now    # time.monotonic()
+        self.seq = seq
+        self.last_seen = now
+
+    def score(self, now, aging=VM_PRIORITY_AGING_PER_MIN) -> float:
+        return self.priority + aging * (now - self.enqueued_at) / 60
+
+
+def pick_waiter(waiters, now, aging=VM_PRIORITY_AGING_PER_MIN):
+    """Waiter được lượt: điểm (priority + aging) cao nhất → deadline sớm nhất → vào hàng trước"""
+    return min(waiters, key=lambda w: (-w.score(now, aging),
+                                       w.deadline if w.deadline is not None else float("inf"), w.seq))
+
+
+class VMLockService:
+    """Singleton: cấp / gia hạn / nhả lease qua backend, đo thời gian chờ + giữ khóa"""
+
+    _instance = None
+    _creation_lock = threading.Lock()
+
+    def __new__(cls):
+        if cls._instance is None:
+            with cls._creation_lock:
+                if cls._instance is None:
+                    cls._instance = super().__new__(cls)
+        return cls._instance
+
+    def __init__(self):
+        if not hasattr(self, '_initialized'):
+            self.logger = logging.getLogger(__name__)
+            self.ttl = VM_LOCK_TTL
+            self.renew_interval = VM_LOCK_RENEW_INTERVAL
+            self._lock = threading.Lock()
+            self._held = {}  # {vm_name: VMLease}
+            self._waiters = {}  # {vm_name: [VMWaiter]}
+            self._waiter_seq = itertools.count()
+            self._renewer = None
+            self._stop_event = threading.Event()
+            self._owner_prefix = f"{socket.gethostname()}:{os.getpid()}"
+            try:
+                self.backend = BACKENDS[VM_LOCK_BACKEND]()
+            except Exception as e:
+                self.logger.error(f"❌ Không mở được VM lock backend '{VM_LOCK_BACKEND}': {e} - dùng memory")
+                self.backend = MemoryLockBackend()
+            self._initialized = True
+
+    def set_backend(self, backend: LockBackend):
+        """Đổi backend (chỉ khi không giữ lease nào)"""
+        with self._lock:
+            if self._held:
+                raise RuntimeError("Đang giữ lease - không đổi được backend")
+            self.backend = backend
+
+    # ==================== ACQUIRE / RELEASE ====================
+    def try_acquire(self, vm_name: str, caller: str = "", wait_start: float = None, waiter: VMWaiter = None):
+        """
+        Khóa VM nếu đang rảnh, KHÔNG chờ.
+
+        Args:
+            wait_start: time.monotonic() lúc bắt đầu chờ (vòng poll) - để đo vm_lock_wait_seconds
+            waiter: VMWaiter từ enqueue() - chỉ khóa được khi đứng đầu hàng chờ (None: khi hàng trống)
+
+        Returns:
+            VMLease nếu khóa được, None nếu VM đang bị giữ (kể cả bởi chính process này)
+            hoặc chưa tới lượt
+        """
+        if not self._is_turn(vm_name, waiter):
+            return None
+        if waiter is not None and wait_start is None:
+            wait_start = waiter.enqueued_at
+        owner = f"{self._owner_prefix}:{caller or threading.current_thread().name}"
+        now = time.time()  # Trước khi gọi backend → hạn trong RAM không bao giờ muộn hơn backend
+        try:
+            token = self.backend.try_acquire(vm_name, owner, self.ttl)
+        except Exception as e:
+            self.logger.error(f"❌ Lỗi VM lock backend khi khóa '{vm_name}': {e}", extra={"vm": vm_name})
+            return None
+        if token is None:
+            return None
+
+        lease = VMLease(vm_name, owner, token, now + self.ttl)
+        with self._lock:
+            self._held[vm_name] = lease
+            if waiter is not None:
+                self._remove_waiter(waiter)
+        waited = lease.acquired_at - wait_start if wait_start is not None else 0.0
+        metrics.observe("vm_lock_wait_seconds", max(0.0, waited), vm=vm_name)
+        self._ensure_renewer()
+        return lease
+
+    def acquire(self, vm_name: str, timeout: float, caller: str = "", cancel_token=None,
+                priority: int = VM_PRIORITY_STREAM, deadline: float = None):
+        """Xếp hàng + chờ tối đa timeout giây (poll mỗi CANCEL_POLL_INTERVAL). Returns: VMLease hoặc None"""
+        waiter = self.enqueue(vm_name, caller, priority=priority, deadline=deadline)
+        end = waiter.enqueued_at + timeout
+        try:
+            while True:
+                lease = self.try_acquire(vm_name, caller, waiter=waiter)
+                if lease is not None:
+                    return lease
+                remaining = end - time.monotonic()
+                if remaining <= 0:
+                    return None
+                if cancel_token is not None:
+                    if cancel_token.wait(min(CANCEL_POLL_INTERVAL, remaining)):
+                        return None
+                else:
+                    time.sleep(min(CANCEL_POLL_INTERVAL, remaining))
+        finally:
+            self.dequeue(waiter)
+
+    def release(self, vm_name: str, token: int = None) -> bool:
+        """
+        Nhả lease process này đang giữ. token khác lease đang giữ → không nhả.
+
+        Returns:
+            bool: False nếu process không giữ VM / sai token / lease đã bị lấy mất
+        """
+        with self._lock:
+            lease = self._held.get(vm_name)
+            if lease is None or (token is not None and lease.token != token):
+                return False
+            del self._held[vm_name]
+        metrics.observe("vm_lock_hold_seconds", time.monotonic() - lease.acquired_at, vm=vm_name)
+        try:
+            released = self.backend.release(vm_name, lease.token)
+        except Exception as e:
+            self.logger.error(f"❌ Lỗi VM lock backend khi nhả '{vm_name}': {e}", extra={"vm": vm_name})
+            return False
+        if not released:
+            self.logger.warning(f"⚠️ Lease '{vm_name}' (token {lease.token}) đã hết hạn / bị lấy trước khi nhả",
+                                extra={"vm": vm_name})
+        return released
+
+    # ==================== HÀNG CHỜ ====================
+    def enqueue(self, vm_name: str, caller: str = "", priority: int = VM_PRIORITY_STREAM,
+                deadline: float = None) -> VMWaiter:
+        """Đăng ký chờ VM - nhớ dequeue() nếu bỏ cuộc (khóa được thì tự ra khỏi hàng)"""
+        now = time.monotonic()
+        waiter = VMWaiter(vm_name, caller, priority, deadline, now, next(self._waiter_seq))
+        with self._lock:
+            self._waiters.setdefault(vm_name, []).append(waiter)
+        return waiter
+
+    def dequeue(self, waiter: VMWaiter):
+        with self._lock:
+            self._remove_waiter(waiter)
+
+    def _remove_waiter(self, waiter):
+        queue = self._waiters.get(waiter.vm_name)
+        if queue and waiter in queue:
+            queue.remove(waiter)
+            if not queue:
+                del self._waiters[waiter.vm_name]
+
+    def _is_turn(self, vm_name, waiter) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            if waiter is not None:
+                waiter.last_seen = now
+            queue = self._waiters.get(vm_name)
+            if not queue:
+                return True
+            # Job chết / bị hủy mà quên dequeue → không chặn VM mãi
+            stale = [w for w in queue if now - w.last_seen > VM_WAITER_STALE_SECONDS]
+            for w in stale:
+                self.logger.warning(f"⚠️ Bỏ waiter '{w.caller}' khỏi hàng chờ VM '{vm_name}' (không poll "
+                                    f"{now - w.last_seen:.0f}s)", extra={"vm": vm_name})
+                self._remove_waiter(w)
+            queue = self._waiters.get(vm_name)
+            if not queue:
+                return True
+            return waiter is not None and pick_waiter(queue, now) is waiter
+
+    def position(self, waiter: VMWaiter):
+        """(vị trí 1-based, tổng số waiter) của waiter trong hàng chờ VM, None nếu không còn trong hàng"""
+        for info in self.waiters(waiter.vm_name):
+            if info["seq"] == waiter.seq:
+                return info["position"], info["queued"]
+        return None
+
+    def waiters(self, vm_name: str = None) -> list:
+        """
+        Ai đang chờ VM nào, theo thứ tự sẽ được lượt (cho UI / API).
+
+        Returns:
+            list[dict]: vm_name, position, queued, caller, priority, score, waited (giây),
+                        deadline (epoch), holder (owner lease đang giữ trong process này), seq
+        """
+        now = time.monotonic()
+        result = []
+        with self._lock:
+            queues = {vm_name: self._waiters.get(vm_name, [])} if vm_name else dict(self._waiters)
+            for name, queue in queues.items():
+                remaining = list(queue)
+                holder = self._held.get(name)
+                position = 0
+                while remaining:
+                    w = pick_waiter(remaining, now)
+                    remaining.remove(w)
+                    position += 1
+                    result.append({
+                        "vm_name": name,
+                        "position": position,
+                        "queued": len(queue),
+                        "caller": w.caller,
+                        "priority": w.priority,
+                        "score": round(w.score(now), 1),
+                        "waited": round(now - w.enqueued_at, 1),
+                        "deadline": w.deadline,
+                        "holder": holder.owner if holder else None,
+                        "seq": w.seq,
+                    })
+        return result
+
+    # ==================== QUERY ====================
+    def lease(self, vm_name: str):
+        """VMLease process này đang giữ cho VM, hoặc None"""
+        with self._lock:
+            return self._held.get(vm_name)
+
+    def holder(self, vm_name: str):
+        """Lease còn hạn của VM (mọi process): {"owner", "token", "expires"} hoặc None"""
+        try:
+            return self.backend.holder(vm_name)
+        except Exception as e:
+            self.logger.error(f"❌ Lỗi VM lock backend khi đọc '{vm_name}': {e}", extra={"vm": vm_name})
+            return None
+
+    def vm_names(self) -> list:
+        try:
+            return self.backend.vm_names()
+        except Exception:
+            with self._lock:
+                return list(self._held)
+
+    def check(self, lease: VMLease):
+        """
+        Raise LeaseLostError nếu lease không còn là lease hiện tại của VM.
+
+        Hot path (mọi lệnh adb/ldconsole, mọi click): lease còn hạn trong RAM hơn 1 chu kỳ
+        gia hạn → tin trạng thái trong RAM, không đọc backend / không chờ lock dùng chung.
+        """
+        if not lease.lost:
+            now = time.time()
+            if lease.expires - now > self.renew_interval:
+                return
+            # Gia hạn đang trễ → hỏi backend (lease có thể vẫn còn / đã bị lấy)
+            try:
+                record = self.backend.holder(lease.vm_name)
+            except Exception as e:
+                raise LeaseLostError(f"Không kiểm tra được khóa VM '{lease.vm_name}': {e}")
+            if record is not None and record.get("token") == lease.token:
+                lease.expires = record["expires"]  # Hạn thật trong backend
+                return
+            self._mark_lost(lease, "token không còn hiệu lực")
+        raise LeaseLostError(f"Mất khóa máy ảo '{lease.vm_name}' (token {lease.token}) - dừng gửi lệnh")
+
+    def _mark_lost(self, lease: VMLease, reason: str):
+        if lease.lost:
+            return
+        lease.lost = True
+        metrics.inc("vm_lock_lost_total", vm=lease.vm_name)
+        self.logger.error(f"❌ Mất lease máy ảo '{lease.vm_name}' (token {lease.token}): {reason}",
+                          extra={"vm": lease.vm_name})
+        for callback in list(lease._on_lost):
+            try:
+                callback()
+            except Exception as e:
+                self.logger.warning(f"⚠️ Lỗi callback mất lease '{lease.vm_name}': {e}", extra={"vm": lease.vm_name})
+
+    # ==================== RENEW ====================
+    def _ensure_renewer(self):
+        with self._lock:
+            if self._renewer is not None and self._renewer.is_alive():
+                return
+            self._stop_event.clear()
+            self._renewer = threading.Thread(target=self._renew_loop, daemon=True, name="VMLockRenewer")
+            self._renewer.start()
+
+    def _renew_loop(self):
+        """Gia hạn mọi lease đang giữ - tự dừng khi không còn giữ lease nào"""
+        while not self._stop_event.wait(self.renew_interval):
+            with self._lock:
+                leases = [lease for lease in self._held.values() if not lease.lost]
+                if not self._held:
+                    self._renewer = None
+                    return
+            for lease in leases:
+                now = time.time()
+                try:
+                    if self.backend.renew(lease.vm_name, lease.token, self.ttl):
+                        lease.expires = now + self.ttl
+                    else:
+                        self._mark_lost(lease, "gia hạn thất bại (đã hết hạn và bị lấy)")
+                except Exception as e:
+                    # Backend lỗi tạm thời → thử lại lần sau, lease còn hạn tới VM_LOCK_TTL
+                    self.logger.warning(f"⚠️ Lỗi gia hạn lease '{lease.vm_name}': {e}", extra={"vm": lease.vm_name})
+                    if now >= lease.expires:
+                        self._mark_lost(lease, "hết hạn khi không gia hạn được")
+
+    def shutdown(self):
+        """Dừng gia hạn + nhả mọi lease còn giữ (gọi khi đóng app)"""
+        self._stop_event.set()
+        with self._lock:
+            held = list(self._held.values())
+        for lease in held:
+            self.release(lease.vm_name, lease.token)
+
+
+# ==================== FENCING ====================
+# Lease của job đang chạy trong context hiện tại (asyncio task / thread) - executor nhận bản copy
+_fence = contextvars.ContextVar("vm_lock_fence", default=None)
+
+
+def set_fence(lease: VMLease):
+    """Gắn lease vào context hiện tại. Returns: token để reset_fence"""
+    return _fence.set(lease)
+
+
+def reset_fence(token):
+    _fence.reset(token)
+
+
+@contextmanager
+def fenced(lease: VMLease):
+    token = _fence.set(lease)
+    try:
+        yield lease
+    finally:
+        _fence.reset(token)
+
+
+def check_fence():
+    """Gọi trước mỗi lệnh adb/ldconsole: ngoài fenced() → bỏ qua, lease mất → LeaseLostError"""
+    lease = _fence.get()
+    if lease is not None:
+        vm_locks.check(lease)
+
+
+# Singleton instance
+vm_locks = VMLockService()
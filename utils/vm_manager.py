@@ -3,6 +3,9 @@ VM Resource Manager - Quản lý truy cập đồng thời vào máy ảo.
 
 Đảm bảo chỉ có 1 luồng sử dụng 1 máy ảo tại 1 thời điểm.
 Các luồng khác phải chờ cho đến khi máy ảo được giải phóng.
+
+Khóa là lease có hạn + fencing token (utils/vm_lock.py) dùng chung giữa các process,
+không còn là threading.Lock trong RAM.
 """
 import threading
 import logging
@@ -10,12 +13,17 @@ import time
 import subprocess
 from typing import Optional
 
+from utils.cancel_token import CancelToken, OperationCancelled, run as cancellable_run
+from constants import VM_PRIORITY_STREAM
+from utils.vm_lock import vm_locks, VMLease, VMWaiter
+
 
 class VMManager:
     """
     Singleton manager để quản lý locks cho từng máy ảo.
 
-    Sử dụng threading.Lock để đảm bảo chỉ 1 luồng truy cập 1 VM tại 1 thời điểm.
+    Khóa qua vm_locks (lease + fencing token) để đảm bảo chỉ 1 luồng / 1 process truy cập
+    1 VM tại 1 thời điểm.
     """
 
     _instance = None
@@ -30,91 +38,97 @@ class VMManager:
 
     def __init__(self):
         if not hasattr(self, '_initialized'):
-            self._vm_locks = {}  # {vm_name: threading.Lock()}
-            self._locks_lock = threading.Lock()  # Lock để tạo lock mới an toàn
             self.logger = logging.getLogger(__name__)
             self._initialized = True
 
-    def acquire_vm(self, vm_name: str, timeout: float = 5400, caller: str = "") -> bool:
+    def acquire_vm(self, vm_name: str, timeout: float = 5400, caller: str = "",
+                   cancel_token: CancelToken = None, priority: int = VM_PRIORITY_STREAM,
+                   deadline: float = None) -> Optional[VMLease]:
         """
         Khóa máy ảo để sử dụng độc quyền.
 
-        Nếu VM đang được sử dụng bởi luồng khác, sẽ CHỜ cho đến khi:
-        - VM được giải phóng, HOẶC
+        Nếu VM đang được sử dụng bởi luồng / process khác, sẽ CHỜ cho đến khi:
+        - VM được giải phóng (hoặc lease của bên kia hết hạn), HOẶC
         - Hết timeout
 
         Args:
             vm_name: Tên máy ảo cần khóa
             timeout: Thời gian chờ tối đa (giây). Mặc định 5400s = 1.5 giờ
             caller: Tên người gọi (để log)
+            cancel_token: Optional CancelToken - dừng chờ ngay khi bị cancel
+            priority: Độ ưu tiên trong hàng chờ VM (VM_PRIORITY_*)
+            deadline: Epoch giây - hạn chót bắt đầu (xếp trước khi cùng điểm ưu tiên)
 
         Returns:
-            bool: True nếu khóa thành công, False nếu timeout
+            VMLease (truthy) nếu khóa thành công, None nếu timeout/bị dừng
         """
-        # Tạo lock cho VM nếu chưa có (thread-safe)
-        with self._locks_lock:
-            if vm_name not in self._vm_locks:
-                self._vm_locks[vm_name] = threading.Lock()
-                self.logger.info(f"Created new lock for VM: {vm_name}")
-
-        vm_lock = self._vm_locks[vm_name]
         caller_info = f"[{caller}] " if caller else ""
+        self.logger.info(f"{caller_info}Attempting to acquire VM '{vm_name}' (timeout={timeout}s)...", extra={"vm": vm_name})
+
+        lease = vm_locks.acquire(vm_name, timeout, caller=caller, cancel_token=cancel_token,
+                                 priority=priority, deadline=deadline)
+        if lease is not None:
+            self.logger.info(f"{caller_info}✅ Successfully acquired VM '{vm_name}' (token {lease.token})", extra={"vm": vm_name})
+            return lease
+        if cancel_token is not None and cancel_token.is_cancelled():
+            self.logger.info(f"{caller_info}🛑 Stopped waiting for VM '{vm_name}'", extra={"vm": vm_name})
+        else:
+            self.logger.warning(f"{caller_info}⏱️ Timeout waiting for VM '{vm_name}' after {timeout}s", extra={"vm": vm_name})
+        return None
 
-        # Thử khóa VM
-        self.logger.info(f"{caller_info}Attempting to acquire VM '{vm_name}' (timeout={timeout}s)...")
+    def try_acquire_vm(self, vm_name: str, caller: str = "", wait_start: float = None,
+                       waiter: VMWaiter = None) -> Optional[VMLease]:
+        """
+        Khóa máy ảo nếu đang rảnh, KHÔNG chờ (dùng cho vòng poll async / reaper).
 
-        acquired = vm_lock.acquire(blocking=True, timeout=timeout)
+        Chỉ log khi khóa thành công để không spam log khi poll liên tục.
 
-        if acquired:
-            self.logger.info(f"{caller_info}✅ Successfully acquired VM '{vm_name}'")
-            return True
-        else:
-            self.logger.warning(f"{caller_info}⏱️ Timeout waiting for VM '{vm_name}' after {timeout}s")
-            return False
+        Args:
+            wait_start: time.monotonic() lúc bắt đầu poll (đo thời gian chờ khóa)
+            waiter: VMWaiter (vm_locks.enqueue) - None: chỉ khóa được khi không ai xếp hàng chờ VM
+
+        Returns:
+            VMLease (truthy) nếu khóa thành công, None nếu VM đang bận / chưa tới lượt
+        """
+        lease = vm_locks.try_acquire(vm_name, caller=caller, wait_start=wait_start, waiter=waiter)
+        if lease is not None:
+            caller_info = f"[{caller}] " if caller else ""
+            self.logger.info(f"{caller_info}✅ Successfully acquired VM '{vm_name}' (token {lease.token})", extra={"vm": vm_name})
+        return lease
 
-    def release_vm(self, vm_name: str, caller: str = ""):
+    def release_vm(self, vm_name: str, caller: str = "", token: int = None) -> bool:
         """
         Giải phóng máy ảo sau khi sử dụng xong.
 
         Args:
             vm_name: Tên máy ảo cần giải phóng
             caller: Tên người gọi (để log)
-        """
-        if vm_name not in self._vm_locks:
-            self.logger.warning(f"Attempted to release non-existent lock for VM: {vm_name}")
-            return
+            token: Fencing token của lease (nên truyền) - khác lease đang giữ thì không nhả
 
+        Returns:
+            bool: True nếu đã nhả lease
+        """
         caller_info = f"[{caller}] " if caller else ""
-
-        try:
-            self._vm_locks[vm_name].release()
-            self.logger.info(f"{caller_info}🔓 Released VM '{vm_name}'")
-        except RuntimeError as e:
-            # Lock chưa được acquire hoặc đã release rồi
-            self.logger.error(f"{caller_info}Error releasing VM '{vm_name}': {e}")
+        if vm_locks.lease(vm_name) is None:
+            self.logger.warning(f"{caller_info}Attempted to release VM '{vm_name}' without holding its lease", extra={"vm": vm_name})
+            return False
+        if vm_locks.release(vm_name, token):
+            self.logger.info(f"{caller_info}🔓 Released VM '{vm_name}'", extra={"vm": vm_name})
+            return True
+        self.logger.error(f"{caller_info}Error releasing VM '{vm_name}': token {token} không khớp / lease đã mất", extra={"vm": vm_name})
+        return False
 
     def is_locked(self, vm_name: str) -> bool:
         """
-        Kiểm tra xem VM có đang bị khóa không (non-blocking check).
+        Kiểm tra xem VM có đang bị khóa không (đọc lease, không thử khóa).
 
         Args:
             vm_name: Tên máy ảo
 
         Returns:
-            bool: True nếu VM đang bị khóa
+            bool: True nếu VM đang có lease còn hạn (process này hoặc process khác)
         """
-        if vm_name not in self._vm_locks:
-            return False
-
-        # Thử acquire với timeout=0 (non-blocking)
-        vm_lock = self._vm_locks[vm_name]
-        if vm_lock.acquire(blocking=False):
-            # Nếu acquire được thì VM đang rảnh, nhớ release lại
-            vm_lock.release()
-            return False
-        else:
-            # Không acquire được = VM đang bị khóa
-            return True
+        return vm_locks.holder(vm_name) is not None
 
     def get_status(self) -> dict:
         """
@@ -123,15 +137,77 @@ class VMManager:
         Returns:
             dict: {vm_name: locked (bool)}
         """
-        status = {}
-        with self._locks_lock:
-            for vm_name in self._vm_locks:
-                status[vm_name] = self.is_locked(vm_name)
-        return status
+        return {vm_name: self.is_locked(vm_name) for vm_name in vm_locks.vm_names()}
+
+    def get_waiters(self, vm_name: str = None) -> list:
+        """Hàng chờ VM theo thứ tự được lượt (xem VMLockService.waiters)"""
+        return vm_locks.waiters(vm_name)
+
+    @staticmethod
+    def _wait_interval(seconds: float, cancel_token: CancelToken = None) -> bool:
+        """Chờ giữa 2 lần check. Returns: True nếu bị dừng (trả về ngay khi cancel)"""
+        if cancel_token is None:
+            time.sleep(seconds)
+            return False
+        return cancel_token.wait(seconds)
+
+    @staticmethod
+    def query_vm_status(vm_name: str, ldconsole_path: str, timeout: int = 10) -> Optional[str]:
+        """
+        Đọc 1 lần trạng thái máy ảo từ ldconsole list2 (không chờ).
+
+        Returns:
+            str: "0" (tắt), "1" (đang chạy), "2" (đang khởi động)...
+            None: VM không có trong danh sách
+
+        Raises:
+            subprocess.TimeoutExpired / OSError nếu không gọi được ldconsole
+        """
+        result = subprocess.run(
+            [ldconsole_path, "list2"],
+            capture_output=True,
+            text=True,
+            creationflags=subprocess.CREATE_NO_WINDOW,
+            timeout=timeout
+        )
+        # Format: index,name,title,top_window,running,pid
+        for line in result.stdout.splitlines():
+            parts = line.split(",")
+            if len(parts) >= 5 and parts[1].strip() == vm_name:
+                return parts[4].strip()
+        return None
+
+    @staticmethod
+    def query_adb_state(device: str, adb_path: str, timeout: int = 10) -> Optional[str]:
+        """
+        Đọc 1 lần state của device trong 'adb devices' (không chờ).
+
+        Returns:
+            str: "device", "offline", "unauthorized"...
+            None: device chưa xuất hiện
+
+        Raises:
+            subprocess.TimeoutExpired / OSError nếu không gọi được adb
+        """
+        result = subprocess.run(
+            [adb_path, "devices"],
+            capture_output=True,
+            text=True,
+            encoding="utf-8",
+            errors="ignore",
+            creationflags=subprocess.CREATE_NO_WINDOW,
+            timeout=timeout
+        )
+        for line in result.stdout.splitlines():
+            parts = line.split()
+            if len(parts) >= 2 and parts[0] == device:
+                return parts[1]
+        return None
 
     @staticmethod
     def wait_vm_ready(vm_name: str, ldconsole_path: str, timeout: int = 60,
-                      check_interval: int = 2, log_callback=None) -> bool:
+                      check_interval: int = 2, log_callback=None,
+                      cancel_token: CancelToken = None) -> bool:
         """
         Chờ máy ảo khởi động hoàn toàn (status = "1" trong ldconsole list2).
 
@@ -141,9 +217,10 @@ class VMManager:
             timeout: Thời gian chờ tối đa (giây)
             check_interval: Thời gian chờ giữa các lần check (giây)
             log_callback: Optional callback function(msg) để log ra UI
+            cancel_token: Optional CancelToken - dừng chờ ngay khi bị cancel
 
         Returns:
-            bool: True nếu VM đã ready, False nếu timeout
+            bool: True nếu VM đã ready, False nếu timeout/bị dừng
         """
         logger = logging.getLogger(__name__)
         elapsed = 0
@@ -154,8 +231,9 @@ class VMManager:
 
         while elapsed < timeout:
             try:
-                result = subprocess.run(
+                result = cancellable_run(
                     [ldconsole_path, "list2"],
+                    token=cancel_token,
                     capture_output=True,
                     text=True,
                     creationflags=subprocess.CREATE_NO_WINDOW,
@@ -184,6 +262,9 @@ class VMManager:
                             return True
                         break
 
+            except OperationCancelled:
+                logger.info(f"🛑 Dừng chờ máy ảo '{vm_name}' khởi động")
+                return False
             except subprocess.TimeoutExpired:
                 msg = f"⚠️ ldconsole list2 timeout (vẫn đang chờ...)"
                 if log_callback:
@@ -202,7 +283,9 @@ class VMManager:
                     log_callback(f"   ⏳ Vẫn đang chờ... ({elapsed}s/{timeout}s, {status_str})")
                 last_progress_log = elapsed
 
-            time.sleep(check_interval)
+            if VMManager._wait_interval(check_interval, cancel_token):
+                logger.info(f"🛑 Dừng chờ máy ảo '{vm_name}' khởi động")
+                return False
             elapsed += check_interval
 
         msg = f"❌ Timeout {timeout}s - VM không ready (status cuối: {last_status})"
@@ -213,7 +296,8 @@ class VMManager:
 
     @staticmethod
     def wait_adb_ready(device: str, adb_path: str, timeout: int = 30,
-                       check_interval: int = 2, log_callback=None) -> bool:
+                       check_interval: int = 2, log_callback=None,
+                       cancel_token: CancelToken = None) -> bool:
         """
         Chờ ADB kết nối đến device và device ở trạng thái "device" (không phải offline).
 
@@ -223,9 +307,10 @@ class VMManager:
             timeout: Thời gian chờ tối đa (giây)
             check_interval: Thời gian chờ giữa các lần check (giây)
             log_callback: Optional callback function(msg) để log ra UI
+            cancel_token: Optional CancelToken - dừng chờ ngay khi bị cancel
 
         Returns:
-            bool: True nếu ADB đã connect và state = "device", False nếu timeout
+            bool: True nếu ADB đã connect và state = "device", False nếu timeout/bị dừng
         """
         logger = logging.getLogger(__name__)
         elapsed = 0
@@ -236,8 +321,9 @@ class VMManager:
 
         while elapsed < timeout:
             try:
-                result = subprocess.run(
+                result = cancellable_run(
                     [adb_path, "devices"],
+                    token=cancel_token,
                     capture_output=True,
                     text=True,
                     encoding="utf-8",
@@ -277,6 +363,9 @@ class VMManager:
                 if not device_found:
                     logger.debug(f"Device '{device}' chưa xuất hiện trong 'adb devices'")
 
+            except OperationCancelled:
+                logger.info(f"🛑 Dừng chờ ADB '{device}'")
+                return False
             except subprocess.TimeoutExpired:
                 msg = f"⚠️ 'adb devices' timeout (vẫn đang chờ...)"
                 if log_callback and elapsed > 10:  # Chỉ log sau 10s
@@ -295,7 +384,9 @@ class VMManager:
                     log_callback(f"   ⏳ Vẫn đang chờ ADB... ({elapsed}s/{timeout}s{state_str})")
                 last_progress_log = elapsed
 
-            time.sleep(check_interval)
+            if VMManager._wait_interval(check_interval, cancel_token):
+                logger.info(f"🛑 Dừng chờ ADB '{device}'")
+                return False
             elapsed += check_interval
 
         msg = f"❌ Timeout {timeout}s - ADB không kết nối được (state cuối: {last_state})"
@@ -306,7 +397,7 @@ class VMManager:
 
     @staticmethod
     def ensure_adb_connected(device: str, adb_path: str, max_retries: int = 3,
-                             log_callback=None) -> bool:
+                             log_callback=None, cancel_token: CancelToken = None) -> bool:
         """
         Ensure ADB connection to device. Force connect nếu device không có trong adb devices.
 
@@ -321,9 +412,10 @@ class VMManager:
             adb_path: Đường dẫn đến adb.exe
             max_retries: Số lần retry tối đa (default 3)
             log_callback: Optional callback function(msg) để log ra UI
+            cancel_token: Optional CancelToken - dừng ngay khi bị cancel
 
         Returns:
-            bool: True nếu device đã connect, False nếu fail sau max_retries
+            bool: True nếu device đã connect, False nếu fail sau max_retries/bị dừng
 
         Example:
             >>> VMManager.ensure_adb_connected("emulator-5554", "path/to/adb.exe")
@@ -344,8 +436,9 @@ class VMManager:
         for attempt in range(1, max_retries + 1):
             try:
                 # Check device có trong adb devices không
-                result = subprocess.run(
+                result = cancellable_run(
                     [adb_path, "devices"],
+                    token=cancel_token,
                     capture_output=True,
                     text=True,
                     encoding="utf-8",
@@ -377,8 +470,9 @@ class VMManager:
 
                 logger.info(f"Attempting adb connect {connect_addr} (try {attempt}/{max_retries})")
 
-                connect_result = subprocess.run(
+                connect_result = cancellable_run(
                     [adb_path, "connect", connect_addr],
+                    token=cancel_token,
                     capture_output=True,
                     text=True,
                     encoding="utf-8",
@@ -394,11 +488,13 @@ class VMManager:
                         log_callback(f"      {output}")
 
                 # Wait 2s sau mỗi lần connect để ADB settle
-                time.sleep(2)
+                if VMManager._wait_interval(2, cancel_token):
+                    raise OperationCancelled()
 
                 # Verify connection
-                verify_result = subprocess.run(
+                verify_result = cancellable_run(
                     [adb_path, "devices"],
+                    token=cancel_token,
                     capture_output=True,
                     text=True,
                     encoding="utf-8",
@@ -418,8 +514,12 @@ class VMManager:
                 # Chưa connect được, retry
                 if attempt < max_retries:
                     logger.warning(f"Connect failed (attempt {attempt}), retrying...")
-                    time.sleep(1)
+                    if VMManager._wait_interval(1, cancel_token):
+                        raise OperationCancelled()
 
+            except OperationCancelled:
+                logger.info(f"🛑 Dừng kết nối ADB '{device}'")
+                return False
             except subprocess.TimeoutExpired:
                 logger.warning(f"ADB command timeout (attempt {attempt})")
                 if log_callback:
@@ -437,7 +537,7 @@ class VMManager:
 
     @staticmethod
     def wait_vm_stopped(vm_name: str, ldconsole_path: str, timeout: int = 60,
-                        check_interval: int = 2) -> bool:
+                        check_interval: int = 2, cancel_token: CancelToken = None) -> bool:
         """
         Chờ máy ảo TẮT hoàn toàn (status = "0" trong ldconsole list2).
 
@@ -450,9 +550,10 @@ class VMManager:
             ldconsole_path: Đường dẫn đến ldconsole.exe
             timeout: Thời gian chờ tối đa (giây)
             check_interval: Thời gian chờ giữa các lần check (giây)
+            cancel_token: Optional CancelToken - dừng chờ ngay khi bị cancel
 
         Returns:
-            bool: True nếu VM đã tắt hoàn toàn, False nếu timeout
+            bool: True nếu VM đã tắt hoàn toàn, False nếu timeout/bị dừng
         """
         logger = logging.getLogger(__name__)
         elapsed = 0
@@ -461,8 +562,9 @@ class VMManager:
 
         while elapsed < timeout:
             try:
-                result = subprocess.run(
+                result = cancellable_run(
                     [ldconsole_path, "list2"],
+                    token=cancel_token,
                     capture_output=True,
                     text=True,
                     creationflags=subprocess.CREATE_NO_WINDOW,
@@ -490,12 +592,17 @@ class VMManager:
                     logger.info(f"✅ Máy ảo '{vm_name}' không còn trong danh sách (đã tắt)")
                     return True
 
+            except OperationCancelled:
+                logger.info(f"🛑 Dừng chờ máy ảo '{vm_name}' tắt")
+                return False
             except subprocess.TimeoutExpired:
                 logger.warning(f"ldconsole list2 timeout khi check VM '{vm_name}'")
             except Exception as e:
                 logger.error(f"Lỗi khi check status VM '{vm_name}': {e}")
 
-            time.sleep(check_interval)
+            if VMManager._wait_interval(check_interval, cancel_token):
+                logger.info(f"🛑 Dừng chờ máy ảo '{vm_name}' tắt")
+                return False
             elapsed += check_interval
 
         logger.error(f"⏱️ Timeout {timeout}s - Máy ảo '{vm_name}' chưa tắt hoàn toàn")
@@ -0,0 +1,250 @@
+"""
+VM Registry - Cache thông tin máy ảo (data/vm/{vm_id}.json) trong RAM.
+
+Trước đây mỗi lần tra port/ID đều phải mở và parse toàn bộ file JSON trong
+VM_DATA_DIR. Registry load 1 lần, sau đó chỉ stat() để phát hiện thay đổi:
+- mtime thư mục đổi (tạo/xóa/os.replace file) → reload các file đã đổi
+- Định kỳ (RESCAN_INTERVAL) stat từng file → bắt được cả sửa tay bằng Notepad
+- Ghi qua registry (write-through) → cập nhật file + cache cùng lúc
+"""
+import os
+import threading
+import logging
+import time
+from typing import Optional
+
+from config import VM_DATA_DIR
+from utils.persistence import load_json, atomic_write_json
+
+# Khoảng thời gian tối thiểu giữa 2 lần stat từng file (giây)
+RESCAN_INTERVAL = 2.0
+
+
+def _sort_key(vm_id: str):
+    """Sắp xếp ID số theo giá trị (2 < 10), ID chữ xếp sau"""
+    return (0, int(vm_id), "") if vm_id.isdigit() else (1, 0, vm_id)
+
+
+class VMRegistry:
+    """
+    Singleton registry: vm_name → vm_id → port / thông tin đăng nhập.
+
+    Thread-safe, mọi dict trả ra đều là bản copy.
+    """
+
+    _instance = None
+    _creation_lock = threading.Lock()
+
+    def __new__(cls, data_dir: str = VM_DATA_DIR):
+        if cls._instance is None:
+            with cls._creation_lock:
+                if cls._instance is None:
+                    cls._instance = super().__new__(cls)
+        return cls._instance
+
+    def __init__(self, data_dir: str = VM_DATA_DIR):
+        if not hasattr(self, '_initialized'):
+            self.data_dir = data_dir
+            self._lock = threading.RLock()
+            self._by_id = {}          # {vm_id: dict}
+            self._id_by_name = {}     # {vm_name: vm_id}
+            self._file_stats = {}     # {filename: (mtime_ns, size)}
+            self._dir_mtime = None
+            self._last_scan = 0.0
+            self.json_reads = 0       # Số lần parse file JSON (để benchmark/debug)
+            self.logger = logging.getLogger(__name__)
+            self._initialized = True
+
+    # ==================== INVALIDATION ====================
+    def _refresh_if_stale(self, force: bool = False):
+        """Reload các file đã thay đổi (gọi khi đang giữ self._lock)"""
+        try:
+            dir_mtime = os.stat(self.data_dir).st_mtime_ns
+        except OSError:
+            if self._by_id:
+                self._by_id.clear()
+                self._id_by_name.clear()
+                self._file_stats.clear()
+            self._dir_mtime = None
+            return
+
+        now = time.monotonic()
+        if (not force and dir_mtime == self._dir_mtime
+                and now - self._last_scan < RESCAN_INTERVAL):
+            return
+
+        self._dir_mtime = dir_mtime
+        self._last_scan = now
+
+        try:
+            filenames = [f for f in os.listdir(self.data_dir) if f.endswith(".json")]
+        except OSError as e:
+            self.logger.error(f"Error listing VM data dir: {e}")
+            return
+
+        seen = set()
+        for filename in filenames:
+            seen.add(filename)
+            path = os.path.join(self.data_dir, filename)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            sig = (st.st_mtime_ns, st.st_size)
+            if not force and self._file_stats.get(filename) == sig:
+                continue
+            self._load_file(filename, sig)
+
+        for filename in list(self._file_stats):
+            if filename not in seen:
+                self._drop(filename[:-5])
+
+    def _load_file(self, filename: str, sig):
+        vm_id = filename[:-5]
+        path = os.path.join(self.data_dir, filename)
+        try:
+            data = load_json(path)
+            self.json_reads += 1
+        except Exception:
+            # Bỏ qua file JSON lỗi (giống get_vm_id_from_name cũ)
+            self._drop(vm_id)
+            return
+        if not isinstance(data, dict):
+            self._drop(vm_id)
+            return
+        self._set(vm_id, data)
+        self._file_stats[filename] = sig
+
+    def _set(self, vm_id: str, data: dict):
+        old = self._by_id.get(vm_id)
+        if old is not None:
+            old_name = old.get("vm_name")
+            if old_name and self._id_by_name.get(old_name) == vm_id:
+                del self._id_by_name[old_name]
+        record = dict(data)
+        self._by_id[vm_id] = record
+        vm_name = record.get("vm_name")
+        if vm_name:
+            self._id_by_name[vm_name] = vm_id
+
+    def _drop(self, vm_id: str):
+        old = self._by_id.pop(vm_id, None)
+        if old is not None:
+            old_name = old.get("vm_name")
+            if old_name and self._id_by_name.get(old_name) == vm_id:
+                del self._id_by_name[old_name]
+        self._file_stats.pop(f"{vm_id}.json", None)
+
+    def _mark_written(self, vm_id: str):
+        """Cập nhật chữ ký file sau khi tự ghi → không parse lại chính file vừa ghi"""
+        filename = f"{vm_id}.json"
+        try:
+            st = os.stat(os.path.join(self.data_dir, filename))
+            self._file_stats[filename] = (st.st_mtime_ns, st.st_size)
+            self._dir_mtime = os.stat(self.data_dir).st_mtime_ns
+        except OSError:
+            self._file_stats.pop(filename, None)
+
+    def invalidate(self):
+        """Bắt buộc reload toàn bộ ở lần tra cứu tiếp theo"""
+        with self._lock:
+            self._dir_mtime = None
+            self._file_stats.clear()
+
+    # ==================== LOOKUP ====================
+    def get_vm_id(self, vm_name: str) -> Optional[str]:
+        """Tên máy ảo → VM ID (None nếu không có)"""
+        with self._lock:
+            self._refresh_if_stale()
+            return self._id_by_name.get(vm_name)
+
+    def get(self, vm_name: str) -> Optional[dict]:
+        """Tên máy ảo → bản copy thông tin VM (kèm key "id"), None nếu không có"""
+        with self._lock:
+            self._refresh_if_stale()
+            vm_id = self._id_by_name.get(vm_name)
+            if vm_id is None:
+                return None
+            return dict(self._by_id[vm_id], id=vm_id)
+
+    def get_by_id(self, vm_id: str) -> Optional[dict]:
+        """VM ID → bản copy thông tin VM, None nếu không có"""
+        with self._lock:
+            self._refresh_if_stale()
+            data = self._by_id.get(str(vm_id))
+            return dict(data, id=str(vm_id)) if data is not None else None
+
+    def get_port(self, vm_name: str) -> Optional[str]:
+        """Tên máy ảo → ADB port (str), None nếu chưa cấu hình"""
+        info = self.get(vm_name)
+        if not info:
+            return None
+        port = info.get("port")
+        return str(port) if port else None
+
+    def get_adb_address(self, vm_name: str) -> Optional[str]:
+        """Tên máy ảo → "emulator-{port}", None nếu chưa cấu hình port"""
+        port = self.get_port(vm_name)
+        return f"emulator-{port}" if port else None
+
+    def list_vms(self) -> list:
+        """Danh sách bản copy thông tin tất cả VM, sắp xếp theo ID"""
+        with self._lock:
+            self._refresh_if_stale()
+            return [dict(self._by_id[vm_id], id=vm_id)
+                    for vm_id in sorted(self._by_id, key=_sort_key)]
+
+    def path_for(self, vm_id: str) -> str:
+        return os.path.join(self.data_dir, f"{vm_id}.json")
+
+    # ==================== WRITE-THROUGH ====================
+    def save(self, vm_id: str, data: dict):
+        """
+        Ghi toàn bộ thông tin VM ra {vm_id}.json và cập nhật cache.
+
+        Args:
+            vm_id: VM ID
+            data: Dict thông tin VM
+        """
+        vm_id = str(vm_id)
+        with self._lock:
+            atomic_write_json(self.path_for(vm_id), data)
+            self._set(vm_id, data)
+            self._mark_written(vm_id)
+
+    def update(self, vm_id: str, changes: dict) -> dict:
+        """
+        Cập nhật một số field của VM (đọc từ cache, ghi ra file).
+
+        Args:
+            vm_id: VM ID
+            changes: Dict các field cần đổi (vd: {"port": "5555"})
+
+        Returns:
+            dict: Bản copy thông tin VM sau khi cập nhật
+        """
+        vm_id = str(vm_id)
+        with self._lock:
+            self._refresh_if_stale()
+            data = dict(self._by_id.get(vm_id, {}))
+            data.update(changes)
+            self.save(vm_id, data)
+            return dict(data, id=vm_id)
+
+    def remove(self, vm_id: str):
+        """Xóa {vm_id}.json và bỏ khỏi cache"""
+        vm_id = str(vm_id)
+        with self._lock:
+            try:
+                os.remove(self.path_for(vm_id))
+            except FileNotFoundError:
+                pass
+            self._drop(vm_id)
+            try:
+                self._dir_mtime = os.stat(self.data_dir).st_mtime_ns
+            except OSError:
+                self._dir_mtime = None
+
+
+# Global singleton instance
+vm_registry = VMRegistry()
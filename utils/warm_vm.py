@@ -0,0 +1,293 @@
+"""
+Warm VM Pool - Giữ máy ảo chạy giữa các post liên tiếp trên cùng 1 VM.
+
+Flow cũ: mỗi post đều reboot/launch → đăng → quit → chờ tắt → sleep 15s.
+Warm mode: nếu VM còn việc (post/video kế tiếp), giữ VM chạy và chỉ reset
+trạng thái Instagram (force-stop app; DCIM/Pictures được dọn khi push). VM được tắt khi
+hết việc hoặc rảnh quá WARM_VM_IDLE_TTL giây.
+
+Thống kê: số lần boot tránh được và số giây tiết kiệm (ước lượng từ thời gian
+boot/tắt đo thực tế).
+"""
+import threading
+import logging
+import subprocess
+import time
+from collections import deque
+
+from config import ADB_EXE, LDCONSOLE_EXE
+from constants import (
+    INSTAGRAM_PACKAGE, WAIT_EXTRA_LONG,
+    WARM_VM_MODE, WARM_VM_IDLE_TTL, WARM_VM_BOOT_ESTIMATE, WARM_VM_SHUTDOWN_ESTIMATE
+)
+from utils.vm_manager import vm_manager
+from utils.vm_lock import check_fence, fenced
+
+# Chu kỳ kiểm tra VM warm rảnh quá TTL (giây)
+REAPER_INTERVAL = 5
+
+
+class WarmVMPool:
+    """
+    Singleton quản lý các VM đang được giữ "warm".
+
+    Quy ước sử dụng (luôn gọi khi ĐANG giữ vm_manager lock của VM):
+    - claim(vm_name) ngay sau acquire_vm → True nếu VM đang warm (bỏ qua reboot)
+    - keep_warm(vm_name) khi xong việc mà còn việc kế tiếp → không quit VM
+    - Các trường hợp còn lại: quit như cũ (VM tự động không còn warm sau claim)
+    """
+
+    _instance = None
+    _creation_lock = threading.Lock()
+
+    def __new__(cls):
+        if cls._instance is None:
+            with cls._creation_lock:
+                if cls._instance is None:
+                    cls._instance = super().__new__(cls)
+        return cls._instance
+
+    def __init__(self):
+        if not hasattr(self, '_initialized'):
+            self.enabled = WARM_VM_MODE
+            self.idle_ttl = WARM_VM_IDLE_TTL
+            self._warm = {}  # {vm_name: last_used (monotonic)}
+            self._lock = threading.Lock()
+            self._boot_samples = deque(maxlen=20)      # Thời gian cold boot đo được (giây)
+            self._shutdown_samples = deque(maxlen=20)  # Thời gian quit + chờ tắt đo được (giây)
+            self.boots_avoided = 0
+            self.seconds_saved = 0.0
+            self._reaper = None
+            self._stop_event = threading.Event()
+            self.logger = logging.getLogger(__name__)
+            self._initialized = True
+
+    # ==================== CẤU HÌNH ====================
+    def set_enabled(self, enabled: bool, idle_ttl: float = None):
+        """Bật/tắt warm mode. Khi tắt, các VM warm sẽ được reaper tắt ngay."""
+        with self._lock:
+            self.enabled = bool(enabled)
+            if idle_ttl is not None:
+                self.idle_ttl = idle_ttl
+        self.logger.info(f"♨️ Warm VM mode: {'BẬT' if enabled else 'TẮT'} (idle TTL={self.idle_ttl}s)")
+        if self._warm:
+            self._ensure_reaper()
+
+    # ==================== TRẠNG THÁI WARM ====================
+    def claim(self, vm_name: str) -> bool:
+        """
+        Lấy VM ra khỏi danh sách warm (gọi sau khi đã acquire_vm).
+
+        Returns:
+            bool: True nếu VM đang warm và warm mode đang bật → có thể bỏ qua reboot
+        """
+        with self._lock:
+            was_warm = self._warm.pop(vm_name, None) is not None
+            return was_warm and self.enabled
+
+    def keep_warm(self, vm_name: str):
+        """Đánh dấu VM đang chạy sẵn cho việc kế tiếp (gọi trước khi release_vm)"""
+        with self._lock:
+            self._warm[vm_name] = time.monotonic()
+        self._ensure_reaper()
+
+    def should_keep_warm(self, has_more_work: bool) -> bool:
+        """True nếu warm mode bật và VM còn việc kế tiếp"""
+        return self.enabled and bool(has_more_work)
+
+    def is_warm(self, vm_name: str) -> bool:
+        with self._lock:
+            return vm_name in self._warm
+
+    def warm_vms(self) -> list:
+        with self._lock:
+            return list(self._warm)
+
+    # ==================== RESET INSTAGRAM ====================
+    def reset_instagram(self, adb_address: str, log_callback=None) -> bool:
+        """
+        Reset trạng thái Instagram thay cho reboot: force-stop app.
+
+        File cũ trong DCIM/Pictures được remote_media.prune dọn ở bước push (chỉ file tool đã push).
+
+        Args:
+            adb_address: Device (vd: "emulator-5554")
+            log_callback: Optional log function
+
+        Returns:
+            bool: True nếu force-stop thành công
+        """
+        log = log_callback or (lambda msg: print(msg))
+        try:
+            check_fence()
+            result = subprocess.run(
+                [ADB_EXE, "-s", adb_address, "shell", "am", "force-stop", INSTAGRAM_PACKAGE],
+                capture_output=True,
+                text=True,
+                encoding="utf-8",
+                errors="ignore",
+                creationflags=subprocess.CREATE_NO_WINDOW,
+                timeout=15
+            )
+            if result.returncode != 0:
+                log(f"⚠️ Force-stop Instagram thất bại: {result.stderr.strip()}")
+                return False
+            log("♨️ Đã reset Instagram (force-stop)")
+            return True
+        except Exception as e:
+            log(f"⚠️ Lỗi reset Instagram: {e}")
+            return False
+
+    # ==================== THỐNG KÊ ====================
+    def record_boot(self, seconds: float):
+        """Ghi nhận thời gian 1 lần cold boot (launch/reboot → ADB ready)"""
+        if seconds > 0:
+            with self._lock:
+                self._boot_samples.append(seconds)
+
+    def record_shutdown(self, seconds: float):
+        """Ghi nhận thời gian 1 lần tắt VM (quit → tắt hẳn + sleep)"""
+        if seconds > 0:
+            with self._lock:
+                self._shutdown_samples.append(seconds)
+
+    def _avg(self, samples, default):
+        return sum(samples) / len(samples) if samples else default
+
+    def record_boot_avoided(self) -> float:
+        """
+        Ghi nhận 1 lần bỏ qua reboot nhờ VM warm.
+
+        Returns:
+            float: Số giây ước lượng tiết kiệm được (boot + tắt trung bình)
+        """
+        with self._lock:
+            saved = (self._avg(self._boot_samples, WARM_VM_BOOT_ESTIMATE)
+                     + self._avg(self._shutdown_samples, WARM_VM_SHUTDOWN_ESTIMATE))
+            self.boots_avoided += 1
+            self.seconds_saved += saved
+        return saved
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "warm_vms": list(self._warm),
+                "boots_avoided": self.boots_avoided,
+                "seconds_saved": round(self.seconds_saved, 1),
+                "avg_boot_s": round(self._avg(self._boot_samples, 0.0), 1),
+                "avg_shutdown_s": round(self._avg(self._shutdown_samples, 0.0), 1),
+            }
+
+    def format_stats(self) -> str:
+        stats = self.get_stats()
+        return (f"♨️ Warm VM: tránh {stats['boots_avoided']} lần boot, "
+                f"tiết kiệm ~{stats['seconds_saved'] / 60:.1f} phút")
+
+    # ==================== TẮT VM ====================
+    def quit_vm(self, vm_name: str, log_callback=None) -> float:
+        """
+        Tắt VM, chờ tắt hẳn rồi sleep như flow cũ. Đo thời gian để ước lượng tiết kiệm.
+
+        Returns:
+            float: Thời gian tắt (giây)
+        """
+        with self._lock:
+            self._warm.pop(vm_name, None)
+        start = time.monotonic()
+        try:
+            check_fence()
+            subprocess.run(
+                [LDCONSOLE_EXE, "quit", "--name", vm_name],
+                creationflags=subprocess.CREATE_NO_WINDOW,
+                timeout=30
+            )
+        except Exception as e:
+            if log_callback:
+                log_callback(f"⚠️ Lỗi tắt máy ảo: {e}")
+        vm_manager.wait_vm_stopped(vm_name, LDCONSOLE_EXE, timeout=60)
+        time.sleep(WAIT_EXTRA_LONG)
+        elapsed = time.monotonic() - start
+        self.record_shutdown(elapsed)
+        return elapsed
+
+    def _ensure_reaper(self):
+        with self._lock:
+            if self._reaper is not None and self._reaper.is_alive():
+                return
+            self._stop_event.clear()
+            self._reaper = threading.Thread(target=self._reap_loop, daemon=True, name="WarmVMReaper")
+            self._reaper.start()
+
+    def _reap_loop(self):
+        """Tắt các VM warm rảnh quá idle TTL (hoặc khi warm mode bị tắt)"""
+        while not self._stop_event.wait(REAPER_INTERVAL):
+            now = time.monotonic()
+            with self._lock:
+                expired = [vm for vm, last_used in self._warm.items()
+                           if not self.enabled or now - last_used >= self.idle_ttl]
+                if not self._warm:
+                    self._reaper = None
+                    return
+
+            for vm_name in expired:
+                # Chỉ tắt khi không ai đang dùng VM (non-blocking)
+                lease = vm_manager.try_acquire_vm(vm_name, caller="WarmVMReaper")
+                if not lease:
+                    continue
+                try:
+                    with self._lock:
+                        still_warm = vm_name in self._warm
+                    if still_warm:
+                        self.logger.info(f"♨️ VM '{vm_name}' rảnh quá {self.idle_ttl}s - Tắt máy ảo")
+                        with fenced(lease):
+                            self.quit_vm(vm_name)
+                finally:
+                    vm_manager.release_vm(vm_name, caller="WarmVMReaper", token=lease.token)
+
+    def quit_if_free(self, vm_name: str, caller: str = "", timeout: float = 10) -> bool:
+        """
+        Gửi lệnh tắt VM chỉ khi không ai đang giữ: khóa non-blocking như reaper, quit chạy trong fence.
+
+        VM đang được job / process khác khóa (hoặc có người xếp hàng chờ) → bỏ qua, không tắt
+        VM đang đăng dở. Dùng khi đóng app / dừng luồng theo dõi.
+
+        Returns:
+            bool: True nếu đã gửi lệnh quit
+        """
+        lease = vm_manager.try_acquire_vm(vm_name, caller=caller)
+        if not lease:
+            self.logger.info(f"🔒 VM '{vm_name}' đang được sử dụng - Bỏ qua tắt máy ảo", extra={"vm": vm_name})
+            return False
+        try:
+            with self._lock:
+                self._warm.pop(vm_name, None)
+            with fenced(lease):
+                check_fence()
+                subprocess.run(
+                    [LDCONSOLE_EXE, "quit", "--name", vm_name],
+                    creationflags=subprocess.CREATE_NO_WINDOW,
+                    timeout=timeout
+                )
+            return True
+        finally:
+            vm_manager.release_vm(vm_name, caller=caller, token=lease.token)
+
+    def shutdown(self, quit_vms: bool = True):
+        """Dừng reaper và (tùy chọn) tắt các VM warm không ai đang dùng - gọi khi đóng app"""
+        self._stop_event.set()
+        with self._lock:
+            vms = list(self._warm)
+            self._warm.clear()
+        if quit_vms:
+            for vm_name in vms:
+                try:
+                    if self.quit_if_free(vm_name, caller="WarmVMPool"):
+                        self.logger.info(f"♨️ Đã gửi lệnh tắt VM warm: {vm_name}")
+                except Exception as e:
+                    self.logger.error(f"❌ Lỗi khi tắt VM warm {vm_name}: {e}")
+        self.logger.info(self.format_stats())
+
+
+# Global singleton instance
+warm_vm_pool = WarmVMPool()